@@ -0,0 +1,172 @@
+import os
+import time
+import math
+import secrets
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import request, jsonify
+
+from shared_state import SharedLedger
+from scheduling import PriorityUpstreamScheduler, request_priority
+from patient_context import session_scope
+
+SESSION_COOKIE = 'care_sid'
+
+# Route classes and their default per-session token buckets: (tokens per second, burst)
+DEFAULT_ROUTE_LIMITS = {
+    'suggest': (2.0, 8),      # autocomplete keystrokes
+    'questions': (0.5, 6),    # questionnaire / label generation
+    'summary': (0.2, 4),      # patient history summaries
+    'analysis': (0.2, 3),     # full diagnostic analysis
+    'prefetch': (0.5, 4)      # speculative questionnaire precomputation
+}
+
+# Per-IP buckets are this many times larger than per-session ones (shared NAT, cookie rotation)
+IP_LIMIT_MULTIPLIER = 4
+
+# Socket peers whose forwarding headers are believed (the local nginx); comma list
+TRUSTED_PROXIES = frozenset(p.strip() for p in os.getenv('TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if p.strip())
+
+
+def client_ip() -> str:
+    """
+    Client address: the socket peer, or when that is a trusted proxy the address nginx
+    saw (X-Real-IP, set to $remote_addr, else the last X-Forwarded-For hop, the one nginx
+    appended). Earlier hops are whatever the client sent and are never used.
+    """
+    peer = request.remote_addr or 'unknown'
+    if peer not in TRUSTED_PROXIES:
+        return peer
+    real_ip = request.headers.get('X-Real-IP', '').strip()
+    if real_ip:
+        return real_ip
+    forwarded = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    return forwarded[-1] if forwarded else peer
+
+
+def client_session_id() -> Optional[str]:
+    """Browser session id set by the index route, if the client sent one."""
+    sid = request.cookies.get(SESSION_COOKIE, '')
+    return sid if 0 < len(sid) <= 64 else None
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def parse_route_limits() -> Dict[str, Tuple[float, int]]:
+    """
+    Read overrides such as RATE_LIMIT_SUGGEST="2/8" (tokens per second / burst)
+    from the environment on top of DEFAULT_ROUTE_LIMITS.
+    """
+    limits = dict(DEFAULT_ROUTE_LIMITS)
+    for route_class in DEFAULT_ROUTE_LIMITS:
+        value = os.getenv(f"RATE_LIMIT_{route_class.upper()}")
+        if not value:
+            continue
+        try:
+            rate, burst = value.split('/')
+            limits[route_class] = (float(rate), int(burst))
+        except ValueError:
+            print(f"WARN: Ignoring malformed RATE_LIMIT_{route_class.upper()}={value!r}")
+    return limits
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets per route class, stored in a ledger shared by all workers."""
+
+    def __init__(self, ledger: SharedLedger, route_limits: Dict[str, Tuple[float, int]], max_buckets: int = 5000):
+        self.ledger = ledger
+        self.route_limits = route_limits
+        self.max_buckets = max_buckets
+
+    @staticmethod
+    def _refill(bucket, rate: float, burst: float, now: float) -> float:
+        tokens, updated = bucket if bucket else (burst, now)
+        return min(burst, tokens + (now - updated) * rate)
+
+    def take(self, route_class: str, ip: str, session_id: Optional[str]) -> Tuple[bool, float]:
+        """
+        Consume one token from the client's session and IP buckets.
+        Returns (allowed, retry_after_seconds).
+        """
+        rate, burst = self.route_limits[route_class]
+        checks = [(f"ip:{route_class}:{ip}", rate * IP_LIMIT_MULTIPLIER, burst * IP_LIMIT_MULTIPLIER)]
+        if session_id:
+            checks.append((f"sid:{route_class}:{session_id}", rate, burst))
+
+        now = time.time()
+        with self.ledger.transaction() as buckets:
+            levels = [(key, self._refill(buckets.get(key), r, b, now), r) for key, r, b in checks]
+            short = [(1 - tokens) / r for _, tokens, r in levels if tokens < 1]
+            if short:
+                for key, tokens, _ in levels:
+                    buckets[key] = [tokens, now]
+                return False, max(short)
+            for key, tokens, _ in levels:
+                buckets[key] = [tokens - 1, now]
+            if len(buckets) > self.max_buckets:
+                self._prune(buckets, now)
+        return True, 0.0
+
+    def _prune(self, buckets: Dict, now: float):
+        """
+        Drop buckets that have been idle long enough to be full again, then, if that is
+        not enough, the least recently used ones down to 90% of max_buckets: the ledger is
+        rewritten on every request, so its size is capped however many clients appear.
+        """
+        slowest_refill = max(burst * IP_LIMIT_MULTIPLIER / rate for rate, burst in self.route_limits.values())
+        for key in [k for k, (_, updated) in buckets.items() if now - updated > slowest_refill]:
+            del buckets[key]
+        excess = len(buckets) - int(self.max_buckets * 0.9)
+        if excess > 0:
+            for key in sorted(buckets, key=lambda k: buckets[k][1])[:excess]:
+                del buckets[key]
+
+
+class AdmissionController:
+    """
+    Admission control in front of the LLM-backed routes: per-client token buckets per
+    route class plus a host-wide, priority-ordered upstream concurrency pool. Overload
+    is shed before any prompt is built, either with 429 + Retry-After or with a
+    rule-based fallback.
+    """
+
+    def __init__(self, upstream_limit: int = 8, upstream_queue_timeout: float = 10.0,
+                 route_limits: Optional[Dict[str, Tuple[float, int]]] = None):
+        self.buckets = TokenBucketLimiter(SharedLedger('rate_limits'), route_limits or parse_route_limits())
+        self.upstream = PriorityUpstreamScheduler(SharedLedger('upstream_slots'), upstream_limit, upstream_queue_timeout)
+
+    def admit(self, route_class: str, fallback: Optional[Callable] = None,
+              urgency: Optional[Callable[[Dict], str]] = None):
+        """
+        Route decorator. When the client is over its budget, or every upstream slot
+        is busy and a fallback exists, respond from `fallback` (called with the
+        request JSON) or with 429 and a Retry-After header. Admitted requests are
+        tagged with the route class and the urgency returned by `urgency` so their
+        upstream calls are dispatched in priority order, and with the client session
+        so they share its patient-context digest.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                allowed, retry_after = self.buckets.take(route_class, client_ip(), client_session_id())
+                if allowed and not (fallback and self.upstream.saturated()):
+                    level = urgency(request.get_json(silent=True) or {}) if urgency else 'routine'
+                    with request_priority(route_class, level), session_scope(client_session_id()):
+                        return view(*args, **kwargs)
+
+                reason = 'rate_limited' if not allowed else 'upstream_saturated'
+                print(f"WARN: Shedding {request.path} for {client_ip()} ({reason})")
+                if fallback:
+                    response = jsonify(fallback(request.get_json(silent=True) or {}))
+                    response.headers['X-Admission'] = reason
+                    return response
+
+                response = jsonify({'error': 'Too many requests, please retry shortly', 'reason': reason})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+            return wrapper
+        return decorator
@@ -1,8 +1,25 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, make_response, redirect, stream_with_context
 from dotenv import load_dotenv
 from openai_helper import OpenAIHelper
+from idempotency import IdempotencyStore, idempotent
+from admission import AdmissionController, SESSION_COOKIE, client_ip, client_session_id, new_session_id
+from metrics import metrics
+from background import BackgroundJobs
+from quota_governor import QuotaGovernor
+from token_budget import MaxTokensTuner
+from patient_context import PatientContextCache
+from questionnaire_cache import QuestionnaireCache
+from followup_cursor import FollowupCursorStore
+from question_wire import QuestionTemplates
+from prefetch import SpeculativePrefetcher, followup_inputs, label_inputs, additional_inputs
+from shared_state import state_dir
+from scheduling import WORKER_TIMEOUT, start_request_deadline
+from symptom_vocabulary import canonical_query, normalize_payload, normalize_symptom
 import os
+import json
+import hashlib
 import traceback
+from urllib.parse import urlencode
 
 load_dotenv()
 
@@ -12,16 +29,141 @@ app = Flask(__name__)
 app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
 app.config['DEBUG'] = os.getenv('DEBUG', 'False').lower() == 'true'
 
-openai_helper = OpenAIHelper()
+# Per-client token buckets and a host-wide, priority-ordered pool of OpenAI calls, shared by all workers
+admission = AdmissionController(
+    upstream_limit=int(os.getenv('UPSTREAM_MAX_CONCURRENCY', 8)),
+    upstream_queue_timeout=float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 10))
+)
+
+# Host-wide OpenAI RPM/TPM budget consulted before every chat.completions.create
+quota_governor = QuotaGovernor(
+    rpm=int(os.getenv('OPENAI_RPM_LIMIT', 500)),
+    tpm=int(os.getenv('OPENAI_TPM_LIMIT', 200000)),
+    max_wait=float(os.getenv('OPENAI_QUOTA_MAX_WAIT', 15))
+)
+
+# Per-family max_tokens sized from observed completion lengths (high percentile + headroom)
+token_tuner = MaxTokensTuner(
+    percentile=float(os.getenv('MAX_TOKENS_PERCENTILE', 0.99)),
+    headroom=float(os.getenv('MAX_TOKENS_HEADROOM', 0.15)),
+    min_samples=int(os.getenv('MAX_TOKENS_MIN_SAMPLES', 50))
+)
+
+# One compact patient-context digest per session, shared by every prompt of that session
+context_cache = PatientContextCache(
+    max_entries=int(os.getenv('PATIENT_CONTEXT_MAX_ENTRIES', 2000)),
+    ttl_seconds=int(os.getenv('PATIENT_CONTEXT_TTL_SECONDS', 3600))
+)
+
+# Questionnaires persisted on disk by (case type, symptom set, demographic band); see warm_questionnaires.py
+questionnaire_cache = None
+if os.getenv('QUESTIONNAIRE_CACHE', '1').strip().lower() not in ('0', 'false', 'no'):
+    questionnaire_cache = QuestionnaireCache(
+        path=os.getenv('QUESTIONNAIRE_CACHE_PATH') or None,
+        ttl_seconds=int(float(os.getenv('QUESTIONNAIRE_CACHE_TTL_DAYS', 30)) * 86400),
+        max_entries=int(os.getenv('QUESTIONNAIRE_CACHE_MAX_ENTRIES', 20000))
+    )
+
+# Each session's position (symptom index, question slot) in the one-by-one /followup interview
+followup_cursors = FollowupCursorStore(
+    max_entries=int(os.getenv('FOLLOWUP_CURSOR_MAX_ENTRIES', 5000)),
+    ttl_seconds=int(os.getenv('FOLLOWUP_CURSOR_TTL_SECONDS', 3600))
+)
+
+openai_helper = OpenAIHelper(upstream_limiter=admission.upstream, quota_governor=quota_governor,
+                             token_tuner=token_tuner, context_cache=context_cache,
+                             questionnaire_cache=questionnaire_cache, followup_cursors=followup_cursors)
+
+# Freshness of GET /symptoms/suggest answers in browser and nginx caches, and how long a
+# stale answer may still be served while it is refreshed in the background
+SUGGEST_MAX_AGE = int(os.getenv('SUGGEST_MAX_AGE', 300))
+SUGGEST_STALE_WHILE_REVALIDATE = int(os.getenv('SUGGEST_STALE_WHILE_REVALIDATE', 86400))
+
+# Dictionary of the rule-based questions, for responses requested with ?format=templated
+question_templates = QuestionTemplates(*openai_helper.wire_templates())
+
+# LLM detail that completes after an instant emergency verdict has been returned
+background_jobs = BackgroundJobs(max_workers=int(os.getenv('BACKGROUND_WORKERS', 4)))
+
+# Questionnaire work started speculatively by POST /prefetch and handed to the real request
+prefetcher = SpeculativePrefetcher(
+    BackgroundJobs(max_workers=int(os.getenv('PREFETCH_WORKERS', 2)),
+                   ttl_seconds=int(os.getenv('PREFETCH_TTL_SECONDS', 600)),
+                   spool_dir=os.path.join(state_dir(), 'prefetch')),
+    wait_timeout=float(os.getenv('PREFETCH_WAIT_TIMEOUT', 20))
+)
+prefetcher.register('followup_questions', followup_inputs,
+                    lambda inputs: openai_helper.generate_structured_questions(**inputs))
+prefetcher.register('labels', label_inputs,
+                    lambda inputs: openai_helper.extract_symptom_labels_local_first(inputs['symptoms'], inputs['free_text']))
+# The OLDCARTS questions are a paid 2k-token call the UI does not always make: only on request
+prefetcher.register('additional_questions', additional_inputs,
+                    lambda inputs: openai_helper.generate_additional_questions(inputs['patient_data'], inputs['max_questions']),
+                    default=False)
+
+# Duplicate POSTs carrying the same Idempotency-Key replay the first response
+idempotency_store = IdempotencyStore(
+    max_entries=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', 1024)),
+    ttl_seconds=int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 600)),
+    # An owner cannot outlive gunicorn's worker timeout (a killed owner's marker is taken over at once)
+    stale_after=WORKER_TIMEOUT,
+    spool_dir=os.getenv('IDEMPOTENCY_DIR') or None
+)
+
+@app.before_request
+def bound_request():
+    """Every wait and upstream call of a request draws on one budget (see scheduling.REQUEST_TIMEOUT)."""
+    start_request_deadline()
+
+def wants_stream() -> bool:
+    """?stream=1 or Accept: application/x-ndjson asks for a route's NDJSON variant."""
+    return request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def wants_templated() -> bool:
+    """?format=templated asks for questions as references into GET /question_templates."""
+    return request.args.get('format') == 'templated'
+
+def conditional_json(body: str, etag: str, cache_control: str) -> Response:
+    """A JSON body with a strong ETag and Cache-Control; an If-None-Match of that ETag gets an empty 304."""
+    etag = f'"{etag}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+        response.mimetype = 'application/json'
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def ndjson_response(parts) -> Response:
+    """Stream (part, data) pairs as NDJSON lines {"part": ..., "data": ...}, each flushed as it is produced."""
+    def generate():
+        for part, result in parts:
+            yield json.dumps({'part': part, 'data': result}) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Let nginx pass each line through as it is written
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/')
 def index():
     # Reset questions when starting a new session
     print("DEBUG: Flask index route called - resetting conversation state")  # Debug log
     openai_helper.reset_conversation()  # Fixed method name
-    return render_template('index.html')
+    response = make_response(render_template('index.html'))
+    if client_session_id():
+        # A reload starts the one-by-one interview over
+        followup_cursors.reset(client_session_id())
+    else:
+        # Session id used to key per-client rate limits
+        response.set_cookie(SESSION_COOKIE, new_session_id(), httponly=True, samesite='Lax',
+                            secure=request.is_secure or request.headers.get('X-Forwarded-Proto') == 'https')
+    return response
 
 @app.route('/get_symptoms', methods=['POST'])
+@admission.admit('suggest', fallback=lambda data: openai_helper.fallback_symptom_suggestions(data.get('input', '')))
 def get_symptoms():
     try:
         user_input = request.json.get('input', '')
@@ -32,13 +174,49 @@ def get_symptoms():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/symptoms/suggest', methods=['GET'])
+@admission.admit('suggest', fallback=lambda data: openai_helper.fallback_symptom_suggestions(
+    canonical_query(request.args.get('q'))))
+def suggest_symptoms():
+    """
+    Cacheable autocomplete: the answer depends only on ?q=, so nginx (proxy_cache) and
+    browsers can serve repeated prefixes without reaching Python. Any other spelling of
+    the query is redirected to its canonical URL, giving each query one cache entry.
+    """
+    query = canonical_query(request.args.get('q'))
+    canonical = urlencode({'q': query})
+    if request.query_string.decode('utf-8', 'replace') != canonical:
+        response = redirect(f"{request.path}?{canonical}", 301)
+        response.headers['Cache-Control'] = f'public, max-age={SUGGEST_STALE_WHILE_REVALIDATE}'
+        return response
+    try:
+        suggestions, cacheable = openai_helper.suggest_symptoms(query)
+        body = json.dumps(suggestions)
+        if cacheable:
+            cache_control = (f'public, max-age={SUGGEST_MAX_AGE}, '
+                             f'stale-while-revalidate={SUGGEST_STALE_WHILE_REVALIDATE}')
+        else:
+            cache_control = 'no-store'
+        return conditional_json(body, hashlib.sha256(body.encode('utf-8')).hexdigest()[:32], cache_control)
+    except Exception as e:
+        print(f"Error in suggest_symptoms: {e}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/submit_symptoms', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('questions', urgency=openai_helper.assess_urgency)
 def submit_symptoms():
     try:
-        data = request.json
+        data = normalize_payload(request.json)
         print(f"Received data: {data}")  # Debug log
-        followup_question = openai_helper.get_followup_questions(data)
+        followup_question = openai_helper.get_followup_questions(
+            data, prefetched=prefetcher.take('followup_questions', data)
+        )
         print(f"Generated question: {followup_question}")  # Debug log
+        if wants_templated() and followup_question.get('structured_questions'):
+            followup_question = {**followup_question, 'question_templates': question_templates.etag,
+                                 'structured_questions': question_templates.encode_all(followup_question['structured_questions'])}
         return jsonify(followup_question)
     except Exception as e:
         print(f"Error in submit_symptoms: {e}")
@@ -49,22 +227,50 @@ def submit_symptoms():
 @app.route('/followup', methods=['POST'])
 def followup():
     try:
-        data = request.json or {}
+        data = normalize_payload(request.json or {})
         print(f"DEBUG: /followup called with data keys: {list(data.keys())}")
-        result = openai_helper.get_next_followup_question(data)
+        result = openai_helper.get_next_followup_question(data, client_session_id() or client_ip())
         print(f"DEBUG: /followup returning: {result}")
+        if wants_templated() and result.get('question'):
+            result = {**result, 'question_templates': question_templates.etag,
+                      'question': question_templates.encode(result['question'])}
         return jsonify(result)
     except Exception as e:
         print(f"Error in /followup: {e}")
         print(traceback.format_exc())
         return jsonify({'completed': True, 'error': str(e)}), 500
 
+@app.route('/question_templates', methods=['GET'])
+def get_question_templates():
+    """
+    The template dictionary that ?format=templated responses reference. It only changes
+    with a deploy, so a request for the current version (?v=<etag>) may be cached for good.
+    """
+    if request.args.get('v') == question_templates.etag:
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = 'public, max-age=300'
+    return conditional_json(question_templates.body, question_templates.etag, cache_control)
+
 @app.route('/analyze', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('analysis', urgency=openai_helper.assess_urgency)
 def analyze():
     try:
         data = request.json
         print(f"DEBUG: Analyze route called with data: {data}")  # Debug log
         
+        # Emergencies are answered instantly from local red-flag rules (on the patient's own wording);
+        # the LLM detail follows via /jobs/<id>
+        verdict = openai_helper.triage_emergency(data)
+        data = normalize_payload(data)
+        if verdict['emergency']:
+            print(f"DEBUG: Red-flag emergency detected: {verdict['matched_rules']}")
+            preliminary = openai_helper.preliminary_analysis(verdict)
+            preliminary['analysis_pending'] = True
+            preliminary['analysis_job'] = background_jobs.submit('analysis', openai_helper.analyze_symptoms, data)
+            return jsonify(preliminary)
+        
         # Call analyze_symptoms which returns the correct format with possible_conditions and diagnostic_tests
         analysis = openai_helper.analyze_symptoms(data)
         
@@ -93,16 +299,20 @@ def analyze():
         }), 500
 
 @app.route('/extract_labels', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('questions', fallback=lambda data: openai_helper.extract_symptom_labels(data.get('symptoms', []), data.get('free_text', '')))
 def extract_labels():
     try:
-        data = request.json
+        data = normalize_payload(request.json)
         symptoms = data.get('symptoms', [])
         free_text = data.get('free_text', '')
         
         print(f"DEBUG: Label extraction request - symptoms: {symptoms}, free_text: '{free_text}'")
         
-        # Use OpenAI to extract labels
-        label_data = openai_helper.extract_symptom_labels_with_openai(symptoms, free_text)
+        # Fuzzy-match locally and only ask OpenAI when unsure, unless /prefetch already did
+        label_data = prefetcher.take('labels', data)
+        if label_data is None:
+            label_data = openai_helper.extract_symptom_labels_local_first(symptoms, free_text)
         
         print(f"DEBUG: Label extraction result: {label_data}")
         
@@ -119,14 +329,18 @@ def extract_labels():
         }), 500
 
 @app.route('/generate_additional_questions', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('questions', urgency=openai_helper.assess_urgency)
 def generate_additional_questions():
     """
     Generate dynamic additional information questions based on patient data using the OLDCARTS framework.
     Uses the OpenAI helper to generate intelligent questions tailored to the patient's
     symptoms, vitals, and demographics.
+    With ?stream=1 (or Accept: application/x-ndjson) each question is sent as an NDJSON line
+    {"part": "question", "data": {...}} as soon as it is generated, then {"part": "done", ...}.
     """
     try:
-        data = request.get_json()
+        data = normalize_payload(request.get_json())
         if not data:
             return jsonify({"error": "No data provided"}), 400
             
@@ -138,8 +352,14 @@ def generate_additional_questions():
         print(f"Patient symptoms count: {len(patient_data.get('symptoms', []))}")
         print(f"Max questions requested: {max_questions}")
         
-        # Generate questions using OpenAI
-        questions = openai_helper.generate_additional_questions(patient_data, max_questions)
+        # Generate questions using OpenAI, unless /prefetch already did
+        questions = prefetcher.take('additional_questions', patient_data, max_questions)
+        if wants_stream():
+            if questions is None:
+                return ndjson_response(openai_helper.stream_additional_questions(patient_data, max_questions))
+            return ndjson_response([('question', q) for q in questions] + [('done', {'total_questions': len(questions)})])
+        if questions is None:
+            questions = openai_helper.generate_additional_questions(patient_data, max_questions)
         
         return jsonify({
             "success": True,
@@ -156,15 +376,27 @@ def generate_additional_questions():
         }), 500
 
 @app.route('/generate_patient_summary', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('summary', urgency=openai_helper.assess_urgency)
 def generate_patient_summary():
     """
     Generate AI-powered patient summary with D/O indicators and vitals abnormalities analysis
     for the Patient History Followup page.
     """
     try:
-        data = request.json
+        data = normalize_payload(request.json)
         print(f"DEBUG: Received patient summary request with data keys: {list(data.keys())}")
         
+        verdict = openai_helper.triage_emergency(data)
+        if verdict['emergency']:
+            preliminary = openai_helper.preliminary_patient_summary(data)
+            preliminary['emergency_triage'] = verdict
+            preliminary['summary_pending'] = True
+            preliminary['summary_job'] = background_jobs.submit(
+                'patient_summary', openai_helper.generate_patient_summary_with_do_indicators, data
+            )
+            return jsonify(preliminary)
+        
         # Generate comprehensive patient summary using OpenAI
         summary_result = openai_helper.generate_patient_summary_with_do_indicators(data)
         
@@ -197,12 +429,22 @@ def generate_patient_summary():
         }), 500
 
 @app.route('/generate_followup_questions', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('summary', urgency=openai_helper.assess_urgency)
 def generate_followup_questions():
-    """Generate dynamic follow-up questions based on patient information with D/O indicators and vitals outliers"""
+    """
+    Generate dynamic follow-up questions based on patient information with D/O indicators and vitals outliers.
+    With ?stream=1 (or Accept: application/x-ndjson) each question is sent as an NDJSON line
+    {"part": "question", "data": {...}} as soon as it is generated; the last line,
+    {"part": "done", "data": {...}}, carries total_questions, outliers_addressed and do_indicators_focus.
+    """
     try:
-        patient_data = request.json
+        patient_data = normalize_payload(request.json)
         print(f"DEBUG: Received patient data for followup questions: {patient_data}")
         
+        if wants_stream():
+            return ndjson_response(openai_helper.stream_followup_questions_with_do_indicators(patient_data))
+
         # Use the OpenAI helper to generate questions
         questions_data = openai_helper.generate_followup_questions_with_do_indicators(patient_data)
         
@@ -221,6 +463,70 @@ def generate_followup_questions():
             'do_indicators_focus': []
         }), 500
 
+@app.route('/generate_patient_history_followup', methods=['POST'])
+@idempotent(idempotency_store)
+@admission.admit('summary', urgency=openai_helper.assess_urgency)
+def generate_patient_history_followup():
+    """
+    Patient summary and D/O follow-up questions in one request. The shared patient context
+    and vitals analysis are computed once and both generations run concurrently.
+    With ?stream=1 (or Accept: application/x-ndjson) each part is sent as an NDJSON line
+    {"part": "triage"|"summary"|"followup", "data": {...}} as soon as it finishes.
+    """
+    try:
+        patient_data = normalize_payload(request.json or {})
+        if not wants_stream():
+            return jsonify(openai_helper.generate_patient_history_followup(patient_data))
+        return ndjson_response(openai_helper.stream_patient_history_followup(patient_data))
+
+    except Exception as e:
+        print(f"Error in generate_patient_history_followup: {e}")
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to generate patient history follow-up', 'message': str(e)}), 500
+
+@app.route('/prefetch', methods=['POST'])
+@admission.admit('prefetch', fallback=lambda data: {'prefetch': {}, 'skipped': True})
+def prefetch():
+    """
+    Speculatively start questionnaire work for the symptoms and case type selected so far.
+    Takes the same payload as /submit_symptoms plus an optional "kinds" list; the real
+    routes pick the results up by input hash. Skipped when the upstream pool is busy.
+    """
+    try:
+        data = normalize_payload(request.json or {})
+        kinds = data.get('kinds')
+        return jsonify({'prefetch': prefetcher.prefetch(client_session_id(), data, kinds)}), 202
+    except Exception as e:
+        print(f"Error in prefetch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a background job started by an instant (red-flag) response"""
+    record = background_jobs.get(job_id)
+    if record is None:
+        return jsonify({'status': 'unknown', 'error': 'Job not found or expired'}), 404
+    return jsonify(record)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_snapshot():
+    """Host-wide operational metrics (upstream queue waits per priority, etc.) as JSON"""
+    snapshot = metrics.snapshot()
+    snapshot['upstream_slots_in_use'] = admission.upstream.in_use()
+    snapshot['upstream_slot_limit'] = admission.upstream.limit
+    snapshot['openai_quota'] = quota_governor.usage()
+    snapshot['max_tokens_tuning'] = token_tuner.snapshot()
+    # Per worker: how often symptom strings were already in the interned normalization table
+    snapshot['symptom_normalizer'] = normalize_symptom.cache_info()._asdict()
+    if questionnaire_cache is not None:
+        snapshot['questionnaire_cache'] = questionnaire_cache.stats()
+    prompt_totals = snapshot.get('llm_prompt_tokens_total', {})
+    snapshot['prompt_cache_hit_rate'] = {
+        family: round(snapshot.get('llm_cached_prompt_tokens', {}).get(family, 0) / total, 4)
+        for family, total in prompt_totals.items() if total
+    }
+    return jsonify(snapshot)
+
 if __name__ == '__main__':
     # Use environment variables for production
     port = int(os.getenv('PORT', 5003))
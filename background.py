@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Dict, Optional
+
+from shared_state import open_private, private_dir, state_dir
+from scheduling import call_deadline
+
+
+class BackgroundJobs:
+    """
+    Small background pool for LLM work that finishes after the HTTP response.
+    Results are spooled to a directory shared by all workers, so a client can
+    poll GET /jobs/<id> and be answered by whichever worker it reaches.
+    The executor is created lazily so it is never inherited across a fork
+    (gunicorn runs with preload_app).
+    """
+
+    def __init__(self, max_workers: int = 4, ttl_seconds: int = 900, stale_after: float = 120.0,
+                 spool_dir: Optional[str] = None):
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self.stale_after = stale_after
+        self.spool_dir = private_dir(spool_dir or os.path.join(state_dir(), 'jobs'))
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._futures = {}  # job_id -> Future, for jobs started by this process
+        self._discarded = set()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='care-ai-job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _write(self, job_id: str, record: Dict):
+        path = self._path(job_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open_private(tmp_path) as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def submit(self, kind: str, func: Callable, *args, job_id: Optional[str] = None, **kwargs) -> str:
+        """
+        Run func(*args, **kwargs) in the background and return a job id. The caller's
+        context (e.g. the upstream request priority) is carried into the worker thread,
+        except its request deadline: the job outlives the request that submitted it.
+        `job_id` (lowercase hex) lets callers address the job by a key they can recompute,
+        e.g. a hash of its inputs; by default a random id is used.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        self._write(job_id, {'status': 'pending', 'kind': kind, 'created_at': time.time()})
+        context = contextvars.copy_context()
+
+        def detached():
+            with call_deadline(None):
+                return func(*args, **kwargs)
+
+        def run():
+            try:
+                result = context.run(detached)
+                record = {'status': 'done', 'kind': kind, 'result': result}
+            except Exception as e:
+                print(f"Error in background job {kind}: {e}")
+                record = {'status': 'failed', 'kind': kind, 'error': str(e)}
+            record['finished_at'] = time.time()
+            with self._lock:
+                self._futures.pop(job_id, None)
+                if job_id in self._discarded:
+                    self._discarded.discard(job_id)
+                    return
+            try:
+                self._write(job_id, record)
+            except OSError as e:
+                print(f"WARN: Could not persist background job {job_id}: {e}")
+
+        future = self._pool().submit(run)
+        with self._lock:
+            self._futures[job_id] = future
+        self._prune()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Drop a job nobody needs any more. A job still queued in this process never
+        runs; one already running here finishes but its result is not stored. Either
+        way the spooled record is removed. Returns True if the work was stopped before
+        it started. Jobs owned by another worker can only have their record removed.
+        """
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+            cancelled = bool(future and future.cancel())
+            if future and not cancelled:
+                self._discarded.add(job_id)
+        try:
+            os.unlink(self._path(job_id))
+        except OSError:
+            pass
+        return cancelled
+
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 0.05) -> Optional[Dict]:
+        """
+        get(job_id), but a pending job is waited for up to `timeout` seconds: on its
+        future when this process started it, otherwise by polling the spool directory.
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            wait_futures([future], timeout=timeout)
+            return self.get(job_id)
+
+        deadline = time.time() + timeout
+        record = self.get(job_id)
+        while record and record['status'] == 'pending' and time.time() < deadline:
+            time.sleep(poll_interval)
+            record = self.get(job_id)
+        return record
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the job record ({'status': 'pending'|'done'|'failed', ...}) or None."""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record['status'] == 'pending' and time.time() - record.get('created_at', 0) > self.stale_after:
+            # The worker that owned the job died or was recycled
+            return {'status': 'failed', 'kind': record.get('kind'), 'error': 'Background job did not finish'}
+        return record
+
+    def _prune(self):
+        now = time.time()
+        try:
+            names = os.listdir(self.spool_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if os.path.getmtime(path) + self.ttl_seconds < now:
+                    os.unlink(path)
+            except OSError:
+                continue
@@ -0,0 +1,105 @@
+"""
+Compare the verbose and compact output schemas for every prompt family that has both.
+
+For each family the same sample patient (Test Case 2 in cases.md) is sent with the
+verbose template and with its *_compact variant; completion tokens and wall time are
+averaged over --runs calls, and the compact output is run through its expander to
+check it rebuilds the verbose shape. Requires OPENAI_API_KEY.
+
+    python benchmarks/compact_output.py --runs 3
+    python benchmarks/compact_output.py --families analysis,followup_questions
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai_helper import OpenAIHelper  # noqa: E402
+from prompt_templates import get_prompt  # noqa: E402
+from compact_schema import (  # noqa: E402
+    COMPACT_FAMILIES, expand_analysis, expand_additional_questions,
+    expand_followup_questions, expand_dynamic_questions
+)
+
+DEMOGRAPHICS = {'age': 58, 'gender': 'male'}
+HISTORY = {'smoking': 'yes', 'diabetes': 'yes', 'hypertension': 'yes', 'weight': 'yes'}
+SYMPTOMS = ["chest pain (crushing sensation)", "shortness of breath (can't catch breath)", "sweating (cold sweat)"]
+FREE_TEXT = "Crushing chest pain radiating to left arm, started 30 minutes ago"
+VITALS = {'systolic': 168, 'diastolic': 98, 'pulseRate': 112, 'oxygenSaturation': 93}
+
+SECTIONS = {
+    'analysis': dict(age='58', gender='male', regions=['Europe'], history=HISTORY, symptoms=SYMPTOMS,
+                     free_text=FREE_TEXT, detailed_symptoms={}),
+    'diagnosis': dict(demographics=DEMOGRAPHICS, history=HISTORY, symptoms=SYMPTOMS, free_text=FREE_TEXT,
+                      detailed_symptoms={}),
+    'followup_questions': dict(demographics=DEMOGRAPHICS, medical_conditions=HISTORY, medical_history={},
+                               lifestyle={'occupation': 'driver'}, medical_records={}, vitals=VITALS,
+                               case_type='sick', vitals_outliers={'critical': [], 'moderate': ['hypertension']}),
+    'dynamic_questions': dict(profile=json.dumps({'case_type': 'sick', 'demographics': DEMOGRAPHICS,
+                                                  'symptoms': SYMPTOMS, 'free_text': FREE_TEXT})),
+    'additional_questions': dict(max_questions='20', age='58', gender='male', symptoms=', '.join(SYMPTOMS),
+                                 free_text=FREE_TEXT, case_type='sick',
+                                 vitals='- Blood pressure: 168/98 mmHg\n- Pulse rate: 112 bpm',
+                                 medical_conditions='- diabetes: yes\n- hypertension: yes'),
+}
+
+PARAMS = {
+    'analysis': dict(temperature=0.1, max_tokens=1500),
+    'diagnosis': dict(temperature=0.2, max_tokens=2000),
+    'followup_questions': dict(temperature=0.3, max_tokens=2000),
+    'dynamic_questions': dict(temperature=0.2, max_tokens=1200),
+    'additional_questions': dict(temperature=0.7, max_tokens=2048),
+}
+
+EXPANDERS = {
+    'analysis': expand_analysis,
+    'diagnosis': lambda payload: expand_analysis(payload, with_icd=False),
+    'followup_questions': expand_followup_questions,
+    'dynamic_questions': expand_dynamic_questions,
+    'additional_questions': expand_additional_questions,
+}
+
+
+def measure(helper: OpenAIHelper, name: str, family: str, runs: int):
+    template = get_prompt(name)
+    rendered = template.render(**SECTIONS[family])
+    tokens, seconds, expanded_ok = [], [], 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = helper._create_chat_completion(name, rendered['messages'], **PARAMS[family])
+        seconds.append(time.perf_counter() - started)
+        tokens.append(response.usage.completion_tokens)
+        try:
+            payload = helper._parse_json_response(name, response)
+            if name.endswith('_compact'):
+                payload = EXPANDERS[family](payload)
+            expanded_ok += bool(payload)
+        except ValueError:
+            pass
+    return sum(tokens) / runs, sum(seconds) / runs, expanded_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--families', default=','.join(COMPACT_FAMILIES))
+    args = parser.parse_args()
+
+    helper = OpenAIHelper()
+    print(f"{'family':<22}{'schema':<9}{'out tokens':>11}{'wall s':>9}{'parsed':>8}")
+    for family in [f.strip() for f in args.families.split(',') if f.strip()]:
+        baseline = None
+        for schema, name in (('verbose', family), ('compact', f"{family}_compact")):
+            avg_tokens, avg_seconds, parsed = measure(helper, name, family, args.runs)
+            print(f"{family:<22}{schema:<9}{avg_tokens:>11.0f}{avg_seconds:>9.2f}{parsed:>5}/{args.runs}")
+            if baseline is None:
+                baseline = (avg_tokens, avg_seconds)
+            elif baseline[0] and baseline[1]:
+                print(f"{'':<22}{'saving':<9}{1 - avg_tokens / baseline[0]:>10.0%}{1 - avg_seconds / baseline[1]:>9.0%}")
+
+
+if __name__ == '__main__':
+    main()
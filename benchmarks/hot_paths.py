@@ -0,0 +1,208 @@
+"""
+Micro-benchmarks for the pure-Python code that runs on every request.
+
+Covers the keyword label extractor, the fuzzy label matcher and the correlation matrix,
+the structured and one-by-one questionnaire builders (whole list and one question at a
+/followup cursor), both vitals analyzers, the rule-based D/O follow-up questions, the
+legacy and templated (question_wire) serialization of a structured questionnaire and
+JSON extraction from large (and truncated) completions. Inputs are generated from a
+fixed seed: many symptoms, long free text, every vital sign and completions of a few
+hundred questions. No OpenAI calls are made.
+
+For each case it reports ops/sec (best of --repeat timing rounds) and, from one traced
+call, the peak memory it allocated and the number of allocated blocks still held by its
+result. Results are compared with benchmarks/hot_paths_baseline.json; --check exits
+non-zero when a case is slower, or its peak allocation larger, than --tolerance beyond
+its baseline.
+
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --check
+    python benchmarks/hot_paths.py --cases vitals_outliers,extract_json_large
+    python benchmarks/hot_paths.py --update      # re-record the baseline
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'hot-path-benchmark')
+
+from openai_helper import OpenAIHelper  # noqa: E402
+from json_extract import extract_json, extract_json_partial  # noqa: E402
+from label_matcher import match_labels  # noqa: E402
+from question_wire import QuestionTemplates  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hot_paths_baseline.json')
+
+SYMPTOM_VOCABULARY = [
+    'fever', 'high temperature', 'chills', 'shivering', 'night sweats', 'muscle pain', 'body ache',
+    'joint pain', 'knee pain', 'headache', 'migraine', 'nausea', 'vomiting', 'diarrhea', 'abdominal pain',
+    'stomach cramps', 'loss of appetite', 'fatigue', 'weakness', 'dizziness', 'cough', 'dry cough',
+    'sore throat', 'runny nose', 'shortness of breath', 'chest pain', 'palpitations', 'rash', 'itching',
+    'yellow eyes', 'dark urine', 'burning urination', 'back pain', 'neck stiffness', 'blurred vision',
+    'confusion', 'swelling in legs', 'weight loss', 'insomnia', 'anxiety'
+]
+QUALIFIERS = ['for three days', 'since last night', 'worse in the morning', 'on and off', 'after meals',
+              'with sweating', 'radiating to the left arm', 'getting worse', 'mild', 'severe']
+
+
+def make_inputs(seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    symptoms = rng.sample(SYMPTOM_VOCABULARY, 25)
+    free_text = ' '.join(
+        f"{rng.choice(['I have', 'There is', 'Also noticed', 'My'])} {rng.choice(SYMPTOM_VOCABULARY)} "
+        f"{rng.choice(QUALIFIERS)}." for _ in range(120)
+    )
+    vitals = {
+        'pulseRate': 128, 'systolic': 182, 'diastolic': 112, 'oxygenSaturation': 88, 'bloodSugar': 310,
+        'temperature': 103.8, 'temperatureUnit': 'F', 'respiratoryRate': 32, 'painScale': 9,
+        'heartRhythm': 'irregular', 'heartLungSounds': 'crackles at both bases',
+        'ecgAvailable': 'yes', 'ecgFindings': 'ST elevation in V2-V4',
+        'peakExpiratoryFlow': 180, 'forcedExpiratoryVolume': 1.4, 'respiratoryObservations': 'using accessory muscles',
+        'weight': 131.0, 'weightUnit': 'kg', 'height': 168.0, 'heightUnit': 'cm', 'bmi': 46.4,
+        'waistCircumference': 128, 'muscleMass': 31.0, 'fatMass': 52.0, 'bodyWater': 41.0,
+        'notes': ' '.join(rng.choice(QUALIFIERS) for _ in range(60))
+    }
+    patient_data = {
+        'caseType': 'sick',
+        'demographics': {'age': 67, 'gender': 'female', 'currentLocation': 'Lagos', 'ethnicity': 'african'},
+        'medicalConditions': {'diabetic': 'yes', 'hypertension': 'yes'},
+        'medicalHistory': {'bloodGroup': 'O+', 'familyHistory': 'heart disease, stroke, diabetes',
+                           'vaccineHistory': ' '.join(rng.choice(QUALIFIERS) for _ in range(40))},
+        'lifestyle': {'occupation': 'nurse', 'travelHistory': 'returned from a malaria region', 'pregnant': 'no'},
+        'medicalRecords': {'takingMedications': 'yes', 'currentMedications': 'metformin, lisinopril, aspirin'},
+        'vitals': vitals,
+        'symptoms': symptoms,
+        'freeTextSymptoms': free_text
+    }
+
+    questions = [{
+        'id': i, 'category': rng.choice(['symptoms', 'medical_history', 'vitals_outlier']),
+        'question': f"How would you describe the {rng.choice(SYMPTOM_VOCABULARY)} {rng.choice(QUALIFIERS)}?",
+        'type': 'multiple_choice', 'options': [f"Option {j} \"quoted\" {{braces}}" for j in range(5)],
+        'relevance': 'Escaped \\"text\\" and [brackets] inside strings', 'priority': 'high'
+    } for i in range(300)]
+    payload = json.dumps({'questions': questions, 'total_questions': len(questions)}, indent=2)
+    completion = f"Here are the questions you asked for:\n```json\n{payload}\n```\nLet me know if you need more."
+    return {
+        'symptoms': symptoms,
+        'free_text': free_text,
+        'vitals': vitals,
+        'patient_data': patient_data,
+        'completion': completion,
+        'truncated_completion': payload[:int(len(payload) * 0.8)]
+    }
+
+
+def make_cases(helper: OpenAIHelper, inputs: dict) -> dict:
+    symptoms, free_text, vitals = inputs['symptoms'], inputs['free_text'], inputs['vitals']
+    patient_data = inputs['patient_data']
+    labels = helper.extract_symptom_labels(symptoms, free_text)['extracted_labels']
+    outliers = helper._analyze_vitals_outliers(vitals)
+    demographics = patient_data['demographics']
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        questionnaire = helper._generate_enhanced_structured_questions('sick', symptoms, free_text, demographics)
+    templates = QuestionTemplates(*helper.wire_templates())
+    return {
+        'extract_symptom_labels': lambda: helper.extract_symptom_labels(symptoms, free_text),
+        'fuzzy_label_matcher': lambda: match_labels(symptoms, free_text),
+        'label_correlation_matrix': lambda: helper._create_label_correlation_matrix(labels),
+        'enhanced_structured_questions': lambda: helper._generate_enhanced_structured_questions(
+            'sick', symptoms, free_text, demographics),
+        'individual_symptom_questions': lambda: helper._generate_individual_symptom_questions(symptoms, free_text),
+        'followup_question_at_cursor': lambda: helper._individual_question(symptoms, len(symptoms) // 2, 1),
+        'vitals_outliers': lambda: helper._analyze_vitals_outliers(vitals),
+        'vitals_abnormalities': lambda: helper._analyze_vitals_abnormalities(vitals),
+        'fallback_followup_questions': lambda: helper._generate_fallback_followup_questions(patient_data, outliers),
+        'questionnaire_json_legacy': lambda: json.dumps(questionnaire),
+        'questionnaire_json_templated': lambda: json.dumps(templates.encode_all(questionnaire)),
+        'extract_json_large': lambda: extract_json(inputs['completion'], expect='object'),
+        'extract_json_partial_truncated': lambda: extract_json_partial(inputs['truncated_completion'], expect='object'),
+    }
+
+
+def bench(func, min_time: float, repeat: int) -> dict:
+    # Calibrate a loop count that runs for about min_time, then keep the best round
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 5 or loops >= 1 << 20:
+            break
+        loops *= 2
+    loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter() - started) / loops)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    del result
+    return {'ops_per_sec': round(1 / best, 1), 'peak_kib': round((peak - base) / 1024, 1), 'blocks': blocks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', default='', help='comma list of cases (default: all)')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds per timing round')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed regression vs baseline (0.3 = 30%%)')
+    parser.add_argument('--check', action='store_true', help='exit 1 on a regression')
+    parser.add_argument('--update', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args()
+
+    helper = OpenAIHelper()
+    cases = make_cases(helper, make_inputs())
+    selected = [c.strip() for c in args.cases.split(',') if c.strip()] or list(cases)
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('cases', {})
+
+    results, regressions = {}, []
+    print(f"{'case':<34}{'ops/sec':>11}{'vs base':>9}{'peak KiB':>10}{'vs base':>9}{'blocks':>8}")
+    for name in selected:
+        # The helpers print debug lines; keep them out of the timings and the report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            row = bench(cases[name], args.min_time, args.repeat)
+        results[name] = row
+        ref = baseline.get(name, {})
+        speed = row['ops_per_sec'] / ref['ops_per_sec'] - 1 if ref.get('ops_per_sec') else None
+        memory = row['peak_kib'] / ref['peak_kib'] - 1 if ref.get('peak_kib') else None
+        print(f"{name:<34}{row['ops_per_sec']:>11,.1f}{'' if speed is None else f'{speed:+.0%}':>9}"
+              f"{row['peak_kib']:>10.1f}{'' if memory is None else f'{memory:+.0%}':>9}{row['blocks']:>8}")
+        if (speed is not None and speed < -args.tolerance) or (memory is not None and memory > args.tolerance):
+            regressions.append(name)
+
+    if args.update:
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'cases': {**baseline, **results}}, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {os.path.relpath(BASELINE)}")
+    elif args.check and regressions:
+        print(f"\nRegressed beyond {args.tolerance:.0%} of baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Offline report of adaptive max_tokens savings per prompt family.
+
+Reads the completion-length sketches recorded by token_budget.MaxTokensTuner in
+CARE_AI_STATE_DIR and compares each family's hard-coded call-site max_tokens with
+the limit the tuner would use at the given percentile and headroom. Try other
+settings before changing MAX_TOKENS_PERCENTILE / MAX_TOKENS_HEADROOM in production:
+
+    python benchmarks/max_tokens_report.py
+    python benchmarks/max_tokens_report.py --percentile 0.95 --headroom 0.25
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_budget import MaxTokensTuner  # noqa: E402
+
+
+def _fmt(value) -> str:
+    return '-' if value is None else f"{value:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--percentile', type=float, default=float(os.getenv('MAX_TOKENS_PERCENTILE', 0.99)))
+    parser.add_argument('--headroom', type=float, default=float(os.getenv('MAX_TOKENS_HEADROOM', 0.15)))
+    parser.add_argument('--min-samples', type=int, default=int(os.getenv('MAX_TOKENS_MIN_SAMPLES', 50)))
+    args = parser.parse_args()
+
+    tuner = MaxTokensTuner(percentile=args.percentile, headroom=args.headroom, min_samples=args.min_samples)
+    rows = tuner.report()
+    if not rows:
+        print("No completions recorded yet")
+        return
+
+    print(f"{'prompt':<42}{'samples':>8}{'p50':>7}{'p95':>7}{'p99':>7}{'default':>9}{'adaptive':>10}"
+          f"{'saved/call':>11}{'over limit':>11}")
+    total_saved = 0
+    for family, row in sorted(rows.items()):
+        saved = row.get('reserved_tokens_saved_per_call')
+        if saved is not None:
+            total_saved += saved * row['calls']
+        print(f"{family:<42}{row['samples']:>8}{_fmt(row['p50']):>7}{_fmt(row['p95']):>7}{_fmt(row['p99']):>7}"
+              f"{_fmt(row['default_max_tokens']):>9}{_fmt(row.get('adaptive_max_tokens')):>10}"
+              f"{_fmt(saved):>11}{row.get('would_truncate_share', 0):>11.1%}")
+    print(f"\nReserved output tokens saved over the recorded calls: {total_saved:,}")
+    print("(the quota governor reserves prompt + max_tokens per call, so this is TPM headroom returned)")
+
+
+if __name__ == '__main__':
+    main()
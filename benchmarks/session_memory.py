@@ -0,0 +1,141 @@
+"""
+Memory held by the locally built questionnaires and vitals findings of many concurrent sessions.
+
+Builds the working set of --sessions sessions with varied symptoms, vitals and
+demographics (fixed seed) the way the routes do: vitals outliers and abnormalities, the
+structured symptom checklist, the rule-based D/O follow-up questions and the one-by-one
+/followup question at a cursor. All sessions are kept alive at once, as concurrent
+in-flight requests would be, and --threads builds them from a thread pool. No OpenAI
+calls are made.
+
+Reports the traced bytes and allocated blocks retained per session, and the peak per
+session while building, compared with benchmarks/session_memory_baseline.json; --check
+exits non-zero when either grows more than --tolerance beyond its baseline.
+
+    python benchmarks/session_memory.py
+    python benchmarks/session_memory.py --sessions 5000 --threads 8
+    python benchmarks/session_memory.py --check
+    python benchmarks/session_memory.py --update      # re-record the baseline
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tracemalloc
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'session-memory-benchmark')
+
+from openai_helper import OpenAIHelper  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'session_memory_baseline.json')
+
+SYMPTOMS = ['fever', 'headache', 'dry cough', 'back pain', 'chest pain', 'nausea', 'rash', 'fatigue',
+            'shortness of breath', 'joint pain', 'dizziness', 'sore throat', 'abdominal pain', 'high temperature']
+CASE_TYPES = ['accident', 'illness', 'sick', 'infection', 'addiction']
+
+
+def make_sessions(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        vitals = {
+            'systolic': rng.choice([88, 118, 146, 186]), 'diastolic': rng.choice([58, 78, 94, 122]),
+            'temperature': rng.choice([98.6, 100.9, 103.4]), 'temperatureUnit': 'F',
+            'pulseRate': rng.choice([46, 76, 128]), 'oxygenSaturation': rng.choice([87, 93, 98]),
+            'bloodSugar': rng.choice([64, 105, 240, 320]), 'painScale': rng.choice([1, 5, 8])
+        }
+        sessions.append({
+            'caseType': rng.choice(CASE_TYPES),
+            'symptoms': rng.sample(SYMPTOMS, rng.randint(2, 6)),
+            'freeTextSymptoms': rng.choice(['', 'feeling dizzy and tired since yesterday']),
+            'demographics': {'age': rng.choice([7, 34, 52, 71]), 'gender': rng.choice(['female', 'male'])},
+            'medicalConditions': {'diabetes': rng.choice(['yes', 'no'])},
+            'vitals': vitals
+        })
+    return sessions
+
+
+def working_set(helper: OpenAIHelper, data: dict) -> dict:
+    outliers = helper._analyze_vitals_outliers(data['vitals'])
+    symptoms = data['symptoms']
+    return {
+        'vitals_outliers': outliers,
+        'vitals_abnormalities': helper._analyze_vitals_abnormalities(data['vitals']),
+        'structured_questions': helper._generate_structured_symptom_questions(
+            data['caseType'], symptoms, data['freeTextSymptoms'], data['demographics']),
+        'followup_questions': helper._generate_fallback_followup_questions(data, outliers),
+        'individual_question': helper._individual_question(symptoms, len(symptoms) // 2, 1)
+    }
+
+
+def measure(helper: OpenAIHelper, sessions: list, threads: int) -> dict:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                held = list(pool.map(lambda data: working_set(helper, data), sessions))
+        else:
+            held = [working_set(helper, data) for data in sessions]
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    count = len(held)
+    del held
+    return {
+        'retained_bytes': round((current - base) / count, 1),
+        'retained_blocks': round(blocks / count, 1),
+        'peak_bytes': round((peak - base) / count, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=1, help='build the sessions from this many threads')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed growth vs baseline (0.1 = 10%%)')
+    parser.add_argument('--check', action='store_true', help='exit 1 on a regression')
+    parser.add_argument('--update', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args()
+
+    helper = OpenAIHelper()
+    sessions = make_sessions(args.sessions)
+    # The helpers print debug lines; keep them out of the measurement and the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        working_set(helper, sessions[0])  # import-time and first-call allocations are not per session
+        row = measure(helper, sessions, args.threads)
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('per_session', {})
+
+    regressions = []
+    print(f"{args.sessions} sessions, {args.threads} thread(s); per session:")
+    for metric, value in row.items():
+        ref = baseline.get(metric)
+        change = value / ref - 1 if ref else None
+        print(f"  {metric:<16}{value:>12,.1f}{'' if change is None else f'{change:+.0%}':>9}")
+        if change is not None and change > args.tolerance:
+            regressions.append(metric)
+
+    if args.update:
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'sessions': args.sessions, 'per_session': row}, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {os.path.relpath(BASELINE)}")
+    elif args.check and regressions:
+        print(f"\nGrew beyond {args.tolerance:.0%} of baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Start-up cost of app.py: import time, time to first request, and the deferred OpenAI SDK load.
+
+Each run starts a fresh interpreter (as a gunicorn worker or test run would) and times
+`import app`, the first request (GET /), and the first access to the lazily built OpenAI
+client. The medians are compared with a stored baseline, and --check exits non-zero when
+either start-up number regressed by more than --tolerance. --importtime prints the
+`python -X importtime` breakdown by top-level package and the slowest modules.
+
+    python benchmarks/startup.py --importtime
+    python benchmarks/startup.py --check
+    python benchmarks/startup.py --update      # re-record benchmarks/startup_baseline.json
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+# Numbers compared against the baseline; sdk_ms is reported only, since lazy loading moves it, not removes it
+CHECKED = ('import_ms', 'first_request_ms')
+
+PROBE = """
+import time, json
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+first_request = time.perf_counter()
+app.openai_helper.client
+sdk = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'sdk_ms': (sdk - first_request) * 1000
+}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'startup-benchmark')
+    # Fresh shared state per run so ledger files do not carry over between measurements
+    env['CARE_AI_STATE_DIR'] = tempfile.mkdtemp(prefix='care_ai_startup_')
+    return env
+
+
+def measure(runs: int) -> dict:
+    samples = defaultdict(list)
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=_env(),
+                             capture_output=True, text=True, check=True)
+        for key, value in json.loads(out.stdout.strip().splitlines()[-1]).items():
+            samples[key].append(value)
+    return {key: round(statistics.median(values), 1) for key, values in samples.items()}
+
+
+def importtime(top: int):
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True)
+    modules = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split('.')[0]] += self_us
+    total = sum(packages.values())
+    print(f"import app: {total / 1000:.0f} ms self time across {len(modules)} modules\n")
+    print(f"{'package':<28}{'ms':>8}{'share':>8}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<28}{self_us / 1000:>8.1f}{self_us / total:>8.1%}")
+    print(f"\n{'module (cumulative)':<48}{'ms':>8}")
+    for name, _, cumulative_us in sorted(modules, key=lambda m: -m[2])[:top]:
+        print(f"{name:<48}{cumulative_us / 1000:>8.1f}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--importtime', action='store_true', help='print the -X importtime breakdown')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--check', action='store_true', help='exit 1 if slower than the baseline')
+    parser.add_argument('--update', action='store_true', help='store this run as the new baseline')
+    args = parser.parse_args()
+
+    if args.importtime:
+        importtime(args.top)
+
+    result = measure(args.runs)
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print(f"{'metric':<20}{'median ms':>10}{'baseline':>10}{'change':>9}")
+    regressions = []
+    for key, value in result.items():
+        reference = baseline.get(key)
+        change = f"{value / reference - 1:>+8.0%}" if reference else f"{'-':>8}"
+        print(f"{key:<20}{value:>10.1f}{reference if reference is not None else '-':>10}{change:>9}")
+        if key in CHECKED and reference and value > reference * (1 + args.tolerance):
+            regressions.append(key)
+
+    if args.update:
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump({**result, 'python': sys.version.split()[0], 'runs': args.runs}, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {os.path.relpath(BASELINE, ROOT)}")
+    elif args.check and regressions:
+        print(f"\nStart-up regression (> {args.tolerance:.0%} over baseline): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import sys
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# Every distinct option list, interned once and shared by all questions that offer it
+_OPTION_TUPLES: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def options(*values: str) -> Tuple[str, ...]:
+    """The shared, immutable tuple for an option list (its strings interned too)."""
+    shared = _OPTION_TUPLES.get(values)
+    if shared is None:
+        shared = _OPTION_TUPLES.setdefault(values, tuple(sys.intern(v) for v in values))
+    return shared
+
+
+class VitalsFinding(NamedTuple):
+    """One vitals outlier (see OpenAIHelper._analyze_vitals_outliers)."""
+    type: str
+    values: str
+    concern: str
+
+    def to_dict(self) -> Dict:
+        return {'type': self.type, 'values': self.values, 'concern': self.concern}
+
+
+class ChecklistItem(NamedTuple):
+    """
+    One yes/no + notes row of the structured symptom checklist. Rows are module-level
+    constants, so each is serialized once and the dict is shared by every questionnaire
+    that contains it: treat it as read-only.
+    """
+    symptom: str
+    category: str = 'general'
+    notes_hint: str = ''
+
+    def to_dict(self) -> Dict:
+        row = _CHECKLIST_ROWS.get(self)
+        if row is None:
+            row = _CHECKLIST_ROWS.setdefault(self, {'symptom': self.symptom, 'category': self.category,
+                                                    'notes_hint': self.notes_hint, 'type': 'yes_no_notes'})
+        return row
+
+
+_CHECKLIST_ROWS: Dict[ChecklistItem, Dict] = {}
+
+
+class FollowupQuestion(NamedTuple):
+    """
+    A rule-based D/O follow-up question. `question` may hold a {values} placeholder for
+    the vitals reading it is about; `scale` is (min, max, min_label, max_label).
+    """
+    category: str
+    question: str
+    type: str
+    relevance: str
+    priority: str
+    options: Tuple[str, ...] = ()
+    placeholder: str = ''
+    scale: Optional[Tuple[int, int, str, str]] = None
+
+    def to_dict(self, question_id: int, values: str = '') -> Dict:
+        """The question in the JSON shape main.js renders, with `values` filled into the text."""
+        text = self.question.replace('{values}', values) if values else self.question
+        question = {'id': question_id, 'category': self.category, 'question': text, 'type': self.type}
+        if self.type == 'multiple_choice':
+            question['options'] = self.options
+        elif self.type == 'scale':
+            question['min'], question['max'], question['min_label'], question['max_label'] = self.scale
+        elif self.type == 'textarea':
+            question['placeholder'] = self.placeholder
+        question['relevance'] = self.relevance
+        question['priority'] = self.priority
+        return question
+
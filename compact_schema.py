@@ -0,0 +1,181 @@
+import os
+from typing import Dict, List, Optional
+
+# Families that have a compact output variant (see the *_COMPACT_PROMPT templates)
+COMPACT_FAMILIES = ('analysis', 'diagnosis', 'followup_questions', 'dynamic_questions', 'additional_questions')
+
+DISCLAIMER = 'This tool is not a substitute for professional medical advice, diagnosis, or treatment.'
+
+_PRIORITY = {'u': 'urgent', 'r': 'routine'}
+_URGENCY = {'e': 'emergency', 'u': 'urgent', 'r': 'routine'}
+_QUESTION_TYPE = {'m': 'multiple_choice', 's': 'scale', 't': 'textarea'}
+_QUESTION_PRIORITY = {'h': 'high', 'm': 'medium', 'l': 'low'}
+_FOLLOWUP_CATEGORY = {
+    'vo': 'vitals_outlier', 'dm': 'demographics', 'mh': 'medical_history',
+    'sy': 'symptoms', 'rf': 'risk_factors', 'fa': 'functional_assessment'
+}
+DYNAMIC_CATEGORIES = (
+    "general", "gastrointestinal", "respiratory", "cardiovascular", "neurological",
+    "musculoskeletal", "dermatological", "risk_factors", "history", "medications",
+    "psychological", "temporal", "epidemiological", "physical", "pain", "throat"
+)
+
+
+def compact_output_enabled(family: str) -> bool:
+    """
+    LLM_COMPACT_OUTPUT selects the compact wire schema: "all", or a comma list of
+    prompt families. Unset keeps the verbose schema everywhere.
+    """
+    setting = os.getenv('LLM_COMPACT_OUTPUT', '').strip().lower()
+    if not setting or family not in COMPACT_FAMILIES:
+        return False
+    return setting in ('all', '1', 'true') or family in {f.strip() for f in setting.split(',')}
+
+
+def _row(value, size: int) -> List:
+    """Pad/trim a positional row; a stray scalar becomes the first column."""
+    row = list(value) if isinstance(value, (list, tuple)) else [value]
+    return (row + [None] * size)[:size]
+
+
+def _code(table: Dict[str, str], value, default: str) -> str:
+    text = str(value or '').strip().lower()
+    return table.get(text, text if text in table.values() else default)
+
+
+def _score(value) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _strings(value) -> List[str]:
+    return [str(v) for v in value] if isinstance(value, list) else []
+
+
+def expand_analysis(payload, with_icd: bool = True) -> Dict:
+    """Rebuild the analysis/diagnosis result shape main.js renders from the compact form."""
+    if not isinstance(payload, dict) or 'possible_conditions' in payload:
+        return payload
+
+    conditions = []
+    for raw in payload.get('c') or []:
+        if with_icd:
+            name, score, code, title, why = _row(raw, 5)
+        else:
+            name, score, why = _row(raw, 3)
+        if not name:
+            continue
+        condition = {'condition': str(name), 'confidence_score': _score(score)}
+        if with_icd:
+            condition['icd11_code'] = str(code or '')
+            condition['icd11_title'] = str(title or '')
+        condition['explanation'] = str(why or '')
+        conditions.append(condition)
+
+    tests = []
+    for raw in payload.get('t') or []:
+        name, score, priority, why = _row(raw, 4)
+        if not name:
+            continue
+        tests.append({
+            'test': str(name),
+            'confidence_score': _score(score),
+            'priority': _code(_PRIORITY, priority, 'routine'),
+            'explanation': str(why or '')
+        })
+
+    urgency, timeline, reason = _row(payload.get('fu'), 3)
+    result = {
+        'possible_conditions': conditions,
+        'diagnostic_tests': tests,
+        'red_flags': _strings(payload.get('rf')),
+        'immediate_care': _strings(payload.get('ic')),
+        'lifestyle': _strings(payload.get('ls')),
+        'disclaimer': DISCLAIMER
+    }
+    if payload.get('partial'):
+        result['partial'] = True
+    if payload.get('fu'):
+        result['follow_up'] = {
+            'urgency': _code(_URGENCY, urgency, 'routine'),
+            'timeline': str(timeline or 'As appropriate'),
+            'reason': str(reason or 'Professional evaluation recommended')
+        }
+    return result
+
+
+def _expand_question(category: str, text, kind, detail, relevance) -> Optional[Dict]:
+    if not text:
+        return None
+    question_type = _code(_QUESTION_TYPE, kind, 'textarea')
+    question = {'category': category, 'question': str(text), 'type': question_type}
+    if question_type == 'multiple_choice':
+        question['options'] = _strings(detail)
+    elif question_type == 'scale':
+        low, high, low_label, high_label = _row(detail, 4)
+        question.update({
+            'min': _score(low), 'max': _score(high) or 10,
+            'min_label': str(low_label or ''), 'max_label': str(high_label or '')
+        })
+    else:
+        question['placeholder'] = str(detail or 'Enter details...')
+    question['relevance'] = str(relevance or '')
+    return question
+
+
+def expand_additional_questions(rows) -> List[Dict]:
+    """Compact rows [category, question, type, detail, relevance] -> OLDCARTS question objects."""
+    if not isinstance(rows, list):
+        return rows
+    questions = []
+    for raw in rows:
+        if isinstance(raw, dict):
+            questions.append(raw)
+            continue
+        category, text, kind, detail, relevance = _row(raw, 5)
+        question = _expand_question(str(category or 'characteristics_quality'), text, kind, detail, relevance)
+        if question:
+            question = {'id': len(questions) + 1, **question}
+            questions.append(question)
+    return questions
+
+
+def expand_followup_questions(payload) -> Dict:
+    """Compact {"q", "oa", "do"} -> the D/O follow-up questions response."""
+    if not isinstance(payload, dict) or 'questions' in payload:
+        return payload
+    questions = []
+    for raw in payload.get('q') or []:
+        category, text, kind, detail, relevance, priority = _row(raw, 6)
+        question = _expand_question(_code(_FOLLOWUP_CATEGORY, category, 'symptoms'), text, kind, detail, relevance)
+        if question:
+            question = {'id': len(questions) + 1, **question}
+            question['priority'] = _code(_QUESTION_PRIORITY, priority, 'medium')
+            questions.append(question)
+    result = {
+        'questions': questions,
+        'total_questions': len(questions),
+        'outliers_addressed': _strings(payload.get('oa')),
+        'do_indicators_focus': _strings(payload.get('do'))
+    }
+    if payload.get('partial'):
+        result['partial'] = True
+    return result
+
+
+def expand_dynamic_questions(rows) -> List[Dict]:
+    """Compact rows [probe, category number, notes hint] -> checklist item dicts."""
+    if not isinstance(rows, list):
+        return rows
+    items = []
+    for raw in rows:
+        if isinstance(raw, dict):
+            items.append(raw)
+            continue
+        probe, category, hint = _row(raw, 3)
+        if isinstance(category, int) and 0 <= category < len(DYNAMIC_CATEGORIES):
+            category = DYNAMIC_CATEGORIES[category]
+        items.append({'symptom': probe, 'category': category, 'notes_hint': hint, 'type': 'yes_no_notes'})
+    return items
@@ -0,0 +1,67 @@
+import json
+import time
+import hashlib
+from typing import List, Optional, Tuple
+
+from shared_state import SharedLedger
+
+
+def inputs_fingerprint(symptoms: List[str], has_free_text: bool) -> str:
+    """Hash of what the one-by-one question sequence depends on; a change restarts the interview."""
+    canonical = json.dumps([list(symptoms), bool(has_free_text)], separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def step_cursor(cursor: Optional[List[int]], blocks: int, slots: int) -> Optional[Tuple[int, int]]:
+    """The (block, slot) after `cursor` ((0, 0) for a new interview), or None past the last question."""
+    if cursor is None:
+        block, slot = 0, 0
+    else:
+        block, slot = cursor
+        slot += 1
+        if slot >= slots:
+            block, slot = block + 1, 0
+    return (block, slot) if block < blocks else None
+
+
+class FollowupCursorStore:
+    """
+    Position of each client session in the one-by-one /followup interview: the
+    fingerprint of its inputs and the (symptom index, question slot) last served,
+    shared by every worker through a small ledger. The questions themselves are
+    built on demand from that position, so a session costs a few bytes whether it
+    selected two symptoms or twenty, and an abandoned interview leaves nothing behind
+    but its cursor until it expires.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: int = 3600, ledger: Optional[SharedLedger] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.ledger = ledger or SharedLedger('followup_cursors')
+
+    def advance(self, session_id: str, fp: str, blocks: int, slots: int) -> Optional[Tuple[int, int]]:
+        """
+        Move the session to its next question and return that (block, slot), or None when
+        the interview is complete. A session whose inputs changed starts over.
+        """
+        now = time.time()
+        with self.ledger.transaction() as entries:
+            entry = entries.get(session_id)
+            live = entry and entry.get('fp') == fp and entry.get('at', 0) + self.ttl_seconds > now
+            position = step_cursor(entry['cursor'] if live else None, blocks, slots)
+            if position is None:
+                # Stay past the end so repeated calls keep reporting completion
+                entries[session_id] = {'fp': fp, 'cursor': [blocks, 0], 'at': now}
+            else:
+                entries[session_id] = {'fp': fp, 'cursor': list(position), 'at': now}
+            if len(entries) > self.max_entries:
+                expired = [k for k, e in entries.items() if e.get('at', 0) + self.ttl_seconds < now]
+                oldest = sorted(entries, key=lambda k: entries[k].get('at', 0))
+                for k in set(expired) | set(oldest[:len(entries) - self.max_entries]):
+                    del entries[k]
+        return position
+
+    def reset(self, session_id: str):
+        """Forget the session's position so its next /followup starts a new interview."""
+        with self.ledger.transaction() as entries:
+            entries.pop(session_id, None)
@@ -1,12 +1,25 @@
+import os
+
+from scheduling import WORKER_TIMEOUT
+
 bind = "0.0.0.0:8000"
 workers = 4
 worker_class = "sync"
 worker_connections = 1000
-timeout = 30
+# Above the app's per-request budget (REQUEST_TIMEOUT) with a margin; see scheduling.py
+timeout = WORKER_TIMEOUT
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 50
 preload_app = True
 accesslog = "-"
 errorlog = "-"
-loglevel = "info"
\ No newline at end of file
+loglevel = "info"
+
+
+def when_ready(server):
+    """Pre-fork warm-up: load the OpenAI SDK in the master so workers (and max_requests recycles) start with it."""
+    if os.getenv('PREFORK_WARMUP', '1').strip().lower() in ('0', 'false', 'no'):
+        return
+    from openai_helper import warm_up
+    server.log.info("Pre-fork warm-up: OpenAI SDK imported in %.0f ms", warm_up() * 1000)
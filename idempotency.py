@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import request, jsonify, current_app
+
+from admission import client_ip, client_session_id
+from shared_state import open_private, pid_alive, private_dir, state_dir
+from scheduling import bounded_wait
+
+# Outcomes of IdempotencyStore.begin()
+OWNER = 'owner'        # caller must run the request and complete()/abandon() it
+REPLAY = 'replay'      # a stored response is available
+MISMATCH = 'mismatch'  # key reused with a different request body
+BUSY = 'busy'          # another worker is still computing and did not finish in time
+
+
+class IdempotencyStore:
+    """
+    Bounded TTL store of completed POST responses keyed by Idempotency-Key.
+    Entries are kept in process memory and mirrored to a private spool directory so a
+    duplicate request landing on another gunicorn worker can replay the stored
+    response, or wait for the in-flight computation instead of re-running it.
+
+    An in-flight marker is only taken over when its owner process is gone or it is
+    older than `stale_after`, which should cover the slowest upstream call a request
+    can make; a duplicate that waits longer than `wait_timeout` gets BUSY instead.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 600,
+                 wait_timeout: float = 25.0, stale_after: float = 300.0, spool_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.wait_timeout = wait_timeout
+        self.stale_after = stale_after
+        self.spool_dir = private_dir(spool_dir or os.path.join(state_dir(), 'idempotency'))
+        self._entries = OrderedDict()  # key -> (expires_at, fingerprint, payload)
+        self._inflight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        base = os.path.join(self.spool_dir, digest)
+        return base + '.json', base + '.lock'
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, Dict]]:
+        """Return (fingerprint, payload) for a completed entry, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1], entry[2]
+                del self._entries[key]
+
+        result_path, _ = self._paths(key)
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored.get('expires_at', 0) <= now:
+            return None
+        self._remember(key, stored['expires_at'], stored['fingerprint'], stored['payload'])
+        return stored['fingerprint'], stored['payload']
+
+    def _remember(self, key: str, expires_at: float, fingerprint: str, payload: Dict):
+        with self._lock:
+            self._entries[key] = (expires_at, fingerprint, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @contextmanager
+    def _spool_lock(self):
+        """Exclusive flock on the spool directory, serializing marker takeovers and releases across workers."""
+        fd = os.open(self.spool_dir, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _claim(self, lock_path: str) -> bool:
+        """Atomically create the cross-process in-flight marker, taking over a stale one."""
+        if self._create_marker(lock_path):
+            return True
+        if not self._stale(lock_path):
+            return False
+        # Several workers can find the same marker stale: only one may replace it, and the
+        # others must then see the fresh marker rather than delete it
+        with self._spool_lock():
+            if not self._stale(lock_path):
+                return False
+            try:
+                os.unlink(lock_path)
+            except OSError:
+                return False
+            return self._create_marker(lock_path)
+
+    @staticmethod
+    def _create_marker(lock_path: str) -> bool:
+        """Create the marker holding the owner's pid; False if it already exists."""
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            return False
+        try:
+            os.write(fd, str(os.getpid()).encode('ascii'))
+        finally:
+            os.close(fd)
+        return True
+
+    @staticmethod
+    def _marker_owner(lock_path: str) -> Optional[str]:
+        try:
+            with open(lock_path, 'r', encoding='ascii') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _stale(self, lock_path: str) -> bool:
+        """A marker whose owner exited, or older than stale_after (a hung worker)."""
+        owner = self._marker_owner(lock_path)
+        try:
+            age = time.time() - os.path.getmtime(lock_path)
+        except OSError:
+            return False
+        if owner and owner.isdigit() and not pid_alive(int(owner)):
+            return True
+        return age > self.stale_after
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[Dict]]:
+        """
+        Register a request. Returns (OWNER, None) when the caller should compute the
+        response, (REPLAY, payload) for a stored response, (MISMATCH, None) when the key
+        was used with a different body, or (BUSY, None) if waiting timed out. The wait is
+        bounded by the request's deadline as well as by wait_timeout.
+        """
+        deadline = time.time() + bounded_wait(self.wait_timeout)
+        result_path, lock_path = self._paths(key)
+
+        while True:
+            found = self._lookup(key)
+            if found:
+                return (REPLAY, found[1]) if found[0] == fingerprint else (MISMATCH, None)
+
+            # Attach to a computation running in this process
+            with self._lock:
+                event = self._inflight.get(key)
+                claimed = event is None and self._claim(lock_path)
+                if claimed:
+                    self._inflight[key] = threading.Event()
+            if claimed:
+                # The previous owner may have finished between the lookup and the claim
+                found = self._lookup(key)
+                if found:
+                    self.abandon(key)
+                    return (REPLAY, found[1]) if found[0] == fingerprint else (MISMATCH, None)
+                return OWNER, None
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return BUSY, None
+            if event is not None:
+                event.wait(remaining)
+            else:
+                # Another worker owns the key; poll its spool entry
+                time.sleep(min(0.1, remaining))
+
+    def complete(self, key: str, fingerprint: str, payload: Dict):
+        """Store the response of an owned request and release any waiters."""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, fingerprint, payload)
+        result_path, lock_path = self._paths(key)
+        try:
+            tmp_path = f"{result_path}.{os.getpid()}.tmp"
+            with open_private(tmp_path) as f:
+                json.dump({'expires_at': expires_at, 'fingerprint': fingerprint, 'payload': payload}, f)
+            os.replace(tmp_path, result_path)
+        except OSError as e:
+            print(f"WARN: Could not persist idempotent response: {e}")
+        self._release(key, lock_path)
+
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._prune_spool()
+
+    def abandon(self, key: str):
+        """Release an owned request without storing a response (errors are not replayed)."""
+        _, lock_path = self._paths(key)
+        self._release(key, lock_path)
+
+    def _release(self, key: str, lock_path: str):
+        # A marker taken over from this (hung) worker belongs to its new owner now
+        with self._spool_lock():
+            if self._marker_owner(lock_path) == str(os.getpid()):
+                try:
+                    os.unlink(lock_path)
+                except OSError:
+                    pass
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event:
+            event.set()
+
+    def _prune_spool(self):
+        """Drop expired spool files and keep the directory within max_entries."""
+        now = time.time()
+        try:
+            files = [os.path.join(self.spool_dir, name) for name in os.listdir(self.spool_dir)
+                     if name.endswith('.json')]
+            files.sort(key=os.path.getmtime, reverse=True)
+        except OSError:
+            return
+        for index, path in enumerate(files):
+            try:
+                if index >= self.max_entries or os.path.getmtime(path) + self.ttl_seconds < now:
+                    os.unlink(path)
+            except OSError:
+                continue
+
+
+def idempotent(store: IdempotencyStore):
+    """
+    Route decorator honouring the Idempotency-Key request header, scoped to the route
+    and the client (session, else IP). Requests without the header run normally.
+    Successful responses (status < 400) are stored and replayed for duplicates. A shed
+    request is never replayed: neither a 429 nor a rule-based fallback answered by
+    admission control (a 200 carrying X-Admission), so a retry gets the real response
+    once there is capacity. A duplicate arriving while the first is still running
+    waits for it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key', '').strip()
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > 255:
+                return jsonify({'error': 'Idempotency-Key must be at most 255 characters'}), 400
+
+            # Keys are only unique per client: another client reusing one must not get this response
+            scoped_key = f"{request.path}:{client_session_id() or client_ip()}:{key}"
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            state, payload = store.begin(scoped_key, fingerprint)
+
+            if state == REPLAY:
+                print(f"DEBUG: Replaying idempotent response for {request.path}")
+                response = current_app.response_class(
+                    payload['body'], status=payload['status'], mimetype=payload['mimetype']
+                )
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            if state == MISMATCH:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request body'}), 422
+            if state == BUSY:
+                response = jsonify({'error': 'A request with this Idempotency-Key is still being processed'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                store.abandon(scoped_key)
+                raise
+
+            if response.status_code < 400 and not response.is_streamed and 'X-Admission' not in response.headers:
+                store.complete(scoped_key, fingerprint, {
+                    'status': response.status_code,
+                    'body': response.get_data(as_text=True),
+                    'mimetype': response.mimetype
+                })
+            else:
+                store.abandon(scoped_key)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,222 @@
+import json
+from typing import Optional, Tuple
+
+_OPENERS = {'{': '}', '[': ']'}
+_CLOSERS = {'}', ']'}
+# Cut points remembered for truncated-output repair; older ones are only needed if newer ones fail to parse
+_MAX_CUT_POINTS = 8
+
+
+def _cut_point(cuts, index: int, stack) -> None:
+    """
+    Remember that text[:index] can be closed with the open brackets on `stack`, unless
+    that would keep a half-generated array element: only the innermost open container
+    may sit directly inside an array.
+    """
+    if ']' in stack[:-1]:
+        return
+    cuts.append((index, ''.join(reversed(stack))))
+    if len(cuts) > _MAX_CUT_POINTS:
+        del cuts[0]
+
+
+class JSONExtractionError(ValueError):
+    """Raised when no complete JSON value of the expected type could be found in a completion."""
+
+
+def _scan(text: str, expect: Optional[str], repair: bool) -> Tuple[object, bool]:
+    if not text:
+        raise JSONExtractionError("Empty completion")
+    wanted = {'object': '{', 'array': '['}.get(expect)
+
+    stack = []
+    start = -1
+    cuts = []
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char in _OPENERS:
+            if not stack:
+                # Values of the unwanted type are still walked so their contents are skipped
+                start = index if not wanted or char == wanted else -1
+                cuts = []
+            stack.append(_OPENERS[char])
+            if repair and len(stack) == 1:
+                # Only the top-level value may be closed empty: a nested container with
+                # nothing complete in it is dropped with its key, not kept as {} / []
+                _cut_point(cuts, index + 1, stack)
+        elif not stack:
+            continue
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            if char != stack.pop():
+                # Mismatched bracket: whatever we were inside was not JSON
+                stack.clear()
+                continue
+            if not stack and start >= 0:
+                try:
+                    return json.loads(text[start:index + 1]), False
+                except ValueError:
+                    continue
+            if repair and stack:
+                # Just after a nested value closed: everything before is complete
+                _cut_point(cuts, index + 1, stack)
+        elif char == ',' and repair:
+            # Just before a separator: the preceding element or key/value pair is complete
+            _cut_point(cuts, index, stack)
+
+    if stack and start >= 0 and repair:
+        for cut, closers in reversed(cuts):
+            try:
+                return json.loads(text[start:cut] + closers), True
+            except ValueError:
+                continue
+
+    raise JSONExtractionError(
+        "Completion ended inside a JSON value" if stack else "No complete JSON value in completion"
+    )
+
+
+def _unwrap_array(value):
+    """The array inside a single-key wrapper object such as {"questions": [...]}."""
+    if isinstance(value, dict) and len(value) == 1:
+        inner = next(iter(value.values()))
+        if isinstance(inner, list):
+            return inner
+    raise JSONExtractionError("No JSON array in completion")
+
+
+def extract_json(text: str, expect: Optional[str] = None):
+    """
+    Find and parse the first complete JSON object/array in a model completion, in a
+    single left-to-right pass. Markdown fences and surrounding prose are skipped because
+    scanning only starts at an opening bracket, and string contents (including escaped
+    quotes and brackets) are tracked so they never affect nesting.
+
+    `expect` is 'object' or 'array' to skip top-level values of the other type. With
+    'array', a completion holding only a single-key object that wraps an array (a model
+    answering {"questions": [...]} to a prompt without response_format) yields that array.
+    """
+    try:
+        return _scan(text, expect, repair=False)[0]
+    except JSONExtractionError:
+        if expect != 'array':
+            raise
+        return _unwrap_array(_scan(text, 'object', repair=False)[0])
+
+
+def extract_json_partial(text: str, expect: Optional[str] = None) -> Tuple[object, bool]:
+    """
+    Like extract_json, but when the completion was cut off (e.g. at max_tokens) the
+    value is closed after its last complete element instead of being discarded.
+    Returns (value, partial): arrays keep only the elements that were fully generated
+    (a cut-off trailing element is dropped), a nested value cut off before any of its
+    own content was complete is dropped with its key, and partial is True when such a
+    repair was needed. Array wrappers are unwrapped as in extract_json.
+    """
+    try:
+        return _scan(text, expect, repair=True)
+    except JSONExtractionError:
+        if expect != 'array':
+            raise
+        value, partial = _scan(text, 'object', repair=True)
+        return _unwrap_array(value), partial
+
+
+class JSONArrayItemStream:
+    """
+    Incremental counterpart of extract_json for streamed completions: feed() the text as
+    it arrives and get back each element of one JSON array the moment its closing
+    bracket (or separator, for scalars) has been received. The array is the first
+    top-level array, or with `key` the value of that key in the top-level object.
+    Prose and fences before the value are skipped, and string contents are tracked
+    exactly as in extract_json. Elements that fail to parse are dropped; an element cut
+    off by the end of the stream is never returned.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self.done = False
+        self._text = ''
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = -1
+        self._last_string = None
+        self._pending_key = None
+        self._array_depth = None
+        self._item_start = None
+
+    def _item(self, end: int, items: list) -> None:
+        raw = self._text[self._item_start:end]
+        self._item_start = None
+        try:
+            items.append(json.loads(raw))
+        except ValueError:
+            pass
+
+    def feed(self, chunk: str) -> list:
+        """Add streamed text; returns the array elements completed by it, in order."""
+        items = []
+        if self.done or not chunk:
+            return items
+        offset = len(self._text)
+        self._text += chunk
+        text = self._text
+        for index in range(offset, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._stack == ['}']:
+                        self._last_string = text[self._string_start + 1:index]
+                continue
+
+            depth = len(self._stack)
+            if depth == self._array_depth and self._item_start is None and char not in ' \t\r\n,]':
+                self._item_start = index
+
+            if char in _OPENERS:
+                if self._array_depth is None and char == '[' and (
+                        (self.key is None and depth == 0)
+                        or (self.key is not None and self._stack == ['}'] and self._pending_key == self.key)):
+                    self._array_depth = depth + 1
+                self._stack.append(_OPENERS[char])
+            elif not depth:
+                continue
+            elif char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in _CLOSERS:
+                if char != self._stack.pop():
+                    # Mismatched bracket: nothing more can be trusted
+                    self.done = True
+                    break
+                if self._array_depth is None:
+                    continue
+                if len(self._stack) == self._array_depth and self._item_start is not None:
+                    self._item(index + 1, items)
+                elif len(self._stack) < self._array_depth:
+                    if self._item_start is not None:
+                        self._item(index, items)
+                    self.done = True
+                    break
+            elif char == ',' and depth == self._array_depth and self._item_start is not None:
+                self._item(index, items)
+            elif char == ':' and self._stack == ['}']:
+                self._pending_key = self._last_string
+        return items
@@ -0,0 +1,193 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from symptom_vocabulary import CANONICAL_SYMPTOMS, PHRASES, normalize_symptom
+
+# Fuzzy matches below this similarity (1 - edit distance / length) are ignored
+MIN_SIMILARITY = 0.8
+# Phrases shorter than this only match exactly ("hot" must not match "not")
+MIN_FUZZY_CHARS = 5
+# Candidate phrases must share at least this share of character trigrams with the text (Dice coefficient)
+MIN_TRIGRAM_DICE = 0.4
+
+NEGATION_CUES = {'no', 'not', 'without', 'denies', 'deny', 'denied', 'never', 'none', 'nor', 'negative', 'free'}
+# A negation stops applying at punctuation or at one of these words ("no fever but headache").
+# "and" is not one: "denies fever and chills" denies both (as red_flags._CLAUSE_END)
+SCOPE_TERMINATORS = {'but', 'however', 'although', 'though', 'except', 'yet', 'apart', 'aside'}
+# How many words after a cue a negation can reach
+NEGATION_WINDOW = 5
+
+# Words that need no label for the text to count as understood: function words, time, severity
+FILLER_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'in', 'on', 'at', 'to', 'for', 'with', 'my', 'i', 'im', "i'm", 'ive', "i've",
+    'have', 'has', 'had', 'having', 'am', 'is', 'are', 'was', 'been', 'be', 'some', 'also', 'since', 'from', 'about',
+    'very', 'really', 'quite', 'bit', 'little', 'slight', 'slightly', 'mild', 'moderate', 'severe', 'bad', 'terrible',
+    'constant', 'sometimes', 'often', 'lot', 'lots', 'feel', 'feeling', 'felt', 'got', 'get', 'getting', 'it', 'there',
+    'day', 'days', 'week', 'weeks', 'month', 'months', 'hour', 'hours', 'ago', 'today', 'yesterday', 'tonight',
+    'morning', 'evening', 'night', 'last', 'past', 'few', 'couple', 'two', 'three', 'since', 'started', 'began',
+    'now', 'still', 'worse', 'better', 'but', 'however', 'too', 'as', 'well', 'like', 'kind', 'sort', 'all'
+}
+
+_TOKEN = re.compile(r"[a-z0-9']+|[.,;:!?()]")
+_CLAUSE_BREAK = {'.', ',', ';', ':', '!', '?', '(', ')'}
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Vocabulary phrases and a trigram -> phrase index over them, built once
+_PHRASES: List[Tuple[str, str, set]] = [(phrase, symptom_id, _trigrams(phrase)) for phrase, symptom_id in PHRASES.items()]
+_TRIGRAM_INDEX: Dict[str, List[int]] = {}
+for _index, (_phrase, _, _grams) in enumerate(_PHRASES):
+    for _gram in _grams:
+        _TRIGRAM_INDEX.setdefault(_gram, []).append(_index)
+MAX_PHRASE_WORDS = max(len(phrase.split()) for phrase in PHRASES)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions), capped at limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+@lru_cache(maxsize=16384)
+def best_phrase(text: str) -> Optional[Tuple[str, str, float]]:
+    """(phrase, canonical id, similarity) of the closest vocabulary phrase to `text`, or None."""
+    exact = PHRASES.get(text)
+    if exact:
+        return text, exact, 1.0
+    if len(text) < MIN_FUZZY_CHARS:
+        return None
+
+    grams = _trigrams(text)
+    shared: Dict[int, int] = {}
+    for gram in grams:
+        for index in _TRIGRAM_INDEX.get(gram, ()):
+            shared[index] = shared.get(index, 0) + 1
+
+    best = None
+    for index, count in shared.items():
+        phrase, symptom_id, phrase_grams = _PHRASES[index]
+        if len(phrase) < MIN_FUZZY_CHARS or 2 * count / (len(grams) + len(phrase_grams)) < MIN_TRIGRAM_DICE:
+            continue
+        longest = max(len(phrase), len(text))
+        limit = int(longest * (1 - MIN_SIMILARITY))
+        distance = edit_distance(text, phrase, limit)
+        if distance > limit:
+            continue
+        similarity = 1 - distance / longest
+        if best is None or similarity > best[2]:
+            best = (phrase, symptom_id, similarity)
+    return best
+
+
+def _confidence(similarity: float) -> str:
+    return 'high' if similarity >= 0.95 else 'medium' if similarity >= 0.85 else 'low'
+
+
+def _label_key(symptom_id: str) -> str:
+    """Key matches under the label vocabulary (fever, nausea_vomiting, ...) when the symptom has one."""
+    entry = CANONICAL_SYMPTOMS.get(symptom_id)
+    return entry[0] if entry and entry[0] else symptom_id
+
+
+def match_labels(symptoms: List[str], free_text: str = '') -> Dict:
+    """
+    Local label extraction: selected symptoms through the canonical normalizer, free text
+    through a trigram-indexed edit-distance matcher over the symptom vocabulary, so
+    "hedache" still finds headache. A label preceded by a negation cue in the same clause
+    ("no fever", "without chills") is reported under negated_labels instead.
+
+    Returns the /extract_labels shape (without the correlation matrix) plus `confidence`:
+    the weakest match similarity times the share of non-filler words a label explains.
+    Low confidence means the text says things the vocabulary does not cover.
+    """
+    labels: Dict[str, Dict] = {}
+    negated: Dict[str, Dict] = {}
+    similarities = []
+    content_words = 0
+    explained_words = 0
+
+    for text in symptoms or []:
+        symptom = normalize_symptom(text) if isinstance(text, str) else None
+        if symptom is None:
+            continue
+        content_words += 1
+        if symptom.id in CANONICAL_SYMPTOMS:
+            explained_words += 1
+            similarities.append(1.0)
+            labels.setdefault(_label_key(symptom.id), {
+                'detected': True, 'source': 'symptoms', 'confidence': 'high', 'matched': text
+            })
+
+    tokens = _TOKEN.findall((free_text or '').lower())
+    negation_left = 0
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        if token in _CLAUSE_BREAK or token in SCOPE_TERMINATORS:
+            negation_left = 0
+            position += 1
+            continue
+        if token in NEGATION_CUES or token.endswith("n't"):
+            negation_left = NEGATION_WINDOW
+            position += 1
+            continue
+
+        match = None
+        for size in range(min(MAX_PHRASE_WORDS, len(tokens) - position), 0, -1):
+            words = tokens[position:position + size]
+            if any(w in _CLAUSE_BREAK for w in words):
+                continue
+            found = best_phrase(' '.join(words))
+            if found and found[2] >= MIN_SIMILARITY:
+                match = (size, words, found)
+                break
+
+        if match is None:
+            if token not in FILLER_WORDS and not token.isdigit():
+                content_words += 1
+            negation_left = max(0, negation_left - 1)
+            position += 1
+            continue
+
+        size, words, (phrase, symptom_id, similarity) = match
+        content_words += size
+        explained_words += size
+        similarities.append(similarity)
+        key = _label_key(symptom_id)
+        entry = {'detected': negation_left == 0, 'source': 'free_text', 'confidence': _confidence(similarity),
+                 'matched': ' '.join(words)}
+        if negation_left:
+            if key not in labels:
+                negated.setdefault(key, entry)
+        else:
+            negated.pop(key, None)
+            labels.setdefault(key, entry)
+        negation_left = max(0, negation_left - size)
+        position += size
+
+    coverage = explained_words / content_words if content_words else 0.0
+    confidence = round(min(similarities) * coverage, 3) if similarities else 0.0
+    return {
+        'extracted_labels': labels,
+        'negated_labels': negated,
+        'label_count': len(labels),
+        'confidence': confidence
+    }
@@ -0,0 +1,44 @@
+import time
+from typing import Dict, Optional
+
+from shared_state import SharedLedger
+
+
+class MetricsRegistry:
+    """
+    Host-wide counters and summaries shared by all gunicorn workers. Values are
+    grouped by metric name and a label string, e.g. ('llm_queue_wait_seconds',
+    'critical/analysis'), and exposed as JSON by the /metrics route.
+    """
+
+    def __init__(self, ledger: Optional[SharedLedger] = None):
+        self.ledger = ledger or SharedLedger('metrics')
+
+    def increment(self, name: str, label: str = '', amount: float = 1):
+        with self.ledger.transaction() as data:
+            series = data.setdefault(name, {})
+            series[label] = series.get(label, 0) + amount
+
+    def observe(self, name: str, label: str, value: float):
+        """Record one sample into a count/sum/max summary."""
+        with self.ledger.transaction() as data:
+            summary = data.setdefault(name, {}).setdefault(label, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['max'] = max(summary['max'], value)
+
+    def snapshot(self) -> Dict:
+        data = self.ledger.read()
+        for series in data.values():
+            for summary in series.values():
+                if isinstance(summary, dict) and summary.get('count'):
+                    summary['avg'] = summary['sum'] / summary['count']
+        data['generated_at'] = time.time()
+        return data
+
+    def reset(self):
+        with self.ledger.transaction() as data:
+            data.clear()
+
+
+metrics = MetricsRegistry()
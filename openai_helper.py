@@ -1,40 +1,569 @@
 import os
 import json
-import re
 import time
 import random
-from openai import OpenAI
-from typing import List, Dict
+import queue
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
+
+import red_flags
+from metrics import metrics
+from prompt_templates import (
+    ANALYSIS_PROMPT, DIAGNOSIS_PROMPT, PATIENT_SUMMARY_PROMPT, FOLLOWUP_QUESTIONS_PROMPT,
+    SYMPTOM_SUGGESTIONS_PROMPT, DYNAMIC_QUESTIONS_PROMPT, LABEL_EXTRACTION_PROMPT, ADDITIONAL_QUESTIONS_PROMPT,
+    ANALYSIS_COMPACT_PROMPT, DIAGNOSIS_COMPACT_PROMPT, FOLLOWUP_QUESTIONS_COMPACT_PROMPT,
+    DYNAMIC_QUESTIONS_COMPACT_PROMPT, ADDITIONAL_QUESTIONS_COMPACT_PROMPT,
+    ANALYSIS_CONDITIONS_PROMPT, ANALYSIS_TESTS_PROMPT, ANALYSIS_CARE_PROMPT, PATIENT_CONTEXT_PROMPT, PROMPTS,
+    prompt_version
+)
+from json_extract import JSONExtractionError, JSONArrayItemStream, extract_json, extract_json_partial
+from patient_context import build_digest
+from symptom_vocabulary import SYMPTOM_LABELS, symptom_terms
+from label_matcher import match_labels
+from questionnaire_cache import additional_profile, profile_patient_data, structured_profile
+from followup_cursor import inputs_fingerprint, step_cursor
+from clinical_models import ChecklistItem, FollowupQuestion, VitalsFinding, options
+from quota_governor import estimate_text_tokens
+from scheduling import CallDeadlineExceeded, bounded_wait, call_deadline, time_left
+from compact_schema import (
+    DYNAMIC_CATEGORIES, compact_output_enabled, expand_analysis, expand_additional_questions,
+    expand_followup_questions, expand_dynamic_questions
+)
+
+# Per-attempt OpenAI request timeout; _make_openai_request_with_retry makes up to OPENAI_REQUEST_ATTEMPTS
+OPENAI_REQUEST_TIMEOUT = float(os.getenv('OPENAI_REQUEST_TIMEOUT', 60))
+OPENAI_REQUEST_ATTEMPTS = 3
+
+# Send each prompt family's response_format (strict JSON schema or JSON mode); "0" falls back to free text
+STRUCTURED_OUTPUT = os.getenv('LLM_STRUCTURED_OUTPUT', '1').strip().lower() not in ('0', 'false', 'no')
+
+# Optional fan-out of analyze_symptoms into concurrent part prompts (takes precedence over compact output).
+# The same per-process pool runs the Patient History Followup summary/questions pair.
+ANALYSIS_FANOUT = os.getenv('ANALYSIS_FANOUT', '0').strip().lower() in ('1', 'true', 'yes')
+ANALYSIS_FANOUT_WORKERS = int(os.getenv('ANALYSIS_FANOUT_WORKERS', 6))
+ANALYSIS_PART_TIMEOUT = float(os.getenv('ANALYSIS_PART_TIMEOUT', 25))
+# Condense the narrative patient-context fields with one LLM call per session once they exceed this many tokens
+PATIENT_CONTEXT_SUMMARIZE = os.getenv('PATIENT_CONTEXT_SUMMARIZE', '0').strip().lower() in ('1', 'true', 'yes')
+PATIENT_CONTEXT_SUMMARY_MIN_TOKENS = int(os.getenv('PATIENT_CONTEXT_SUMMARY_MIN_TOKENS', 200))
+# Local fuzzy label matches at or above this confidence are returned without asking the LLM
+LABEL_MATCH_MIN_CONFIDENCE = float(os.getenv('LABEL_MATCH_MIN_CONFIDENCE', 0.75))
+NARRATIVE_CONTEXT_FIELDS = ('medical_history', 'history', 'lifestyle', 'medical_records')
+# (part, template, max_tokens, response keys it fills)
+ANALYSIS_PARTS = (
+    ('conditions', ANALYSIS_CONDITIONS_PROMPT, 800, ('possible_conditions',)),
+    ('tests', ANALYSIS_TESTS_PROMPT, 500, ('diagnostic_tests',)),
+    ('care', ANALYSIS_CARE_PROMPT, 600, ('red_flags', 'immediate_care', 'follow_up', 'lifestyle')),
+)
+
+# One-by-one /followup interview: three questions per selected symptom ({symptom} is its
+# name), the second chosen by whether the symptom has an intensity, then three for free text
+QUESTIONS_PER_SYMPTOM = 3
+SYMPTOM_QUESTION_TEMPLATES = {
+    0: {
+        'question': 'When did your {symptom} first appear, and how has the timing pattern been?',
+        'type': 'multiple_choice',
+        'options': options(
+            'Sudden onset - appeared within minutes',
+            'Gradual onset - developed over hours',
+            'Started days ago and persisting',
+            'Started weeks/months ago',
+            'Recurring episodes - comes and goes',
+            'Daily at specific times (morning/evening)',
+            'Triggered by specific activities',
+            'Constant since it started'
+        ),
+        'help_text': 'Understanding onset and timing patterns helps identify the underlying cause',
+        'diagnostic_purpose': 'Analyze temporal characteristics and patterns of {symptom}',
+        'question_category': 'onset_timing'
+    },
+    2: {
+        'question': 'What specific characteristics, triggers, or factors affect your {symptom}?',
+        'type': 'textarea',
+        'placeholder': 'Describe: What does the {symptom} feel like? What makes it worse or better? Any specific triggers (food, stress, position, weather, etc.)? How does it affect your daily activities?',
+        'help_text': 'Detailed characteristics and modifying factors are crucial for accurate diagnosis',
+        'diagnostic_purpose': 'Identify quality, triggers, relieving factors, and functional impact of {symptom}',
+        'question_category': 'characteristics_triggers'
+    }
+}
+SYMPTOM_QUESTION_VARIANTS = {
+    'intensity_duration': {
+        'question': 'How would you describe the intensity and duration of your {symptom} episodes?',
+        'type': 'multiple_choice',
+        'options': options(
+            'Mild intensity - lasts few minutes',
+            'Mild intensity - lasts hours',
+            'Moderate intensity - brief episodes',
+            'Moderate intensity - lasts several hours',
+            'Severe intensity - short bursts',
+            'Severe intensity - prolonged episodes',
+            'Very severe - debilitating when present',
+            'Varies greatly in intensity and duration'
+        ),
+        'help_text': 'Intensity and duration patterns help assess severity and underlying pathology',
+        'diagnostic_purpose': 'Assess severity characteristics and episode duration of {symptom}',
+        'question_category': 'intensity_duration'
+    },
+    'frequency_pattern': {
+        'question': 'How often does your {symptom} occur and how long does it typically last?',
+        'type': 'multiple_choice',
+        'options': options(
+            'Constant and continuous',
+            'Several times daily',
+            'Once daily at regular times',
+            'Few times per week',
+            'Intermittent with no clear pattern',
+            'Only during specific activities',
+            'Mainly at night or morning',
+            'Triggered by certain situations'
+        ),
+        'help_text': 'Frequency patterns help identify triggers and underlying mechanisms',
+        'diagnostic_purpose': 'Determine frequency and persistence patterns of {symptom}',
+        'question_category': 'frequency_pattern'
+    }
+}
+FREE_TEXT_QUESTIONS = (
+    {
+        'question': 'For the symptoms you described, when did they first appear and what is their timing pattern?',
+        'type': 'multiple_choice',
+        'options': options(
+            'All started suddenly at the same time',
+            'Appeared gradually over days/weeks',
+            'Different symptoms started at different times',
+            'Symptoms come and go together',
+            'Some constant, others intermittent',
+            'Mainly occur at specific times of day',
+            'Triggered by specific situations',
+            'Present for months/years'
+        ),
+        'help_text': 'Timeline helps understand if symptoms are related or separate conditions',
+        'diagnostic_purpose': 'Establish temporal relationship between patient-described symptoms',
+        'symptom_focus': 'free_text_symptoms',
+        'question_category': 'onset_timing'
+    },
+    {
+        'question': 'How severe are your described symptoms and how do they impact your daily life?',
+        'type': 'multiple_choice',
+        'options': options(
+            'Mild - barely noticeable, no impact on activities',
+            'Mild to moderate - some discomfort but manageable',
+            'Moderate - interferes with some daily activities',
+            'Moderate to severe - significant impact on work/life',
+            'Severe - greatly limits daily functioning',
+            'Very severe - unable to perform normal activities',
+            'Severity varies greatly throughout the day',
+            'Progressive worsening over time'
+        ),
+        'help_text': 'Severity and functional impact help prioritize treatment urgency',
+        'diagnostic_purpose': 'Assess overall severity and functional impact of described symptoms',
+        'symptom_focus': 'free_text_symptoms',
+        'question_category': 'severity_impact'
+    },
+    {
+        'question': 'What specific details can you provide about your symptoms - their character, what triggers them, and what provides relief?',
+        'type': 'textarea',
+        'placeholder': 'Please describe: Exact nature/quality of each symptom, any patterns you\'ve noticed, what makes them worse, what helps, any associated factors (stress, food, weather, position), medications tried, etc.',
+        'help_text': 'Detailed symptom characteristics are essential for accurate diagnosis',
+        'diagnostic_purpose': 'Gather comprehensive qualitative information about patient-described symptoms',
+        'symptom_focus': 'free_text_symptoms',
+        'question_category': 'detailed_characteristics'
+    }
+)
+# Template fields that name the symptom, filled in per question
+_SYMPTOM_FIELDS = {
+    id(template): tuple(field for field, value in template.items() if isinstance(value, str) and '{symptom}' in value)
+    for template in (*SYMPTOM_QUESTION_TEMPLATES.values(), *SYMPTOM_QUESTION_VARIANTS.values())
+}
+
+# Rule-based D/O follow-up questions (_generate_fallback_followup_questions); {values} is the vitals reading
+FALLBACK_OUTLIER_QUESTIONS = {
+    'critical': {
+        'hypertensive_crisis': FollowupQuestion(
+            'vitals_outlier',
+            'Your blood pressure is critically high ({values}). Are you experiencing severe headaches, chest pain, or difficulty breathing?',
+            'multiple_choice', 'Critical hypertension assessment - immediate medical evaluation needed', 'high',
+            options('No symptoms', 'Mild headache', 'Severe headache', 'Chest pain', 'Difficulty breathing')
+        ),
+        'high_fever': FollowupQuestion(
+            'vitals_outlier', 'You have a high fever ({values}). How long have you had this fever?',
+            'multiple_choice', 'High fever duration assessment for infection severity', 'high',
+            options('Less than 6 hours', '6-12 hours', '1-2 days', 'More than 2 days')
+        )
+    },
+    'moderate': {
+        'fever': FollowupQuestion(
+            'vitals_outlier', 'You have a fever ({values}). Have you taken any fever-reducing medications?',
+            'multiple_choice', 'Fever management assessment for treatment planning', 'medium',
+            options('No medications taken', 'Acetaminophen/Tylenol', 'Ibuprofen/Advil', 'Other pain relievers')
+        ),
+        'tachycardia': FollowupQuestion(
+            'vitals_outlier', 'Your heart rate is elevated ({values}). Do you feel your heart racing or pounding?',
+            'multiple_choice', 'Tachycardia symptom assessment for cardiac evaluation', 'medium',
+            options('No awareness of heartbeat', 'Slight awareness', 'Noticeable pounding', 'Very uncomfortable pounding')
+        )
+    }
+}
+FALLBACK_SENIOR_QUESTION = FollowupQuestion(
+    'demographics', 'As a senior patient, do you have any difficulty with balance or have you had any recent falls?',
+    'multiple_choice', 'Age-related fall risk assessment for elderly patients', 'medium',
+    options('No balance issues', 'Occasional unsteadiness', 'Frequent balance problems', 'Recent falls')
+)
+FALLBACK_PEDIATRIC_QUESTION = FollowupQuestion(
+    'demographics', 'For pediatric patients, have there been any recent changes in eating, sleeping, or behavior patterns?',
+    'multiple_choice', 'Pediatric health pattern assessment', 'medium',
+    options('No changes', 'Eating changes', 'Sleep changes', 'Behavior changes', 'Multiple changes')
+)
+FALLBACK_PREGNANCY_QUESTION = FollowupQuestion(
+    'demographics', 'Are you currently pregnant, breastfeeding, or could you be pregnant?',
+    'multiple_choice', 'Female reproductive status for medication and treatment safety', 'high',
+    options('Not pregnant', 'Possibly pregnant', 'Currently pregnant', 'Breastfeeding')
+)
+FALLBACK_DIABETES_QUESTION = FollowupQuestion(
+    'medical_history', 'How well has your diabetes been controlled in the past month?',
+    'multiple_choice', 'Diabetes management assessment affects treatment decisions', 'medium',
+    options('Very well controlled', 'Moderately controlled', 'Poorly controlled', 'Not monitoring')
+)
+FALLBACK_FUNCTION_QUESTION = FollowupQuestion(
+    'functional_assessment', 'How much do your current symptoms interfere with your daily activities?',
+    'scale', 'Functional impact assessment for treatment urgency', 'medium',
+    scale=(1, 10, 'No interference', 'Cannot function')
+)
+FALLBACK_ONSET_QUESTION = FollowupQuestion(
+    'symptoms', 'When did you first notice your current symptoms?',
+    'multiple_choice', 'Symptom onset timing crucial for diagnosis and urgency', 'high',
+    options('Within the last hour', 'Within the last day', '2-7 days ago', 'More than a week ago')
+)
+FALLBACK_GENERAL_QUESTION = FollowupQuestion(
+    'general_health', 'Please describe any other symptoms or concerns you would like the doctor to know about.',
+    'textarea', 'Additional information gathering for comprehensive assessment', 'low',
+    placeholder='Describe any additional symptoms, concerns, or relevant information...'
+)
+
+# Structured symptom checklist (_generate_structured_symptom_questions): rows every case gets
+BASE_CHECKLIST = (
+    ChecklistItem("Fever is continuous (no breaks)", "general", "e.g., constant vs up/down"),
+    ChecklistItem("Fever spikes at certain times daily", "general", "Mention time of spikes"),
+    ChecklistItem("Chills or shivering present", "general"),
+    ChecklistItem("Vomiting even without eating", "gastrointestinal"),
+    ChecklistItem("Vomiting only after food", "gastrointestinal"),
+    ChecklistItem("Stool watery", "gastrointestinal"),
+    ChecklistItem("Stool with mucus", "gastrointestinal"),
+    ChecklistItem("Stool with blood", "gastrointestinal"),
+    ChecklistItem("Abdominal pain constant", "gastrointestinal"),
+    ChecklistItem("Abdominal pain comes in waves (cramps)", "gastrointestinal"),
+    ChecklistItem("Pain spreads to back/shoulder", "pain"),
+    ChecklistItem("Rash on skin", "dermatological"),
+    ChecklistItem("Yellowing of eyes/skin", "general"),
+    ChecklistItem("Severe headache", "neurological"),
+    ChecklistItem("Joint or muscle pain", "musculoskeletal"),
+    ChecklistItem("Recent outside food / street food", "risk_factors", "Give date/place"),
+    ChecklistItem("Recent travel", "risk_factors", "Where/when"),
+    ChecklistItem("Contact with someone sick", "risk_factors", "Who/when")
+)
+# Rows added for the case type
+CASE_CHECKLISTS = {
+    "accident": (
+        ChecklistItem("Loss of consciousness", "neurological", "How long"),
+        ChecklistItem("Memory loss around the event", "neurological"),
+        ChecklistItem("Confusion or disorientation", "neurological"),
+        ChecklistItem("Difficulty speaking clearly", "neurological"),
+        ChecklistItem("Numbness or tingling", "neurological", "Where"),
+        ChecklistItem("Vision changes", "neurological", "Describe"),
+        ChecklistItem("Difficulty moving limbs", "musculoskeletal", "Which limbs"),
+        ChecklistItem("Visible deformity", "physical", "Location"),
+        ChecklistItem("Swelling at injury site", "physical"),
+        ChecklistItem("Bruising or discoloration", "physical", "Color/location")
+    ),
+    "infection": (
+        ChecklistItem("Known outbreak in area", "epidemiological", "What disease"),
+        ChecklistItem("Others in household sick", "epidemiological", "How many"),
+        ChecklistItem("Exposure to animals", "risk_factors", "What animals"),
+        ChecklistItem("Insect or tick bites", "risk_factors", "When/where"),
+        ChecklistItem("Drinking untreated water", "risk_factors", "Source"),
+        ChecklistItem("Night sweats", "general", "How often"),
+        ChecklistItem("Swollen lymph nodes", "general", "Location"),
+        ChecklistItem("Difficulty swallowing", "throat"),
+        ChecklistItem("Cough with blood", "respiratory", "Amount"),
+        ChecklistItem("Rapid breathing", "respiratory")
+    ),
+    "sick": (
+        ChecklistItem("Gradual onset over days", "temporal", "How many days"),
+        ChecklistItem("Sudden onset within hours", "temporal", "Exact time"),
+        ChecklistItem("Symptoms getting worse", "temporal", "How fast"),
+        ChecklistItem("Previous similar episodes", "history", "When"),
+        ChecklistItem("Family history of similar illness", "history", "Who"),
+        ChecklistItem("Taking any medications", "medications", "List all"),
+        ChecklistItem("Missed medication doses", "medications", "Which ones"),
+        ChecklistItem("New medications started", "medications", "When started"),
+        ChecklistItem("Stress or emotional changes", "psychosocial", "What kind")
+    ),
+    "addiction": (
+        ChecklistItem("Withdrawal symptoms", "addiction", "Which symptoms"),
+        ChecklistItem("Craving for substance", "addiction", "How strong"),
+        ChecklistItem("Last substance use", "addiction", "When exactly"),
+        ChecklistItem("Amount typically used", "addiction", "Daily amount"),
+        ChecklistItem("Shaking or tremors", "neurological", "Which parts"),
+        ChecklistItem("Anxiety or panic", "psychological", "Severity"),
+        ChecklistItem("Hallucinations", "psychological", "Visual/auditory"),
+        ChecklistItem("Sleep disturbances", "general", "How many hours"),
+        ChecklistItem("Loss of appetite", "general", "For how long"),
+        ChecklistItem("Rapid heart rate", "cardiovascular")
+    )
+}
+# Rows added when a selected symptom (or another name of it, see symptom_terms) contains one of the keywords
+SYMPTOM_CHECKLISTS = (
+    (('pain', 'ache', 'hurt'), (
+        ChecklistItem("Pain radiates to other areas", "pain", "Where"),
+        ChecklistItem("Pain worse with movement", "pain", "Which movements"),
+        ChecklistItem("Pain relief with rest", "pain", "How much relief")
+    )),
+    (('cough', 'breathing'), (
+        ChecklistItem("Cough produces phlegm", "respiratory", "Color/amount"),
+        ChecklistItem("Shortness of breath at rest", "respiratory"),
+        ChecklistItem("Wheezing sounds", "respiratory", "When"),
+        ChecklistItem("Chest tightness", "respiratory")
+    )),
+    (('fever', 'temperature'), (
+        ChecklistItem("Fever measured with thermometer", "general", "Exact temperature"),
+        ChecklistItem("Fever responds to medication", "general", "Which medication"),
+        ChecklistItem("Fever pattern changes", "general", "How")
+    ))
+)
+# Rows added when the free text contains one of the keywords
+FREE_TEXT_CHECKLISTS = (
+    (('dizziness', 'dizzy'), ChecklistItem("Dizziness when standing up", "neurological", "How severe")),
+    (('fatigue', 'tired'), ChecklistItem("Fatigue interferes with daily activities", "general", "What activities"))
+)
+
+
+def warm_up() -> float:
+    """
+    Import the OpenAI SDK ahead of time and return the seconds it took. Called from the
+    gunicorn master (see gunicorn.conf.py) so the modules are loaded once before fork and
+    shared by every worker; the client itself is still built per worker on first use.
+    """
+    started = time.perf_counter()
+    import openai  # noqa: F401
+    import openai.types.chat  # noqa: F401
+    return time.perf_counter() - started
+
+
+def _valid_question(question) -> bool:
+    """Per-item check of a streamed question against the shape main.js renders."""
+    if not isinstance(question, dict) or not str(question.get('question') or '').strip():
+        return False
+    if not isinstance(question.get('category'), str):
+        return False
+    kind = question.get('type')
+    if kind == 'multiple_choice':
+        options = question.get('options')
+        return isinstance(options, list) and len(options) >= 2
+    if kind == 'scale':
+        return all(isinstance(question.get(k), (int, float)) for k in ('min', 'max'))
+    return kind == 'textarea'
+
 
 class OpenAIHelper:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    def __init__(self, upstream_limiter=None, quota_governor=None, token_tuner=None, context_cache=None,
+                 questionnaire_cache=None, followup_cursors=None):
+        # The OpenAI client (and the SDK import behind it) is created on first use, per process
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
         self.model = "gpt-4.1-nano"  # Updated to use gpt-4.1-nano as requested
+        # Optional host-wide, priority-ordered pool of concurrent OpenAI calls (see scheduling.PriorityUpstreamScheduler)
+        self.upstream_limiter = upstream_limiter
+        # Optional host-wide RPM/TPM governor (see quota_governor.QuotaGovernor)
+        self.quota_governor = quota_governor
+        # Optional finish_reason-driven max_tokens tuning per prompt family (see token_budget.MaxTokensTuner)
+        self.token_tuner = token_tuner
+        # Optional per-session patient-context digest store (see patient_context.PatientContextCache)
+        self.context_cache = context_cache
+        # Optional disk-persisted questionnaires by canonical profile (see questionnaire_cache.QuestionnaireCache)
+        self.questionnaire_cache = questionnaire_cache
+        # Optional per-session positions in the one-by-one /followup flow (see followup_cursor.FollowupCursorStore)
+        self.followup_cursors = followup_cursors
+        self._fanout_executor = None
+        self._fanout_pid = None
+        self._fanout_lock = threading.Lock()
         self.question_history = []
         self.symptom_analysis_state = {
             'all_questions': [],  # Pre-generated list of all questions
             'current_question_index': 0,  # Current position in the question sequence
             'total_questions': 0,  # Total number of questions to ask
             'symptoms_processed': False,  # Whether we've generated all questions
-            # New: state for individual follow-up questions flow
-            'individual_questions': [],
-            'individual_index': 0
+            # New: position in the individual follow-up questions flow (see get_next_followup_question)
+            'individual_fp': None,
+            'individual_cursor': None
         }
 
-    def _clean_json_response(self, content: str) -> str:
-        """Clean the response content by removing markdown code blocks and other formatting."""
-        # Remove markdown code blocks
-        content = re.sub(r'```(?:json)?\s*(.*?)\s*```', r'\1', content, flags=re.DOTALL)
-        # Remove leading/trailing whitespace and newlines
-        content = content.strip()
-        return content
+    @property
+    def client(self):
+        """
+        The OpenAI client, built on first use. The SDK (pydantic models, httpx) is most of
+        the app's import time, so it is only imported once a request needs it, and a client
+        inherited across a fork is replaced so workers never share its connection pool.
+        """
+        if self._client is None or self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    from openai import OpenAI
+                    # Retries happen in _make_openai_request_with_retry, within the request's deadline
+                    self._client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), timeout=OPENAI_REQUEST_TIMEOUT,
+                                          max_retries=0)
+                    self._client_pid = os.getpid()
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+        self._client_pid = os.getpid()
+
+    def _parse_json_response(self, prompt_family: str, response, expect: str = None):
+        """
+        Parse the JSON payload of a completion in one pass (fences and stray prose are
+        skipped). Failures are counted per prompt family before being re-raised.
 
-    def _make_openai_request_with_retry(self, request_func, max_retries=3, base_delay=1):
+        When the completion stopped at max_tokens, the complete elements generated so far
+        are salvaged instead of discarded; object payloads are then marked 'partial'.
+        """
+        choice = response.choices[0]
+        content = choice.message.content or ''
+        try:
+            if getattr(choice, 'finish_reason', None) != 'length':
+                return extract_json(content, expect)
+            payload, partial = extract_json_partial(content, expect)
+        except JSONExtractionError:
+            metrics.increment('llm_json_parse_failures', prompt_family)
+            raise
+        if partial:
+            print(f"WARN: {prompt_family} completion hit max_tokens; returning salvaged partial result")
+            metrics.increment('llm_partial_responses', prompt_family)
+            if isinstance(payload, dict):
+                payload['partial'] = True
+        return payload
+
+    def _create_chat_completion(self, prompt_family: str, messages: List[Dict], **params):
+        """
+        Single entry point for chat.completions.create. Applies the template's structured
+        response_format, reserves host-wide quota and only then an upstream slot, reconciles
+        its reservation with response.usage after, and records per prompt-version call and
+        input-token metrics, including the cached prompt tokens reported in
+        usage.prompt_tokens_details. The call-site max_tokens is a default: the token
+        tuner replaces it from observed completion lengths and finish_reason.
+        """
+        label, default_max_tokens = self._prepare_completion(prompt_family, params)
+        # Quota first: an upstream slot is only held while the call is actually in flight.
+        # Under a call deadline every wait, and the request itself, is bounded by the time left.
+        reservation = (self.quota_governor.acquire(messages, params.get('max_tokens'), max_wait=time_left())
+                       if self.quota_governor else None)
+        dispatched = False
+        try:
+            with self._upstream_slot(time_left()):
+                left = time_left()
+                if left is not None:
+                    params['timeout'] = left
+                dispatched = True
+                response = self.client.chat.completions.create(model=self.model, messages=messages, **params)
+        except Exception:
+            if reservation is not None:
+                self._settle_failed(reservation, dispatched)
+            raise
+        if reservation is not None:
+            self.quota_governor.reconcile(reservation, getattr(response, 'usage', None))
+
+        choices = getattr(response, 'choices', None)
+        self._record_completion(label, prompt_family, getattr(response, 'usage', None),
+                                choices[0].finish_reason if choices else None, bool(choices), default_max_tokens)
+        return response
+
+    def _stream_chat_completion(self, prompt_family: str, messages: List[Dict], outcome: Optional[Dict] = None,
+                                **params):
+        """
+        Streaming counterpart of _create_chat_completion: yields the completion text as
+        it arrives. The upstream slot and the quota reservation are held until the
+        stream ends, and are settled from the final usage chunk like a normal call.
+        Not retried, since part of the output may already have been used.
+        When given, outcome['finish_reason'] is set once the stream has ended.
+        Bounded by the call deadline like a normal call; a stream still running when it
+        passes is cut off with CallDeadlineExceeded.
+        """
+        label, default_max_tokens = self._prepare_completion(prompt_family, params)
+        params.update(stream=True, stream_options={'include_usage': True})
+        usage = finish_reason = None
+        reservation = (self.quota_governor.acquire(messages, params.get('max_tokens'), max_wait=time_left())
+                       if self.quota_governor else None)
+        dispatched = False
+        try:
+            with self._upstream_slot(time_left()):
+                left = time_left()
+                if left is not None:
+                    params['timeout'] = left
+                dispatched = True
+                for chunk in self.client.chat.completions.create(model=self.model, messages=messages, **params):
+                    time_left()
+                    if getattr(chunk, 'usage', None) is not None:
+                        usage = chunk.usage
+                    for choice in getattr(chunk, 'choices', None) or []:
+                        finish_reason = choice.finish_reason or finish_reason
+                        text = getattr(choice.delta, 'content', None)
+                        if text:
+                            yield text
+        finally:
+            if reservation is not None:
+                if dispatched:
+                    self.quota_governor.reconcile(reservation, usage)
+                else:
+                    self.quota_governor.release(reservation)
+        if outcome is not None:
+            outcome['finish_reason'] = finish_reason
+        self._record_completion(label, prompt_family, usage, finish_reason, True, default_max_tokens)
+
+    def _settle_failed(self, reservation: str, dispatched: bool):
+        """A failed call still counts towards RPM once sent; one that never went out frees its reservation."""
+        if dispatched:
+            self.quota_governor.reconcile(reservation, None)
+        else:
+            self.quota_governor.release(reservation)
+
+    def _upstream_slot(self, timeout: Optional[float] = None):
+        """One slot of the host-wide upstream pool (see scheduling.PriorityUpstreamScheduler), if configured."""
+        return self.upstream_limiter.slot(timeout) if self.upstream_limiter is not None else contextlib.nullcontext()
+
+    def _prepare_completion(self, prompt_family: str, params: Dict):
+        """Fill in response_format and tuned max_tokens; returns (metrics label, call-site max_tokens)."""
+        label = prompt_version(prompt_family) or prompt_family
+        metrics.increment('llm_calls', label)
+        template = PROMPTS.get(prompt_family)
+        if STRUCTURED_OUTPUT and template is not None and template.response_format and 'response_format' not in params:
+            params['response_format'] = template.response_format
+        default_max_tokens = params.get('max_tokens')
+        if self.token_tuner is not None and default_max_tokens:
+            # Sized per prompt version, so a reworded prompt starts from its call-site default
+            params['max_tokens'] = self.token_tuner.max_tokens(label, default_max_tokens)
+        return label, default_max_tokens
+
+    def _record_completion(self, label: str, prompt_family: str, usage, finish_reason, completed: bool,
+                           default_max_tokens):
+        if usage is not None and getattr(usage, 'prompt_tokens', None) is not None:
+            metrics.observe('llm_prompt_tokens', label, usage.prompt_tokens)
+            # Provider-side prefix cache hits; hit rate = cached / prompt tokens per family
+            details = getattr(usage, 'prompt_tokens_details', None)
+            cached = getattr(details, 'cached_tokens', None) or 0
+            metrics.increment('llm_prompt_tokens_total', prompt_family, usage.prompt_tokens)
+            metrics.increment('llm_cached_prompt_tokens', prompt_family, cached)
+        if self.token_tuner is not None and completed:
+            self.token_tuner.record(label, finish_reason, getattr(usage, 'completion_tokens', None), default_max_tokens)
+
+    def _make_openai_request_with_retry(self, request_func, max_retries=OPENAI_REQUEST_ATTEMPTS, base_delay=1):
         """
         Make OpenAI API request with exponential backoff retry logic to handle 500 errors.
         """
         for attempt in range(max_retries):
             try:
+                # The upstream slot is taken inside the call, so none is held during backoff
                 return request_func()
             except Exception as e:
                 error_message = str(e).lower()
@@ -44,6 +573,9 @@ class OpenAIHelper:
                     if attempt < max_retries - 1:  # Don't sleep on the last attempt
                         # Exponential backoff with jitter
                         delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                        left = time_left()
+                        if left is not None and delay >= left:
+                            raise CallDeadlineExceeded(f"LLM call abandoned: no time left to retry after {e}")
                         print(f"OpenAI API error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay:.2f} seconds...")
                         time.sleep(delay)
                         continue
@@ -55,96 +587,83 @@ class OpenAIHelper:
         raise Exception(f"Failed to complete OpenAI request after {max_retries} attempts")
 
     def get_symptom_suggestions(self, user_input: str) -> List[str]:
-        # Create a comprehensive prompt for symptom matching
-        prompt = f"""User input: '{user_input}'
-        Provide EXACTLY 10 relevant medical symptoms as suggestions.
-
-        Guidelines:
-        1. Ensure direct relevance to the input
-        2. Include both exact matches and related symptoms
-        3. Use simple, everyday language
-        4. Keep descriptions to 2-4 words
-        5. List EXACTLY 10 suggestions, no more, no less
-        6. Format: "symptom (brief description)"
-
-        Example format for "headache":
-        [
-            "headache (pain in head)",
-            "migraine (severe pulsing headache)",
-            "tension headache (tight band feeling)",
-            "sinus pain (face pressure)",
-            "neck pain (stiff neck)",
-            "dizziness (room spinning)",
-            "eye strain (tired eyes)",
-            "ear pain (throbbing ear)",
-            "fever (high temperature)",
-            "fatigue (feeling very tired)"
-        ]
+        try:
+            return self._request_symptom_suggestions(user_input)
+        except Exception as e:
+            print(f"Error in get_symptom_suggestions: {e}")
+            return self.fallback_symptom_suggestions(user_input)
 
-        Important: 
-        - Always return exactly 10 items
-        - Ensure first suggestions are most relevant
-        - Include common related symptoms
+    def suggest_symptoms(self, query: str) -> Tuple[List[str], bool]:
         """
-
+        (suggestions, cacheable) for a canonical autocomplete query (see
+        symptom_vocabulary.canonical_query), for GET /symptoms/suggest. Answers go through
+        the questionnaire cache, so every worker serves a query with the same body (and
+        ETag) until the prompt version changes; fallback suggestions are not cacheable.
+        """
+        if not query:
+            return [], True
         try:
-            # Use retry wrapper for OpenAI API call
-            def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "system",
-                        "content": "You are a medical symptom suggestion system. Provide relevant symptom suggestions in simple language."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }],
-                    temperature=0.3,
-                    max_tokens=500,
-                    presence_penalty=0.3,
-                    frequency_penalty=0.3
-                )
-            
-            response = self._make_openai_request_with_retry(make_request)
-            content = self._clean_json_response(response.choices[0].message.content)
-            suggestions = json.loads(content)
-            
-            # Ensure exactly 10 suggestions
-            if len(suggestions) < 10:
-                # Add fallback symptoms if needed
-                common_symptoms = [
-                    "fatigue (feeling very tired)",
-                    "fever (elevated temperature)",
-                    "pain (general discomfort)",
-                    "weakness (reduced strength)",
-                    "dizziness (light headed feeling)"
-                ]
-                suggestions.extend([s for s in common_symptoms if s not in suggestions])
-            
-            return suggestions[:10]
-            
+            suggestions = self._cached_questionnaire(
+                'symptom_suggestions', SYMPTOM_SUGGESTIONS_PROMPT,
+                lambda: {'query': query}, lambda: self._request_symptom_suggestions(query))
+            return suggestions, True
         except Exception as e:
-            print(f"Error in get_symptom_suggestions: {e}")
-            # Fallback suggestions
-            return [
-                f"{user_input} (main symptom)",
-                "fever (high temperature)",
+            print(f"Error in suggest_symptoms: {e}")
+            return self.fallback_symptom_suggestions(query), False
+
+    def _request_symptom_suggestions(self, user_input: str) -> List[str]:
+        """Exactly 10 suggestions from the LLM, topped up with common symptoms; raises on failure."""
+        rendered = SYMPTOM_SUGGESTIONS_PROMPT.render(user_input=user_input)
+
+        # Use retry wrapper for OpenAI API call
+        def make_request():
+            return self._create_chat_completion(
+                'symptom_suggestions',
+                messages=rendered['messages'],
+                temperature=0.3,
+                max_tokens=500,
+                presence_penalty=0.3,
+                frequency_penalty=0.3
+            )
+
+        response = self._make_openai_request_with_retry(make_request)
+        suggestions = self._parse_json_response('symptom_suggestions', response, expect='array')
+
+        # Ensure exactly 10 suggestions
+        if len(suggestions) < 10:
+            # Add fallback symptoms if needed
+            common_symptoms = [
+                "fatigue (feeling very tired)",
+                "fever (elevated temperature)",
                 "pain (general discomfort)",
-                "fatigue (feeling tired)",
-                "headache (head pain)",
-                "nausea (feeling sick)",
-                "dizziness (light headed)",
                 "weakness (reduced strength)",
-                "chills (feeling cold)",
-                "sweating (excess moisture)"
+                "dizziness (light headed feeling)"
             ]
+            suggestions.extend([s for s in common_symptoms if s not in suggestions])
+
+        return suggestions[:10]
+
+    def fallback_symptom_suggestions(self, user_input: str) -> List[str]:
+        """Rule-based suggestions used when the LLM fails or the request is shed under load"""
+        return [
+            f"{user_input} (main symptom)",
+            "fever (high temperature)",
+            "pain (general discomfort)",
+            "fatigue (feeling tired)",
+            "headache (head pain)",
+            "nausea (feeling sick)",
+            "dizziness (light headed)",
+            "weakness (reduced strength)",
+            "chills (feeling cold)",
+            "sweating (excess moisture)"
+        ]
 
-    def get_followup_questions(self, data: Dict) -> Dict:
+    def get_followup_questions(self, data: Dict, prefetched: Optional[List[Dict]] = None) -> Dict:
         """
         Generate structured symptom questions based on case type, patient information, and selected symptoms.
         Uses enhanced label extraction and correlation analysis.
         Returns questions in a format similar to a medical intake form with Yes/No/Notes structure.
+        `prefetched` is a questionnaire already built by generate_structured_questions for the same inputs.
         """
         case_type = data.get('caseType', '')
         symptoms = data.get('symptoms', [])
@@ -158,30 +677,13 @@ class OpenAIHelper:
         
         # Generate structured questions based on case type and symptoms
         if not self.symptom_analysis_state['symptoms_processed']:
-            print(f"DEBUG: ==> Generating enhanced structured symptom questions with label extraction...")  # Debug log
-            
-            # Use enhanced version with label extraction and correlation analysis
-            structured_questions = []
-            try:
-                structured_questions = self._generate_enhanced_structured_questions(
+            if prefetched is not None:
+                print(f"DEBUG: ==> Using speculatively prefetched questionnaire")  # Debug log
+                structured_questions = prefetched
+            else:
+                structured_questions = self.generate_structured_questions(
                     case_type, symptoms, free_text_symptoms, demographics
                 )
-                print(f"DEBUG: ==> Enhanced questions generated: {len(structured_questions)}")
-            except Exception as e:
-                print(f"WARN: Enhanced question generation failed: {e}")
-                # Fallback to OpenAI dynamic generation
-                try:
-                    structured_questions = self._generate_dynamic_symptom_questions_openai(
-                        case_type, symptoms, free_text_symptoms, demographics
-                    )
-                    print(f"DEBUG: ==> OpenAI dynamic questions generated: {len(structured_questions)}")
-                except Exception as e2:
-                    print(f"WARN: OpenAI dynamic question generation failed: {e2}")
-                    # Final fallback to rule-based generator
-                    structured_questions = self._generate_structured_symptom_questions(
-                        case_type, symptoms, free_text_symptoms, demographics
-                    )
-                    print(f"DEBUG: ==> Fallback structured questions generated: {len(structured_questions)}")
             
             print(f"DEBUG: ==> Generated {len(structured_questions)} structured questions")  # Debug log
             
@@ -211,301 +713,267 @@ class OpenAIHelper:
             print("DEBUG: ==> Structured questionnaire completed")  # Debug log
             return {"question": None, "completed": True}
 
+    def generate_structured_questions(self, case_type: str, symptoms: List[str], free_text: str, demographics: Dict) -> List[Dict]:
+        """
+        Build the structured questionnaire without touching the conversation state, so it
+        can also run speculatively (see prefetch.SpeculativePrefetcher).
+        Enhanced label/correlation questions first, then OpenAI dynamic questions, then rules.
+        """
+        print(f"DEBUG: ==> Generating enhanced structured symptom questions with label extraction...")  # Debug log
+        try:
+            structured_questions = self._generate_enhanced_structured_questions(
+                case_type, symptoms, free_text, demographics
+            )
+            print(f"DEBUG: ==> Enhanced questions generated: {len(structured_questions)}")
+            return structured_questions
+        except Exception as e:
+            print(f"WARN: Enhanced question generation failed: {e}")
+        # Fallback to OpenAI dynamic generation
+        try:
+            structured_questions = self._generate_dynamic_symptom_questions_openai(
+                case_type, symptoms, free_text, demographics
+            )
+            print(f"DEBUG: ==> OpenAI dynamic questions generated: {len(structured_questions)}")
+            return structured_questions
+        except Exception as e2:
+            print(f"WARN: OpenAI dynamic question generation failed: {e2}")
+        # Final fallback to rule-based generator
+        structured_questions = self._generate_structured_symptom_questions(
+            case_type, symptoms, free_text, demographics
+        )
+        print(f"DEBUG: ==> Fallback structured questions generated: {len(structured_questions)}")
+        return structured_questions
+
     def _generate_structured_symptom_questions(self, case_type: str, symptoms: List[str], free_text: str, demographics: Dict) -> List[Dict]:
         """
         Generate structured symptom questions based on the case type, selected symptoms, and patient demographics.
         This creates a comprehensive symptom checklist similar to medical intake forms.
         """
-        questions = []
-        
-        # Base questions that apply to all cases
-        base_questions = [
-            {"symptom": "Fever is continuous (no breaks)", "category": "general", "notes_hint": "e.g., constant vs up/down"},
-            {"symptom": "Fever spikes at certain times daily", "category": "general", "notes_hint": "Mention time of spikes"},
-            {"symptom": "Chills or shivering present", "category": "general", "notes_hint": ""},
-            {"symptom": "Vomiting even without eating", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Vomiting only after food", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Stool watery", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Stool with mucus", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Stool with blood", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Abdominal pain constant", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Abdominal pain comes in waves (cramps)", "category": "gastrointestinal", "notes_hint": ""},
-            {"symptom": "Pain spreads to back/shoulder", "category": "pain", "notes_hint": ""},
-            {"symptom": "Rash on skin", "category": "dermatological", "notes_hint": ""},
-            {"symptom": "Yellowing of eyes/skin", "category": "general", "notes_hint": ""},
-            {"symptom": "Severe headache", "category": "neurological", "notes_hint": ""},
-            {"symptom": "Joint or muscle pain", "category": "musculoskeletal", "notes_hint": ""},
-            {"symptom": "Recent outside food / street food", "category": "risk_factors", "notes_hint": "Give date/place"},
-            {"symptom": "Recent travel", "category": "risk_factors", "notes_hint": "Where/when"},
-            {"symptom": "Contact with someone sick", "category": "risk_factors", "notes_hint": "Who/when"}
-        ]
-        
-        # Add case-type specific questions
-        case_specific_questions = self._get_case_specific_questions(case_type)
-        
-        # Add symptom-specific follow-up questions
-        symptom_specific_questions = self._get_symptom_specific_questions(symptoms, free_text)
-        
-        # Combine all questions
-        all_questions = base_questions + case_specific_questions + symptom_specific_questions
-        
+        # Base rows, case-type rows and symptom-specific follow-up rows, all shared ChecklistItems
+        all_questions = (*BASE_CHECKLIST, *self._get_case_specific_questions(case_type),
+                         *self._get_symptom_specific_questions(symptoms, free_text))
+
         # Remove duplicates and format for frontend
+        questions = []
         seen_symptoms = set()
-        for q in all_questions:
-            symptom_key = q["symptom"].lower()
+        for item in all_questions:
+            symptom_key = item.symptom.lower()
             if symptom_key not in seen_symptoms:
                 seen_symptoms.add(symptom_key)
-                questions.append({
-                    "symptom": q["symptom"],
-                    "category": q.get("category", "general"),
-                    "notes_hint": q.get("notes_hint", ""),
-                    "type": "yes_no_notes"
-                })
-        
+                questions.append(item.to_dict())
+
         print(f"DEBUG: Generated {len(questions)} structured questions")
         return questions
     
-    def _get_case_specific_questions(self, case_type: str) -> List[Dict]:
+    def _get_case_specific_questions(self, case_type: str) -> Tuple[ChecklistItem, ...]:
         """Get additional questions specific to the case type"""
-        case_questions = {
-            "accident": [
-                {"symptom": "Loss of consciousness", "category": "neurological", "notes_hint": "How long"},
-                {"symptom": "Memory loss around the event", "category": "neurological", "notes_hint": ""},
-                {"symptom": "Confusion or disorientation", "category": "neurological", "notes_hint": ""},
-                {"symptom": "Difficulty speaking clearly", "category": "neurological", "notes_hint": ""},
-                {"symptom": "Numbness or tingling", "category": "neurological", "notes_hint": "Where"},
-                {"symptom": "Vision changes", "category": "neurological", "notes_hint": "Describe"},
-                {"symptom": "Difficulty moving limbs", "category": "musculoskeletal", "notes_hint": "Which limbs"},
-                {"symptom": "Visible deformity", "category": "physical", "notes_hint": "Location"},
-                {"symptom": "Swelling at injury site", "category": "physical", "notes_hint": ""},
-                {"symptom": "Bruising or discoloration", "category": "physical", "notes_hint": "Color/location"}
-            ],
-            "infection": [
-                {"symptom": "Known outbreak in area", "category": "epidemiological", "notes_hint": "What disease"},
-                {"symptom": "Others in household sick", "category": "epidemiological", "notes_hint": "How many"},
-                {"symptom": "Exposure to animals", "category": "risk_factors", "notes_hint": "What animals"},
-                {"symptom": "Insect or tick bites", "category": "risk_factors", "notes_hint": "When/where"},
-                {"symptom": "Drinking untreated water", "category": "risk_factors", "notes_hint": "Source"},
-                {"symptom": "Night sweats", "category": "general", "notes_hint": "How often"},
-                {"symptom": "Swollen lymph nodes", "category": "general", "notes_hint": "Location"},
-                {"symptom": "Difficulty swallowing", "category": "throat", "notes_hint": ""},
-                {"symptom": "Cough with blood", "category": "respiratory", "notes_hint": "Amount"},
-                {"symptom": "Rapid breathing", "category": "respiratory", "notes_hint": ""}
-            ],
-            "sick": [
-                {"symptom": "Gradual onset over days", "category": "temporal", "notes_hint": "How many days"},
-                {"symptom": "Sudden onset within hours", "category": "temporal", "notes_hint": "Exact time"},
-                {"symptom": "Symptoms getting worse", "category": "temporal", "notes_hint": "How fast"},
-                {"symptom": "Previous similar episodes", "category": "history", "notes_hint": "When"},
-                {"symptom": "Family history of similar illness", "category": "history", "notes_hint": "Who"},
-                {"symptom": "Taking any medications", "category": "medications", "notes_hint": "List all"},
-                {"symptom": "Missed medication doses", "category": "medications", "notes_hint": "Which ones"},
-                {"symptom": "New medications started", "category": "medications", "notes_hint": "When started"},
-                {"symptom": "Stress or emotional changes", "category": "psychosocial", "notes_hint": "What kind"}
-            ],
-            "addiction": [
-                {"symptom": "Withdrawal symptoms", "category": "addiction", "notes_hint": "Which symptoms"},
-                {"symptom": "Craving for substance", "category": "addiction", "notes_hint": "How strong"},
-                {"symptom": "Last substance use", "category": "addiction", "notes_hint": "When exactly"},
-                {"symptom": "Amount typically used", "category": "addiction", "notes_hint": "Daily amount"},
-                {"symptom": "Shaking or tremors", "category": "neurological", "notes_hint": "Which parts"},
-                {"symptom": "Anxiety or panic", "category": "psychological", "notes_hint": "Severity"},
-                {"symptom": "Hallucinations", "category": "psychological", "notes_hint": "Visual/auditory"},
-                {"symptom": "Sleep disturbances", "category": "general", "notes_hint": "How many hours"},
-                {"symptom": "Loss of appetite", "category": "general", "notes_hint": "For how long"},
-                {"symptom": "Rapid heart rate", "category": "cardiovascular", "notes_hint": ""}
-            ]
-        }
-        
-        return case_questions.get(case_type, [])
+        return CASE_CHECKLISTS.get(case_type, ())
     
-    def _get_symptom_specific_questions(self, symptoms: List[str], free_text: str) -> List[Dict]:
+    def _get_symptom_specific_questions(self, symptoms: List[str], free_text: str) -> List[ChecklistItem]:
         """Generate specific follow-up questions based on selected symptoms"""
         specific_questions = []
         
         # Analyze symptoms and add relevant questions
         for symptom in symptoms:
-            clean_symptom = symptom.lower()
-            
-            if any(keyword in clean_symptom for keyword in ['pain', 'ache', 'hurt']):
-                specific_questions.extend([
-                    {"symptom": f"Pain radiates to other areas", "category": "pain", "notes_hint": "Where"},
-                    {"symptom": f"Pain worse with movement", "category": "pain", "notes_hint": "Which movements"},
-                    {"symptom": f"Pain relief with rest", "category": "pain", "notes_hint": "How much relief"}
-                ])
-            
-            if any(keyword in clean_symptom for keyword in ['cough', 'breathing']):
-                specific_questions.extend([
-                    {"symptom": "Cough produces phlegm", "category": "respiratory", "notes_hint": "Color/amount"},
-                    {"symptom": "Shortness of breath at rest", "category": "respiratory", "notes_hint": ""},
-                    {"symptom": "Wheezing sounds", "category": "respiratory", "notes_hint": "When"},
-                    {"symptom": "Chest tightness", "category": "respiratory", "notes_hint": ""}
-                ])
-            
-            if any(keyword in clean_symptom for keyword in ['fever', 'temperature']):
-                specific_questions.extend([
-                    {"symptom": "Fever measured with thermometer", "category": "general", "notes_hint": "Exact temperature"},
-                    {"symptom": "Fever responds to medication", "category": "general", "notes_hint": "Which medication"},
-                    {"symptom": "Fever pattern changes", "category": "general", "notes_hint": "How"}
-                ])
+            clean_symptom = symptom_terms(symptom)
+            for keywords, items in SYMPTOM_CHECKLISTS:
+                if any(keyword in clean_symptom for keyword in keywords):
+                    specific_questions.extend(items)
         
         # Add questions based on free text analysis
         if free_text:
             # Simple keyword analysis of free text
             text_lower = free_text.lower()
-            if 'dizziness' in text_lower or 'dizzy' in text_lower:
-                specific_questions.append({"symptom": "Dizziness when standing up", "category": "neurological", "notes_hint": "How severe"})
-            if 'fatigue' in text_lower or 'tired' in text_lower:
-                specific_questions.append({"symptom": "Fatigue interferes with daily activities", "category": "general", "notes_hint": "What activities"})
+            for keywords, item in FREE_TEXT_CHECKLISTS:
+                if any(keyword in text_lower for keyword in keywords):
+                    specific_questions.append(item)
         
         return specific_questions
 
     def analyze_symptoms(self, data: Dict) -> Dict:
         demographics = data.get('demographics', {})
-        history = data.get('history', {})
-        symptoms = data.get('symptoms', [])
-        detailed_symptoms = data.get('detailed_symptoms', {})
-        free_text = data.get('freeTextSymptoms', '')
-        regions = data.get('regions', [])
-        
+        digest = self.patient_context_digest(data)
+        sections = {
+            'age': demographics.get('age', 'unknown'),
+            'gender': demographics.get('gender', 'unknown'),
+            'regions': digest['regions'],
+            'history': digest['history'],
+            'symptoms': data.get('symptoms', []),
+            'free_text': data.get('freeTextSymptoms', ''),
+            'detailed_symptoms': data.get('detailed_symptoms', {})
+        }
+
+        if ANALYSIS_FANOUT:
+            result = self._analyze_symptoms_fanout(sections)
+        else:
+            try:
+                result = self._analyze_symptoms_single(sections)
+            except Exception as e:
+                print(f"Error in analyze_symptoms: {e}")
+                result = self._fallback_analysis()
+
+        # Local red-flag rules can only raise the urgency the model returned
+        return red_flags.apply_to_analysis(self._normalize_analysis(result), self.triage_emergency(data))
+
+    def _analyze_symptoms_single(self, sections: Dict) -> Dict:
+        """One call producing the whole analysis (verbose or compact schema)."""
         # Enhanced analysis prompt with comprehensive OPQRST framework and ICD-11 codes
-        prompt = f"""You are a world-class diagnostic physician conducting comprehensive medical analysis using the complete OPQRST framework.
-
-PATIENT PROFILE:
-- Demographics: Age {demographics.get('age', 'unknown')}, Gender: {demographics.get('gender', 'unknown')}
-- Geographic Regions: {', '.join(regions)}
-- Medical History: {json.dumps(history)}
-- Primary Symptoms: {', '.join(symptoms)}
-- Patient Description: {free_text}
-- Detailed OPQRST Analysis: {json.dumps(detailed_symptoms)}
-
-ANALYSIS REQUIREMENTS:
-1. Apply systematic differential diagnosis using OPQRST findings
-2. Consider epidemiology, risk factors, and demographics  
-3. Prioritize based on urgency, probability, and OPQRST patterns
-4. Use evidence-based medicine principles
-5. Account for all OPQRST components in diagnostic reasoning
-6. Include accurate ICD-11 codes for each condition
-
-Provide analysis in this EXACT JSON format:
-{{
-    "possible_conditions": [
-        {{
-            "condition": "Primary Condition Name",
-            "confidence_score": 85,
-            "icd11_code": "1A00.0Z",
-            "icd11_title": "Official ICD-11 condition title",
-            "explanation": "Detailed clinical reasoning incorporating complete OPQRST findings, demographics, and risk factors."
-        }}
-    ],
-    "diagnostic_tests": [
-        {{
-            "test": "Specific Test Name",
-            "confidence_score": 90,
-            "priority": "urgent/routine",
-            "explanation": "Clinical rationale based on OPQRST findings and differential diagnosis requirements"
-        }}
-    ],
-    "red_flags": ["List any concerning OPQRST features that suggest urgent evaluation"],
-    "immediate_care": ["Specific actionable recommendations"],
-    "follow_up": {{
-        "urgency": "emergency/urgent/routine",
-        "timeline": "Specific timeframe",
-        "reason": "Why this timeline"
-    }},
-    "lifestyle": ["Relevant lifestyle modifications"],
-    "disclaimer": "Important medical disclaimer"
-}}
-
-DIAGNOSTIC CRITERIA:
-- Emergency: Life-threatening conditions requiring immediate intervention
-- Urgent: Serious conditions requiring evaluation within hours
-- Routine: Stable conditions that can be evaluated within days
-
-ICD-11 CODE REQUIREMENTS:
-- Use the most current ICD-11 classification codes
-- Provide both the code (e.g., "1A00.0Z") and official title
-- Ensure codes match the clinical condition accurately
-- Use unspecified codes (.Z) when specific variants cannot be determined
-- Include primary codes for main conditions, not just symptom codes
-
-Focus on clinical excellence, patient safety, comprehensive OPQRST-based systematic reasoning, and accurate medical coding."""
-        
-        try:
-            # Use retry wrapper for OpenAI API call
-            def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "system",
-                        "content": "You are a world-class diagnostic physician with expertise in comprehensive OPQRST symptom analysis, systematic clinical reasoning, and accurate ICD-11 medical coding. Provide thorough, accurate medical analysis with proper ICD-11 classification codes based on complete OPQRST assessment."
-                    }, {
-                        "role": "user", 
-                        "content": prompt
-                    }],
-                    temperature=0.1,
-                    max_tokens=1500
-                )
-            
+        compact = compact_output_enabled('analysis')
+        template = ANALYSIS_COMPACT_PROMPT if compact else ANALYSIS_PROMPT
+        rendered = template.render(**sections)
+
+        # Use retry wrapper for OpenAI API call
+        def make_request():
+            return self._create_chat_completion(
+                template.name,
+                messages=rendered['messages'],
+                temperature=0.1,
+                max_tokens=1500
+            )
+
+        response = self._make_openai_request_with_retry(make_request)
+        result = self._parse_json_response(template.name, response, expect='object')
+        return expand_analysis(result) if compact else result
+
+    def _analysis_part(self, template, sections: Dict, max_tokens: int, deadline: float) -> Dict:
+        """
+        One fan-out part. Its calls stop at `deadline`: a part still queued for a pool
+        thread, a quota reservation or a slot when the fan-out gives up makes no request,
+        and one in flight is cut off by the request timeout, so no slot or quota is held
+        for a result nobody will read.
+        """
+        rendered = template.render(**sections)
+
+        def make_request():
+            return self._create_chat_completion(
+                template.name,
+                messages=rendered['messages'],
+                temperature=0.1,
+                max_tokens=max_tokens
+            )
+
+        with call_deadline(deadline):
             response = self._make_openai_request_with_retry(make_request)
-            content = self._clean_json_response(response.choices[0].message.content)
-            result = json.loads(content)
-            
-            # Validate and ensure proper response format
-            if 'possible_conditions' not in result:
-                result['possible_conditions'] = []
-            if 'diagnostic_tests' not in result:
-                result['diagnostic_tests'] = []
-            if 'red_flags' not in result:
-                result['red_flags'] = []
-            if 'immediate_care' not in result:
-                result['immediate_care'] = []
-            if 'follow_up' not in result:
-                result['follow_up'] = {
-                    'urgency': 'routine',
-                    'timeline': 'As appropriate',
-                    'reason': 'Professional evaluation recommended'
-                }
-            if 'lifestyle' not in result:
-                result['lifestyle'] = []
-            if 'disclaimer' not in result:
-                result['disclaimer'] = 'This tool is not a substitute for professional medical advice, diagnosis, or treatment.'
-            
-            # Ensure ICD-11 codes are present in conditions
-            for condition in result['possible_conditions']:
-                if 'icd11_code' not in condition or not condition['icd11_code']:
-                    condition['icd11_code'] = 'Not specified'
-                if 'icd11_title' not in condition or not condition['icd11_title']:
-                    condition['icd11_title'] = 'ICD-11 classification pending'
-            
-            return result
-            
-        except Exception as e:
-            print(f"Error in analyze_symptoms: {e}")
-            return {
-                'possible_conditions': [{
-                    'condition': 'Comprehensive Clinical Assessment Required',
-                    'confidence_score': 95,
-                    'icd11_code': 'Z51.8',
-                    'icd11_title': 'Other specified medical care',
-                    'explanation': 'The symptoms described require professional medical evaluation for accurate diagnosis using complete OPQRST analysis.'
-                }],
-                'diagnostic_tests': [{
-                    'test': 'Comprehensive Medical Evaluation',
-                    'confidence_score': 98,
-                    'priority': 'urgent',
-                    'explanation': 'Complete history, physical examination, and appropriate diagnostic testing by a qualified healthcare provider.'
-                }],
-                'red_flags': ['Any worsening symptoms', 'New concerning symptoms'],
-                'immediate_care': ['Seek medical attention if symptoms worsen'],
-                'follow_up': {
-                    'urgency': 'urgent',
-                    'timeline': 'Within 24-48 hours',
-                    'reason': 'Professional evaluation needed for accurate diagnosis'
-                },
-                'lifestyle': ['Follow medical advice from healthcare provider'],
-                'disclaimer': 'This tool is not a substitute for professional medical advice, diagnosis, or treatment.'
-            }
+        return self._parse_json_response(template.name, response, expect='object')
+
+    def _fanout_pool(self) -> ThreadPoolExecutor:
+        # Created lazily per process: gunicorn preloads the app before forking workers
+        with self._fanout_lock:
+            if self._fanout_executor is None or self._fanout_pid != os.getpid():
+                self._fanout_executor = ThreadPoolExecutor(max_workers=ANALYSIS_FANOUT_WORKERS,
+                                                           thread_name_prefix='care-ai-analysis')
+                self._fanout_pid = os.getpid()
+            return self._fanout_executor
+
+    def _analyze_symptoms_fanout(self, sections: Dict) -> Dict:
+        """
+        Run the conditions, tests and care parts of the analysis concurrently and merge
+        them into the single-call response shape. Each part has its own deadline and
+        falls back to the matching sections of the generic analysis on error or timeout.
+        """
+        pool = self._fanout_pool()
+        fallback = self._fallback_analysis()
+        started = time.monotonic()
+        deadline = started + bounded_wait(ANALYSIS_PART_TIMEOUT)
+        pending = []
+        for part, template, max_tokens, keys in ANALYSIS_PARTS:
+            # Carry the request priority into the worker thread (a copy, so the part's deadline stays there)
+            context = contextvars.copy_context()
+            pending.append((part, keys, pool.submit(context.run, self._analysis_part, template, sections, max_tokens,
+                                                    deadline)))
+
+        result = {}
+        for part, keys, future in pending:
+            try:
+                payload = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                if not any(key in payload for key in keys):
+                    raise ValueError(f"response has none of {keys}")
+            except Exception as e:
+                future.cancel()
+                print(f"WARN: analysis part '{part}' failed ({str(e) or type(e).__name__}); using fallback")
+                metrics.increment('analysis_part_fallbacks', part)
+                payload = fallback
+            for key in keys:
+                result[key] = payload.get(key, fallback[key])
+            if payload.get('partial'):
+                result['partial'] = True
+        result['disclaimer'] = fallback['disclaimer']
+        metrics.observe('analysis_fanout_seconds', '', time.monotonic() - started)
+        return result
+
+    def _normalize_analysis(self, result: Dict) -> Dict:
+        # Validate and ensure proper response format; empty or wrongly typed sections
+        # (e.g. from a salvaged truncated completion) count as missing
+        for key in ('possible_conditions', 'diagnostic_tests', 'red_flags', 'immediate_care', 'lifestyle'):
+            if not isinstance(result.get(key), list):
+                result[key] = []
+        follow_up = result.get('follow_up') if isinstance(result.get('follow_up'), dict) else {}
+        defaults = {
+            'urgency': 'routine',
+            'timeline': 'As appropriate',
+            'reason': 'Professional evaluation recommended'
+        }
+        result['follow_up'] = {**defaults, **{k: v for k, v in follow_up.items() if v not in (None, '', [], {})}}
+        if not result.get('disclaimer'):
+            result['disclaimer'] = 'This tool is not a substitute for professional medical advice, diagnosis, or treatment.'
+
+        # Ensure ICD-11 codes are present in conditions
+        for condition in result['possible_conditions']:
+            if 'icd11_code' not in condition or not condition['icd11_code']:
+                condition['icd11_code'] = 'Not specified'
+            if 'icd11_title' not in condition or not condition['icd11_title']:
+                condition['icd11_title'] = 'ICD-11 classification pending'
+        return result
+
+    def _fallback_analysis(self) -> Dict:
+        return {
+            'possible_conditions': [{
+                'condition': 'Comprehensive Clinical Assessment Required',
+                'confidence_score': 95,
+                'icd11_code': 'Z51.8',
+                'icd11_title': 'Other specified medical care',
+                'explanation': 'The symptoms described require professional medical evaluation for accurate diagnosis using complete OPQRST analysis.'
+            }],
+            'diagnostic_tests': [{
+                'test': 'Comprehensive Medical Evaluation',
+                'confidence_score': 98,
+                'priority': 'urgent',
+                'explanation': 'Complete history, physical examination, and appropriate diagnostic testing by a qualified healthcare provider.'
+            }],
+            'red_flags': ['Any worsening symptoms', 'New concerning symptoms'],
+            'immediate_care': ['Seek medical attention if symptoms worsen'],
+            'follow_up': {
+                'urgency': 'urgent',
+                'timeline': 'Within 24-48 hours',
+                'reason': 'Professional evaluation needed for accurate diagnosis'
+            },
+            'lifestyle': ['Follow medical advice from healthcare provider'],
+            'disclaimer': 'This tool is not a substitute for professional medical advice, diagnosis, or treatment.'
+        }
+
+    def triage_emergency(self, data: Dict) -> Dict:
+        """
+        Evaluate the local red-flag rule set (symptoms, free text, history, vitals outliers).
+        Returns the red_flags.evaluate() verdict; never calls the LLM.
+        """
+        try:
+            outliers = self._analyze_vitals_outliers(data.get('vitals') or {})
+        except (TypeError, ValueError):
+            outliers = {}
+        return red_flags.evaluate(data, outliers)
+
+    def preliminary_analysis(self, verdict: Dict) -> Dict:
+        """Analysis-shaped response returned instantly for emergencies while the LLM detail is generated"""
+        return {
+            'possible_conditions': [],
+            'diagnostic_tests': [],
+            'red_flags': verdict['red_flags'],
+            'immediate_care': verdict['immediate_care'],
+            'follow_up': red_flags.emergency_follow_up(verdict),
+            'lifestyle': [],
+            'emergency_triage': verdict,
+            'disclaimer': 'Emergency warning signs were detected. Contact emergency services now; detailed analysis will follow.'
+        }
 
     def reset_conversation(self):
         """Reset the conversation state for a new diagnostic session"""
@@ -516,113 +984,39 @@ Focus on clinical excellence, patient safety, comprehensive OPQRST-based systema
             'total_questions': 0,
             'symptoms_processed': False,
             # Reset individual follow-up flow state
-            'individual_questions': [],
-            'individual_index': 0
+            'individual_fp': None,
+            'individual_cursor': None
         }
 
     def get_diagnosis_and_recommendations(self, data: Dict) -> Dict:
         """
         Generate comprehensive diagnosis and recommendations based on all collected information
         """
-        prompt = f"""You are an experienced physician providing diagnostic analysis and recommendations.
-
-PATIENT DATA:
-Demographics: {json.dumps(data.get('demographics', {}))}
-Medical History: {json.dumps(data.get('history', {}))}
-Primary Symptoms: {', '.join(data.get('symptoms', []))}
-Free Text Description: {data.get('freeTextSymptoms', '')}
-Detailed Symptom Analysis: {json.dumps(data.get('detailed_symptoms', {}))}
-
-PROVIDE:
-
-1. POSSIBLE CONDITIONS (3-5 most likely conditions with confidence scores):
-   - List conditions from most to least likely
-   - Include confidence score (0-100%)
-   - One-line explanation for each condition
-
-2. RECOMMENDED DIAGNOSTIC TESTS (with confidence scores):
-   - Include confidence score (0-100%) for test necessity
-   - Priority order (urgent vs routine)
-   - One-line rationale for each test
-
-3. RED FLAGS requiring immediate medical attention:
-   - Specific warning signs to watch for
-   - When to seek emergency care
-
-4. IMMEDIATE CARE RECOMMENDATIONS:
-   - What patient can do now
-   - Symptom management
-   - Activity restrictions
-
-5. FOLLOW-UP TIMELINE:
-   - When to see a doctor
-   - Urgency level (emergency, urgent, routine)
-
-6. LIFESTYLE MODIFICATIONS:
-   - Relevant diet, activity, or environmental changes
-
-Format as JSON:
-{{
-    "possible_conditions": [
-        {{
-            "condition": "Condition name",
-            "confidence_score": 85,
-            "explanation": "One-line explanation of why this condition is likely based on symptoms"
-        }}
-    ],
-    "diagnostic_tests": [
-        {{
-            "test": "Test name",
-            "confidence_score": 90,
-            "priority": "Urgent/Routine",
-            "explanation": "One-line rationale for why this test is recommended"
-        }}
-    ],
-    "red_flags": [
-        "Specific warning sign to watch for"
-    ],
-    "immediate_care": [
-        "Specific actionable recommendation"
-    ],
-    "follow_up": {{
-        "urgency": "Emergency/Urgent/Routine",
-        "timeline": "Specific timeframe",
-        "reason": "Why this timeline"
-    }},
-    "lifestyle": [
-        "Relevant lifestyle modification"
-    ],
-    "disclaimer": "Important medical disclaimer"
-}}
-
-IMPORTANT: 
-- Base confidence scores on symptom match, patient demographics, and clinical evidence
-- Confidence scores should reflect diagnostic certainty (100% = definitive, 50% = possible, <30% = unlikely)
-- For diagnostic tests: higher confidence = more essential for diagnosis
-- Be specific and actionable with one-line explanations
-- Consider patient's age and medical history
-- Include appropriate medical disclaimers
-- Focus on patient safety"""
+        compact = compact_output_enabled('diagnosis')
+        template = DIAGNOSIS_COMPACT_PROMPT if compact else DIAGNOSIS_PROMPT
+        digest = self.patient_context_digest(data)
+        rendered = template.render(
+            demographics=digest['demographics'],
+            history=digest['history'],
+            symptoms=data.get('symptoms', []),
+            free_text=data.get('freeTextSymptoms', ''),
+            detailed_symptoms=data.get('detailed_symptoms', {})
+        )
 
         try:
             # Use retry wrapper for OpenAI API call
             def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "system",
-                        "content": "You are an experienced diagnostic physician. Provide thorough, evidence-based analysis with confidence scores reflecting clinical certainty. Always emphasize the importance of professional medical evaluation and prioritize patient safety."
-                    }, {
-                        "role": "user", 
-                        "content": prompt
-                    }],
+                return self._create_chat_completion(
+                    template.name,
+                    messages=rendered['messages'],
                     temperature=0.2,
                     max_tokens=2000
                 )
             
             response = self._make_openai_request_with_retry(make_request)
-            content = self._clean_json_response(response.choices[0].message.content)
-            diagnosis_data = json.loads(content)
+            diagnosis_data = self._parse_json_response(template.name, response, expect='object')
+            if compact:
+                diagnosis_data = expand_analysis(diagnosis_data, with_icd=False)
             
             return diagnosis_data
             
@@ -654,153 +1048,34 @@ IMPORTANT:
     def _generate_individual_symptom_questions(self, symptoms: List[str], free_text: str) -> List[Dict]:
         """
         Generate exactly 3 detailed questions for each individual symptom to probe the nature,
-        timing, patterns, and characteristics like an expert doctor would.
+        timing, patterns, and characteristics like an expert doctor would, plus 3 for free text.
         """
-        questions = []
-        
-        print(f"DEBUG: Processing {len(symptoms)} symptoms: {symptoms}")  # Debug log
-        
-        # Process each selected symptom with 3 targeted questions
-        for i, symptom in enumerate(symptoms):
-            # Clean symptom name (remove description in parentheses)
-            clean_symptom = symptom.split('(')[0].strip()
-            
-            print(f"DEBUG: Processing symptom {i+1}/{len(symptoms)}: {clean_symptom}")  # Debug log
-            
-            # Question 1: Comprehensive Onset & Timing Analysis
-            question1 = {
-                'question': f'When did your {clean_symptom} first appear, and how has the timing pattern been?',
-                'type': 'multiple_choice',
-                'options': [
-                    'Sudden onset - appeared within minutes',
-                    'Gradual onset - developed over hours',
-                    'Started days ago and persisting',
-                    'Started weeks/months ago',
-                    'Recurring episodes - comes and goes',
-                    'Daily at specific times (morning/evening)',
-                    'Triggered by specific activities',
-                    'Constant since it started'
-                ],
-                'help_text': 'Understanding onset and timing patterns helps identify the underlying cause',
-                'diagnostic_purpose': f'Analyze temporal characteristics and patterns of {clean_symptom}',
-                'symptom_focus': clean_symptom,
-                'question_category': 'onset_timing'
-            }
-            questions.append(question1)
-            print(f"DEBUG: Added question 1 for {clean_symptom}")  # Debug log
-            
-            # Question 2: Intensity, Duration & Frequency
-            if self._symptom_needs_intensity_rating(clean_symptom):
-                question2 = {
-                    'question': f'How would you describe the intensity and duration of your {clean_symptom} episodes?',
-                    'type': 'multiple_choice',
-                    'options': [
-                        'Mild intensity - lasts few minutes',
-                        'Mild intensity - lasts hours',
-                        'Moderate intensity - brief episodes',
-                        'Moderate intensity - lasts several hours',
-                        'Severe intensity - short bursts',
-                        'Severe intensity - prolonged episodes',
-                        'Very severe - debilitating when present',
-                        'Varies greatly in intensity and duration'
-                    ],
-                    'help_text': 'Intensity and duration patterns help assess severity and underlying pathology',
-                    'diagnostic_purpose': f'Assess severity characteristics and episode duration of {clean_symptom}',
-                    'symptom_focus': clean_symptom,
-                    'question_category': 'intensity_duration'
-                }
-            else:
-                # For non-intensity symptoms, focus on frequency and persistence
-                question2 = {
-                    'question': f'How often does your {clean_symptom} occur and how long does it typically last?',
-                    'type': 'multiple_choice',
-                    'options': [
-                        'Constant and continuous',
-                        'Several times daily',
-                        'Once daily at regular times',
-                        'Few times per week',
-                        'Intermittent with no clear pattern',
-                        'Only during specific activities',
-                        'Mainly at night or morning',
-                        'Triggered by certain situations'
-                    ],
-                    'help_text': 'Frequency patterns help identify triggers and underlying mechanisms',
-                    'diagnostic_purpose': f'Determine frequency and persistence patterns of {clean_symptom}',
-                    'symptom_focus': clean_symptom,
-                    'question_category': 'frequency_pattern'
-                }
-            questions.append(question2)
-            print(f"DEBUG: Added question 2 for {clean_symptom}")  # Debug log
-            
-            # Question 3: Characteristics, Triggers & Modifying Factors
-            question3 = {
-                'question': f'What specific characteristics, triggers, or factors affect your {clean_symptom}?',
-                'type': 'textarea',
-                'placeholder': f'Describe: What does the {clean_symptom} feel like? What makes it worse or better? Any specific triggers (food, stress, position, weather, etc.)? How does it affect your daily activities?',
-                'help_text': 'Detailed characteristics and modifying factors are crucial for accurate diagnosis',
-                'diagnostic_purpose': f'Identify quality, triggers, relieving factors, and functional impact of {clean_symptom}',
-                'symptom_focus': clean_symptom,
-                'question_category': 'characteristics_triggers'
-            }
-            questions.append(question3)
-            print(f"DEBUG: Added question 3 for {clean_symptom}")  # Debug log
-        
-        # For free text symptoms, ask 3 comprehensive questions
-        if free_text and free_text.strip():
-            print(f"DEBUG: Processing free text symptoms: {free_text}")  # Debug log
-            
-            questions.append({
-                'question': 'For the symptoms you described, when did they first appear and what is their timing pattern?',
-                'type': 'multiple_choice',
-                'options': [
-                    'All started suddenly at the same time',
-                    'Appeared gradually over days/weeks',
-                    'Different symptoms started at different times',
-                    'Symptoms come and go together',
-                    'Some constant, others intermittent',
-                    'Mainly occur at specific times of day',
-                    'Triggered by specific situations',
-                    'Present for months/years'
-                ],
-                'help_text': 'Timeline helps understand if symptoms are related or separate conditions',
-                'diagnostic_purpose': 'Establish temporal relationship between patient-described symptoms',
-                'symptom_focus': 'free_text_symptoms',
-                'question_category': 'onset_timing'
-            })
-            
-            questions.append({
-                'question': 'How severe are your described symptoms and how do they impact your daily life?',
-                'type': 'multiple_choice',
-                'options': [
-                    'Mild - barely noticeable, no impact on activities',
-                    'Mild to moderate - some discomfort but manageable',
-                    'Moderate - interferes with some daily activities',
-                    'Moderate to severe - significant impact on work/life',
-                    'Severe - greatly limits daily functioning',
-                    'Very severe - unable to perform normal activities',
-                    'Severity varies greatly throughout the day',
-                    'Progressive worsening over time'
-                ],
-                'help_text': 'Severity and functional impact help prioritize treatment urgency',
-                'diagnostic_purpose': 'Assess overall severity and functional impact of described symptoms',
-                'symptom_focus': 'free_text_symptoms',
-                'question_category': 'severity_impact'
-            })
-            
-            questions.append({
-                'question': 'What specific details can you provide about your symptoms - their character, what triggers them, and what provides relief?',
-                'type': 'textarea',
-                'placeholder': 'Please describe: Exact nature/quality of each symptom, any patterns you\'ve noticed, what makes them worse, what helps, any associated factors (stress, food, weather, position), medications tried, etc.',
-                'help_text': 'Detailed symptom characteristics are essential for accurate diagnosis',
-                'diagnostic_purpose': 'Gather comprehensive qualitative information about patient-described symptoms',
-                'symptom_focus': 'free_text_symptoms',
-                'question_category': 'detailed_characteristics'
-            })
-            
-            print(f"DEBUG: Added 3 free text questions")  # Debug log
-        
-        print(f"DEBUG: Total questions generated: {len(questions)}")  # Debug log
-        return questions
+        blocks = len(symptoms) + (1 if free_text and free_text.strip() else 0)
+        return [self._individual_question(symptoms, block, slot)
+                for block in range(blocks) for slot in range(QUESTIONS_PER_SYMPTOM)]
+
+    def _individual_question(self, symptoms: List[str], block: int, slot: int) -> Dict:
+        """
+        Question `slot` of symptom `block` of the one-by-one interview, built from the shared
+        templates; the block after the last selected symptom holds the free-text questions.
+        """
+        if block >= len(symptoms):
+            return dict(FREE_TEXT_QUESTIONS[slot])
+
+        # Clean symptom name (remove description in parentheses)
+        clean_symptom = symptoms[block].split('(')[0].strip()
+        if slot == 1:
+            # Intensity for pain-like symptoms, frequency and persistence for the rest
+            key = 'intensity_duration' if self._symptom_needs_intensity_rating(clean_symptom) else 'frequency_pattern'
+            template = SYMPTOM_QUESTION_VARIANTS[key]
+        else:
+            template = SYMPTOM_QUESTION_TEMPLATES[slot]
+
+        question = dict(template)
+        for field in _SYMPTOM_FIELDS[id(template)]:
+            question[field] = template[field].replace('{symptom}', clean_symptom)
+        question['symptom_focus'] = clean_symptom
+        return question
 
     def _symptom_needs_intensity_rating(self, symptom: str) -> bool:
         """
@@ -818,65 +1093,47 @@ IMPORTANT:
         Use OpenAI to dynamically generate a structured list of follow-up questions
         for the "Additional Information" section based on prior inputs.
         The output must be an array of objects with keys: symptom, category, notes_hint, type.
+        Served from the questionnaire cache when the inputs map to a cacheable profile.
         """
+        return self._cached_questionnaire(
+            'dynamic_questions', self._dynamic_questions_template(),
+            lambda: structured_profile(case_type, symptoms, free_text, demographics),
+            lambda: self._request_dynamic_questions(case_type, symptoms, free_text, demographics)
+        )
+
+    def _dynamic_questions_template(self):
+        return DYNAMIC_QUESTIONS_COMPACT_PROMPT if compact_output_enabled('dynamic_questions') else DYNAMIC_QUESTIONS_PROMPT
+
+    def _request_dynamic_questions(self, case_type: str, symptoms: List[str], free_text: str, demographics: Dict) -> List[Dict]:
         profile = {
             'case_type': case_type,
-            'demographics': demographics or {},
+            'demographics': build_digest({'demographics': demographics})['demographics'],
             'symptoms': symptoms or [],
             'free_text': free_text or ''
         }
 
-        categories = [
-            "general", "gastrointestinal", "respiratory", "cardiovascular", "neurological",
-            "musculoskeletal", "dermatological", "risk_factors", "history", "medications",
-            "psychological", "temporal", "epidemiological", "physical", "pain", "throat"
-        ]
-
-        prompt = (
-            "You are a medical intake assistant. Based on the patient profile, generate a structured "
-            "checklist of follow-up items to ask in an intake form.\n\n"
-            f"PATIENT PROFILE (JSON):\n{json.dumps(profile, ensure_ascii=False)}\n\n"
-            "REQUIREMENTS:\n"
-            "- Output ONLY valid JSON. No prose, no markdown.\n"
-            "- JSON must be an array of 15-25 objects.\n"
-            "- Each object must have: \n"
-            "  {\n    \"symptom\": \"Short human-readable question/symptom probe\",\n"
-            "    \"category\": \"one of: " + ", ".join(categories) + "\",\n"
-            "    \"notes_hint\": \"Brief hint for notes input\",\n"
-            "    \"type\": \"yes_no_notes\"\n  }\n"
-            "- Questions must be tailored to the case type, selected symptoms, demographics, and free text.\n"
-            "- Include temporal, risk factor, and red-flag probes when appropriate.\n"
-            "- Keep 'symptom' field concise (max ~80 chars).\n"
-        )
+        template = self._dynamic_questions_template()
+        compact = template is DYNAMIC_QUESTIONS_COMPACT_PROMPT
+        rendered = template.render(profile=json.dumps(profile, ensure_ascii=False))
 
         def make_request():
-            return self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You generate structured JSON checklists for medical intake forms."},
-                    {"role": "user", "content": prompt}
-                ],
+            return self._create_chat_completion(
+                template.name,
+                messages=rendered['messages'],
                 temperature=0.2,
                 max_tokens=1200
             )
 
         response = self._make_openai_request_with_retry(make_request)
-        content = self._clean_json_response(response.choices[0].message.content)
-
-        try:
-            payload = json.loads(content)
-        except Exception as e:
-            # Some models might wrap in an object
-            try:
-                alt = json.loads(content)
-                payload = alt.get('questions', []) if isinstance(alt, dict) else []
-            except Exception:
-                raise ValueError(f"OpenAI returned non-JSON or invalid JSON: {str(e)}")
+        # Some models wrap the array in an object
+        payload = self._parse_json_response(template.name, response)
 
         # Normalize into expected structure
         items = payload.get('questions', payload) if isinstance(payload, dict) else payload
         if not isinstance(items, list):
             raise ValueError("OpenAI dynamic questions not a list")
+        if compact:
+            items = expand_dynamic_questions(items)
 
         questions: List[Dict] = []
         seen = set()
@@ -891,7 +1148,7 @@ IMPORTANT:
                 continue
             seen.add(key)
             category = str(raw.get('category') or 'general').strip().lower()
-            if category not in categories:
+            if category not in DYNAMIC_CATEGORIES:
                 category = 'general'
             notes_hint = str(raw.get('notes_hint') or raw.get('notes') or '').strip()
             questions.append({
@@ -908,97 +1165,11 @@ IMPORTANT:
         Extract key symptom labels from user input and create a structured label system.
         Returns extracted labels with their features and correlations.
         """
-        # Define primary symptom labels with their feature questions
-        primary_labels = {
-            'fever': {
-                'keywords': ['fever', 'temperature', 'hot', 'burning up', 'feverish'],
-                'features': [
-                    "Did you check temperature with thermometer?",
-                    "How many times has fever come in a day?", 
-                    "Does fever come every day at least twice?",
-                    "What is the highest temperature recorded?",
-                    "Does fever respond to paracetamol/acetaminophen?"
-                ]
-            },
-            'chills_shivering': {
-                'keywords': ['chills', 'shivering', 'shaking', 'cold', 'trembling'],
-                'features': [
-                    "Do chills come along with fever?",
-                    "Do you feel sweating after chills?",
-                    "How long do chills episodes last?",
-                    "Do chills happen at specific times?"
-                ]
-            },
-            'sweating': {
-                'keywords': ['sweating', 'perspiration', 'night sweats', 'profuse sweating'],
-                'features': [
-                    "Is sweating mainly at night?",
-                    "Does sweating occur with fever?",
-                    "Is sweating excessive even when cool?",
-                    "Does sweating soak through clothes/bedding?"
-                ]
-            },
-            'muscle_pain': {
-                'keywords': ['muscle pain', 'body ache', 'myalgia', 'body pain', 'muscle ache'],
-                'features': [
-                    "Is muscle pain all over body or specific areas?",
-                    "Does muscle pain worsen with movement?",
-                    "Is pain constant or comes in waves?",
-                    "Does pain respond to pain medication?"
-                ]
-            },
-            'joint_pain': {
-                'keywords': ['joint pain', 'arthralgia', 'knee pain', 'elbow pain', 'wrist pain'],
-                'features': [
-                    "Which joints are affected?",
-                    "Is joint pain worse in morning or evening?",
-                    "Any visible swelling in joints?",
-                    "Does joint pain limit movement?"
-                ]
-            },
-            'headache': {
-                'keywords': ['headache', 'head pain', 'migraine', 'head ache'],
-                'features': [
-                    "Where exactly is headache located?",
-                    "Is headache throbbing or constant pressure?",
-                    "Does headache worsen with light/sound?",
-                    "How severe is headache on scale 1-10?"
-                ]
-            },
-            'weakness': {
-                'keywords': ['weakness', 'fatigue', 'tired', 'exhaustion', 'weak', 'energy loss'],
-                'features': [
-                    "Is weakness generalized or specific body parts?",
-                    "Does weakness interfere with daily activities?",
-                    "Is weakness worse at certain times?",
-                    "Any difficulty getting up from sitting/lying?"
-                ]
-            },
-            'nausea_vomiting': {
-                'keywords': ['nausea', 'vomiting', 'feeling sick', 'throwing up', 'sick feeling'],
-                'features': [
-                    "Does vomiting occur with or without eating?",
-                    "How many times vomiting per day?",
-                    "Is nausea constant or comes in waves?",
-                    "What triggers the nausea/vomiting?"
-                ]
-            },
-            'loss_of_appetite': {
-                'keywords': ['loss of appetite', 'no appetite', 'not hungry', 'food aversion'],
-                'features': [
-                    "Complete loss of appetite or reduced?",
-                    "Any specific foods you can tolerate?",
-                    "How much weight loss if any?",
-                    "When did appetite loss start?"
-                ]
-            }
-        }
-        
         # Extract labels present in symptoms
         extracted_labels = {}
         all_text = ' '.join(symptoms).lower() + ' ' + free_text.lower()
         
-        for label, data in primary_labels.items():
+        for label, data in SYMPTOM_LABELS.items():
             if any(keyword in all_text for keyword in data['keywords']):
                 extracted_labels[label] = {
                     'detected': True,
@@ -1093,6 +1264,49 @@ IMPORTANT:
         
         return questions
 
+    def _correlation_questions(self, correlation_matrix: Dict) -> List[Dict]:
+        """Yes/no + notes rows asking how each pair of correlated labels relate."""
+        questions = []
+        for label, correlations in correlation_matrix.items():
+            for correlation in correlations:
+                for question in correlation['questions']:
+                    questions.append({
+                        'symptom': question,
+                        'category': 'correlation',
+                        'notes_hint': f'Relationship between {label.replace("_", " ")} and {correlation["label"].replace("_", " ")}',
+                        'type': 'yes_no_notes',
+                        'correlation_strength': correlation['strength'],
+                        'question_type': 'correlation_analysis'
+                    })
+        return questions
+
+    def wire_templates(self) -> Tuple[List[Dict], List[Dict]]:
+        """
+        (fixed rows, parametric templates) of every rule-based question this helper builds,
+        for the templated questionnaire wire format (see question_wire.QuestionTemplates).
+        Parametric templates keep their {symptom}/{values} placeholders; ids are params.
+        """
+        every_label = {label: {'features': data['features']} for label, data in SYMPTOM_LABELS.items()}
+        rows = [item.to_dict() for item in BASE_CHECKLIST]
+        rows += [item.to_dict() for items in CASE_CHECKLISTS.values() for item in items]
+        rows += [item.to_dict() for _, items in SYMPTOM_CHECKLISTS for item in items]
+        rows += [item.to_dict() for _, item in FREE_TEXT_CHECKLISTS]
+        rows += self._generate_label_feature_questions(every_label)
+        rows += self._correlation_questions(self._create_label_correlation_matrix(every_label))
+        rows += [dict(question) for question in FREE_TEXT_QUESTIONS]
+
+        parametric = [{**template, 'symptom_focus': '{symptom}'} for template in (
+            *SYMPTOM_QUESTION_TEMPLATES.values(), *SYMPTOM_QUESTION_VARIANTS.values())]
+        fallback = [*FALLBACK_OUTLIER_QUESTIONS['critical'].values(), *FALLBACK_OUTLIER_QUESTIONS['moderate'].values(),
+                    FALLBACK_SENIOR_QUESTION, FALLBACK_PEDIATRIC_QUESTION, FALLBACK_PREGNANCY_QUESTION,
+                    FALLBACK_DIABETES_QUESTION, FALLBACK_FUNCTION_QUESTION, FALLBACK_ONSET_QUESTION,
+                    FALLBACK_GENERAL_QUESTION]
+        for question in fallback:
+            template = question.to_dict(0)
+            del template['id']
+            parametric.append(template)
+        return rows, parametric
+
     def _generate_enhanced_structured_questions(self, case_type: str, symptoms: List[str], free_text: str, demographics: Dict) -> List[Dict]:
         """
         Enhanced version that includes label extraction and correlation-based questions.
@@ -1104,17 +1318,7 @@ IMPORTANT:
         questions = label_data['feature_questions']
         
         # Add correlation questions
-        for label, correlations in label_data['correlation_matrix'].items():
-            for correlation in correlations:
-                for question in correlation['questions']:
-                    questions.append({
-                        'symptom': question,
-                        'category': 'correlation',
-                        'notes_hint': f'Relationship between {label.replace("_", " ")} and {correlation["label"].replace("_", " ")}',
-                        'type': 'yes_no_notes',
-                        'correlation_strength': correlation['strength'],
-                        'question_type': 'correlation_analysis'
-                    })
+        questions.extend(self._correlation_questions(label_data['correlation_matrix']))
         
         # Add base questions from original method
         base_questions = self._generate_structured_symptom_questions(case_type, symptoms, free_text, demographics)
@@ -1132,45 +1336,66 @@ IMPORTANT:
         
         return final_questions
 
-    def get_next_followup_question(self, data: Dict) -> Dict:
+    def get_next_followup_question(self, data: Dict, session_id: Optional[str] = None) -> Dict:
         """
         Serve the next question in the legacy one-by-one interview flow.
-        Uses cached state to step through questions generated per selected symptoms
-        and free-text. Returns { question, completed }.
+        Only the session's position (symptom index, question slot) is kept between calls,
+        in the followup_cursors store when given (else in this process); the question at
+        that position is built from the shared templates on demand. Returns
+        { question, completed, final_question }.
         """
-        # Initialize the question list if empty
-        if not self.symptom_analysis_state.get('individual_questions'):
-            # Pull inputs from payload
-            symptoms = data.get('symptoms') or []
-            free_text = data.get('freeTextSymptoms') or data.get('free_text') or ''
-
-            # Generate questions (3 per symptom + 3 for free text if present)
-            questions = self._generate_individual_symptom_questions(symptoms, free_text)
-
-            self.symptom_analysis_state['individual_questions'] = questions
-            self.symptom_analysis_state['individual_index'] = 0
-
-        # Fetch current index and questions
-        idx = self.symptom_analysis_state.get('individual_index', 0)
-        questions = self.symptom_analysis_state.get('individual_questions', [])
+        symptoms = [s for s in (data.get('symptoms') or []) if isinstance(s, str)]
+        free_text = data.get('freeTextSymptoms') or data.get('free_text') or ''
+        has_free_text = bool(free_text.strip())
+        blocks = len(symptoms) + (1 if has_free_text else 0)
+        fp = inputs_fingerprint(symptoms, has_free_text)
+
+        if self.followup_cursors is not None and session_id:
+            position = self.followup_cursors.advance(session_id, fp, blocks, QUESTIONS_PER_SYMPTOM)
+        else:
+            state = self.symptom_analysis_state
+            cursor = state['individual_cursor'] if state.get('individual_fp') == fp else None
+            position = step_cursor(cursor, blocks, QUESTIONS_PER_SYMPTOM)
+            state['individual_fp'] = fp
+            state['individual_cursor'] = list(position) if position else [blocks, 0]
 
         # If we've asked all questions, mark completed
-        if idx >= len(questions):
+        if position is None:
             return { 'completed': True }
 
-        # Get the next question and advance the index
-        next_q = questions[idx]
-        self.symptom_analysis_state['individual_index'] = idx + 1
-
-        # Indicate if this is the final question
-        is_final = (self.symptom_analysis_state['individual_index'] >= len(questions))
-
+        block, slot = position
         return {
-            'question': next_q,
+            'question': self._individual_question(symptoms, block, slot),
             'completed': False,
-            'final_question': is_final
+            # Indicate if this is the final question
+            'final_question': block == blocks - 1 and slot == QUESTIONS_PER_SYMPTOM - 1
         }
 
+    def extract_symptom_labels_local_first(self, symptoms: List[str], free_text: str = '') -> Dict:
+        """
+        Label extraction for /extract_labels: the local fuzzy matcher answers when its
+        confidence reaches LABEL_MATCH_MIN_CONFIDENCE (plain inputs such as "fever and
+        headache since 2 days", typos and negations included); anything it cannot
+        explain goes to the LLM. Which path answered, and how long it took, is recorded
+        under label_extraction and label_extraction_seconds.
+        """
+        started = time.time()
+        local = match_labels(symptoms, free_text)
+        if local['extracted_labels'] and local['confidence'] >= LABEL_MATCH_MIN_CONFIDENCE:
+            local['correlation_matrix'] = self._create_label_correlation_matrix(local['extracted_labels'])
+            local['feature_questions'] = []
+            local['source'] = 'local'
+            metrics.increment('label_extraction', 'local')
+            metrics.observe('label_extraction_seconds', 'local', time.time() - started)
+            return local
+
+        result = self.extract_symptom_labels_with_openai(symptoms, free_text)
+        result['source'] = 'llm'
+        metrics.increment('label_extraction', 'llm')
+        metrics.observe('label_extraction_seconds', 'llm', time.time() - started)
+        print(f"DEBUG: Local label match confidence {local['confidence']} below {LABEL_MATCH_MIN_CONFIDENCE}, used LLM")
+        return result
+
     def extract_symptom_labels_with_openai(self, symptoms: List[str], free_text: str = '') -> Dict:
         """
         Use OpenAI to extract symptom labels from user input instead of keyword matching.
@@ -1187,63 +1412,19 @@ IMPORTANT:
                 'feature_questions': []
             }
 
-        prompt = f"""You are a medical AI assistant. Analyze the following symptom description and extract key medical symptom labels.
-
-SYMPTOM INPUT: "{all_symptom_text}"
-
-Extract specific medical symptom labels from this text. Focus on identifying distinct, clinically relevant symptom categories.
-
-Return your analysis in this EXACT JSON format:
-{{
-    "extracted_labels": {{
-        "label_name": {{
-            "detected": true,
-            "source": "symptoms" or "free_text",
-            "confidence": "high" or "medium" or "low"
-        }}
-    }},
-    "correlation_matrix": {{
-        "label_name": [
-            {{
-                "label": "related_label_name",
-                "strength": "high" or "moderate",
-                "questions": [
-                    "Specific correlation question 1",
-                    "Specific correlation question 2"
-                ]
-            }}
-        ]
-    }}
-}}
-
-GUIDELINES:
-- Extract 3-8 specific medical symptom labels
-- Use standard medical terminology 
-- Correlations should be medically accurate
-- Questions should be clinically relevant
-- Focus on primary symptoms mentioned
-- Avoid generic terms like "general symptoms"
-
-Example labels: fever, headache, nausea, muscle_pain, fatigue, abdominal_pain, respiratory_symptoms, etc."""
+        rendered = LABEL_EXTRACTION_PROMPT.render(symptom_text=all_symptom_text)
 
         try:
             def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "system",
-                        "content": "You are a medical AI specialized in symptom analysis and label extraction. Provide accurate, clinically relevant symptom labels and their relationships."
-                    }, {
-                        "role": "user",
-                        "content": prompt
-                    }],
+                return self._create_chat_completion(
+                    'label_extraction',
+                    messages=rendered['messages'],
                     temperature=0.2,
                     max_tokens=1500
                 )
             
             response = self._make_openai_request_with_retry(make_request)
-            content = self._clean_json_response(response.choices[0].message.content)
-            result = json.loads(content)
+            result = self._parse_json_response('label_extraction', response, expect='object')
             
             # Validate and ensure proper response format
             if 'extracted_labels' not in result:
@@ -1288,249 +1469,319 @@ Example labels: fever, headache, nausea, muscle_pain, fatigue, abdominal_pain, r
         Returns:
             list: A list of question objects with type, text, and options
         """
+        return self._cached_questionnaire(
+            'additional_questions', self._additional_questions_template(),
+            lambda: self._additional_questions_profile(patient_data, max_questions),
+            lambda: self._request_additional_questions(patient_data, max_questions)
+        )
+
+    def _request_additional_questions(self, patient_data: Dict, max_questions: int) -> List[Dict]:
         try:
-            # Extract relevant information from patient data
-            symptoms = patient_data.get('symptoms', [])
-            free_text_symptoms = patient_data.get('freeTextSymptoms', '')
-            demographics = patient_data.get('demographics', {})
-            vitals = patient_data.get('vitals', {})
-            medical_conditions = patient_data.get('medicalConditions', {})
-            case_type = patient_data.get('caseType', '')
-            
-            # Construct prompt for OpenAI
-            system_message = """You are a medical expert specializing in patient assessment. 
-            Your task is to generate targeted additional information questions based on the OLDCARTS framework
-            (Onset, Location, Duration, Characteristics, Aggravating factors, Relieving factors, Timing, Severity)
-            tailored to the patient's specific symptoms, demographics, and clinical measurements.
-            
-            Create questions that are directly relevant to the reported symptoms and will help in accurate diagnosis.
-            Each question should have a clear clinical purpose and be formatted as a JSON object with:
-            - id: A unique numerical identifier
-            - category: The OLDCARTS category (onset_timing, location, duration_pattern, characteristics_quality, aggravating_factors, relieving_factors, pain_assessment, nausea_vomiting, fatigue_impact, daily_life_impact, work_school_impact, patient_concerns, patient_expectations)
-            - question: The actual question text
-            - type: Question type (multiple_choice, textarea, scale)
-            - options: For multiple_choice questions, an array of possible answers
-            - min/max/min_label/max_label: For scale questions
-            - relevance: A short explanation of why this question is clinically relevant
-            - placeholder: For textarea questions, a hint for the answer
-            
-            Prioritize questions that:
-            1. Address the timing and nature of the primary symptoms
-            2. Explore potential complications or differential diagnoses
-            3. Assess severity and impact on the patient's life
-            4. Help distinguish between similar conditions
-            
-            Make sure questions are medically accurate and use appropriate medical terminology while still being understandable to patients.
-            """
-            
-            # Construct context message with patient information
-            context_message = f"""
-            Generate additional information questions for a {demographics.get('age', '')} year old {demographics.get('gender', '')} 
-            with the following reported symptoms: {', '.join(symptoms)}
-            
-            Additional symptom details: {free_text_symptoms}
-            
-            Case type: {case_type}
-            
-            Vital signs:
-            """
-            
-            # Add vitals if available
-            if vitals:
-                if 'temperature' in vitals:
-                    context_message += f"- Temperature: {vitals.get('temperature')} {vitals.get('temperatureUnit', 'C')}\n"
-                if 'pulseRate' in vitals:
-                    context_message += f"- Pulse rate: {vitals.get('pulseRate')} bpm\n"
-                if 'systolic' in vitals and 'diastolic' in vitals:
-                    context_message += f"- Blood pressure: {vitals.get('systolic')}/{vitals.get('diastolic')} mmHg\n"
-                if 'oxygenSaturation' in vitals:
-                    context_message += f"- Oxygen saturation: {vitals.get('oxygenSaturation')}%\n"
-                if 'respiratoryRate' in vitals:
-                    context_message += f"- Respiratory rate: {vitals.get('respiratoryRate')} breaths/min\n"
-                if 'painScale' in vitals:
-                    context_message += f"- Pain level: {vitals.get('painScale')}/10\n"
-            
-            # Add medical conditions if available
-            if medical_conditions:
-                context_message += "\nMedical conditions:\n"
-                for condition, value in medical_conditions.items():
-                    context_message += f"- {condition}: {value}\n"
-            
-            user_message = f"""
-            Based on the patient information provided, generate a maximum of {max_questions} clinically relevant additional information questions 
-            using the OLDCARTS framework. Focus on questions that would help determine the diagnosis and severity of the patient's condition.
-            
-            Return the questions in a valid JSON array format that I can parse programmatically. Each question should be directly relevant 
-            to the symptoms and medical context provided. Don't invent new symptoms that weren't mentioned.
-            
-            Here's an example of the desired output format:
-            ```json
-            [
-              {{
-                "id": 1,
-                "category": "onset_timing",
-                "question": "When did your fever first begin?",
-                "type": "multiple_choice",
-                "options": ["Within the last 24 hours", "1-3 days ago", "4-7 days ago", "More than a week ago"],
-                "relevance": "Helps determine if this is an acute or chronic condition"
-              }},
-              {{
-                "id": 2,
-                "category": "pain_assessment",
-                "question": "How would you rate your abdominal pain?",
-                "type": "scale",
-                "min": 0,
-                "max": 10,
-                "min_label": "No pain",
-                "max_label": "Worst possible pain",
-                "relevance": "Pain severity helps assess condition urgency"
-              }}
-            ]
-            ```
-            """
+            template, rendered, compact = self._additional_questions_prompt(patient_data, max_questions)
 
             # Use retry wrapper for OpenAI API call with the same model as other features
             def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,  # Use the model defined in the class instead of hard-coded "gpt-4"
-                    messages=[
-                        {"role": "system", "content": system_message},
-                        {"role": "user", "content": context_message},
-                        {"role": "user", "content": user_message}
-                    ],
+                return self._create_chat_completion(
+                    template.name,
+                    messages=rendered['messages'],
                     temperature=0.7,
                     max_tokens=2048
                 )
             
             response = self._make_openai_request_with_retry(make_request)
-            response_text = response.choices[0].message.content
-            
-            # Extract JSON from response
-            import re
-            import json
-            
-            # Find JSON array in the response
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```|(\[[\s\S]*\])', response_text)
-            
-            if json_match:
-                json_str = json_match.group(1) or json_match.group(2)
-                questions = json.loads(json_str)
-                return questions
-            else:
-                # If no proper JSON found, attempt to parse the entire response
-                try:
-                    questions = json.loads(response_text)
-                    return questions
-                except:
-                    print("Could not parse JSON from response, using fallback questions")
-                    return []
+            try:
+                questions = self._parse_json_response(template.name, response, expect='array')
+            except JSONExtractionError:
+                print("Could not parse JSON from response, using fallback questions")
+                return []
+            return expand_additional_questions(questions) if compact else questions
                 
         except Exception as e:
             print(f"Error generating additional information questions: {e}")
             return []
-    
-    def generate_patient_summary_with_do_indicators(self, patient_data: Dict) -> Dict:
+
+    def stream_additional_questions(self, patient_data: Dict, max_questions: int = 20):
         """
-        Generate a comprehensive patient summary with D/O (Diagnostic/Objective) indicators
-        and analyze clinical vitals for abnormalities.
+        Streaming variant of generate_additional_questions. Returns an iterator of
+        ('question', question) pairs, each yielded as soon as that question is complete in
+        the token stream and passes _valid_question, then ('done', {'total_questions': n}).
+        Generation starts before this returns, so it runs under the caller's request priority.
+        A questionnaire-cache hit is sent at once; only a stream that finished with 'stop'
+        is stored in the cache, never one cut short by max_tokens or a content filter.
+        """
+        template, rendered, compact = self._additional_questions_prompt(patient_data, max_questions)
+        cache = self.questionnaire_cache
+        profile = version = None
+        if cache is not None:
+            version = f"{template.name}.v{template.version}"
+            profile = self._additional_questions_profile(patient_data, max_questions)
+            cached = cache.lookup('additional_questions', version, profile)
+            if cached is not None:
+                return iter([('question', question) for question in cached]
+                            + [('done', {'total_questions': len(cached)})])
+
+        def produce():
+            count = 0
+            questions = []
+            outcome = {}
+            try:
+                items = JSONArrayItemStream()
+                for text in self._stream_chat_completion(template.name, rendered['messages'], outcome,
+                                                         temperature=0.7, max_tokens=2048):
+                    for item in items.feed(text):
+                        question = expand_additional_questions([item]) if compact else [item]
+                        if count < max_questions and question and _valid_question(question[0]):
+                            count += 1
+                            questions.append({**question[0], 'id': count})
+                            yield 'question', questions[-1]
+                if cache is not None and outcome.get('finish_reason') == 'stop':
+                    cache.store('additional_questions', version, profile, questions)
+                elif cache is not None:
+                    print(f"WARN: Not caching additional questions stream (finish_reason={outcome.get('finish_reason')})")
+            except Exception as e:
+                print(f"Error streaming additional information questions: {e}")
+            yield 'done', {'total_questions': count}
+        return self._drain_in_background(produce())
+
+    def _additional_questions_template(self):
+        return ADDITIONAL_QUESTIONS_COMPACT_PROMPT if compact_output_enabled('additional_questions') else ADDITIONAL_QUESTIONS_PROMPT
+
+    def _additional_questions_profile(self, patient_data: Dict, max_questions: int) -> Optional[Dict]:
+        try:
+            outliers = self._analyze_vitals_outliers(patient_data.get('vitals') or {})
+        except (TypeError, ValueError):
+            return None
+        flags = [outlier.type for level in outliers.values() for outlier in level]
+        return additional_profile(patient_data, max_questions, flags)
+
+    def _cached_questionnaire(self, family: str, template, profile_for, generate):
+        """generate() through the questionnaire cache, keyed by profile_for() and the prompt version."""
+        if self.questionnaire_cache is None:
+            return generate()
+        version = f"{template.name}.v{template.version}"
+        return self.questionnaire_cache.get_or_create(family, version, profile_for(), generate)
+
+    def warm_questionnaire(self, family: str, profile: Dict, refresh: bool = False) -> bool:
+        """
+        Generate and store the questionnaire for a cache profile from representative
+        inputs (see warm_questionnaires.py). Returns True when a new entry was stored,
+        False when one already existed or generation produced nothing.
         """
-        # Extract patient information
+        patient_data = profile_patient_data(profile)
+        if family == 'dynamic_questions':
+            template = self._dynamic_questions_template()
+            generate = lambda: self._request_dynamic_questions(
+                patient_data['caseType'], patient_data['symptoms'], '', patient_data['demographics'])
+        elif family == 'additional_questions':
+            template = self._additional_questions_template()
+            generate = lambda: self._request_additional_questions(patient_data, profile.get('max_questions', 20))
+        else:
+            raise ValueError(f"Unknown questionnaire family: {family}")
+
+        version = f"{template.name}.v{template.version}"
+        if not refresh and self.questionnaire_cache.get(family, version, profile, observe=False) is not None:
+            return False
+        payload = generate()
+        if payload:
+            self.questionnaire_cache.put(family, version, profile, payload)
+        return bool(payload)
+
+    def _additional_questions_prompt(self, patient_data: Dict, max_questions: int):
+        """(template, rendered prompt, compact) for the OLDCARTS questions."""
+        symptoms = patient_data.get('symptoms', [])
         demographics = patient_data.get('demographics', {})
-        medical_conditions = patient_data.get('medicalConditions', {})
-        medical_history = patient_data.get('medicalHistory', {})
-        lifestyle = patient_data.get('lifestyle', {})
-        medical_records = patient_data.get('medicalRecords', {})
+
+        # Vitals and conditions come from the session digest and go last in the prompt
+        digest = self.patient_context_digest(patient_data)
+
+        template = self._additional_questions_template()
+        compact = template is ADDITIONAL_QUESTIONS_COMPACT_PROMPT
+        rendered = template.render(
+            max_questions=str(max_questions),
+            age=str(demographics.get('age', '')),
+            gender=demographics.get('gender', ''),
+            symptoms=', '.join(symptoms),
+            free_text=patient_data.get('freeTextSymptoms', ''),
+            case_type=patient_data.get('caseType', ''),
+            vitals=digest['vitals'],
+            medical_conditions=digest['medical_conditions']
+        )
+        return template, rendered, compact
+
+    def _drain_in_background(self, items):
+        """
+        Run the generator `items` on the fan-out pool, under a copy of the caller's context
+        (request priority, session), and return an iterator over what it yields. The work
+        starts now and keeps its priority after the view has returned a streamed response.
+        Closing the iterator (the client went away) stops the generator at its next item,
+        so it closes its upstream stream instead of draining it into a queue nobody reads.
+        """
+        channel = queue.Queue()
+        finished = object()
+        cancelled = threading.Event()
+
+        def pump():
+            try:
+                for item in items:
+                    if cancelled.is_set():
+                        break
+                    channel.put(item)
+            except Exception as e:
+                print(f"Error in background stream: {e}")
+            finally:
+                if cancelled.is_set():
+                    print("DEBUG: Stream consumer went away, closing the background generator")
+                    items.close()
+                channel.put(finished)
+
+        self._fanout_pool().submit(contextvars.copy_context().run, pump)
+
+        def results():
+            try:
+                while True:
+                    item = channel.get()
+                    if item is finished:
+                        return
+                    yield item
+            finally:
+                cancelled.set()
+        return results()
+
+    def patient_context_digest(self, patient_data: Dict) -> Dict[str, str]:
+        """
+        The session's compact patient-context digest (see patient_context.build_digest),
+        keyed like the template fields. Every prompt builder renders demographics, history,
+        lifestyle, records and vitals from it instead of from the raw form blobs.
+        """
+        if self.context_cache is None:
+            return self._build_patient_context(patient_data)
+        return self.context_cache.get(patient_data, self._build_patient_context)
+
+    def _build_patient_context(self, patient_data: Dict) -> Dict[str, str]:
+        digest = build_digest(patient_data)
+        narrative = '\n'.join(f"{field.replace('_', ' ')}: {digest[field]}"
+                              for field in NARRATIVE_CONTEXT_FIELDS if digest[field])
+        if not PATIENT_CONTEXT_SUMMARIZE or estimate_text_tokens(narrative) < PATIENT_CONTEXT_SUMMARY_MIN_TOKENS:
+            return digest
+
+        rendered = PATIENT_CONTEXT_PROMPT.render(context=narrative)
+        try:
+            def make_request():
+                return self._create_chat_completion(
+                    'patient_context',
+                    messages=rendered['messages'],
+                    temperature=0.0,
+                    max_tokens=200
+                )
+
+            summary = ' '.join(self._make_openai_request_with_retry(make_request).choices[0].message.content.split())
+        except Exception as e:
+            print(f"WARN: Patient context summarization failed, using the plain digest: {e}")
+            return digest
+        if summary:
+            # The analysis prompts read `history`, the Patient History prompts `medical_history`
+            digest.update({field: '' for field in NARRATIVE_CONTEXT_FIELDS})
+            digest['medical_history'] = digest['history'] = summary
+        return digest
+
+    def patient_history_context(self, patient_data: Dict) -> Dict:
+        """
+        Inputs shared by the Patient History Followup prompts, computed once: the session's
+        patient-context digest, vitals outliers and abnormalities, and the local red-flag
+        verdict.
+        """
         vitals = patient_data.get('vitals', {})
-        case_type = patient_data.get('caseType', '')
+        vitals_outliers = self._analyze_vitals_outliers(vitals)
+        digest = self.patient_context_digest(patient_data)
+        return {
+            'sections': {field: digest[field] for field in (
+                'demographics', 'medical_conditions', 'medical_history', 'lifestyle', 'medical_records',
+                'vitals', 'case_type'
+            )},
+            'vitals_outliers': vitals_outliers,
+            'vitals_abnormalities': self._analyze_vitals_abnormalities(vitals),
+            'verdict': red_flags.evaluate(patient_data, vitals_outliers)
+        }
+
+    def generate_patient_history_followup(self, patient_data: Dict) -> Dict:
+        """
+        Patient summary and D/O follow-up questions for the Patient History Followup page,
+        generated concurrently from one shared context.
+        """
+        results = dict(self.stream_patient_history_followup(patient_data))
+        return {
+            'summary': results['summary'],
+            'followup': results['followup'],
+            'emergency_triage': results.get('triage')
+        }
+
+    def stream_patient_history_followup(self, patient_data: Dict):
+        """
+        Start the summary and follow-up question generations concurrently and return an
+        iterator of (part, result) pairs in completion order. An emergency red-flag
+        verdict is yielded first as ('triage', verdict). Work is submitted before this
+        returns, so it runs under the caller's request priority.
+        """
+        context = self.patient_history_context(patient_data)
+        pool = self._fanout_pool()
+        futures = {
+            pool.submit(contextvars.copy_context().run, method, patient_data, context): part
+            for part, method in (('summary', self.generate_patient_summary_with_do_indicators),
+                                 ('followup', self.generate_followup_questions_with_do_indicators))
+        }
+
+        def results():
+            if context['verdict']['emergency']:
+                yield 'triage', context['verdict']
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        return results()
+
+    def generate_patient_summary_with_do_indicators(self, patient_data: Dict, context: Optional[Dict] = None) -> Dict:
+        """
+        Generate a comprehensive patient summary with D/O (Diagnostic/Objective) indicators
+        and analyze clinical vitals for abnormalities.
+        """
+        context = context or self.patient_history_context(patient_data)
 
         # Create comprehensive prompt for patient summary with D/O indicators
-        prompt = f"""You are a medical AI assistant generating a comprehensive patient history summary with Diagnostic (D) and Objective (O) indicators.
-
-PATIENT DATA:
-Demographics: {json.dumps(demographics)}
-Medical Conditions: {json.dumps(medical_conditions)}
-Medical History: {json.dumps(medical_history)}
-Lifestyle: {json.dumps(lifestyle)}
-Medical Records: {json.dumps(medical_records)}
-Clinical Vitals: {json.dumps(vitals)}
-Case Type: {case_type}
-
-TASK: Generate a structured patient summary with D/O indicators for medical documentation.
-
-INSTRUCTIONS:
-1. Use (D) for Diagnostic indicators - information that helps diagnose conditions
-2. Use (O) for Objective indicators - measurable, observable findings
-3. Highlight risk factors, abnormalities, and clinical significance
-4. Provide insights for medical decision-making
-5. Format as HTML for web display
-
-Generate response in this EXACT JSON format:
-{{
-    "patient_summary": {{
-        "demographics_summary": "HTML formatted demographics with D/O indicators",
-        "medical_history_summary": "HTML formatted medical history with D/O indicators", 
-        "risk_factors_summary": "HTML formatted risk factors with D/O indicators",
-        "clinical_relevance": "HTML formatted clinical relevance assessment"
-    }},
-    "vitals_abnormalities": {{
-        "critical_abnormalities": ["List of critical findings requiring immediate attention"],
-        "moderate_abnormalities": ["List of moderate abnormalities requiring monitoring"],
-        "mild_abnormalities": ["List of mild abnormalities to note"],
-        "normal_findings": ["List of normal vital signs"]
-    }},
-    "medical_significance": {{
-        "diagnostic_indicators": "HTML analysis of diagnostic indicators (D)",
-        "objective_findings": "HTML analysis of objective findings (O)",
-        "clinical_correlations": "HTML analysis of clinical correlations",
-        "next_steps": "HTML recommendations for next steps"
-    }}
-}}
-
-Focus on:
-- Age/gender risk factors
-- Chronic disease implications
-- Lifestyle/occupational risks
-- Medication interactions
-- Family history significance
-- Vital signs abnormalities
-- Clinical decision support"""
+        rendered = PATIENT_SUMMARY_PROMPT.render(**context['sections'])
 
         try:
             def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "system",
-                        "content": "You are a medical AI assistant specializing in patient history summarization with D/O indicators and clinical vitals analysis. Provide comprehensive, structured medical summaries."
-                    }, {
-                        "role": "user",
-                        "content": prompt
-                    }],
+                return self._create_chat_completion(
+                    'patient_summary',
+                    messages=rendered['messages'],
                     temperature=0.2,
                     max_tokens=2000
                 )
             
             response = self._make_openai_request_with_retry(make_request)
-            content = self._clean_json_response(response.choices[0].message.content)
-            result = json.loads(content)
+            result = self._parse_json_response('patient_summary', response, expect='object')
             
             # Validate response structure
             if 'patient_summary' not in result:
                 result['patient_summary'] = self._generate_fallback_patient_summary(patient_data)
             if 'vitals_abnormalities' not in result:
-                result['vitals_abnormalities'] = self._analyze_vitals_abnormalities(vitals)
+                result['vitals_abnormalities'] = context['vitals_abnormalities']
             if 'medical_significance' not in result:
                 result['medical_significance'] = self._generate_medical_significance(patient_data)
             
-            return result
-            
         except Exception as e:
             print(f"Error generating patient summary: {e}")
-            return {
-                'patient_summary': self._generate_fallback_patient_summary(patient_data),
-                'vitals_abnormalities': self._analyze_vitals_abnormalities(vitals),
-                'medical_significance': self._generate_medical_significance(patient_data)
-            }
+            result = self.preliminary_patient_summary(patient_data)
+
+        if context['verdict']['emergency']:
+            result['emergency_triage'] = context['verdict']
+        return result
+
+    def preliminary_patient_summary(self, patient_data: Dict) -> Dict:
+        """Rule-based patient summary, used as the fallback and as the instant response for emergencies"""
+        return {
+            'patient_summary': self._generate_fallback_patient_summary(patient_data),
+            'vitals_abnormalities': self._analyze_vitals_abnormalities(patient_data.get('vitals', {})),
+            'medical_significance': self._generate_medical_significance(patient_data)
+        }
 
     def _generate_fallback_patient_summary(self, patient_data: Dict) -> Dict:
         """Generate a basic patient summary when AI generation fails"""
@@ -1653,101 +1904,28 @@ Focus on:
             'next_steps': "<p><strong>Recommended Next Steps:</strong> Continue with symptom assessment and clinical evaluation based on collected patient information.</p>"
         }
 
-    def generate_followup_questions_with_do_indicators(self, patient_data: Dict) -> Dict:
+    def generate_followup_questions_with_do_indicators(self, patient_data: Dict, context: Optional[Dict] = None) -> Dict:
         """
         Generate dynamic follow-up questions based on patient information with D/O indicators
         and outliers in clinical vitals using OpenAI.
         """
-        # Extract patient information
-        demographics = patient_data.get('demographics', {})
-        medical_conditions = patient_data.get('medicalConditions', {})
-        medical_history = patient_data.get('medicalHistory', {})
-        lifestyle = patient_data.get('lifestyle', {})
-        medical_records = patient_data.get('medicalRecords', {})
-        vitals = patient_data.get('vitals', {})
-        case_type = patient_data.get('caseType', '')
-
-        # Analyze vitals for outliers
-        vitals_outliers = self._analyze_vitals_outliers(vitals)
-        
-        # Create comprehensive prompt for question generation
-        prompt = f"""You are a medical AI assistant generating targeted follow-up questions based on patient information with D/O (Diagnostic/Objective) indicators and clinical vitals outliers.
-
-PATIENT DATA:
-Demographics: {json.dumps(demographics)}
-Medical Conditions: {json.dumps(medical_conditions)}
-Medical History: {json.dumps(medical_history)}
-
-Lifestyle: {json.dumps(lifestyle)}
-Medical Records: {json.dumps(medical_records)}
-Clinical Vitals: {json.dumps(vitals)}
-Case Type: {case_type}
-
-VITALS OUTLIERS DETECTED:
-{json.dumps(vitals_outliers)}
-
-TASK: Generate 8-12 targeted follow-up questions based on:
-1. Patient demographics with D/O indicators (age, gender, occupation, medical history)
-2. Clinical vitals outliers requiring further assessment
-3. Medical conditions that need clarification
-4. Risk factors identified from patient information
-
-QUESTION GENERATION GUIDELINES:
-- Focus on D (Diagnostic) indicators: Information that helps diagnose conditions
-- Focus on O (Objective) indicators: Measurable, observable findings
-- Address any critical vitals outliers first
-- Include age-appropriate questions
-- Consider gender-specific health concerns
-- Ask about symptom onset, duration, and severity
-- Investigate family history implications
-- Assess functional impact and quality of life
-
-Generate response in this EXACT JSON format:
-{{
-    "questions": [
-        {{
-            "id": 1,
-            "category": "vitals_outlier" | "demographics" | "medical_history" | "symptoms" | "risk_factors" | "functional_assessment",
-            "question": "Clear, specific question text",
-            "type": "multiple_choice" | "textarea" | "scale",
-            "options": ["option1", "option2", "option3", "option4"] (only for multiple_choice),
-            "min": 1, "max": 10, "min_label": "No pain", "max_label": "Severe pain" (only for scale),
-            "placeholder": "Enter details..." (only for textarea),
-            "relevance": "Medical relevance and D/O indicator explanation",
-            "priority": "high" | "medium" | "low"
-        }}
-    ],
-    "total_questions": 10,
-    "outliers_addressed": ["list of vitals outliers being addressed"],
-    "do_indicators_focus": ["list of key D/O indicators being assessed"]
-}}
-
-EXAMPLES OF GOOD QUESTIONS:
-- "You have elevated blood pressure (142/88). Have you experienced headaches or dizziness recently?" (O indicator)
-- "Given your age of 68 and diabetes history, do you check your blood sugar regularly?" (D indicator)
-- "Your temperature is 99.2°F. When did you first notice feeling warm or feverish?" (O indicator)
-- "As a female patient, are you currently taking any hormonal medications?" (D indicator)
-
-Focus on actionable medical information that will help with diagnosis and treatment planning."""
+        context = context or self.patient_history_context(patient_data)
+        vitals_outliers = context['vitals_outliers']
+        template, rendered, compact = self._followup_questions_prompt(context)
 
         try:
             def make_request():
-                return self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "system",
-                        "content": "You are a medical AI assistant specializing in generating targeted follow-up questions based on patient data and clinical findings. Generate questions that help gather diagnostic and objective information."
-                    }, {
-                        "role": "user",
-                        "content": prompt
-                    }],
+                return self._create_chat_completion(
+                    template.name,
+                    messages=rendered['messages'],
                     temperature=0.3,
                     max_tokens=2000
                 )
             
             response = self._make_openai_request_with_retry(make_request)
-            content = self._clean_json_response(response.choices[0].message.content)
-            result = json.loads(content)
+            result = self._parse_json_response(template.name, response, expect='object')
+            if compact:
+                result = expand_followup_questions(result)
             
             # Validate response structure
             if 'questions' not in result or not isinstance(result['questions'], list):
@@ -1764,8 +1942,62 @@ Focus on actionable medical information that will help with diagnosis and treatm
             print(f"Error generating followup questions: {e}")
             return self._generate_fallback_followup_questions(patient_data, vitals_outliers)
 
+    def stream_followup_questions_with_do_indicators(self, patient_data: Dict):
+        """
+        Streaming variant of generate_followup_questions_with_do_indicators. Returns an
+        iterator of ('question', question) pairs as each question completes in the token
+        stream, then ('done', {...}) with total_questions, outliers_addressed and
+        do_indicators_focus, which the model writes after the questions. Rule-based
+        questions top up (or, on error, replace) a stream of fewer than 3 questions.
+        """
+        context = self.patient_history_context(patient_data)
+        vitals_outliers = context['vitals_outliers']
+        template, rendered, compact = self._followup_questions_prompt(context)
+
+        def produce():
+            count = 0
+            completion = []
+            try:
+                items = JSONArrayItemStream('q' if compact else 'questions')
+                for text in self._stream_chat_completion(template.name, rendered['messages'],
+                                                         temperature=0.3, max_tokens=2000):
+                    completion.append(text)
+                    for item in items.feed(text):
+                        question = expand_followup_questions({'q': [item]})['questions'] if compact else [item]
+                        if question and _valid_question(question[0]):
+                            count += 1
+                            yield 'question', {**question[0], 'id': count}
+            except Exception as e:
+                print(f"Error streaming followup questions: {e}")
+
+            try:
+                tail = extract_json_partial(''.join(completion), expect='object')[0]
+                tail = expand_followup_questions(tail) if compact else tail
+            except JSONExtractionError:
+                tail = {}
+            if count < 3:
+                fallback = self._generate_fallback_followup_questions(patient_data, vitals_outliers)
+                for question in fallback['questions'][:5] if count else fallback['questions']:
+                    count += 1
+                    yield 'question', {**question, 'id': count}
+                if not tail:
+                    tail = fallback
+            yield 'done', {
+                'total_questions': count,
+                'outliers_addressed': tail.get('outliers_addressed', []),
+                'do_indicators_focus': tail.get('do_indicators_focus', [])
+            }
+        return self._drain_in_background(produce())
+
+    def _followup_questions_prompt(self, context: Dict):
+        """(template, rendered prompt, compact) for the D/O follow-up questions."""
+        compact = compact_output_enabled('followup_questions')
+        template = FOLLOWUP_QUESTIONS_COMPACT_PROMPT if compact else FOLLOWUP_QUESTIONS_PROMPT
+        rendered = template.render(vitals_outliers=context['vitals_outliers'], **context['sections'])
+        return template, rendered, compact
+
     def _analyze_vitals_outliers(self, vitals: Dict) -> Dict:
-        """Analyze vital signs to identify outliers requiring follow-up questions"""
+        """Analyze vital signs to identify outliers requiring follow-up questions (VitalsFinding per level)"""
         outliers = {
             'critical': [],
             'moderate': [],
@@ -1778,23 +2010,17 @@ Focus on actionable medical information that will help with diagnosis and treatm
             diastolic = int(vitals['diastolic'])
             
             if systolic >= 180 or diastolic >= 120:
-                outliers['critical'].append({
-                    'type': 'hypertensive_crisis',
-                    'values': f"{systolic}/{diastolic} mmHg",
-                    'concern': 'Immediate medical attention required'
-                })
+                outliers['critical'].append(VitalsFinding(
+                    'hypertensive_crisis', f"{systolic}/{diastolic} mmHg", 'Immediate medical attention required'
+                ))
             elif systolic >= 140 or diastolic >= 90:
-                outliers['moderate'].append({
-                    'type': 'hypertension',
-                    'values': f"{systolic}/{diastolic} mmHg",
-                    'concern': 'Elevated blood pressure requiring assessment'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'hypertension', f"{systolic}/{diastolic} mmHg", 'Elevated blood pressure requiring assessment'
+                ))
             elif systolic < 90 or diastolic < 60:
-                outliers['moderate'].append({
-                    'type': 'hypotension',
-                    'values': f"{systolic}/{diastolic} mmHg",
-                    'concern': 'Low blood pressure requiring evaluation'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'hypotension', f"{systolic}/{diastolic} mmHg", 'Low blood pressure requiring evaluation'
+                ))
         
         # Temperature analysis
         if vitals.get('temperature'):
@@ -1803,276 +2029,150 @@ Focus on actionable medical information that will help with diagnosis and treatm
             
             if unit == 'F':
                 if temp >= 103:
-                    outliers['critical'].append({
-                        'type': 'high_fever',
-                        'values': f"{temp}°F",
-                        'concern': 'High fever requiring immediate attention'
-                    })
+                    outliers['critical'].append(VitalsFinding(
+                        'high_fever', f"{temp}°F", 'High fever requiring immediate attention'
+                    ))
                 elif temp >= 100.4:
-                    outliers['moderate'].append({
-                        'type': 'fever',
-                        'values': f"{temp}°F",
-                        'concern': 'Fever indicating possible infection'
-                    })
+                    outliers['moderate'].append(VitalsFinding(
+                        'fever', f"{temp}°F", 'Fever indicating possible infection'
+                    ))
                 elif temp < 96:
-                    outliers['moderate'].append({
-                        'type': 'hypothermia',
-                        'values': f"{temp}°F",
-                        'concern': 'Low temperature requiring assessment'
-                    })
+                    outliers['moderate'].append(VitalsFinding(
+                        'hypothermia', f"{temp}°F", 'Low temperature requiring assessment'
+                    ))
             else:  # Celsius
                 if temp >= 39.4:
-                    outliers['critical'].append({
-                        'type': 'high_fever',
-                        'values': f"{temp}°C",
-                        'concern': 'High fever requiring immediate attention'
-                    })
+                    outliers['critical'].append(VitalsFinding(
+                        'high_fever', f"{temp}°C", 'High fever requiring immediate attention'
+                    ))
                 elif temp >= 38:
-                    outliers['moderate'].append({
-                        'type': 'fever',
-                        'values': f"{temp}°C",
-                        'concern': 'Fever indicating possible infection'
-                    })
+                    outliers['moderate'].append(VitalsFinding(
+                        'fever', f"{temp}°C", 'Fever indicating possible infection'
+                    ))
                 elif temp < 35.5:
-                    outliers['moderate'].append({
-                        'type': 'hypothermia',
-                        'values': f"{temp}°C",
-                        'concern': 'Low temperature requiring assessment'
-                    })
+                    outliers['moderate'].append(VitalsFinding(
+                        'hypothermia', f"{temp}°C", 'Low temperature requiring assessment'
+                    ))
         
         # Heart rate analysis
         if vitals.get('pulseRate'):
             pulse = int(vitals['pulseRate'])
             
             if pulse < 50:
-                outliers['moderate'].append({
-                    'type': 'bradycardia',
-                    'values': f"{pulse} BPM",
-                    'concern': 'Slow heart rate requiring evaluation'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'bradycardia', f"{pulse} BPM", 'Slow heart rate requiring evaluation'
+                ))
             elif pulse > 120:
-                outliers['moderate'].append({
-                    'type': 'tachycardia',
-                    'values': f"{pulse} BPM",
-                    'concern': 'Fast heart rate requiring assessment'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'tachycardia', f"{pulse} BPM", 'Fast heart rate requiring assessment'
+                ))
         
         # Oxygen saturation analysis
         if vitals.get('oxygenSaturation'):
             spo2 = int(vitals['oxygenSaturation'])
             
             if spo2 < 90:
-                outliers['critical'].append({
-                    'type': 'severe_hypoxemia',
-                    'values': f"{spo2}%",
-                    'concern': 'Dangerously low oxygen levels'
-                })
+                outliers['critical'].append(VitalsFinding(
+                    'severe_hypoxemia', f"{spo2}%", 'Dangerously low oxygen levels'
+                ))
             elif spo2 < 95:
-                outliers['moderate'].append({
-                    'type': 'mild_hypoxemia',
-                    'values': f"{spo2}%",
-                    'concern': 'Low oxygen saturation requiring monitoring'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'mild_hypoxemia', f"{spo2}%", 'Low oxygen saturation requiring monitoring'
+                ))
         
         # Blood sugar analysis
         if vitals.get('bloodSugar'):
             glucose = int(vitals['bloodSugar'])
             
             if glucose >= 300:
-                outliers['critical'].append({
-                    'type': 'severe_hyperglycemia',
-                    'values': f"{glucose} mg/dL",
-                    'concern': 'Extremely high blood sugar - diabetic emergency risk'
-                })
+                outliers['critical'].append(VitalsFinding(
+                    'severe_hyperglycemia', f"{glucose} mg/dL", 'Extremely high blood sugar - diabetic emergency risk'
+                ))
             elif glucose >= 200:
-                outliers['moderate'].append({
-                    'type': 'hyperglycemia',
-                    'values': f"{glucose} mg/dL",
-                    'concern': 'High blood sugar requiring assessment'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'hyperglycemia', f"{glucose} mg/dL", 'High blood sugar requiring assessment'
+                ))
             elif glucose < 70:
-                outliers['moderate'].append({
-                    'type': 'hypoglycemia',
-                    'values': f"{glucose} mg/dL",
-                    'concern': 'Low blood sugar requiring immediate attention'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'hypoglycemia', f"{glucose} mg/dL", 'Low blood sugar requiring immediate attention'
+                ))
         
         # Pain scale analysis
         if vitals.get('painScale'):
             pain = int(vitals['painScale'])
             
             if pain >= 7:
-                outliers['moderate'].append({
-                    'type': 'severe_pain',
-                    'values': f"{pain}/10",
-                    'concern': 'Severe pain requiring management'
-                })
+                outliers['moderate'].append(VitalsFinding(
+                    'severe_pain', f"{pain}/10", 'Severe pain requiring management'
+                ))
             elif pain >= 4:
-                outliers['mild'].append({
-                    'type': 'moderate_pain',
-                    'values': f"{pain}/10",
-                    'concern': 'Moderate pain affecting function'
-                })
+                outliers['mild'].append(VitalsFinding(
+                    'moderate_pain', f"{pain}/10", 'Moderate pain affecting function'
+                ))
         
         return outliers
 
+    def assess_urgency(self, data: Dict) -> str:
+        """
+        Classify a request for upstream scheduling using local rules only:
+        'critical' for any critical vitals outlier or red-flag emergency,
+        'elevated' for moderate outliers, otherwise 'routine'.
+        """
+        data = data.get('patient_data') or data
+        try:
+            outliers = self._analyze_vitals_outliers(data.get('vitals') or {})
+        except (TypeError, ValueError):
+            outliers = {'critical': [], 'moderate': []}
+        if outliers['critical'] or red_flags.evaluate(data, outliers)['emergency']:
+            return 'critical'
+        if outliers['moderate']:
+            return 'elevated'
+        return 'routine'
+
     def _generate_fallback_followup_questions(self, patient_data: Dict, vitals_outliers: Dict) -> Dict:
         """Generate fallback questions when AI generation fails"""
-        questions = []
-        question_id = 1
-        
-        # Address critical vitals outliers first
-        for outlier in vitals_outliers.get('critical', []):
-            if outlier['type'] == 'hypertensive_crisis':
-                questions.append({
-                    "id": question_id,
-                    "category": "vitals_outlier",
-                    "question": f"Your blood pressure is critically high ({outlier['values']}). Are you experiencing severe headaches, chest pain, or difficulty breathing?",
-                    "type": "multiple_choice",
-                    "options": ["No symptoms", "Mild headache", "Severe headache", "Chest pain", "Difficulty breathing"],
-                    "relevance": "Critical hypertension assessment - immediate medical evaluation needed",
-                    "priority": "high"
-                })
-                question_id += 1
-            elif outlier['type'] == 'high_fever':
-                questions.append({
-                    "id": question_id,
-                    "category": "vitals_outlier",
-                    "question": f"You have a high fever ({outlier['values']}). How long have you had this fever?",
-                    "type": "multiple_choice",
-                    "options": ["Less than 6 hours", "6-12 hours", "1-2 days", "More than 2 days"],
-                    "relevance": "High fever duration assessment for infection severity",
-                    "priority": "high"
-                })
-                question_id += 1
-        
-        # Address moderate outliers
-        for outlier in vitals_outliers.get('moderate', []):
-            if outlier['type'] == 'fever' and question_id <= 8:
-                questions.append({
-                    "id": question_id,
-                    "category": "vitals_outlier",
-                    "question": f"You have a fever ({outlier['values']}). Have you taken any fever-reducing medications?",
-                    "type": "multiple_choice",
-                    "options": ["No medications taken", "Acetaminophen/Tylenol", "Ibuprofen/Advil", "Other pain relievers"],
-                    "relevance": "Fever management assessment for treatment planning",
-                    "priority": "medium"
-                })
-                question_id += 1
-            elif outlier['type'] == 'tachycardia' and question_id <= 8:
-                questions.append({
-                    "id": question_id,
-                    "category": "vitals_outlier",
-                    "question": f"Your heart rate is elevated ({outlier['values']}). Do you feel your heart racing or pounding?",
-                    "type": "multiple_choice",
-                    "options": ["No awareness of heartbeat", "Slight awareness", "Noticeable pounding", "Very uncomfortable pounding"],
-                    "relevance": "Tachycardia symptom assessment for cardiac evaluation",
-                    "priority": "medium"
-                })
-                question_id += 1
-        
+        selected = []  # (FollowupQuestion, vitals reading for its text)
+
+        # Address critical vitals outliers first, then moderate ones while fewer than 8 are chosen
+        for level, limit in (('critical', None), ('moderate', 8)):
+            for outlier in vitals_outliers.get(level, []):
+                template = FALLBACK_OUTLIER_QUESTIONS[level].get(outlier.type)
+                if template and (limit is None or len(selected) < limit):
+                    selected.append((template, outlier.values))
+
         # Demographics-based questions
         demographics = patient_data.get('demographics', {})
-        if demographics.get('age') and question_id <= 10:
+        if demographics.get('age') and len(selected) < 10:
             age = int(demographics['age'])
             if age > 65:
-                questions.append({
-                    "id": question_id,
-                    "category": "demographics",
-                    "question": "As a senior patient, do you have any difficulty with balance or have you had any recent falls?",
-                    "type": "multiple_choice",
-                    "options": ["No balance issues", "Occasional unsteadiness", "Frequent balance problems", "Recent falls"],
-                    "relevance": "Age-related fall risk assessment for elderly patients",
-                    "priority": "medium"
-                })
-                question_id += 1
+                selected.append((FALLBACK_SENIOR_QUESTION, ''))
             elif age < 18:
-                questions.append({
-                    "id": question_id,
-                    "category": "demographics",
-                    "question": "For pediatric patients, have there been any recent changes in eating, sleeping, or behavior patterns?",
-                    "type": "multiple_choice",
-                    "options": ["No changes", "Eating changes", "Sleep changes", "Behavior changes", "Multiple changes"],
-                    "relevance": "Pediatric health pattern assessment",
-                    "priority": "medium"
-                })
-                question_id += 1
-        
+                selected.append((FALLBACK_PEDIATRIC_QUESTION, ''))
+
         # Gender-specific questions
-        if demographics.get('gender') == 'female' and question_id <= 10:
-            questions.append({
-                "id": question_id,
-                "category": "demographics",
-                "question": "Are you currently pregnant, breastfeeding, or could you be pregnant?",
-                "type": "multiple_choice",
-                "options": ["Not pregnant", "Possibly pregnant", "Currently pregnant", "Breastfeeding"],
-                "relevance": "Female reproductive status for medication and treatment safety",
-                "priority": "high"
-            })
-            question_id += 1
-        
+        if demographics.get('gender') == 'female' and len(selected) < 10:
+            selected.append((FALLBACK_PREGNANCY_QUESTION, ''))
+
         # Medical conditions follow-up
         medical_conditions = patient_data.get('medicalConditions', {})
-        if medical_conditions.get('diabetes') == 'yes' and question_id <= 10:
-            questions.append({
-                "id": question_id,
-                "category": "medical_history",
-                "question": "How well has your diabetes been controlled in the past month?",
-                "type": "multiple_choice",
-                "options": ["Very well controlled", "Moderately controlled", "Poorly controlled", "Not monitoring"],
-                "relevance": "Diabetes management assessment affects treatment decisions",
-                "priority": "medium"
-            })
-            question_id += 1
-        
-        # Functional assessment
-        if question_id <= 10:
-            questions.append({
-                "id": question_id,
-                "category": "functional_assessment",
-                "question": "How much do your current symptoms interfere with your daily activities?",
-                "type": "scale",
-                "min": 1,
-                "max": 10,
-                "min_label": "No interference",
-                "max_label": "Cannot function",
-                "relevance": "Functional impact assessment for treatment urgency",
-                "priority": "medium"
-            })
-            question_id += 1
-        
-        # Symptom timeline
-        if question_id <= 10:
-            questions.append({
-                "id": question_id,
-                "category": "symptoms",
-                "question": "When did you first notice your current symptoms?",
-                "type": "multiple_choice",
-                "options": ["Within the last hour", "Within the last day", "2-7 days ago", "More than a week ago"],
-                "relevance": "Symptom onset timing crucial for diagnosis and urgency",
-                "priority": "high"
-            })
-            question_id += 1
-        
+        if medical_conditions.get('diabetes') == 'yes' and len(selected) < 10:
+            selected.append((FALLBACK_DIABETES_QUESTION, ''))
+
+        # Functional assessment, then symptom timeline
+        for question in (FALLBACK_FUNCTION_QUESTION, FALLBACK_ONSET_QUESTION):
+            if len(selected) < 10:
+                selected.append((question, ''))
+
         # Ensure we have at least 3 questions
-        while len(questions) < 3:
-            questions.append({
-                "id": len(questions) + 1,
-                "category": "general_health",
-                "question": f"Please describe any other symptoms or concerns you would like the doctor to know about.",
-                "type": "textarea",
-                "placeholder": "Describe any additional symptoms, concerns, or relevant information...",
-                "relevance": "Additional information gathering for comprehensive assessment",
-                "priority": "low"
-            })
-        
-        outliers_list = []
-        for category in vitals_outliers.values():
-            outliers_list.extend([o['type'] for o in category])
-        
+        while len(selected) < 3:
+            selected.append((FALLBACK_GENERAL_QUESTION, ''))
+
+        # Limit to 10 questions, as JSON-shaped dicts with the readings filled in
+        questions = [question.to_dict(question_id, values)
+                     for question_id, (question, values) in enumerate(selected[:10], 1)]
         return {
-            "questions": questions[:10],  # Limit to 10 questions
-            "total_questions": len(questions[:10]),
-            "outliers_addressed": outliers_list,
+            "questions": questions,
+            "total_questions": len(questions),
+            "outliers_addressed": [o.type for category in vitals_outliers.values() for o in category],
             "do_indicators_focus": ["patient_demographics", "vital_signs_abnormalities", "medical_history", "symptom_assessment"]
         }
\ No newline at end of file
@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from shared_state import state_dir
+from quota_governor import estimate_text_tokens
+from prompt_templates import render_section
+from metrics import metrics
+
+# Request payload fields the digest is built from; everything else (symptoms, answers) varies per prompt
+CONTEXT_FIELDS = ('caseType', 'regions', 'demographics', 'medicalConditions', 'medicalHistory', 'history',
+                  'lifestyle', 'medicalRecords', 'vitals')
+
+# Identifiers that never help the model and are not sent to it
+DROPPED_KEYS = {'emrId'}
+
+# Values shorter than this are not deduplicated across sections ("yes" is not a repeat)
+DEDUPE_MIN_CHARS = 12
+
+# Vital signs in reading order: key -> (label, unit); units/companion keys are folded in below
+VITAL_LABELS = {
+    'systolic': ('BP', 'mmHg'), 'pulseRate': ('HR', 'bpm'), 'respiratoryRate': ('RR', '/min'),
+    'oxygenSaturation': ('SpO2', '%'), 'temperature': ('T', ''), 'bloodSugar': ('glucose', 'mg/dL'),
+    'painScale': ('pain', '/10'), 'weight': ('weight', ''), 'height': ('height', ''), 'bmi': ('BMI', ''),
+    'waistCircumference': ('waist', 'cm'), 'peakExpiratoryFlow': ('PEF', 'L/min'),
+    'forcedExpiratoryVolume': ('FEV1', 'L'), 'muscleMass': ('muscle', 'kg'), 'fatMass': ('fat', 'kg'),
+    'bodyWater': ('water', '%'), 'heartRhythm': ('rhythm', ''), 'heartLungSounds': ('heart/lung sounds', ''),
+    'ecgAvailable': ('ECG', ''), 'ecgFindings': ('ECG findings', ''),
+    'respiratoryObservations': ('respiratory', ''), 'tongueThroatFindings': ('throat', ''),
+    'infectionRashFindings': ('skin', ''), 'notes': ('notes', '')
+}
+_FOLDED_VITALS = {'diastolic', 'temperatureUnit', 'weightUnit', 'heightUnit'}
+
+_session: ContextVar[Optional[str]] = ContextVar('patient_context_session', default=None)
+
+
+@contextmanager
+def session_scope(session_id: Optional[str]):
+    """Associate patient-context digests built inside the block with a client session."""
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def fingerprint(patient_data: Dict) -> str:
+    """Hash of the session-stable patient fields; a change in any of them invalidates the digest."""
+    stable = {field: patient_data.get(field) for field in CONTEXT_FIELDS if patient_data.get(field)}
+    canonical = json.dumps(stable, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def _label(key: str) -> str:
+    """camelCase form keys -> plain words (familyHistory -> family history)."""
+    return re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', str(key)).replace('_', ' ').lower()
+
+
+def _text(value) -> str:
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    if isinstance(value, (list, tuple)):
+        return ', '.join(t for t in (_text(v) for v in value) if t)
+    if isinstance(value, dict):
+        return render_section(value)
+    text = ' '.join(str(value).split())
+    return text.lower() if text.lower() in ('yes', 'no', 'none', 'unknown') else text
+
+
+class _Deduper:
+    """Drops a long value that was already stated in an earlier section."""
+
+    def __init__(self):
+        self.seen = set()
+
+    def keep(self, text: str) -> bool:
+        if len(text) < DEDUPE_MIN_CHARS:
+            return True
+        key = text.lower()
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+
+def _pairs(*sections: Optional[Dict], dedupe: _Deduper) -> str:
+    """Merge form sections into 'label: value; ...', skipping empties, identifiers and repeats."""
+    parts = []
+    seen_keys = set()
+    for section in sections:
+        for key, value in (section or {}).items():
+            if key in DROPPED_KEYS or key in seen_keys:
+                continue
+            text = _text(value)
+            if not text or not dedupe.keep(text):
+                continue
+            seen_keys.add(key)
+            parts.append(f"{_label(key)}: {text}")
+    return '; '.join(parts)
+
+
+def _vitals(vitals: Optional[Dict], dedupe: _Deduper) -> str:
+    vitals = vitals or {}
+    parts = []
+    for key, (label, unit) in VITAL_LABELS.items():
+        value = vitals.get(key)
+        if value in (None, ''):
+            continue
+        if key == 'systolic':
+            value = f"{value}/{vitals.get('diastolic', '?')}"
+        elif key == 'temperature':
+            unit = vitals.get('temperatureUnit', '')
+        elif key in ('weight', 'height'):
+            unit = vitals.get(f"{key}Unit", '')
+        text = _text(value)
+        if dedupe.keep(text):
+            # "SpO2 93%", "pain 6/10", but "HR 112 bpm"
+            parts.append(f"{label} {text}{'' if not unit or unit[0] in '%/' else ' '}{unit}")
+    for key, value in vitals.items():
+        if key not in VITAL_LABELS and key not in _FOLDED_VITALS and value not in (None, ''):
+            parts.append(f"{_label(key)}: {_text(value)}")
+    return ', '.join(parts)
+
+
+def build_digest(patient_data: Dict) -> Dict[str, str]:
+    """
+    Compact, normalized rendering of the session-stable patient blobs, keyed like the
+    prompt template fields: empty answers and identifiers dropped, camelCase keys turned
+    into words, yes/no answers normalized, vitals written the way a chart abbreviates
+    them, and long free text that repeats an earlier section left out.
+    """
+    dedupe = _Deduper()
+    demographics = dict(patient_data.get('demographics') or {})
+    age, gender = demographics.pop('age', None), demographics.pop('gender', None)
+    head = ' '.join(t for t in (f"{age}y" if age not in (None, '') else '', _text(gender or '')) if t)
+    rest = _pairs(demographics, dedupe=dedupe)
+    return {
+        'case_type': _text(patient_data.get('caseType', '')),
+        'regions': _text(patient_data.get('regions') or []),
+        'demographics': '; '.join(t for t in (head, rest) if t),
+        'medical_conditions': _pairs(patient_data.get('medicalConditions'), dedupe=dedupe),
+        'medical_history': _pairs(patient_data.get('medicalHistory'), dedupe=dedupe),
+        # Read on its own by the analysis/diagnosis prompts, so not deduplicated against the sections above
+        'history': _pairs(patient_data.get('history'), dedupe=_Deduper()),
+        'lifestyle': _pairs(patient_data.get('lifestyle'), dedupe=dedupe),
+        'medical_records': _pairs(patient_data.get('medicalRecords'), dedupe=dedupe),
+        'vitals': _vitals(patient_data.get('vitals'), dedupe)
+    }
+
+
+def raw_context_tokens(patient_data: Dict) -> int:
+    """Tokens the same fields cost when rendered directly, as the prompts did before digests."""
+    return sum(estimate_text_tokens(render_section(patient_data.get(field))) for field in CONTEXT_FIELDS)
+
+
+def digest_tokens(digest: Dict[str, str]) -> int:
+    return sum(estimate_text_tokens(text) for text in digest.values())
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patient_context (
+    key TEXT PRIMARY KEY,
+    fp TEXT NOT NULL,
+    at REAL NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patient_context_at ON patient_context (at);
+"""
+
+
+class PatientContextCache:
+    """
+    One patient-context digest per client session, shared by every worker through a
+    host-local SQLite file. The summary, follow-up, additional-question and analysis
+    prompts all read the session's digest instead of re-rendering the raw form blobs,
+    so an optional LLM summarization of the narrative fields is paid for once per
+    session. The entry is rebuilt whenever the patient fields' fingerprint changes;
+    requests outside a session share entries by fingerprint.
+
+    A lookup reads only its own row and a miss writes only its own row, so workers do
+    not serialize on the cache. Digests are patient data: the file is created 0o600.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: int = 3600, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path or os.path.join(state_dir(), 'patient_context.sqlite3')
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process: gunicorn forks after the app is imported
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, patient_data: Dict, build: Callable[[Dict], Dict[str, str]]) -> Dict[str, str]:
+        """The cached digest for this session and patient data, building it with `build` on a miss."""
+        fp = fingerprint(patient_data)
+        key = _session.get() or f"fp:{fp}"
+        try:
+            row = self._db().execute(
+                'SELECT digest FROM patient_context WHERE key = ? AND fp = ? AND at > ?',
+                (key, fp, time.time() - self.ttl_seconds)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"WARN: Patient context cache unavailable: {e}")
+            row = None
+        if row is not None:
+            metrics.increment('patient_context', 'hit')
+            return json.loads(row[0])
+
+        digest = build(patient_data)
+        metrics.increment('patient_context', 'miss')
+        metrics.observe('patient_context_tokens', 'raw', raw_context_tokens(patient_data))
+        metrics.observe('patient_context_tokens', 'digest', digest_tokens(digest))
+        try:
+            self._put(key, fp, digest)
+        except sqlite3.Error as e:
+            print(f"WARN: Could not store patient context: {e}")
+        return digest
+
+    def _put(self, key: str, fp: str, digest: Dict[str, str]):
+        now = time.time()
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO patient_context (key, fp, at, digest) VALUES (?, ?, ?, ?)',
+                   (key, fp, now, json.dumps(digest, separators=(',', ':'))))
+        db.execute('DELETE FROM patient_context WHERE at < ?', (now - self.ttl_seconds,))
+        (count,) = db.execute('SELECT COUNT(*) FROM patient_context').fetchone()
+        if count > self.max_entries:
+            db.execute('DELETE FROM patient_context WHERE key IN '
+                       '(SELECT key FROM patient_context ORDER BY at LIMIT ?)', (count - self.max_entries,))
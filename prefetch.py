@@ -0,0 +1,156 @@
+import json
+import time
+import hashlib
+from typing import Callable, Dict, Iterable, Optional
+
+from background import BackgroundJobs
+from shared_state import SharedLedger
+from scheduling import bounded_wait, request_priority
+from metrics import metrics
+
+# Route class for speculative upstream calls; it is not in ROUTE_CLASS_ORDER, so they are
+# dispatched after every request a user is actually waiting for
+PREFETCH_ROUTE_CLASS = 'prefetch'
+
+
+def input_key(kind: str, inputs: Dict) -> str:
+    """Stable hex key for a computation: the same kind and inputs always give the same key."""
+    canonical = json.dumps([kind, inputs], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+def _symptom_text(data: Dict):
+    free_text = data.get('freeTextSymptoms', data.get('free_text', '')) or ''
+    return list(data.get('symptoms') or []), free_text.strip()
+
+
+def followup_inputs(data: Dict) -> Optional[Dict]:
+    """Inputs of the structured symptom questionnaire (POST /submit_symptoms)."""
+    symptoms, free_text = _symptom_text(data)
+    if not data.get('caseType') or not (symptoms or free_text.strip()):
+        return None
+    return {'case_type': data.get('caseType', ''), 'symptoms': symptoms, 'free_text': free_text,
+            'demographics': data.get('demographics') or {}}
+
+
+def label_inputs(data: Dict) -> Optional[Dict]:
+    """Inputs of the label extraction (POST /extract_labels)."""
+    symptoms, free_text = _symptom_text(data)
+    if not (symptoms or free_text.strip()):
+        return None
+    return {'symptoms': symptoms, 'free_text': free_text}
+
+
+ADDITIONAL_QUESTION_FIELDS = ('caseType', 'symptoms', 'freeTextSymptoms', 'demographics', 'vitals', 'medicalConditions')
+
+
+def additional_inputs(patient_data: Dict, max_questions: int = 20) -> Optional[Dict]:
+    """Inputs of the OLDCARTS questions (POST /generate_additional_questions)."""
+    symptoms, free_text = _symptom_text(patient_data)
+    if not (symptoms or free_text.strip()):
+        return None
+    return {'patient_data': {k: patient_data[k] for k in ADDITIONAL_QUESTION_FIELDS if k in patient_data},
+            'max_questions': max_questions}
+
+
+class SpeculativePrefetcher:
+    """
+    Speculative precomputation of questionnaire work the client is about to ask for.
+    main.js calls POST /prefetch as soon as symptoms and a case type are chosen; each
+    registered kind is started in a background pool under a key hashed from exactly
+    the inputs its real route will use. When the real request arrives it takes the
+    finished result, or waits for the in-flight one, and otherwise computes as usual.
+
+    Because keys are input hashes, a result can never be handed to a request whose
+    inputs differ. The last key per (session, kind) is kept in a shared ledger so that
+    when a session's inputs change, the superseded job is cancelled (or its result
+    discarded) instead of occupying the pool. Clients without a session never supersede
+    anything: an IP address would make users behind one NAT cancel each other's jobs.
+    """
+
+    def __init__(self, jobs: BackgroundJobs, wait_timeout: float = 20.0, ledger: Optional[SharedLedger] = None):
+        self.jobs = jobs
+        self.wait_timeout = wait_timeout
+        self.ledger = ledger or SharedLedger('prefetch_sessions')
+        self._kinds = {}  # kind -> (inputs(data, ...), compute(inputs))
+        self._default_kinds = []  # started when a /prefetch request names no kinds
+
+    def register(self, kind: str, inputs: Callable[..., Optional[Dict]], compute: Callable[[Dict], object],
+                 default: bool = True):
+        """
+        `inputs` maps a request payload to the dict of values the computation depends on
+        (None when there is nothing to compute); `compute` runs it from that dict. A kind
+        registered with default=False only runs when a request asks for it by name.
+        """
+        self._kinds[kind] = (inputs, compute)
+        if default:
+            self._default_kinds.append(kind)
+
+    def prefetch(self, session_id: Optional[str], data: Dict, kinds: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Start every requested (or default) kind not already running or done. Returns kind -> status."""
+        started = {}
+        for kind in kinds or self._default_kinds:
+            if kind not in self._kinds:
+                started[kind] = 'unknown'
+                continue
+            inputs_for, compute = self._kinds[kind]
+            inputs = inputs_for(data)
+            if inputs is None:
+                started[kind] = 'skipped'
+                continue
+
+            key = input_key(kind, inputs)
+            superseded = self._claim(session_id, kind, key) if session_id else None
+            if superseded:
+                self.jobs.cancel(superseded)
+                metrics.increment('prefetch', f"{kind}/superseded")
+
+            record = self.jobs.get(key)
+            if record and record['status'] in ('pending', 'done'):
+                started[kind] = record['status']
+                continue
+            with request_priority(PREFETCH_ROUTE_CLASS):
+                self.jobs.submit(kind, compute, inputs, job_id=key)
+            metrics.increment('prefetch', f"{kind}/started")
+            started[kind] = 'started'
+        return started
+
+    def take(self, kind: str, *args):
+        """
+        The prefetched result for the inputs `args` map to (the same payload arguments the
+        kind's inputs function takes), waiting for it if still in flight (at most wait_timeout,
+        within the request's deadline), or None on a miss.
+        """
+        if kind not in self._kinds:
+            return None
+        inputs = self._kinds[kind][0](*args)
+        if inputs is None:
+            return None
+
+        key = input_key(kind, inputs)
+        record = self.jobs.get(key)
+        in_flight = bool(record) and record['status'] == 'pending'
+        if in_flight:
+            started = time.time()
+            record = self.jobs.wait(key, bounded_wait(self.wait_timeout))
+            metrics.observe('prefetch_wait_seconds', kind, time.time() - started)
+        if record is None or record['status'] != 'done':
+            metrics.increment('prefetch', f"{kind}/miss")
+            return None
+        metrics.increment('prefetch', f"{kind}/{'hit_in_flight' if in_flight else 'hit'}")
+        return record['result']
+
+    def _claim(self, session_id: str, kind: str, key: str) -> Optional[str]:
+        """Record `key` as the session's current job for `kind`; return the key it replaced."""
+        now = time.time()
+        with self.ledger.transaction() as sessions:
+            for sid in [sid for sid, entry in sessions.items() if entry.get('at', 0) + self.jobs.ttl_seconds < now]:
+                del sessions[sid]
+            entry = sessions.setdefault(session_id, {})
+            entry['at'] = now
+            previous = entry.get(kind)
+            entry[kind] = key
+            # Identical inputs from another session share the job, so it is still wanted
+            if previous == key or any(other.get(kind) == previous for other in sessions.values()):
+                return None
+        return previous
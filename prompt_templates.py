@@ -0,0 +1,791 @@
+import json
+import hashlib
+from string import Formatter
+from typing import Dict, List, Optional
+
+from quota_governor import CHARS_PER_TOKEN, MESSAGE_OVERHEAD_TOKENS, estimate_text_tokens
+
+TRUNCATION_MARKER = ' ...[truncated]'
+
+
+def _compact(value):
+    """Drop empty values recursively so they cost no prompt tokens."""
+    if isinstance(value, tuple) and hasattr(value, 'to_dict'):
+        # clinical_models records render in their JSON shape
+        value = value.to_dict()
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items() if v not in (None, '', [], {})}
+    if isinstance(value, list):
+        return [_compact(v) for v in value if v not in (None, '', [], {})]
+    return value
+
+
+def render_section(value) -> str:
+    """Render a variable prompt section: plain text, a comma list, or compact JSON."""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return ', '.join(value)
+    return json.dumps(_compact(value), ensure_ascii=False, separators=(',', ':'))
+
+
+class PromptTemplate:
+    """
+    A prompt compiled once at import: literal text and placeholders are split up
+    front, the static token count is recorded, and every render fits the variable
+    sections into the template's input-token budget. The version id combines the
+    declared version with a digest of the text, so caches and metrics can key on it.
+
+    Templates keep instructions and schemas ahead of the first placeholder, so the
+    system message plus that prefix is byte-identical across requests and can be
+    served from the provider's prompt cache; `prefix_tokens` records its size.
+    """
+
+    def __init__(self, name: str, version: int, system: str, template: str, input_token_budget: int,
+                 output_schema: Optional[str] = None, response_format: Optional[Dict] = None):
+        self.name = name
+        self.system = system
+        self.source = template
+        self.input_token_budget = input_token_budget
+        self.output_schema = output_schema
+        # chat.completions response_format for structured output; None means free text + extract_json
+        self.response_format = response_format
+        if output_schema is not None:
+            template = template.replace('{output_schema}', output_schema)
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+        self.fields = [field for _, field in self._parts if field]
+        self.literal = ''.join(literal for literal, _ in self._parts)
+        digest = hashlib.sha256((system + '\0' + template).encode('utf-8')).hexdigest()[:8]
+        self.version = f"{name}@v{version}-{digest}"
+        self.static_tokens = estimate_text_tokens(system) + estimate_text_tokens(self.literal) + 2 * MESSAGE_OVERHEAD_TOKENS
+        prefix = ''
+        for literal, field in self._parts:
+            prefix += literal
+            if field:
+                break
+        self.prefix_tokens = estimate_text_tokens(system) + estimate_text_tokens(prefix) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+    def with_output_schema(self, name: str, output_schema: str, version: int = 1,
+                           response_format: Optional[Dict] = None) -> 'PromptTemplate':
+        """Same instructions and patient sections, different response schema (e.g. a compact one)."""
+        return PromptTemplate(name, version, self.system, self.source, self.input_token_budget,
+                              output_schema, response_format)
+
+    def _fit(self, texts: Dict[str, str]) -> List[str]:
+        """
+        Trim variable sections so the whole prompt fits the budget. Small sections are
+        kept intact and the remaining budget is shared among the large ones.
+        """
+        available = max(0, self.input_token_budget - self.static_tokens) * CHARS_PER_TOKEN
+        if sum(len(t) for t in texts.values()) <= available:
+            return []
+
+        trimmed = []
+        ordered = sorted(texts.items(), key=lambda item: len(item[1]))
+        remaining = available
+        for index, (name, text) in enumerate(ordered):
+            share = remaining // (len(ordered) - index)
+            if len(text) > share:
+                keep = max(0, share - len(TRUNCATION_MARKER))
+                texts[name] = text[:keep] + TRUNCATION_MARKER
+                trimmed.append(name)
+            remaining -= len(texts[name])
+        return trimmed
+
+    def render(self, **sections) -> Dict:
+        """
+        Fill the template. Returns {'messages', 'version', 'input_tokens', 'trimmed'}
+        where `trimmed` lists sections that were cut to fit the budget.
+        """
+        texts = {field: render_section(sections.get(field)) for field in dict.fromkeys(self.fields)}
+        trimmed = self._fit(texts)
+        if trimmed:
+            print(f"DEBUG: Prompt {self.version} trimmed sections to fit budget: {trimmed}")
+        user = ''.join(literal + (texts[field] if field else '') for literal, field in self._parts)
+        return {
+            'messages': [
+                {"role": "system", "content": self.system},
+                {"role": "user", "content": user}
+            ],
+            'version': self.version,
+            'input_tokens': self.static_tokens + sum(estimate_text_tokens(t) for t in texts.values()),
+            'trimmed': trimmed
+        }
+
+
+PROMPTS: Dict[str, PromptTemplate] = {}
+
+JSON_OBJECT = {"type": "json_object"}
+
+
+def _strict_schema(name: str, properties: Dict) -> Dict:
+    """Wrap an object schema as a strict json_schema response_format (every key required)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+def _object(properties: Dict) -> Dict:
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+_STRING = {"type": "string"}
+_INTEGER = {"type": "integer"}
+_STRINGS = {"type": "array", "items": _STRING}
+_TEST = _object({"test": _STRING, "confidence_score": _INTEGER, "priority": _STRING, "explanation": _STRING})
+_FOLLOW_UP = _object({"urgency": _STRING, "timeline": _STRING, "reason": _STRING})
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    PROMPTS[template.name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    return PROMPTS[name]
+
+
+def prompt_version(name: str) -> Optional[str]:
+    template = PROMPTS.get(name)
+    return template.version if template else None
+
+
+_ANALYSIS_PROPERTIES = {
+    "possible_conditions": {"type": "array", "items": _object({
+        "condition": _STRING, "confidence_score": _INTEGER, "icd11_code": _STRING,
+        "icd11_title": _STRING, "explanation": _STRING
+    })},
+    "diagnostic_tests": {"type": "array", "items": _TEST},
+    "red_flags": _STRINGS,
+    "immediate_care": _STRINGS,
+    "follow_up": _FOLLOW_UP,
+    "lifestyle": _STRINGS,
+    "disclaimer": _STRING
+}
+
+_ANALYSIS_SCHEMA = """Provide analysis in this EXACT JSON format:
+{{
+    "possible_conditions": [
+        {{
+            "condition": "Primary Condition Name",
+            "confidence_score": 85,
+            "icd11_code": "1A00.0Z",
+            "icd11_title": "Official ICD-11 condition title",
+            "explanation": "Detailed clinical reasoning incorporating complete OPQRST findings, demographics, and risk factors."
+        }}
+    ],
+    "diagnostic_tests": [
+        {{
+            "test": "Specific Test Name",
+            "confidence_score": 90,
+            "priority": "urgent/routine",
+            "explanation": "Clinical rationale based on OPQRST findings and differential diagnosis requirements"
+        }}
+    ],
+    "red_flags": ["List any concerning OPQRST features that suggest urgent evaluation"],
+    "immediate_care": ["Specific actionable recommendations"],
+    "follow_up": {{
+        "urgency": "emergency/urgent/routine",
+        "timeline": "Specific timeframe",
+        "reason": "Why this timeline"
+    }},
+    "lifestyle": ["Relevant lifestyle modifications"],
+    "disclaimer": "Important medical disclaimer"
+}}"""
+
+ANALYSIS_PROMPT = register(PromptTemplate(
+    name='analysis',
+    version=2,
+    system="You are a world-class diagnostic physician with expertise in comprehensive OPQRST symptom analysis, systematic clinical reasoning, and accurate ICD-11 medical coding. Provide thorough, accurate medical analysis with proper ICD-11 classification codes based on complete OPQRST assessment.",
+    template="""You are a world-class diagnostic physician conducting comprehensive medical analysis using the complete OPQRST framework.
+
+ANALYSIS REQUIREMENTS:
+1. Apply systematic differential diagnosis using OPQRST findings
+2. Consider epidemiology, risk factors, and demographics  
+3. Prioritize based on urgency, probability, and OPQRST patterns
+4. Use evidence-based medicine principles
+5. Account for all OPQRST components in diagnostic reasoning
+6. Include accurate ICD-11 codes for each condition
+
+{output_schema}
+
+DIAGNOSTIC CRITERIA:
+- Emergency: Life-threatening conditions requiring immediate intervention
+- Urgent: Serious conditions requiring evaluation within hours
+- Routine: Stable conditions that can be evaluated within days
+
+ICD-11 CODE REQUIREMENTS:
+- Use the most current ICD-11 classification codes
+- Provide both the code (e.g., "1A00.0Z") and official title
+- Ensure codes match the clinical condition accurately
+- Use unspecified codes (.Z) when specific variants cannot be determined
+- Include primary codes for main conditions, not just symptom codes
+
+Focus on clinical excellence, patient safety, comprehensive OPQRST-based systematic reasoning, and accurate medical coding.
+
+PATIENT PROFILE:
+- Demographics: Age {age}, Gender: {gender}
+- Geographic Regions: {regions}
+- Medical History: {history}
+- Primary Symptoms: {symptoms}
+- Patient Description: {free_text}
+- Detailed OPQRST Analysis: {detailed_symptoms}""",
+    output_schema=_ANALYSIS_SCHEMA,
+    response_format=_strict_schema('analysis', _ANALYSIS_PROPERTIES),
+    input_token_budget=2500
+))
+
+
+_DIAGNOSIS_SCHEMA = """Format as JSON:
+{{
+    "possible_conditions": [
+        {{
+            "condition": "Condition name",
+            "confidence_score": 85,
+            "explanation": "One-line explanation of why this condition is likely based on symptoms"
+        }}
+    ],
+    "diagnostic_tests": [
+        {{
+            "test": "Test name",
+            "confidence_score": 90,
+            "priority": "Urgent/Routine",
+            "explanation": "One-line rationale for why this test is recommended"
+        }}
+    ],
+    "red_flags": [
+        "Specific warning sign to watch for"
+    ],
+    "immediate_care": [
+        "Specific actionable recommendation"
+    ],
+    "follow_up": {{
+        "urgency": "Emergency/Urgent/Routine",
+        "timeline": "Specific timeframe",
+        "reason": "Why this timeline"
+    }},
+    "lifestyle": [
+        "Relevant lifestyle modification"
+    ],
+    "disclaimer": "Important medical disclaimer"
+}}"""
+
+DIAGNOSIS_PROMPT = register(PromptTemplate(
+    name='diagnosis',
+    version=2,
+    system="You are an experienced diagnostic physician. Provide thorough, evidence-based analysis with confidence scores reflecting clinical certainty. Always emphasize the importance of professional medical evaluation and prioritize patient safety.",
+    template="""You are an experienced physician providing diagnostic analysis and recommendations.
+
+PROVIDE:
+
+1. POSSIBLE CONDITIONS (3-5 most likely conditions with confidence scores):
+   - List conditions from most to least likely
+   - Include confidence score (0-100%)
+   - One-line explanation for each condition
+
+2. RECOMMENDED DIAGNOSTIC TESTS (with confidence scores):
+   - Include confidence score (0-100%) for test necessity
+   - Priority order (urgent vs routine)
+   - One-line rationale for each test
+
+3. RED FLAGS requiring immediate medical attention:
+   - Specific warning signs to watch for
+   - When to seek emergency care
+
+4. IMMEDIATE CARE RECOMMENDATIONS:
+   - What patient can do now
+   - Symptom management
+   - Activity restrictions
+
+5. FOLLOW-UP TIMELINE:
+   - When to see a doctor
+   - Urgency level (emergency, urgent, routine)
+
+6. LIFESTYLE MODIFICATIONS:
+   - Relevant diet, activity, or environmental changes
+
+{output_schema}
+
+IMPORTANT: 
+- Base confidence scores on symptom match, patient demographics, and clinical evidence
+- Confidence scores should reflect diagnostic certainty (100% = definitive, 50% = possible, <30% = unlikely)
+- For diagnostic tests: higher confidence = more essential for diagnosis
+- Be specific and actionable with one-line explanations
+- Consider patient's age and medical history
+- Include appropriate medical disclaimers
+- Focus on patient safety
+
+PATIENT DATA:
+Demographics: {demographics}
+Medical History: {history}
+Primary Symptoms: {symptoms}
+Free Text Description: {free_text}
+Detailed Symptom Analysis: {detailed_symptoms}""",
+    output_schema=_DIAGNOSIS_SCHEMA,
+    response_format=_strict_schema('diagnosis', {
+        "possible_conditions": {"type": "array", "items": _object({
+            "condition": _STRING, "confidence_score": _INTEGER, "explanation": _STRING
+        })},
+        "diagnostic_tests": {"type": "array", "items": _TEST},
+        "red_flags": _STRINGS,
+        "immediate_care": _STRINGS,
+        "follow_up": _FOLLOW_UP,
+        "lifestyle": _STRINGS,
+        "disclaimer": _STRING
+    }),
+    input_token_budget=2500
+))
+
+
+PATIENT_SUMMARY_PROMPT = register(PromptTemplate(
+    name='patient_summary',
+    version=2,
+    system="You are a medical AI assistant specializing in patient history summarization with D/O indicators and clinical vitals analysis. Provide comprehensive, structured medical summaries.",
+    template="""You are a medical AI assistant generating a comprehensive patient history summary with Diagnostic (D) and Objective (O) indicators.
+
+TASK: Generate a structured patient summary with D/O indicators for medical documentation.
+
+INSTRUCTIONS:
+1. Use (D) for Diagnostic indicators - information that helps diagnose conditions
+2. Use (O) for Objective indicators - measurable, observable findings
+3. Highlight risk factors, abnormalities, and clinical significance
+4. Provide insights for medical decision-making
+5. Format as HTML for web display
+
+Generate response in this EXACT JSON format:
+{{
+    "patient_summary": {{
+        "demographics_summary": "HTML formatted demographics with D/O indicators",
+        "medical_history_summary": "HTML formatted medical history with D/O indicators", 
+        "risk_factors_summary": "HTML formatted risk factors with D/O indicators",
+        "clinical_relevance": "HTML formatted clinical relevance assessment"
+    }},
+    "vitals_abnormalities": {{
+        "critical_abnormalities": ["List of critical findings requiring immediate attention"],
+        "moderate_abnormalities": ["List of moderate abnormalities requiring monitoring"],
+        "mild_abnormalities": ["List of mild abnormalities to note"],
+        "normal_findings": ["List of normal vital signs"]
+    }},
+    "medical_significance": {{
+        "diagnostic_indicators": "HTML analysis of diagnostic indicators (D)",
+        "objective_findings": "HTML analysis of objective findings (O)",
+        "clinical_correlations": "HTML analysis of clinical correlations",
+        "next_steps": "HTML recommendations for next steps"
+    }}
+}}
+
+Focus on:
+- Age/gender risk factors
+- Chronic disease implications
+- Lifestyle/occupational risks
+- Medication interactions
+- Family history significance
+- Vital signs abnormalities
+- Clinical decision support
+
+PATIENT DATA:
+Demographics: {demographics}
+Medical Conditions: {medical_conditions}
+Medical History: {medical_history}
+Lifestyle: {lifestyle}
+Medical Records: {medical_records}
+Clinical Vitals: {vitals}
+Case Type: {case_type}""",
+    response_format=JSON_OBJECT,
+    input_token_budget=3000
+))
+
+
+_FOLLOWUP_QUESTIONS_SCHEMA = """Generate response in this EXACT JSON format:
+{{
+    "questions": [
+        {{
+            "id": 1,
+            "category": "vitals_outlier" | "demographics" | "medical_history" | "symptoms" | "risk_factors" | "functional_assessment",
+            "question": "Clear, specific question text",
+            "type": "multiple_choice" | "textarea" | "scale",
+            "options": ["option1", "option2", "option3", "option4"] (only for multiple_choice),
+            "min": 1, "max": 10, "min_label": "No pain", "max_label": "Severe pain" (only for scale),
+            "placeholder": "Enter details..." (only for textarea),
+            "relevance": "Medical relevance and D/O indicator explanation",
+            "priority": "high" | "medium" | "low"
+        }}
+    ],
+    "total_questions": 10,
+    "outliers_addressed": ["list of vitals outliers being addressed"],
+    "do_indicators_focus": ["list of key D/O indicators being assessed"]
+}}"""
+
+FOLLOWUP_QUESTIONS_PROMPT = register(PromptTemplate(
+    name='followup_questions',
+    version=2,
+    system="You are a medical AI assistant specializing in generating targeted follow-up questions based on patient data and clinical findings. Generate questions that help gather diagnostic and objective information.",
+    template="""You are a medical AI assistant generating targeted follow-up questions based on patient information with D/O (Diagnostic/Objective) indicators and clinical vitals outliers.
+
+TASK: Generate 8-12 targeted follow-up questions based on:
+1. Patient demographics with D/O indicators (age, gender, occupation, medical history)
+2. Clinical vitals outliers requiring further assessment
+3. Medical conditions that need clarification
+4. Risk factors identified from patient information
+
+QUESTION GENERATION GUIDELINES:
+- Focus on D (Diagnostic) indicators: Information that helps diagnose conditions
+- Focus on O (Objective) indicators: Measurable, observable findings
+- Address any critical vitals outliers first
+- Include age-appropriate questions
+- Consider gender-specific health concerns
+- Ask about symptom onset, duration, and severity
+- Investigate family history implications
+- Assess functional impact and quality of life
+
+{output_schema}
+
+EXAMPLES OF GOOD QUESTIONS:
+- "You have elevated blood pressure (142/88). Have you experienced headaches or dizziness recently?" (O indicator)
+- "Given your age of 68 and diabetes history, do you check your blood sugar regularly?" (D indicator)
+- "Your temperature is 99.2°F. When did you first notice feeling warm or feverish?" (O indicator)
+- "As a female patient, are you currently taking any hormonal medications?" (D indicator)
+
+Focus on actionable medical information that will help with diagnosis and treatment planning.
+
+PATIENT DATA:
+Demographics: {demographics}
+Medical Conditions: {medical_conditions}
+Medical History: {medical_history}
+Lifestyle: {lifestyle}
+Medical Records: {medical_records}
+Clinical Vitals: {vitals}
+Case Type: {case_type}
+
+VITALS OUTLIERS DETECTED:
+{vitals_outliers}""",
+    output_schema=_FOLLOWUP_QUESTIONS_SCHEMA,
+    response_format=JSON_OBJECT,
+    input_token_budget=3000
+))
+
+
+SYMPTOM_SUGGESTIONS_PROMPT = register(PromptTemplate(
+    name='symptom_suggestions',
+    version=1,
+    system="You are a medical symptom suggestion system. Provide relevant symptom suggestions in simple language.",
+    template="""Provide EXACTLY 10 relevant medical symptoms as suggestions for the user input below.
+
+Guidelines:
+1. Ensure direct relevance to the input
+2. Include both exact matches and related symptoms
+3. Use simple, everyday language
+4. Keep descriptions to 2-4 words
+5. List EXACTLY 10 suggestions, no more, no less
+6. Format: "symptom (brief description)"
+
+Example format for "headache":
+[
+    "headache (pain in head)",
+    "migraine (severe pulsing headache)",
+    "tension headache (tight band feeling)",
+    "sinus pain (face pressure)",
+    "neck pain (stiff neck)",
+    "dizziness (room spinning)",
+    "eye strain (tired eyes)",
+    "ear pain (throbbing ear)",
+    "fever (high temperature)",
+    "fatigue (feeling very tired)"
+]
+
+Important: 
+- Always return exactly 10 items
+- Ensure first suggestions are most relevant
+- Include common related symptoms
+
+User input: '{user_input}'""",
+    input_token_budget=600
+))
+
+
+_DYNAMIC_QUESTIONS_SCHEMA = """- Output ONLY valid JSON. No prose, no markdown.
+- JSON must be an array of 15-25 objects.
+- Each object must have: 
+  {{
+    "symptom": "Short human-readable question/symptom probe",
+    "category": "one of: general, gastrointestinal, respiratory, cardiovascular, neurological, musculoskeletal, dermatological, risk_factors, history, medications, psychological, temporal, epidemiological, physical, pain, throat",
+    "notes_hint": "Brief hint for notes input",
+    "type": "yes_no_notes"
+  }}"""
+
+DYNAMIC_QUESTIONS_PROMPT = register(PromptTemplate(
+    name='dynamic_questions',
+    version=1,
+    system="You generate structured JSON checklists for medical intake forms.",
+    template="""You are a medical intake assistant. Based on the patient profile, generate a structured checklist of follow-up items to ask in an intake form.
+
+REQUIREMENTS:
+{output_schema}
+- Questions must be tailored to the case type, selected symptoms, demographics, and free text.
+- Include temporal, risk factor, and red-flag probes when appropriate.
+- Keep 'symptom' field concise (max ~80 chars).
+
+PATIENT PROFILE (JSON):
+{profile}""",
+    output_schema=_DYNAMIC_QUESTIONS_SCHEMA,
+    input_token_budget=1500
+))
+
+
+PATIENT_CONTEXT_PROMPT = register(PromptTemplate(
+    name='patient_context',
+    version=1,
+    system="You condense patient intake notes for other clinical prompts. Be factual and terse.",
+    template="""Rewrite the patient background at the end of this message as one compact clinical note.
+- Keep every clinically relevant fact: diagnoses, medications, allergies, exposures, family history, pregnancy, occupation.
+- Drop identifiers, repetition and filler. Do not interpret, diagnose or add facts.
+- Plain text, at most 80 words.
+
+PATIENT BACKGROUND:
+{context}""",
+    input_token_budget=1500
+))
+
+
+LABEL_EXTRACTION_PROMPT = register(PromptTemplate(
+    name='label_extraction',
+    version=1,
+    system="You are a medical AI specialized in symptom analysis and label extraction. Provide accurate, clinically relevant symptom labels and their relationships.",
+    template="""You are a medical AI assistant. Analyze the symptom description at the end of this message and extract key medical symptom labels.
+
+Extract specific medical symptom labels from this text. Focus on identifying distinct, clinically relevant symptom categories.
+
+Return your analysis in this EXACT JSON format:
+{{
+    "extracted_labels": {{
+        "label_name": {{
+            "detected": true,
+            "source": "symptoms" or "free_text",
+            "confidence": "high" or "medium" or "low"
+        }}
+    }},
+    "correlation_matrix": {{
+        "label_name": [
+            {{
+                "label": "related_label_name",
+                "strength": "high" or "moderate",
+                "questions": [
+                    "Specific correlation question 1",
+                    "Specific correlation question 2"
+                ]
+            }}
+        ]
+    }}
+}}
+
+GUIDELINES:
+- Extract 3-8 specific medical symptom labels
+- Use standard medical terminology 
+- Correlations should be medically accurate
+- Questions should be clinically relevant
+- Focus on primary symptoms mentioned
+- Avoid generic terms like "general symptoms"
+
+Example labels: fever, headache, nausea, muscle_pain, fatigue, abdominal_pain, respiratory_symptoms, etc.
+
+SYMPTOM INPUT: "{symptom_text}\"""",
+    response_format=JSON_OBJECT,
+    input_token_budget=1500
+))
+
+
+_ADDITIONAL_QUESTIONS_SCHEMA = """Return the questions in a valid JSON array format that I can parse programmatically. Each question should be directly relevant 
+to the symptoms and medical context provided. Don't invent new symptoms that weren't mentioned.
+
+Here's an example of the desired output format:
+```json
+[
+  {{
+    "id": 1,
+    "category": "onset_timing",
+    "question": "When did your fever first begin?",
+    "type": "multiple_choice",
+    "options": ["Within the last 24 hours", "1-3 days ago", "4-7 days ago", "More than a week ago"],
+    "relevance": "Helps determine if this is an acute or chronic condition"
+  }},
+  {{
+    "id": 2,
+    "category": "pain_assessment",
+    "question": "How would you rate your abdominal pain?",
+    "type": "scale",
+    "min": 0,
+    "max": 10,
+    "min_label": "No pain",
+    "max_label": "Worst possible pain",
+    "relevance": "Pain severity helps assess condition urgency"
+  }}
+]
+```"""
+
+ADDITIONAL_QUESTIONS_PROMPT = register(PromptTemplate(
+    name='additional_questions',
+    version=1,
+    system="""You are a medical expert specializing in patient assessment. 
+Your task is to generate targeted additional information questions based on the OLDCARTS framework
+(Onset, Location, Duration, Characteristics, Aggravating factors, Relieving factors, Timing, Severity)
+tailored to the patient's specific symptoms, demographics, and clinical measurements.
+
+Create questions that are directly relevant to the reported symptoms and will help in accurate diagnosis.
+Each question should have a clear clinical purpose and be formatted as a JSON object with:
+- id: A unique numerical identifier
+- category: The OLDCARTS category (onset_timing, location, duration_pattern, characteristics_quality, aggravating_factors, relieving_factors, pain_assessment, nausea_vomiting, fatigue_impact, daily_life_impact, work_school_impact, patient_concerns, patient_expectations)
+- question: The actual question text
+- type: Question type (multiple_choice, textarea, scale)
+- options: For multiple_choice questions, an array of possible answers
+- min/max/min_label/max_label: For scale questions
+- relevance: A short explanation of why this question is clinically relevant
+- placeholder: For textarea questions, a hint for the answer
+
+Prioritize questions that:
+1. Address the timing and nature of the primary symptoms
+2. Explore potential complications or differential diagnoses
+3. Assess severity and impact on the patient's life
+4. Help distinguish between similar conditions
+
+Make sure questions are medically accurate and use appropriate medical terminology while still being understandable to patients.""",
+    template="""Based on the patient information at the end of this message, generate clinically relevant additional information questions 
+using the OLDCARTS framework. Focus on questions that would help determine the diagnosis and severity of the patient's condition.
+
+{output_schema}
+
+PATIENT INFORMATION:
+Generate a maximum of {max_questions} questions for a {age} year old {gender} with the following reported symptoms: {symptoms}
+
+Additional symptom details: {free_text}
+
+Case type: {case_type}
+
+Vital signs:
+{vitals}
+Medical conditions:
+{medical_conditions}""",
+    output_schema=_ADDITIONAL_QUESTIONS_SCHEMA,
+    input_token_budget=2500
+))
+
+
+# Compact output schemas: short keys, enum codes and positional rows. compact_schema.py
+# expands the model output back into the verbose shapes above before it leaves the server.
+_ANALYSIS_COMPACT_SCHEMA = """Respond with ONLY this compact JSON (short keys, positional arrays, no other keys):
+{{"c":[["Condition name",85,"1A00.0Z","Official ICD-11 title","One-sentence clinical reasoning"]],"t":[["Test name",90,"u","One-sentence rationale"]],"rf":["Concerning feature"],"ic":["Actionable recommendation"],"fu":["r","Specific timeframe","Why this timeline"],"ls":["Lifestyle modification"]}}
+c = possible conditions: [name, confidence 0-100, ICD-11 code, ICD-11 title, explanation]
+t = diagnostic tests: [name, confidence 0-100, priority u=urgent r=routine, explanation]
+rf = red flags, ic = immediate care, ls = lifestyle
+fu = follow-up: [urgency e=emergency u=urgent r=routine, timeline, reason]
+Do not include a disclaimer."""
+
+_DIAGNOSIS_COMPACT_SCHEMA = """Respond with ONLY this compact JSON (short keys, positional arrays, no other keys):
+{{"c":[["Condition name",85,"One-line explanation"]],"t":[["Test name",90,"u","One-line rationale"]],"rf":["Warning sign"],"ic":["Actionable recommendation"],"fu":["r","Specific timeframe","Why this timeline"],"ls":["Lifestyle modification"]}}
+c = possible conditions: [name, confidence 0-100, explanation]
+t = diagnostic tests: [name, confidence 0-100, priority u=urgent r=routine, explanation]
+rf = red flags, ic = immediate care, ls = lifestyle
+fu = follow-up: [urgency e=emergency u=urgent r=routine, timeline, reason]
+Do not include a disclaimer."""
+
+_FOLLOWUP_QUESTIONS_COMPACT_SCHEMA = """Respond with ONLY this compact JSON (short keys, positional arrays, no other keys):
+{{"q":[["vo","Clear, specific question text","m",["option1","option2","option3","option4"],"Medical relevance and D/O indicator","h"]],"oa":["vitals outlier addressed"],"do":["key D/O indicator assessed"]}}
+q = questions: [category, question, type, detail, relevance, priority]
+category: vo=vitals_outlier dm=demographics mh=medical_history sy=symptoms rf=risk_factors fa=functional_assessment
+type and detail: m=multiple_choice with detail = list of options; s=scale with detail = [min, max, min label, max label]; t=textarea with detail = placeholder text
+priority: h=high m=medium l=low"""
+
+_DYNAMIC_QUESTIONS_COMPACT_SCHEMA = """- Output ONLY valid JSON. No prose, no markdown.
+- JSON must be an array of 15-25 rows: ["Short question/symptom probe", category number, "Brief hint for notes input"]
+- Category numbers: 0 general, 1 gastrointestinal, 2 respiratory, 3 cardiovascular, 4 neurological, 5 musculoskeletal, 6 dermatological, 7 risk_factors, 8 history, 9 medications, 10 psychological, 11 temporal, 12 epidemiological, 13 physical, 14 pain, 15 throat"""
+
+_ADDITIONAL_QUESTIONS_COMPACT_SCHEMA = """Return ONLY a JSON array of compact rows, one per question: [category, question, type, detail, relevance]
+- type and detail: m=multiple_choice with detail = list of options; s=scale with detail = [min, max, min label, max label]; t=textarea with detail = placeholder text
+- Each question should be directly relevant to the symptoms and medical context provided. Don't invent new symptoms that weren't mentioned.
+
+Example:
+[["onset_timing","When did your fever first begin?","m",["Within the last 24 hours","1-3 days ago","4-7 days ago","More than a week ago"],"Acute vs chronic"],["pain_assessment","How would you rate your abdominal pain?","s",[0,10,"No pain","Worst possible pain"],"Assesses urgency"]]"""
+
+# Positional rows mix types, which strict schemas cannot express; object payloads still use JSON mode.
+# Array-only families (suggestions, dynamic and additional questions) are parsed with extract_json.
+ANALYSIS_COMPACT_PROMPT = register(
+    ANALYSIS_PROMPT.with_output_schema('analysis_compact', _ANALYSIS_COMPACT_SCHEMA, response_format=JSON_OBJECT)
+)
+DIAGNOSIS_COMPACT_PROMPT = register(
+    DIAGNOSIS_PROMPT.with_output_schema('diagnosis_compact', _DIAGNOSIS_COMPACT_SCHEMA, response_format=JSON_OBJECT)
+)
+FOLLOWUP_QUESTIONS_COMPACT_PROMPT = register(
+    FOLLOWUP_QUESTIONS_PROMPT.with_output_schema('followup_questions_compact', _FOLLOWUP_QUESTIONS_COMPACT_SCHEMA,
+                                                 response_format=JSON_OBJECT)
+)
+DYNAMIC_QUESTIONS_COMPACT_PROMPT = register(
+    DYNAMIC_QUESTIONS_PROMPT.with_output_schema('dynamic_questions_compact', _DYNAMIC_QUESTIONS_COMPACT_SCHEMA)
+)
+ADDITIONAL_QUESTIONS_COMPACT_PROMPT = register(
+    ADDITIONAL_QUESTIONS_PROMPT.with_output_schema('additional_questions_compact', _ADDITIONAL_QUESTIONS_COMPACT_SCHEMA)
+)
+
+
+
+# Fan-out parts of the analysis prompt (OpenAIHelper.analyze_symptoms with ANALYSIS_FANOUT=1).
+# Each part shares the full analysis instructions and patient profile but asks for one slice of the output.
+_ANALYSIS_CONDITIONS_SCHEMA = """For this request provide ONLY the possible conditions, in this EXACT JSON format:
+{{
+    "possible_conditions": [
+        {{
+            "condition": "Primary Condition Name",
+            "confidence_score": 85,
+            "icd11_code": "1A00.0Z",
+            "icd11_title": "Official ICD-11 condition title",
+            "explanation": "Detailed clinical reasoning incorporating complete OPQRST findings, demographics, and risk factors."
+        }}
+    ]
+}}"""
+
+_ANALYSIS_TESTS_SCHEMA = """For this request provide ONLY the recommended diagnostic tests, in this EXACT JSON format:
+{{
+    "diagnostic_tests": [
+        {{
+            "test": "Specific Test Name",
+            "confidence_score": 90,
+            "priority": "urgent/routine",
+            "explanation": "Clinical rationale based on OPQRST findings and differential diagnosis requirements"
+        }}
+    ]
+}}"""
+
+_ANALYSIS_CARE_SCHEMA = """For this request provide ONLY red flags, care advice and follow-up, in this EXACT JSON format:
+{{
+    "red_flags": ["List any concerning OPQRST features that suggest urgent evaluation"],
+    "immediate_care": ["Specific actionable recommendations"],
+    "follow_up": {{
+        "urgency": "emergency/urgent/routine",
+        "timeline": "Specific timeframe",
+        "reason": "Why this timeline"
+    }},
+    "lifestyle": ["Relevant lifestyle modifications"]
+}}"""
+
+
+def _analysis_part(name: str, output_schema: str, keys) -> PromptTemplate:
+    properties = {key: _ANALYSIS_PROPERTIES[key] for key in keys}
+    return register(ANALYSIS_PROMPT.with_output_schema(name, output_schema,
+                                                       response_format=_strict_schema(name, properties)))
+
+
+ANALYSIS_CONDITIONS_PROMPT = _analysis_part('analysis_conditions', _ANALYSIS_CONDITIONS_SCHEMA, ('possible_conditions',))
+ANALYSIS_TESTS_PROMPT = _analysis_part('analysis_tests', _ANALYSIS_TESTS_SCHEMA, ('diagnostic_tests',))
+ANALYSIS_CARE_PROMPT = _analysis_part(
+    'analysis_care', _ANALYSIS_CARE_SCHEMA, ('red_flags', 'immediate_care', 'follow_up', 'lifestyle')
+)
@@ -0,0 +1,143 @@
+import re
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+# "{name}" in a template string is filled from the item's params
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+# Template fields that identify which parametric template a question may come from
+_DISCRIMINATORS = ('help_text', 'relevance')
+
+
+def expand(template: Dict, params: Dict) -> Dict:
+    """
+    A question from its template: placeholders in string fields are filled from
+    `params`, and params no placeholder consumed are set as fields (an id, say).
+    static/js/main.js (expandQuestionItem) implements the same rule.
+    """
+    used = set()
+
+    def fill(match):
+        name = match.group(1)
+        if name in params:
+            used.add(name)
+            return str(params[name])
+        return match.group(0)
+
+    question = {k: _PLACEHOLDER.sub(fill, v) if isinstance(v, str) else v for k, v in template.items()}
+    for name, value in params.items():
+        if name not in used:
+            question[name] = value
+    return question
+
+
+def _row_key(question: Dict):
+    try:
+        return hash(tuple(sorted(question.items())))
+    except TypeError:  # list values (e.g. options decoded from JSON) are not hashable
+        return None
+
+
+def _extractor(template: Dict, name: str):
+    """(field, regex) recovering placeholder `name` from the one field that holds only it."""
+    for field, value in template.items():
+        if isinstance(value, str) and _PLACEHOLDER.findall(value) == [name]:
+            literal_parts = value.split('{' + name + '}')
+            pattern = '(.+?)'.join(re.escape(part) for part in literal_parts)
+            return field, re.compile(f'^{pattern}$', re.DOTALL)
+    return None
+
+
+def _to_ref(index: int) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    ref = ''
+    while True:
+        index, rest = divmod(index, 36)
+        ref = digits[rest] + ref
+        if not index:
+            return ref
+
+
+class QuestionTemplates:
+    """
+    Template dictionary of the templated questionnaire wire format. Fixed questions
+    (checklist rows, label feature rows, ...) are sent as a short reference, and
+    parametric ones as [reference, params]: a questionnaire of 60 rows costs a few
+    hundred bytes instead of ~10 KB, and the client expands it from the dictionary it
+    fetched once from GET /question_templates and caches under its ETag.
+
+    Anything no template reproduces exactly (LLM questions, changed inputs) is sent
+    inline as the plain question, so the format is a superset of the legacy one.
+    """
+
+    def __init__(self, rows: Iterable[Dict], parametric: Iterable[Dict]):
+        self.templates: Dict[str, Dict] = {}
+        self._by_identity: Dict[int, str] = {}
+        self._by_content: Dict[int, str] = {}
+        self._by_discriminator: Dict[tuple, List] = {}
+
+        for row in rows:
+            key = _row_key(row)
+            if key is None or key in self._by_content:
+                continue
+            ref = self._add(row)
+            self._by_content[key] = ref
+            # Rows shared across questionnaires (clinical_models.ChecklistItem) match by identity
+            self._by_identity[id(row)] = ref
+
+        for template in parametric:
+            discriminator = next(((f, template[f]) for f in _DISCRIMINATORS if isinstance(template.get(f), str)), None)
+            if discriminator is None:
+                raise ValueError(f"Parametric question template needs one of {_DISCRIMINATORS}: {template}")
+            names = sorted({n for v in template.values() if isinstance(v, str) for n in _PLACEHOLDER.findall(v)})
+            extractors = [(name, _extractor(template, name)) for name in names]
+            if any(extractor is None for _, extractor in extractors):
+                raise ValueError(f"Each placeholder needs a field holding only it: {template}")
+            self._by_discriminator.setdefault(discriminator, []).append((self._add(template), template, extractors))
+
+        canonical = json.dumps(self.templates, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        self.etag = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:20]
+        # The GET /question_templates body, serialized once
+        self.body = json.dumps({'etag': self.etag, 'templates': self.templates},
+                               separators=(',', ':'), ensure_ascii=False)
+
+    def _add(self, template: Dict) -> str:
+        ref = _to_ref(len(self.templates))
+        self.templates[ref] = template
+        return ref
+
+    def encode(self, question):
+        """A reference, [reference, params], or the question itself when no template reproduces it."""
+        if not isinstance(question, dict):
+            return question
+        ref = self._by_identity.get(id(question))
+        if ref is not None and self.templates[ref] is question:
+            return ref
+        key = _row_key(question)
+        ref = self._by_content.get(key) if key is not None else None
+        if ref is not None and self.templates[ref] == question:
+            return ref
+
+        for field in _DISCRIMINATORS:
+            for ref, template, extractors in self._by_discriminator.get((field, question.get(field)), ()):
+                params = self._params(template, extractors, question)
+                if params is not None:
+                    return [ref, params]
+        return question
+
+    def encode_all(self, questions: List) -> List:
+        return [self.encode(question) for question in questions]
+
+    @staticmethod
+    def _params(template: Dict, extractors, question: Dict) -> Optional[Dict]:
+        params = {}
+        for name, (field, pattern) in extractors:
+            match = pattern.match(question.get(field) or '') if isinstance(question.get(field), str) else None
+            if match is None:
+                return None
+            params[name] = match.group(1)
+        for field, value in question.items():
+            if field not in template:
+                params[field] = value
+        return params if expand(template, params) == question else None
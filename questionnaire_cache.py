@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+
+from shared_state import state_dir
+from symptom_vocabulary import normalize_symptom, normalize_symptoms
+from label_matcher import match_labels
+from metrics import metrics
+
+# Age bands a questionnaire is shared across, with the age used when generating for the band
+AGE_BANDS = ((12, '0-12', 8), (17, '13-17', 15), (39, '18-39', 30), (64, '40-64', 52), (200, '65+', 72))
+
+# Free text only joins the key when the local matcher explains it this well (typos allowed);
+# anything else it says could change the questionnaire, so such requests are not cached
+FREE_TEXT_MIN_CONFIDENCE = 0.85
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questionnaires (
+    family TEXT NOT NULL,
+    version TEXT NOT NULL,
+    key TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (family, version, key)
+);
+CREATE TABLE IF NOT EXISTS observed (
+    family TEXT NOT NULL,
+    key TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (family, key)
+);
+"""
+
+
+def demographic_band(demographics: Optional[Dict]) -> Dict[str, str]:
+    demographics = demographics or {}
+    try:
+        age = float(demographics.get('age'))
+        band = next(name for limit, name, _ in AGE_BANDS if age <= limit)
+    except (TypeError, ValueError):
+        band = 'unknown'
+    gender = str(demographics.get('gender') or '').strip().lower()
+    return {'age': band, 'gender': gender if gender in ('male', 'female') else ('other' if gender else 'unknown')}
+
+
+def band_demographics(band: Dict[str, str]) -> Dict:
+    """Representative demographics for a band, used when a questionnaire is generated for it."""
+    demographics = {}
+    age = next((age for _, name, age in AGE_BANDS if name == band.get('age')), None)
+    if age is not None:
+        demographics['age'] = age
+    if band.get('gender') in ('male', 'female', 'other'):
+        demographics['gender'] = band['gender']
+    return demographics
+
+
+def symptom_set(symptoms: List[str], free_text: str = '') -> Optional[List[str]]:
+    """
+    Sorted canonical symptom strings for the selection plus the symptoms named in the
+    free text, or None when the free text says something the vocabulary cannot
+    represent (low match confidence, or a negation).
+    """
+    canonical = set(normalize_symptoms(symptoms))
+    if (free_text or '').strip():
+        matched = match_labels([], free_text)
+        if matched['negated_labels'] or matched['confidence'] < FREE_TEXT_MIN_CONFIDENCE:
+            return None
+        for entry in matched['extracted_labels'].values():
+            symptom = normalize_symptom(entry['matched'])
+            if symptom is not None:
+                canonical.add(symptom.display)
+    return sorted(canonical) or None
+
+
+def structured_profile(case_type: str, symptoms: List[str], free_text: str, demographics: Dict) -> Optional[Dict]:
+    """Cache profile of the dynamic symptom checklist (_generate_dynamic_symptom_questions_openai)."""
+    canonical = symptom_set(symptoms, free_text)
+    if canonical is None:
+        return None
+    return {'case_type': (case_type or '').strip().lower(), 'symptoms': canonical, 'band': demographic_band(demographics)}
+
+
+def additional_profile(patient_data: Dict, max_questions: int, vitals_flags: List[str]) -> Optional[Dict]:
+    """
+    Cache profile of the OLDCARTS questions. Their prompt also carries vitals and
+    conditions, so the profile adds which vitals are out of range and which conditions
+    were answered yes, rather than the readings themselves.
+    """
+    profile = structured_profile(patient_data.get('caseType', ''), patient_data.get('symptoms') or [],
+                                 patient_data.get('freeTextSymptoms', ''), patient_data.get('demographics'))
+    if profile is None:
+        return None
+    conditions = patient_data.get('medicalConditions') or {}
+    profile.update({
+        'vitals_flags': sorted(set(vitals_flags)),
+        'conditions': sorted(k for k, v in conditions.items() if v is True or str(v).strip().lower() == 'yes'),
+        'max_questions': int(max_questions)
+    })
+    return profile
+
+
+def profile_patient_data(profile: Dict) -> Dict:
+    """Representative request data for a profile, used to (re)generate its questionnaire."""
+    patient_data = {
+        'caseType': profile.get('case_type', ''),
+        'symptoms': list(profile.get('symptoms') or []),
+        'freeTextSymptoms': '',
+        'demographics': band_demographics(profile.get('band') or {})
+    }
+    if profile.get('conditions'):
+        patient_data['medicalConditions'] = {condition: 'yes' for condition in profile['conditions']}
+    if profile.get('vitals_flags'):
+        patient_data['vitals'] = {'notes': 'outside normal range: ' + ', '.join(
+            flag.replace('_', ' ') for flag in profile['vitals_flags'])}
+    return patient_data
+
+
+def profile_key(profile: Dict) -> str:
+    canonical = json.dumps(profile, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class QuestionnaireCache:
+    """
+    Questionnaires persisted in a host-local SQLite file, keyed by the canonical
+    (case type, symptom set, demographic band) profile of the request plus the prompt
+    version that produced them, so every worker (including a freshly started one) and
+    every restart serves recurring flows without an LLM call. Each lookup is also
+    counted per profile, which gives warm_questionnaires.py the most requested
+    combinations to pre-generate.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: int = 30 * 86400, max_entries: int = 20000):
+        self.path = path or os.path.join(state_dir(), 'questionnaires.sqlite3')
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process: gunicorn forks after the app is imported
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get_or_create(self, family: str, version: str, profile: Optional[Dict], generate: Callable[[], object]):
+        """The stored questionnaire for `profile`, or generate() stored under it. None profile: not cacheable."""
+        cached = self.lookup(family, version, profile)
+        if cached is not None:
+            return cached
+        payload = generate()
+        self.store(family, version, profile, payload)
+        return payload
+
+    def lookup(self, family: str, version: str, profile: Optional[Dict]):
+        """get() with hit/miss metrics; None on a miss, for an uncacheable profile or if the database fails."""
+        if profile is None:
+            metrics.increment('questionnaire_cache', f"{family}/uncacheable")
+            return None
+        try:
+            cached = self.get(family, version, profile)
+        except sqlite3.Error as e:
+            print(f"WARN: Questionnaire cache unavailable: {e}")
+            return None
+        metrics.increment('questionnaire_cache', f"{family}/{'hit' if cached is not None else 'miss'}")
+        return cached
+
+    def store(self, family: str, version: str, profile: Optional[Dict], payload):
+        """put() for a generated questionnaire; empty results and uncacheable profiles are not stored."""
+        if profile is None or not payload:
+            return
+        try:
+            self.put(family, version, profile, payload)
+        except sqlite3.Error as e:
+            print(f"WARN: Could not store questionnaire: {e}")
+
+    def get(self, family: str, version: str, profile: Dict, observe: bool = True):
+        """The stored payload or None; `observe` counts the lookup towards the request and hit totals."""
+        key = profile_key(profile)
+        now = time.time()
+        db = self._db()
+        if observe:
+            db.execute(
+                'INSERT INTO observed (family, key, profile, requests, last_seen) VALUES (?, ?, ?, 1, ?) '
+                'ON CONFLICT(family, key) DO UPDATE SET requests = requests + 1, last_seen = excluded.last_seen',
+                (family, key, json.dumps(profile), now)
+            )
+        row = db.execute(
+            'SELECT payload FROM questionnaires WHERE family = ? AND version = ? AND key = ? AND created_at > ?',
+            (family, version, key, now - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        if observe:
+            db.execute('UPDATE questionnaires SET hits = hits + 1 WHERE family = ? AND version = ? AND key = ?',
+                       (family, version, key))
+        return json.loads(row[0])
+
+    def put(self, family: str, version: str, profile: Dict, payload):
+        db = self._db()
+        db.execute(
+            'INSERT OR REPLACE INTO questionnaires (family, version, key, profile, payload, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (family, version, profile_key(profile), json.dumps(profile), json.dumps(payload), time.time())
+        )
+        (count,) = db.execute('SELECT COUNT(*) FROM questionnaires').fetchone()
+        if count > self.max_entries:
+            db.execute('DELETE FROM questionnaires WHERE rowid IN '
+                       '(SELECT rowid FROM questionnaires ORDER BY created_at LIMIT ?)', (count - self.max_entries,))
+
+    def top_observed(self, family: str, limit: int) -> List[Dict]:
+        """Profiles of the most requested combinations for a family, most requested first."""
+        rows = self._db().execute(
+            'SELECT profile FROM observed WHERE family = ? ORDER BY requests DESC, last_seen DESC LIMIT ?',
+            (family, limit)
+        ).fetchall()
+        return [json.loads(profile) for (profile,) in rows]
+
+    def stats(self) -> Dict:
+        db = self._db()
+        return {
+            family: {'entries': entries, 'hits': hits or 0}
+            for family, entries, hits in db.execute(
+                'SELECT family, COUNT(*), SUM(hits) FROM questionnaires GROUP BY family')
+        }
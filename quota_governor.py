@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from shared_state import SharedLedger, pid_alive
+from scheduling import current_priority, effective_rank, priority_rank
+from metrics import metrics
+
+# Rough OpenAI accounting: ~4 characters per token plus per-message framing overhead
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class QuotaExceededError(Exception):
+    """Raised when the RPM/TPM budget did not free up within the governor's max wait."""
+
+
+def estimate_text_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_prompt_tokens(messages: List[Dict]) -> int:
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + estimate_text_tokens(str(message.get('content') or ''))
+    return total
+
+
+class QuotaGovernor:
+    """
+    Host-wide requests-per-minute / tokens-per-minute governor for the OpenAI account.
+    Every worker records its calls in one sliding-window ledger before calling
+    chat.completions.create, so bursts are smoothed on our side instead of the whole
+    fleet receiving 429s together. Reservations are estimated from the prompt plus
+    max_tokens and reconciled against response.usage afterwards.
+
+    Callers waiting for room queue in the same ledger and are admitted in
+    request_priority() order (with the upstream scheduler's aging), so an emergency
+    analysis is not stuck behind autocomplete traffic when the window is full.
+    """
+
+    def __init__(self, rpm: int, tpm: int, window_seconds: float = 60.0, max_wait: float = 15.0,
+                 ledger: Optional[SharedLedger] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window_seconds = window_seconds
+        self.max_wait = max_wait
+        self.ledger = ledger or SharedLedger('openai_quota')
+
+    def _prune(self, entries: List, now: float) -> List:
+        return [entry for entry in entries if now - entry[1] < self.window_seconds]
+
+    def acquire(self, messages: List[Dict], max_tokens: Optional[int], max_wait: Optional[float] = None) -> str:
+        """
+        Block until the call fits in the current RPM/TPM window and record a reservation.
+        Waits at most the governor's max_wait, or `max_wait` if shorter.
+        Returns the reservation id to pass to reconcile().
+        """
+        estimate = estimate_prompt_tokens(messages) + (max_tokens or 0)
+        reservation = uuid.uuid4().hex[:12]
+        urgency, route_class = current_priority()
+        rank = priority_rank(urgency, route_class)
+        started = time.time()
+        deadline = started + (self.max_wait if max_wait is None else min(self.max_wait, max_wait))
+
+        try:
+            while True:
+                now = time.time()
+                with self.ledger.transaction() as state:
+                    entries = self._prune(state.get('entries', []), now)
+                    state['entries'] = entries
+                    waiters = state.setdefault('waiters', {})
+                    for ticket in [t for t, (_, _, pid) in waiters.items() if not pid_alive(pid)]:
+                        del waiters[ticket]
+                    waiters.setdefault(reservation, [rank, started, os.getpid()])
+                    head = min(waiters.items(), key=lambda item: (effective_rank(item[1][0], item[1][1], now), item[1][1]))[0]
+                    used_tokens = sum(entry[2] for entry in entries)
+                    # A single call larger than the whole budget is admitted into an empty window
+                    fits_tokens = used_tokens + estimate <= self.tpm or not entries
+                    if head == reservation and len(entries) < self.rpm and fits_tokens:
+                        del waiters[reservation]
+                        entries.append([reservation, now, estimate])
+                        break
+                    if head != reservation or not entries:
+                        wait = 0.05
+                    else:
+                        # Earliest moment an entry leaves the window
+                        wait = max(0.05, self.window_seconds - (now - entries[0][1]))
+
+                if (head == reservation and now + wait > deadline) or now >= deadline:
+                    metrics.increment('openai_quota_rejections')
+                    raise QuotaExceededError(
+                        f"OpenAI quota window full ({len(entries)} requests, {used_tokens} tokens in the last {self.window_seconds:.0f}s)"
+                    )
+                time.sleep(min(wait, 0.25))
+        except BaseException:
+            with self.ledger.transaction() as state:
+                state.setdefault('waiters', {}).pop(reservation, None)
+            raise
+
+        waited = time.time() - started
+        if waited > 0.01:
+            metrics.observe('openai_quota_wait_seconds', f"{urgency}/{route_class}", waited)
+        return reservation
+
+    def release(self, reservation: str) -> None:
+        """Drop a reservation whose request was never sent (e.g. no upstream slot in time)."""
+        with self.ledger.transaction() as state:
+            state['entries'] = [entry for entry in state.get('entries', []) if entry[0] != reservation]
+
+    def reconcile(self, reservation: str, usage) -> None:
+        """
+        Replace the reservation's estimate with actual usage. When a sent call failed
+        (usage is None) the request still counts towards RPM but not its completion tokens.
+        """
+        actual = getattr(usage, 'total_tokens', None) if usage is not None else None
+        with self.ledger.transaction() as state:
+            for entry in state.get('entries', []):
+                if entry[0] == reservation:
+                    entry[2] = actual if actual is not None else min(entry[2], MESSAGE_OVERHEAD_TOKENS)
+                    break
+        if actual is not None:
+            metrics.increment('openai_tokens_total', '', actual)
+
+    def usage(self) -> Dict:
+        entries = self._prune(self.ledger.read().get('entries', []), time.time())
+        return {
+            'requests_in_window': len(entries),
+            'tokens_in_window': sum(entry[2] for entry in entries),
+            'rpm_limit': self.rpm,
+            'tpm_limit': self.tpm
+        }
@@ -0,0 +1,222 @@
+import re
+from typing import Dict, List, Optional
+
+from symptom_vocabulary import symptom_terms
+
+# Symptom concepts, compiled once at import. Each is a single alternation regex over
+# the lower-cased symptom text (selected symptoms + free text + OPQRST details).
+_CONCEPTS = {
+    'chest_pain': r"chest (?:pain|pressure|tightness|heaviness|discomfort)|crushing|pressure on (?:my |the )?chest|heart attack",
+    'radiation': r"radiat\w*|spread\w* to (?:my |the )?(?:left |right )?(?:arm|jaw|neck|shoulder|back)|left arm|(?:arm|jaw) pain",
+    'dyspnea': r"short(?:ness)? of breath|can'?t (?:catch (?:my |a )?)?breath|can ?not breathe|unable to breathe|difficulty breathing|breathless|gasping",
+    'diaphoresis': r"cold sweat|sweating|diaphores\w*|clammy",
+    'severe_dyspnea': r"can'?t breathe|can ?not breathe|unable to breathe|gasping|blue lips|turning blue|choking",
+    'stroke_signs': r"face droop\w*|facial droop\w*|drooping (?:face|mouth)|slurred speech|can'?t speak|one[- ]sided weakness|weakness (?:on|in) one side|numb(?:ness)? (?:on|in) one side|sudden (?:vision loss|confusion)",
+    'thunderclap': r"worst headache|thunderclap|sudden severe headache",
+    'neck_stiffness': r"stiff neck|neck stiffness",
+    'fever': r"fever|high temperature",
+    'anaphylaxis_airway': r"throat (?:swelling|closing|tight\w*)|swollen (?:tongue|lips|throat)|tongue swelling",
+    'allergic_trigger': r"allerg\w*|hives|bee sting|peanut|after eating",
+    'unresponsive': r"unconscious|unresponsive|passed out|fainted|loss of consciousness|seizure|convulsion",
+    'major_bleeding': r"vomiting blood|coughing up blood|blood in vomit|heavy bleeding|bleeding (?:heavily|won'?t stop)|black tarry stool",
+    'suicidal': r"suicid\w*|kill myself|end my life|self[- ]harm",
+}
+_PATTERNS = {name: re.compile(pattern) for name, pattern in _CONCEPTS.items()}
+
+# Negation cues ("no chest pain", "denies sweating", "without fever"). "can not"/"could not"
+# are not cues: "I can not breathe" is a symptom, not a denial.
+_NEGATION_CUE = re.compile(r"\b(?:no|denies|denied|deny|denying|without|never|negative for|(?<!can )(?<!could )not)\b")
+# A negation covers at most this many words after its cue, and stops at the end of the clause
+NEGATION_WINDOW_WORDS = 6
+_CLAUSE_END = re.compile(r"[.,;:!?\n]| - |\b(?:but|however|although|though|except|yet|apart from)\b")
+_WORD = re.compile(r"[\w'/-]+")
+
+# Vitals outlier types (from OpenAIHelper._analyze_vitals_outliers) that alone warrant emergency care
+_EMERGENCY_OUTLIERS = {'hypertensive_crisis', 'severe_hypoxemia', 'severe_hyperglycemia'}
+
+_RISK_FACTOR_KEYS = ('diabet', 'hypertens', 'smok', 'weight', 'obes', 'cholesterol', 'heart')
+_AFFIRMATIVE = {'yes', 'true', '1', 'y'}
+
+# Rule id -> (red flag shown to the patient, immediate care instruction)
+_RULE_TEXT = {
+    'acute_coronary_syndrome': (
+        'Chest pain with features of a possible heart attack (radiation, breathlessness, sweating or cardiac risk factors)',
+        'Call emergency services now. Do not drive yourself. Chew aspirin only if advised by emergency services and not allergic.'
+    ),
+    'stroke': (
+        'Possible stroke signs (face droop, slurred speech or one-sided weakness)',
+        'Call emergency services now and note the time symptoms started.'
+    ),
+    'respiratory_distress': (
+        'Severe difficulty breathing',
+        'Call emergency services now. Sit upright and stay with someone.'
+    ),
+    'anaphylaxis': (
+        'Possible severe allergic reaction affecting the airway',
+        'Use an adrenaline auto-injector if available and call emergency services now.'
+    ),
+    'thunderclap_headache': (
+        'Sudden, severe headache',
+        'Seek emergency care immediately to rule out bleeding in the brain.'
+    ),
+    'meningitis': (
+        'Fever with stiff neck',
+        'Seek emergency care immediately.'
+    ),
+    'unresponsive': (
+        'Loss of consciousness or seizure',
+        'Call emergency services now. Place the person on their side if unresponsive and breathing.'
+    ),
+    'major_bleeding': (
+        'Significant bleeding',
+        'Call emergency services now. Apply firm pressure to any external bleeding.'
+    ),
+    'suicidal_ideation': (
+        'Thoughts of self-harm or suicide',
+        'Contact emergency services or a crisis line now. Do not stay alone.'
+    ),
+    'critical_vitals': (
+        'Critically abnormal vital signs',
+        'Seek emergency medical care immediately.'
+    ),
+}
+
+
+def _answer_text(answer) -> str:
+    """The patient's own words in a detailed_symptoms value (a string, a list of options or {answer: ...})."""
+    if isinstance(answer, dict):
+        answer = answer.get('answer', '')
+    if isinstance(answer, (list, tuple)):
+        return ', '.join(str(a) for a in answer)
+    return '' if answer is None else str(answer)
+
+
+def _detailed_parts(detailed) -> List[str]:
+    """
+    Text from the OPQRST / checklist answers. main.js keys detailed_symptoms by the
+    question asked, so the question wording only counts when the answer affirms it
+    ("Any shortness of breath?" -> "Yes"); the answer text itself always counts.
+    """
+    if not isinstance(detailed, dict):
+        return [str(detailed)]
+    parts = []
+    for question, answer in detailed.items():
+        text = _answer_text(answer)
+        if text.strip().lower().split(' ')[0].rstrip('.,!-') in _AFFIRMATIVE:
+            parts.append(str(question))
+        parts.append(text)
+    return parts
+
+
+def _mask_negated(text: str) -> str:
+    """Blank out what each negation cue denies, up to the end of its clause or NEGATION_WINDOW_WORDS words."""
+    masked = list(text)
+    for cue in _NEGATION_CUE.finditer(text):
+        clause_end = _CLAUSE_END.search(text, cue.end())
+        stop = clause_end.start() if clause_end else len(text)
+        words = list(_WORD.finditer(text, cue.end(), stop))[:NEGATION_WINDOW_WORDS]
+        if words:
+            masked[cue.start():words[-1].end()] = ' ' * (words[-1].end() - cue.start())
+    return ''.join(masked)
+
+
+def _symptom_text(data: Dict) -> str:
+    """
+    Lower-cased symptom text with negated findings blanked out; each source is its own clause.
+    Selected symptoms carry their canonical names, so rules fire the same on normalized input.
+    """
+    parts = [symptom_terms(s) if isinstance(s, str) else s for s in data.get('symptoms') or []]
+    parts.append(data.get('freeTextSymptoms') or data.get('free_text') or '')
+    detailed = data.get('detailed_symptoms')
+    if detailed:
+        parts.extend(_detailed_parts(detailed))
+    return _mask_negated('\n'.join(str(p) for p in parts).lower())
+
+
+def count_risk_factors(data: Dict) -> int:
+    """Count affirmative cardiac risk factors across the history/condition sections."""
+    count = 0
+    for section in ('history', 'medicalConditions', 'medicalHistory'):
+        values = data.get(section) or {}
+        if not isinstance(values, dict):
+            continue
+        for key, value in values.items():
+            if any(marker in key.lower() for marker in _RISK_FACTOR_KEYS) and str(value).strip().lower() in _AFFIRMATIVE:
+                count += 1
+    age = (data.get('demographics') or {}).get('age')
+    try:
+        if age and int(age) >= 55:
+            count += 1
+    except (TypeError, ValueError):
+        pass
+    return count
+
+
+def evaluate(data: Dict, vitals_outliers: Optional[Dict] = None) -> Dict:
+    """
+    Run the local emergency rule set over symptoms, free text, OPQRST details,
+    history and vitals outliers. Pure regex/dict work, so it answers in
+    microseconds, long before an LLM response could arrive.
+
+    Returns {'emergency': bool, 'matched_rules': [...], 'red_flags': [...], 'immediate_care': [...]}.
+    """
+    text = _symptom_text(data)
+    hits = {name for name, pattern in _PATTERNS.items() if pattern.search(text)} if text.strip() else set()
+    matched: List[str] = []
+
+    if 'chest_pain' in hits:
+        supporting = len(hits & {'radiation', 'dyspnea', 'diaphoresis'})
+        if supporting >= 1 and (supporting >= 2 or count_risk_factors(data) >= 2):
+            matched.append('acute_coronary_syndrome')
+    if 'stroke_signs' in hits:
+        matched.append('stroke')
+    if 'severe_dyspnea' in hits:
+        matched.append('respiratory_distress')
+    if 'anaphylaxis_airway' in hits and ('allergic_trigger' in hits or 'dyspnea' in hits):
+        matched.append('anaphylaxis')
+    if 'thunderclap' in hits:
+        matched.append('thunderclap_headache')
+    if 'fever' in hits and 'neck_stiffness' in hits:
+        matched.append('meningitis')
+    if 'unresponsive' in hits:
+        matched.append('unresponsive')
+    if 'major_bleeding' in hits:
+        matched.append('major_bleeding')
+    if 'suicidal' in hits:
+        matched.append('suicidal_ideation')
+
+    critical_types = [o.type for o in (vitals_outliers or {}).get('critical', [])]
+    if any(t in _EMERGENCY_OUTLIERS for t in critical_types):
+        matched.append('critical_vitals')
+
+    return {
+        'emergency': bool(matched),
+        'matched_rules': matched,
+        'red_flags': [_RULE_TEXT[rule][0] for rule in matched],
+        'immediate_care': [_RULE_TEXT[rule][1] for rule in matched]
+    }
+
+
+def emergency_follow_up(verdict: Dict) -> Dict:
+    """follow_up block used whenever the local rules flag an emergency."""
+    return {
+        'urgency': 'emergency',
+        'timeline': 'Immediately',
+        'reason': '; '.join(verdict['red_flags']) or 'Emergency warning signs detected'
+    }
+
+
+def apply_to_analysis(analysis: Dict, verdict: Dict) -> Dict:
+    """
+    Merge an emergency verdict into an LLM analysis result. The local verdict can
+    only raise urgency, never lower it.
+    """
+    if not verdict.get('emergency'):
+        return analysis
+    analysis['emergency_triage'] = verdict
+    analysis['follow_up'] = emergency_follow_up(verdict)
+    analysis['red_flags'] = verdict['red_flags'] + [f for f in analysis.get('red_flags', []) if f not in verdict['red_flags']]
+    analysis['immediate_care'] = verdict['immediate_care'] + [
+        c for c in analysis.get('immediate_care', []) if c not in verdict['immediate_care']
+    ]
+    return analysis
@@ -0,0 +1,199 @@
+import os
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from shared_state import SharedLedger, pid_alive
+from metrics import metrics
+
+# Urgency levels derived from local vitals / red-flag rules, most urgent first
+URGENCY_LEVELS = ('critical', 'elevated', 'routine')
+
+# Route classes in dispatch order when urgency is equal
+ROUTE_CLASS_ORDER = ('analysis', 'summary', 'questions', 'suggest')
+
+# Every AGING_SECONDS spent waiting promotes a ticket by one route class so
+# autocomplete traffic is delayed under load but never starved
+AGING_SECONDS = 5.0
+
+# Budget for everything one HTTP request waits on and calls upstream: an Idempotency-Key
+# duplicate's wait, a prefetch handoff, the quota window, the upstream queue, and every
+# OpenAI attempt and retry backoff. Each of those is bounded by the time left, so a request
+# never outlives WORKER_TIMEOUT (gunicorn's timeout), which leaves a margin for the local
+# work around the calls; nginx's proxy_read_timeout must in turn exceed WORKER_TIMEOUT.
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 50))
+WORKER_TIMEOUT = math.ceil(REQUEST_TIMEOUT) + 10
+
+_request_priority: ContextVar[Optional[Tuple[str, str]]] = ContextVar('llm_request_priority', default=None)
+
+# time.monotonic() by which the waits and LLM calls of the current task must be done
+_call_deadline: ContextVar[Optional[float]] = ContextVar('llm_call_deadline', default=None)
+
+
+class UpstreamBusyError(Exception):
+    """Raised when no upstream LLM slot became free within the queue timeout."""
+
+
+class CallDeadlineExceeded(Exception):
+    """Raised instead of starting (or retrying) an LLM call whose task deadline has passed."""
+
+
+def priority_rank(urgency: str, route_class: str) -> int:
+    """Lower rank is dispatched first: urgency dominates, route class breaks ties."""
+    urgency_index = URGENCY_LEVELS.index(urgency) if urgency in URGENCY_LEVELS else len(URGENCY_LEVELS) - 1
+    route_index = ROUTE_CLASS_ORDER.index(route_class) if route_class in ROUTE_CLASS_ORDER else len(ROUTE_CLASS_ORDER)
+    return urgency_index * 10 + route_index
+
+
+def effective_rank(rank: int, enqueued_at: float, now: float) -> float:
+    """A waiter's rank after aging: one route class better per AGING_SECONDS waited."""
+    return rank - (now - enqueued_at) / AGING_SECONDS
+
+
+@contextmanager
+def request_priority(route_class: str, urgency: str = 'routine'):
+    """Tag every upstream call made inside the block with (urgency, route class)."""
+    token = _request_priority.set((urgency, route_class))
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def current_priority() -> Tuple[str, str]:
+    return _request_priority.get() or ('routine', 'questions')
+
+
+def start_request_deadline(seconds: float = REQUEST_TIMEOUT):
+    """Start the current request's budget; set at the start of every request, replacing the last one."""
+    _call_deadline.set(time.monotonic() + seconds)
+
+
+@contextmanager
+def call_deadline(deadline: Optional[float]):
+    """
+    Run the block under `deadline` (a time.monotonic() value), never later than an
+    enclosing deadline. None lifts the bound, for background work that outlives its request.
+    """
+    enclosing = _call_deadline.get()
+    if deadline is not None and enclosing is not None:
+        deadline = min(deadline, enclosing)
+    token = _call_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _call_deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Seconds before the current call deadline (None without one); raises once it has passed."""
+    deadline = _call_deadline.get()
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise CallDeadlineExceeded("LLM call abandoned: its deadline passed")
+    return left
+
+
+def bounded_wait(seconds: float) -> float:
+    """`seconds`, or the time left before the current deadline if shorter (0 once it has passed)."""
+    try:
+        left = time_left()
+    except CallDeadlineExceeded:
+        return 0.0
+    return seconds if left is None else min(seconds, left)
+
+
+class PriorityUpstreamScheduler:
+    """
+    Host-wide bounded pool of concurrent upstream OpenAI calls, dispatched in
+    priority order. Waiting tickets and held slots live in a shared ledger so
+    all workers see one queue; entries owned by dead pids are reclaimed.
+    Queue-wait time is reported per priority to the metrics registry.
+    """
+
+    def __init__(self, ledger: SharedLedger, limit: int, queue_timeout: float = 10.0, poll_interval: float = 0.02):
+        self.ledger = ledger
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.poll_interval = poll_interval
+
+    @staticmethod
+    def _prune_dead(state: Dict):
+        slots = state.setdefault('slots', {})
+        for pid in [p for p in slots if not pid_alive(int(p))]:
+            del slots[pid]
+        waiters = state.setdefault('waiters', {})
+        for ticket in [t for t, (_, _, pid) in waiters.items() if not pid_alive(pid)]:
+            del waiters[ticket]
+
+    def in_use(self) -> int:
+        slots = self.ledger.read().get('slots', {})
+        return sum(count for pid, count in slots.items() if pid_alive(int(pid)))
+
+    def saturated(self) -> bool:
+        return self.in_use() >= self.limit
+
+    def _try_dispatch(self, ticket: str, rank: int, enqueued_at: float) -> bool:
+        """Take a slot if one is free and this ticket is at the head of the queue."""
+        pid = os.getpid()
+        now = time.time()
+        with self.ledger.transaction() as state:
+            self._prune_dead(state)
+            slots, waiters = state['slots'], state['waiters']
+            waiters.setdefault(ticket, [rank, enqueued_at, pid])
+            if sum(slots.values()) >= self.limit:
+                return False
+            head = min(waiters.items(), key=lambda item: (effective_rank(item[1][0], item[1][1], now), item[1][1]))[0]
+            if head != ticket:
+                return False
+            del waiters[ticket]
+            slots[str(pid)] = slots.get(str(pid), 0) + 1
+        return True
+
+    def _leave_queue(self, ticket: str):
+        with self.ledger.transaction() as state:
+            state.setdefault('waiters', {}).pop(ticket, None)
+
+    def release(self):
+        pid = str(os.getpid())
+        with self.ledger.transaction() as state:
+            slots = state.setdefault('slots', {})
+            if slots.get(pid, 0) > 1:
+                slots[pid] -= 1
+            else:
+                slots.pop(pid, None)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """
+        Hold one upstream slot for the duration of the block. The caller's priority
+        comes from request_priority(); waits up to queue_timeout, or `timeout` if
+        shorter, then raises UpstreamBusyError.
+        """
+        urgency, route_class = current_priority()
+        label = f"{urgency}/{route_class}"
+        rank = priority_rank(urgency, route_class)
+        ticket = uuid.uuid4().hex
+        enqueued_at = time.time()
+        deadline = enqueued_at + (self.queue_timeout if timeout is None else min(self.queue_timeout, timeout))
+
+        try:
+            while not self._try_dispatch(ticket, rank, enqueued_at):
+                if time.time() >= deadline:
+                    metrics.increment('llm_queue_timeouts', label)
+                    raise UpstreamBusyError(f"All {self.limit} upstream LLM slots are busy")
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._leave_queue(ticket)
+            raise
+
+        metrics.observe('llm_queue_wait_seconds', label, time.time() - enqueued_at)
+        try:
+            yield
+        finally:
+            self.release()
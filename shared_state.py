@@ -0,0 +1,85 @@
+import os
+import json
+import fcntl
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+def state_dir() -> str:
+    """Directory shared by all gunicorn workers on a host for cross-process state."""
+    return private_dir(os.getenv('CARE_AI_STATE_DIR') or os.path.join(tempfile.gettempdir(), 'care_ai_state'))
+
+
+def private_dir(path: str) -> str:
+    """Create `path` if needed and restrict it to the service user (0o700): spools hold patient data."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    os.chmod(path, 0o700)
+    return path
+
+
+def open_private(path: str, mode: str = 'w'):
+    """Open a new file for writing, readable by the service user only (0o600)."""
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+    return os.fdopen(fd, mode, encoding='utf-8')
+
+
+def pid_alive(pid: int) -> bool:
+    """Check whether a worker process still exists (used to reclaim leaked slots)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedLedger:
+    """
+    Small JSON document shared between worker processes. Every read-modify-write
+    happens under an exclusive flock on the file, so the document can hold token
+    buckets, slot counters and usage windows for the whole host.
+    """
+
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.path = os.path.join(directory or state_dir(), f"{name}.json")
+        # Create the file once so every process locks the same inode; service user only
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def transaction(self):
+        """Yield the ledger dict under an exclusive lock and write it back afterwards."""
+        with open(self.path, 'r+', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                raw = f.read()
+                try:
+                    data = json.loads(raw) if raw else {}
+                except ValueError:
+                    print(f"WARN: Resetting corrupt shared ledger {self.path}")
+                    data = {}
+                yield data
+                f.seek(0)
+                f.truncate()
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self) -> Dict:
+        """Return a snapshot of the ledger under a shared lock."""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                raw = f.read()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
@@ -9,5 +9,10 @@ if [ -d "venv" ]; then
     echo "Virtual environment activated"
 fi
 
+# Pre-generate the common questionnaires into the on-disk cache (opt-in)
+if [ "${WARM_QUESTIONNAIRES:-0}" = "1" ]; then
+    python warm_questionnaires.py
+fi
+
 # Start the application with Gunicorn
 gunicorn --config gunicorn.conf.py app:app
\ No newline at end of file
@@ -23,6 +23,21 @@ document.addEventListener('DOMContentLoaded', function() {
     // Alias for legacy code that references patientData
     window.patientData = window.userData;
 
+    // Idempotency keys: retries and double-clicks of the same request reuse one key,
+    // so the server answers duplicates from the first response instead of re-running the LLM
+    const idempotencyKeys = new Map();
+    const getIdempotencyKey = (route, body) => {
+        const cacheKey = `${route}|${body}`;
+        if (!idempotencyKeys.has(cacheKey)) {
+            const key = (window.crypto && typeof window.crypto.randomUUID === 'function')
+                ? window.crypto.randomUUID()
+                : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+            idempotencyKeys.set(cacheKey, key);
+        }
+        return idempotencyKeys.get(cacheKey);
+    };
+    window.getIdempotencyKey = getIdempotencyKey;
+
     // Initialize the interface
     const init = () => {
         showStep(0);  // Start from step 0
@@ -735,7 +750,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
 
         symptomInput.addEventListener('input', () => {
-            const query = symptomInput.value.trim().toLowerCase();
+            const query = canonicalSymptomQuery(symptomInput.value);
             
             if (query.length < 2) {
                 symptomSuggestions.style.display = 'none';
@@ -803,11 +818,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
     const getSymptomSuggestions = async (input) => {
         try {
-            const response = await fetch('/get_symptoms', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ input })
-            });
+            // GET with the canonical query, so the browser and nginx can answer repeated prefixes
+            const response = await fetch(`/symptoms/suggest?${new URLSearchParams({ q: canonicalSymptomQuery(input) })}`);
 
             if (!response.ok) {
                 throw new Error(`Server error: ${response.status} ${response.statusText}`);
@@ -891,6 +903,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (freeTextInput) {
         freeTextInput.addEventListener('input', () => {
             extractAndDisplayLabels();
+            schedulePrefetch();
         });
     }
 
@@ -902,10 +915,14 @@ document.addEventListener('DOMContentLoaded', function() {
             
             console.log('DEBUG: Sending userData to backend:', userData);
             
-            const response = await fetch('/submit_symptoms', {
+            const body = JSON.stringify(userData);
+            const response = await fetch('/submit_symptoms?format=templated', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(userData)
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': getIdempotencyKey('/submit_symptoms', body)
+                },
+                body
             });
             
             // Check if response is ok
@@ -921,7 +938,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('Server returned HTML instead of JSON. Please check if the Flask server is running properly.');
             }
             
-            const data = await response.json();
+            const data = await expandTemplatedQuestions(await response.json(), 'structured_questions');
             console.log('DEBUG: Received response from backend:', data);
             
             // Hide loading indicator
@@ -985,10 +1002,14 @@ document.addEventListener('DOMContentLoaded', function() {
             // Show loading indicator
             showResultsLoading();
             
+            const body = JSON.stringify(userData);
             const response = await fetch('/analyze', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(userData)
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': getIdempotencyKey('/analyze', body)
+                },
+                body
             });
             
             if (!response.ok) {
@@ -1009,6 +1030,11 @@ document.addEventListener('DOMContentLoaded', function() {
             hideResultsLoading();
             
             displayAnalysis(analysis);
+
+            // Emergency verdicts arrive instantly; the detailed LLM analysis follows
+            if (analysis.analysis_pending && analysis.analysis_job) {
+                pollAnalysisJob(analysis.analysis_job);
+            }
         } catch (error) {
             console.error('Error analyzing symptoms:', error);
             hideResultsLoading();
@@ -1029,6 +1055,26 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     };
 
+    const pollAnalysisJob = async (jobId, attempt = 0) => {
+        if (attempt >= 60) return;
+        await new Promise(resolve => setTimeout(resolve, 1500));
+        try {
+            const response = await fetch(`/jobs/${jobId}`);
+            const job = await response.json();
+            if (job.status === 'done' && job.result) {
+                displayAnalysis(job.result);
+                return;
+            }
+            if (job.status !== 'pending') {
+                console.error('Detailed analysis failed:', job.error);
+                return;
+            }
+        } catch (error) {
+            console.error('Error polling analysis job:', error);
+        }
+        pollAnalysisJob(jobId, attempt + 1);
+    };
+
     // Add server status check function
     window.checkServerStatus = async () => {
         try {
@@ -1055,6 +1101,40 @@ document.addEventListener('DOMContentLoaded', function() {
         const analysisContainer = document.createElement('div');
         analysisContainer.className = 'analysis-container';
 
+        // Emergency verdict from local red-flag rules, shown before any LLM detail arrives
+        if (analysis && analysis.emergency_triage && analysis.emergency_triage.emergency) {
+            const emergencySection = document.createElement('div');
+            emergencySection.className = 'emergency-alert';
+
+            const emergencyHeader = document.createElement('h3');
+            emergencyHeader.textContent = '🚨 Emergency warning signs detected - seek emergency care now';
+            emergencySection.appendChild(emergencyHeader);
+
+            const emergencyList = document.createElement('ul');
+            [...(analysis.red_flags || []), ...(analysis.immediate_care || [])].forEach(item => {
+                const li = document.createElement('li');
+                li.textContent = item;
+                emergencyList.appendChild(li);
+            });
+            emergencySection.appendChild(emergencyList);
+
+            if (analysis.analysis_pending) {
+                const pendingNote = document.createElement('p');
+                pendingNote.className = 'emergency-pending';
+                pendingNote.textContent = 'Detailed analysis is still being prepared and will appear here shortly.';
+                emergencySection.appendChild(pendingNote);
+            }
+            analysisContainer.appendChild(emergencySection);
+        }
+
+        // The model ran out of output budget; only fully generated items are shown
+        if (analysis && analysis.partial) {
+            const partialNote = document.createElement('p');
+            partialNote.className = 'partial-result-note';
+            partialNote.textContent = 'Some sections of this analysis were cut short. Showing the complete items that were generated.';
+            analysisContainer.appendChild(partialNote);
+        }
+
         // Display Summary of Information Gathered
         const summarySection = document.createElement('div');
         summarySection.className = 'summary-section';
@@ -1744,16 +1824,51 @@ document.addEventListener('DOMContentLoaded', function() {
     const updateSelectedSymptomsWithLabels = () => {
         updateSelectedSymptoms(); // Call existing function
         // Don't automatically trigger label extraction
+        schedulePrefetch();
+    };
+
+    // Speculative prefetch: once a case type and symptoms are chosen, ask the server to start
+    // the questionnaire and label work so /submit_symptoms and /extract_labels find it ready.
+    // Debounced so typing or toggling symptoms only sends the settled selection.
+    let prefetchTimer = null;
+    let lastPrefetchBody = null;
+    const schedulePrefetch = () => {
+        clearTimeout(prefetchTimer);
+        prefetchTimer = setTimeout(() => {
+            const freeText = (document.getElementById('freeTextSymptoms')?.value || '').trim();
+            if (!userData.caseType || (selectedSymptoms.size === 0 && !freeText)) {
+                return;
+            }
+            const body = JSON.stringify({
+                ...userData,
+                symptoms: Array.from(selectedSymptoms),
+                freeTextSymptoms: freeText,
+                // Only what this page goes on to request
+                kinds: ['followup_questions', 'labels']
+            });
+            if (body === lastPrefetchBody) {
+                return;
+            }
+            lastPrefetchBody = body;
+            // Best effort: the real requests compute as usual when this is skipped or fails
+            fetch('/prefetch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body
+            }).catch(error => console.log('DEBUG: prefetch skipped:', error));
+        }, 800);
     };
 
     // Patient History Followup functionality - Updated for Questions
     let followupQuestions = [];
     let currentFollowupQuestionIndex = 0;
     let followupAnswers = [];
+    let followupQuestionsStreaming = false;
 
     const generateFollowupQuestions = async () => {
         console.log('DEBUG: generateFollowupQuestions called');
-        
+        let questionsShown = false;
+
         try {
             // Show loading state
             document.getElementById('historyFollowupLoading').style.display = 'block';
@@ -1770,51 +1885,96 @@ document.addEventListener('DOMContentLoaded', function() {
                 caseType: window.userData.caseType || ''
             };
 
-            // Call backend to generate follow-up questions
+            // Call backend to generate follow-up questions, streamed as one NDJSON line per question
+            const body = JSON.stringify(patientData);
             const response = await fetch('/generate_followup_questions', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'application/x-ndjson',
+                    'Idempotency-Key': getIdempotencyKey('/generate_followup_questions', body)
                 },
-                body: JSON.stringify(patientData)
+                body
             });
 
             if (!response.ok) {
                 throw new Error(`Server error: ${response.status} ${response.statusText}`);
             }
 
-            const contentType = response.headers.get('content-type');
-            if (!contentType || !contentType.includes('application/json')) {
+            const contentType = response.headers.get('content-type') || '';
+            if (!contentType.includes('application/x-ndjson') && !contentType.includes('application/json')) {
                 const text = await response.text();
                 console.error('Non-JSON response from followup questions:', text);
                 throw new Error('Server returned HTML instead of JSON');
             }
 
-            const questionsData = await response.json();
-            console.log('DEBUG: Received questions data:', questionsData);
-            
-            if (questionsData.questions && questionsData.questions.length > 0) {
-                followupQuestions = questionsData.questions;
-                currentFollowupQuestionIndex = 0;
-                followupAnswers = [];
-                
+            followupQuestions = [];
+            currentFollowupQuestionIndex = 0;
+            followupAnswers = [];
+
+            const showQuestions = () => {
                 // Hide loading and show questions section
                 document.getElementById('historyFollowupLoading').style.display = 'none';
                 document.getElementById('followupQuestionsSection').style.display = 'block';
-                
+
                 // Update progress
                 updateQuestionsProgress();
-                
+
                 // Display first question
                 displayCurrentFollowupQuestion();
+                questionsShown = true;
+            };
+
+            if (contentType.includes('application/json')) {
+                // Replayed or non-streaming response: the whole list at once
+                const questionsData = await response.json();
+                console.log('DEBUG: Received questions data:', questionsData);
+                followupQuestions = (questionsData.questions || []).filter(isRenderableQuestion);
             } else {
+                followupQuestionsStreaming = true;
+                try {
+                    await readNdjsonStream(response, (part, data) => {
+                        if (part === 'done') {
+                            console.log('DEBUG: Follow-up question stream finished:', data);
+                        }
+                        if (part !== 'question' || !isRenderableQuestion(data)) {
+                            return;
+                        }
+                        followupQuestions.push(data);
+                        if (!questionsShown) {
+                            // Render question 1 while the rest are still being generated
+                            showQuestions();
+                        } else {
+                            updateQuestionsProgress();
+                            updateFollowupNavigationButtons();
+                        }
+                    });
+                } finally {
+                    followupQuestionsStreaming = false;
+                }
+            }
+
+            if (followupQuestions.length === 0) {
                 throw new Error('No questions generated');
             }
-            
+            if (questionsShown) {
+                updateQuestionsProgress();
+                updateFollowupNavigationButtons();
+            } else {
+                showQuestions();
+            }
+
         } catch (error) {
             console.error('Error generating followup questions:', error);
+            followupQuestionsStreaming = false;
             document.getElementById('historyFollowupLoading').style.display = 'none';
-            
+            if (questionsShown) {
+                // The stream broke after some questions arrived: keep them
+                updateQuestionsProgress();
+                updateFollowupNavigationButtons();
+                return;
+            }
+
             // Show fallback questions
             displayFallbackFollowupQuestions();
         }
@@ -2024,7 +2184,13 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // Show/hide next vs complete button
-        if (currentFollowupQuestionIndex >= followupQuestions.length - 1) {
+        nextBtn.disabled = false;
+        if (followupQuestionsStreaming && currentFollowupQuestionIndex >= followupQuestions.length - 1) {
+            // More questions are still being generated
+            nextBtn.style.display = 'inline-block';
+            nextBtn.disabled = true;
+            completeBtn.style.display = 'none';
+        } else if (currentFollowupQuestionIndex >= followupQuestions.length - 1) {
             nextBtn.style.display = 'none';
             completeBtn.style.display = 'inline-block';
         } else {
@@ -2311,7 +2477,7 @@ function submitFollowupAnswer() {
     questionContainer.innerHTML = '<div class="loading">Processing your answer...</div>';
     
     // Get the next follow-up question
-    fetch('/followup', {
+    fetch('/followup?format=templated', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -2319,6 +2485,7 @@ function submitFollowupAnswer() {
         body: JSON.stringify(window.patientData)
     })
     .then(response => response.json())
+    .then(data => expandTemplatedQuestions(data, 'question'))
     .then(data => {
         if (data.question && !data.completed) {
             displayQuestion(data.question);
@@ -2860,14 +3027,126 @@ window.skipToResults = () => {
     }
 };
 
+// Read an NDJSON response ({"part": ..., "data": ...} per line) as it arrives, calling onPart for each line
+async function readNdjsonStream(response, onPart) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffered.split('\n');
+        buffered = done ? '' : lines.pop();
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch (error) {
+                console.warn('Skipping malformed NDJSON line:', line);
+                continue;
+            }
+            onPart(message.part, message.data);
+        }
+        if (done) break;
+    }
+}
+
+// Same rule as symptom_vocabulary.canonical_query: one spelling (and URL) per autocomplete query
+const SUGGEST_QUERY_MAX_LENGTH = 64;
+
+function canonicalSymptomQuery(text) {
+    return String(text || '').toLowerCase()
+        .replace(/[^\p{L}\p{M}\p{N}_\s'\/-]+/gu, ' ')
+        .split(/\s+/).filter(Boolean).join(' ')
+        .slice(0, SUGGEST_QUERY_MAX_LENGTH).trim();
+}
+
+// Per-item schema check for streamed questions: only shapes the question renderer understands
+function isRenderableQuestion(question) {
+    if (!question || typeof question.question !== 'string' || !question.question.trim()) return false;
+    if (typeof question.category !== 'string') return false;
+    if (question.type === 'multiple_choice') {
+        return Array.isArray(question.options) && question.options.length >= 2;
+    }
+    if (question.type === 'scale') {
+        return Number.isFinite(Number(question.min)) && Number.isFinite(Number(question.max));
+    }
+    return question.type === 'textarea';
+}
+
+// Template dictionary for ?format=templated responses, kept in memory and in localStorage
+// under its ETag: it only changes with a deploy, so it is downloaded once per version
+const QUESTION_TEMPLATES_STORAGE_KEY = 'questionTemplates';
+let questionTemplatesCache = null;
+
+async function loadQuestionTemplates(etag) {
+    if (questionTemplatesCache && questionTemplatesCache.etag === etag) return questionTemplatesCache.templates;
+    try {
+        const stored = JSON.parse(localStorage.getItem(QUESTION_TEMPLATES_STORAGE_KEY) || 'null');
+        if (stored && stored.etag === etag) {
+            questionTemplatesCache = stored;
+            return stored.templates;
+        }
+    } catch (error) {
+        console.warn('Ignoring unreadable stored question templates:', error);
+    }
+    const response = await fetch(`/question_templates?v=${encodeURIComponent(etag)}`);
+    if (!response.ok) {
+        throw new Error(`Question templates unavailable: ${response.status}`);
+    }
+    questionTemplatesCache = await response.json();
+    try {
+        localStorage.setItem(QUESTION_TEMPLATES_STORAGE_KEY, JSON.stringify(questionTemplatesCache));
+    } catch (error) {
+        console.warn('Could not store question templates:', error);
+    }
+    return questionTemplatesCache.templates;
+}
+
+// One templated item back to the plain question (same rule as question_wire.expand):
+// "ref" is a fixed template, [ref, params] fills its {name} placeholders and adds the
+// params no placeholder used, and an object is already the question
+function expandQuestionItem(item, templates) {
+    if (typeof item !== 'string' && !Array.isArray(item)) return item;
+    const [ref, params = {}] = Array.isArray(item) ? item : [item];
+    const template = templates[ref];
+    if (!template) throw new Error(`Unknown question template ${ref}`);
+    const used = new Set();
+    const question = {};
+    for (const [field, value] of Object.entries(template)) {
+        question[field] = typeof value !== 'string' ? value : value.replace(/\{(\w+)\}/g, (match, name) => {
+            if (!(name in params)) return match;
+            used.add(name);
+            return String(params[name]);
+        });
+    }
+    for (const [name, value] of Object.entries(params)) {
+        if (!used.has(name)) question[name] = value;
+    }
+    return question;
+}
+
+// Expand data[field] (one item or a list) of a response that carries question_templates
+async function expandTemplatedQuestions(data, field) {
+    if (!data || !data.question_templates || data[field] == null) return data;
+    const templates = await loadQuestionTemplates(data.question_templates);
+    data[field] = Array.isArray(data[field])
+        ? data[field].map(item => expandQuestionItem(item, templates))
+        : expandQuestionItem(data[field], templates);
+    return data;
+}
+
 // Patient History Followup functionality - Updated for Questions
 let followupQuestions = [];
 let currentFollowupQuestionIndex = 0;
 let followupAnswers = [];
+let followupQuestionsStreaming = false;
 
 const generateFollowupQuestions = async () => {
     console.log('DEBUG: generateFollowupQuestions called');
-    
+    let questionsShown = false;
+
     try {
         // Show loading state
         document.getElementById('historyFollowupLoading').style.display = 'block';
@@ -2884,51 +3163,96 @@ const generateFollowupQuestions = async () => {
             caseType: window.userData.caseType || ''
         };
 
-        // Call backend to generate follow-up questions
+        // Call backend to generate follow-up questions, streamed as one NDJSON line per question
+        const body = JSON.stringify(patientData);
         const response = await fetch('/generate_followup_questions', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'application/x-ndjson',
+                'Idempotency-Key': window.getIdempotencyKey('/generate_followup_questions', body)
             },
-            body: JSON.stringify(patientData)
+            body
         });
 
         if (!response.ok) {
             throw new Error(`Server error: ${response.status} ${response.statusText}`);
         }
 
-        const contentType = response.headers.get('content-type');
-        if (!contentType || !contentType.includes('application/json')) {
+        const contentType = response.headers.get('content-type') || '';
+        if (!contentType.includes('application/x-ndjson') && !contentType.includes('application/json')) {
             const text = await response.text();
             console.error('Non-JSON response from followup questions:', text);
             throw new Error('Server returned HTML instead of JSON');
         }
 
-        const questionsData = await response.json();
-        console.log('DEBUG: Received questions data:', questionsData);
-        
-        if (questionsData.questions && questionsData.questions.length > 0) {
-            followupQuestions = questionsData.questions;
-            currentFollowupQuestionIndex = 0;
-            followupAnswers = [];
-            
+        followupQuestions = [];
+        currentFollowupQuestionIndex = 0;
+        followupAnswers = [];
+
+        const showQuestions = () => {
             // Hide loading and show questions section
             document.getElementById('historyFollowupLoading').style.display = 'none';
             document.getElementById('followupQuestionsSection').style.display = 'block';
-            
+
             // Update progress
             updateQuestionsProgress();
-            
+
             // Display first question
             displayCurrentFollowupQuestion();
+            questionsShown = true;
+        };
+
+        if (contentType.includes('application/json')) {
+            // Replayed or non-streaming response: the whole list at once
+            const questionsData = await response.json();
+            console.log('DEBUG: Received questions data:', questionsData);
+            followupQuestions = (questionsData.questions || []).filter(isRenderableQuestion);
         } else {
+            followupQuestionsStreaming = true;
+            try {
+                await readNdjsonStream(response, (part, data) => {
+                    if (part === 'done') {
+                        console.log('DEBUG: Follow-up question stream finished:', data);
+                    }
+                    if (part !== 'question' || !isRenderableQuestion(data)) {
+                        return;
+                    }
+                    followupQuestions.push(data);
+                    if (!questionsShown) {
+                        // Render question 1 while the rest are still being generated
+                        showQuestions();
+                    } else {
+                        updateQuestionsProgress();
+                        updateFollowupNavigationButtons();
+                    }
+                });
+            } finally {
+                followupQuestionsStreaming = false;
+            }
+        }
+
+        if (followupQuestions.length === 0) {
             throw new Error('No questions generated');
         }
-        
+        if (questionsShown) {
+            updateQuestionsProgress();
+            updateFollowupNavigationButtons();
+        } else {
+            showQuestions();
+        }
+
     } catch (error) {
         console.error('Error generating followup questions:', error);
+        followupQuestionsStreaming = false;
         document.getElementById('historyFollowupLoading').style.display = 'none';
-        
+        if (questionsShown) {
+            // The stream broke after some questions arrived: keep them
+            updateQuestionsProgress();
+            updateFollowupNavigationButtons();
+            return;
+        }
+
         // Show fallback questions
         displayFallbackFollowupQuestions();
     }
@@ -3138,7 +3462,13 @@ const updateFollowupNavigationButtons = () => {
     }
     
     // Show/hide next vs complete button
-    if (currentFollowupQuestionIndex >= followupQuestions.length - 1) {
+    nextBtn.disabled = false;
+    if (followupQuestionsStreaming && currentFollowupQuestionIndex >= followupQuestions.length - 1) {
+        // More questions are still being generated
+        nextBtn.style.display = 'inline-block';
+        nextBtn.disabled = true;
+        completeBtn.style.display = 'none';
+    } else if (currentFollowupQuestionIndex >= followupQuestions.length - 1) {
         nextBtn.style.display = 'none';
         completeBtn.style.display = 'inline-block';
     } else {
@@ -0,0 +1,254 @@
+import re
+import sys
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+# Primary symptom labels used by the keyword label extractor: keywords matched in the
+# lower-cased symptom text, and the feature questions asked for each detected label
+SYMPTOM_LABELS = {
+    'fever': {
+        'keywords': ['fever', 'temperature', 'hot', 'burning up', 'feverish'],
+        'features': [
+            "Did you check temperature with thermometer?",
+            "How many times has fever come in a day?",
+            "Does fever come every day at least twice?",
+            "What is the highest temperature recorded?",
+            "Does fever respond to paracetamol/acetaminophen?"
+        ]
+    },
+    'chills_shivering': {
+        'keywords': ['chills', 'shivering', 'shaking', 'cold', 'trembling'],
+        'features': [
+            "Do chills come along with fever?",
+            "Do you feel sweating after chills?",
+            "How long do chills episodes last?",
+            "Do chills happen at specific times?"
+        ]
+    },
+    'sweating': {
+        'keywords': ['sweating', 'perspiration', 'night sweats', 'profuse sweating'],
+        'features': [
+            "Is sweating mainly at night?",
+            "Does sweating occur with fever?",
+            "Is sweating excessive even when cool?",
+            "Does sweating soak through clothes/bedding?"
+        ]
+    },
+    'muscle_pain': {
+        'keywords': ['muscle pain', 'body ache', 'myalgia', 'body pain', 'muscle ache'],
+        'features': [
+            "Is muscle pain all over body or specific areas?",
+            "Does muscle pain worsen with movement?",
+            "Is pain constant or comes in waves?",
+            "Does pain respond to pain medication?"
+        ]
+    },
+    'joint_pain': {
+        'keywords': ['joint pain', 'arthralgia', 'knee pain', 'elbow pain', 'wrist pain'],
+        'features': [
+            "Which joints are affected?",
+            "Is joint pain worse in morning or evening?",
+            "Any visible swelling in joints?",
+            "Does joint pain limit movement?"
+        ]
+    },
+    'headache': {
+        'keywords': ['headache', 'head pain', 'migraine', 'head ache'],
+        'features': [
+            "Where exactly is headache located?",
+            "Is headache throbbing or constant pressure?",
+            "Does headache worsen with light/sound?",
+            "How severe is headache on scale 1-10?"
+        ]
+    },
+    'weakness': {
+        'keywords': ['weakness', 'fatigue', 'tired', 'exhaustion', 'weak', 'energy loss'],
+        'features': [
+            "Is weakness generalized or specific body parts?",
+            "Does weakness interfere with daily activities?",
+            "Is weakness worse at certain times?",
+            "Any difficulty getting up from sitting/lying?"
+        ]
+    },
+    'nausea_vomiting': {
+        'keywords': ['nausea', 'vomiting', 'feeling sick', 'throwing up', 'sick feeling'],
+        'features': [
+            "Does vomiting occur with or without eating?",
+            "How many times vomiting per day?",
+            "Is nausea constant or comes in waves?",
+            "What triggers the nausea/vomiting?"
+        ]
+    },
+    'loss_of_appetite': {
+        'keywords': ['loss of appetite', 'no appetite', 'not hungry', 'food aversion'],
+        'features': [
+            "Complete loss of appetite or reduced?",
+            "Any specific foods you can tolerate?",
+            "How much weight loss if any?",
+            "When did appetite loss start?"
+        ]
+    }
+}
+
+# Canonical symptoms: id -> (label it feeds, display name, synonyms). Synonyms are plain
+# restatements of the canonical name only: anything that adds clinical detail ("cold sweat",
+# "crushing") stays a qualifier, so no red-flag wording is lost when a synonym is folded.
+CANONICAL_SYMPTOMS = {
+    'fever': ('fever', 'fever', ('feverish', 'high temperature', 'elevated temperature', 'raised temperature',
+                                 'temperature', 'pyrexia', 'febrile', 'burning up', 'running a temperature')),
+    'chills': ('chills_shivering', 'chills', ('shivering', 'shivers', 'rigors', 'feeling cold', 'trembling', 'shaking')),
+    'sweating': ('sweating', 'sweating', ('perspiration', 'excess moisture', 'sweats', 'sweaty', 'profuse sweating')),
+    'night_sweats': ('sweating', 'night sweats', ('sweating at night', 'nocturnal sweating')),
+    'muscle_pain': ('muscle_pain', 'muscle pain', ('myalgia', 'muscle ache', 'muscle aches', 'body ache', 'body aches',
+                                                  'body pain', 'aching muscles')),
+    'joint_pain': ('joint_pain', 'joint pain', ('arthralgia', 'joint ache', 'aching joints', 'painful joints')),
+    'headache': ('headache', 'headache', ('head pain', 'head ache', 'head hurts', 'head hurting')),
+    'migraine': ('headache', 'migraine', ()),
+    'fatigue': ('weakness', 'fatigue', ('feeling tired', 'feeling very tired', 'tired', 'tiredness', 'exhaustion',
+                                       'exhausted', 'lethargy', 'energy loss', 'low energy')),
+    'weakness': ('weakness', 'weakness', ('reduced strength', 'weak', 'feeling weak', 'loss of strength')),
+    'nausea': ('nausea_vomiting', 'nausea', ('feeling sick', 'sick feeling', 'nauseous', 'nauseated', 'queasy')),
+    'vomiting': ('nausea_vomiting', 'vomiting', ('throwing up', 'vomit', 'being sick', 'emesis')),
+    'loss_of_appetite': ('loss_of_appetite', 'loss of appetite', ('no appetite', 'not hungry', 'poor appetite',
+                                                                  'decreased appetite', 'anorexia')),
+    'dizziness': (None, 'dizziness', ('dizzy', 'light headed', 'lightheaded', 'light headed feeling',
+                                      'lightheadedness', 'giddiness')),
+    'cough': (None, 'cough', ('coughing',)),
+    'shortness_of_breath': (None, 'shortness of breath', ('short of breath', 'breathlessness', 'breathless',
+                                                          'difficulty breathing', 'dyspnea', 'dyspnoea')),
+    'chest_pain': (None, 'chest pain', ('chest ache', 'pain in chest', 'pain in the chest')),
+    'abdominal_pain': (None, 'abdominal pain', ('stomach pain', 'stomach ache', 'stomachache', 'belly pain',
+                                                'tummy ache', 'tummy pain')),
+    'diarrhea': (None, 'diarrhea', ('diarrhoea', 'loose stools', 'loose motions', 'watery stools')),
+    'sore_throat': (None, 'sore throat', ('throat pain', 'painful throat', 'scratchy throat')),
+    'runny_nose': (None, 'runny nose', ('rhinorrhea', 'running nose', 'nasal discharge')),
+    'rash': (None, 'rash', ('skin rash', 'rashes')),
+    'pain': (None, 'pain', ('general discomfort', 'discomfort', 'aches')),
+}
+
+# Bound on distinct raw strings kept in the normalization cache
+NORMALIZER_CACHE_SIZE = 8192
+
+# Longest autocomplete query kept by canonical_query; suggestions past this prefix do not change
+SUGGEST_QUERY_MAX_LENGTH = 64
+
+_PARENTHETICAL = re.compile(r'\(([^()]*)\)')
+_NON_WORD = re.compile(r"[^\w\s'/-]+")
+
+
+class CanonicalSymptom(NamedTuple):
+    id: str
+    label: Optional[str]
+    qualifier: str
+
+    @property
+    def display(self) -> str:
+        """The canonical UI string, e.g. 'chest pain (crushing sensation)'."""
+        name = CANONICAL_SYMPTOMS[self.id][1] if self.id in CANONICAL_SYMPTOMS else self.id.replace('_', ' ')
+        return sys.intern(f"{name} ({self.qualifier})") if self.qualifier else name
+
+
+def _phrase(text: str) -> str:
+    return ' '.join(_NON_WORD.sub(' ', text.lower()).split())
+
+
+def canonical_query(text: Optional[str]) -> str:
+    """
+    The one spelling of an autocomplete query that GET /symptoms/suggest answers: lower
+    case, punctuation dropped, whitespace collapsed and cut to SUGGEST_QUERY_MAX_LENGTH,
+    so "Chest  Pain!" and "chest pain" share a URL and a cache entry. static/js/main.js
+    (canonicalSymptomQuery) applies the same rule before requesting.
+    """
+    return _phrase(text or '')[:SUGGEST_QUERY_MAX_LENGTH].strip()
+
+
+def _phrase_table() -> Dict[str, str]:
+    table = {}
+    for symptom_id, (_, name, synonyms) in CANONICAL_SYMPTOMS.items():
+        for phrase in (name, symptom_id.replace('_', ' ')) + synonyms:
+            table.setdefault(_phrase(phrase), symptom_id)
+    return table
+
+
+# Interned phrase -> canonical id, built once
+PHRASES = {sys.intern(phrase): sys.intern(symptom_id) for phrase, symptom_id in _phrase_table().items()}
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def normalize_symptom(text: str) -> Optional[CanonicalSymptom]:
+    """
+    Map one UI symptom string to (canonical id, label, qualifier). "Fever (high temperature)",
+    "fever (elevated temperature)" and "feverish" all become fever with no qualifier, while a
+    parenthetical that adds detail is kept: "chest pain (crushing sensation)". Strings
+    outside the vocabulary get an id slugged from their head phrase, so casing, spacing
+    and punctuation variants still collapse. Results and their strings are interned.
+    """
+    qualifiers = [_phrase(q) for q in _PARENTHETICAL.findall(text)]
+    head = _phrase(_PARENTHETICAL.sub(' ', text))
+    if not head:
+        if not qualifiers:
+            return None
+        head, qualifiers = qualifiers[0], qualifiers[1:]
+
+    symptom_id = PHRASES.get(head)
+    if symptom_id is None:
+        symptom_id = sys.intern(head.replace(' ', '_'))
+    # A qualifier that is only another name for the same symptom adds nothing
+    kept = [q for q in qualifiers if q and PHRASES.get(q) != symptom_id]
+    label = CANONICAL_SYMPTOMS[symptom_id][0] if symptom_id in CANONICAL_SYMPTOMS else None
+    return CanonicalSymptom(symptom_id, label, sys.intern('; '.join(kept)))
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def symptom_terms(text: str) -> str:
+    """
+    Lower-cased symptom string followed by every name of its canonical symptom, for
+    keyword rules: "difficulty breathing", "Shortness of breath (difficulty breathing)"
+    and the normalized "shortness of breath" all contain "breathing", so a rule fires
+    the same before and after normalize_symptoms. Names are joined as separate clauses
+    so a negated qualifier ("chest pain (no radiation)") cannot mask them.
+    """
+    symptom = normalize_symptom(text)
+    if symptom is None or symptom.id not in CANONICAL_SYMPTOMS:
+        return text.lower()
+    _, name, synonyms = CANONICAL_SYMPTOMS[symptom.id]
+    return sys.intern('; '.join((text.lower(), name) + synonyms))
+
+
+def normalize_symptoms(symptoms: List[str]) -> List[str]:
+    """Canonical display strings for a symptom list, in order, with duplicates dropped."""
+    seen = set()
+    canonical = []
+    for text in symptoms or []:
+        if not isinstance(text, str):
+            continue
+        symptom = normalize_symptom(text)
+        if symptom is None or symptom.display in seen:
+            continue
+        seen.add(symptom.display)
+        canonical.append(symptom.display)
+    return canonical
+
+
+def normalize_free_text(text: Optional[str]) -> str:
+    """Free text keeps the patient's words; only whitespace is collapsed."""
+    return ' '.join((text or '').split())
+
+
+def normalize_payload(data: Dict) -> Dict:
+    """
+    Copy of a request payload with its symptom fields normalized (including a nested
+    patient_data), applied before prompts are built and before prefetch cache keys are
+    computed so spelling variants of the same selection share both.
+    """
+    if not isinstance(data, dict):
+        return data
+    normalized = dict(data)
+    if 'symptoms' in normalized:
+        normalized['symptoms'] = normalize_symptoms(normalized['symptoms'])
+    for key in ('freeTextSymptoms', 'free_text'):
+        if isinstance(normalized.get(key), str):
+            normalized[key] = normalize_free_text(normalized[key])
+    if isinstance(normalized.get('patient_data'), dict):
+        normalized['patient_data'] = normalize_payload(normalized['patient_data'])
+    return normalized
@@ -0,0 +1,98 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from flask import Flask  # noqa: E402
+
+import admission  # noqa: E402
+from admission import IP_LIMIT_MULTIPLIER, TokenBucketLimiter, client_ip  # noqa: E402
+from shared_state import SharedLedger  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def limiter(tmp_path, max_buckets=5000):
+    return TokenBucketLimiter(SharedLedger('rate_limits', str(tmp_path)), {'questions': (0.5, 2)}, max_buckets)
+
+
+def test_session_bucket_caps_a_session_and_refills(tmp_path, clock):
+    buckets = limiter(tmp_path)
+    assert [buckets.take('questions', '203.0.113.5', 'sid-a')[0] for _ in range(3)] == [True, True, False]
+    allowed, retry_after = buckets.take('questions', '203.0.113.5', 'sid-a')
+    assert not allowed and retry_after == pytest.approx(2.0)
+
+    clock[0] += 2.0
+    assert buckets.take('questions', '203.0.113.5', 'sid-a') == (True, 0.0)
+    assert not buckets.take('questions', '203.0.113.5', 'sid-a')[0]
+
+
+def test_ip_bucket_caps_sessions_sharing_an_address(tmp_path, clock):
+    buckets = limiter(tmp_path)
+    ip_burst = 2 * IP_LIMIT_MULTIPLIER
+    results = [buckets.take('questions', '203.0.113.5', f"sid-{i}")[0] for i in range(ip_burst + 1)]
+    assert results == [True] * ip_burst + [False]
+    # Other addresses have their own bucket
+    assert buckets.take('questions', '198.51.100.7', 'sid-x')[0]
+
+
+def test_requests_without_a_session_use_the_ip_bucket_only(tmp_path, clock):
+    buckets = limiter(tmp_path)
+    ip_burst = 2 * IP_LIMIT_MULTIPLIER
+    results = [buckets.take('questions', '203.0.113.5', None)[0] for _ in range(ip_burst + 1)]
+    assert results == [True] * ip_burst + [False]
+
+
+def test_bucket_count_stays_capped(tmp_path, clock):
+    buckets = limiter(tmp_path, max_buckets=10)
+    for i in range(30):
+        clock[0] += 0.01
+        buckets.take('questions', f"10.0.0.{i}", f"sid-{i}")
+    stored = buckets.ledger.read()
+    assert len(stored) <= 10
+    # The most recent clients are the ones kept
+    assert 'sid:questions:sid-29' in stored and 'sid:questions:sid-0' not in stored
+
+
+def test_idle_buckets_are_dropped_first(tmp_path, clock):
+    buckets = limiter(tmp_path, max_buckets=4)
+    buckets.take('questions', '203.0.113.5', 'sid-old')
+    clock[0] += 60
+    for i in range(3):
+        buckets.take('questions', f"198.51.100.{i}", None)
+    stored = buckets.ledger.read()
+    assert not any(key.endswith('sid-old') or key.endswith('203.0.113.5') for key in stored)
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def ip_for(app, peer, headers=None):
+    with app.test_request_context('/', environ_base={'REMOTE_ADDR': peer}, headers=headers or {}):
+        return client_ip()
+
+
+def test_direct_client_forwarding_headers_are_ignored(app):
+    headers = {'X-Real-IP': '10.9.9.9', 'X-Forwarded-For': '10.8.8.8'}
+    assert ip_for(app, '203.0.113.5', headers) == '203.0.113.5'
+
+
+def test_trusted_proxy_real_ip_is_used(app):
+    headers = {'X-Real-IP': '203.0.113.5', 'X-Forwarded-For': '10.8.8.8, 203.0.113.5'}
+    assert ip_for(app, '127.0.0.1', headers) == '203.0.113.5'
+
+
+def test_trusted_proxy_uses_the_last_forwarded_hop(app):
+    # The first hop is whatever the client sent; nginx appends the address it saw
+    headers = {'X-Forwarded-For': '10.8.8.8, 203.0.113.5'}
+    assert ip_for(app, '127.0.0.1', headers) == '203.0.113.5'
+    assert ip_for(app, '::1') == '::1'
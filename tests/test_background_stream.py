@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai_helper import OpenAIHelper  # noqa: E402
+
+
+def _upstream(produced, closed):
+    """Stands in for a streamed completion: yields until closed (or for about two seconds)."""
+    try:
+        for _ in range(400):
+            produced.append(len(produced))
+            yield {'question': f"q{len(produced)}"}
+            time.sleep(0.005)
+    finally:
+        closed.set()
+
+
+def test_all_items_arrive_in_order():
+    def items():
+        yield from ({'question': f"q{i}"} for i in range(5))
+
+    assert [item['question'] for item in OpenAIHelper()._drain_in_background(items())] == \
+        ['q0', 'q1', 'q2', 'q3', 'q4']
+
+
+def test_closing_the_results_stops_and_closes_the_generator():
+    produced, closed = [], threading.Event()
+    results = OpenAIHelper()._drain_in_background(_upstream(produced, closed))
+    assert next(results) == {'question': 'q1'}
+    # The client disconnected: the WSGI server closes the response iterable
+    results.close()
+    assert closed.wait(1)
+    count = len(produced)
+    time.sleep(0.05)
+    assert len(produced) == count
+
+
+def test_errors_in_the_generator_end_the_stream():
+    def items():
+        yield {'question': 'q0'}
+        raise RuntimeError('upstream reset')
+
+    assert list(OpenAIHelper()._drain_in_background(items())) == [{'question': 'q0'}]
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from followup_cursor import FollowupCursorStore, inputs_fingerprint, step_cursor  # noqa: E402
+from scheduling import call_deadline  # noqa: E402
+from shared_state import SharedLedger  # noqa: E402
+
+
+def test_step_cursor_walks_slots_then_blocks():
+    positions, cursor = [], None
+    while True:
+        cursor = step_cursor(cursor, blocks=2, slots=3)
+        if cursor is None:
+            break
+        positions.append(cursor)
+    assert positions == [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]
+    assert step_cursor(None, blocks=0, slots=3) is None
+
+
+def test_fingerprint_depends_on_symptom_order_and_free_text():
+    fp = inputs_fingerprint(['cough', 'fever'], False)
+    assert fp == inputs_fingerprint(['cough', 'fever'], False)
+    assert fp != inputs_fingerprint(['fever', 'cough'], False)
+    assert fp != inputs_fingerprint(['cough', 'fever'], True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FollowupCursorStore(max_entries=3, ttl_seconds=3600, ledger=SharedLedger('followup_cursors', str(tmp_path)))
+
+
+def test_advance_serves_each_position_once_then_reports_completion(store):
+    fp = inputs_fingerprint(['cough'], False)
+    assert [store.advance('sid-a', fp, 1, 2) for _ in range(4)] == [(0, 0), (0, 1), None, None]
+
+
+def test_changed_inputs_restart_the_interview(store):
+    store.advance('sid-a', inputs_fingerprint(['cough'], False), 2, 3)
+    store.advance('sid-a', inputs_fingerprint(['cough'], False), 2, 3)
+    assert store.advance('sid-a', inputs_fingerprint(['cough'], True), 2, 3) == (0, 0)
+
+
+def test_sessions_advance_independently_and_reset_forgets_one(store):
+    fp = inputs_fingerprint(['cough'], False)
+    store.advance('sid-a', fp, 2, 3)
+    store.advance('sid-a', fp, 2, 3)
+    assert store.advance('sid-b', fp, 2, 3) == (0, 0)
+    store.reset('sid-a')
+    assert store.advance('sid-a', fp, 2, 3) == (0, 0)
+    assert store.advance('sid-b', fp, 2, 3) == (0, 1)
+
+
+def test_expired_and_oldest_sessions_are_pruned(store):
+    fp = inputs_fingerprint(['cough'], False)
+    for sid in ('sid-a', 'sid-b', 'sid-c', 'sid-d'):
+        store.advance(sid, fp, 2, 3)
+    assert set(store.ledger.read()) == {'sid-b', 'sid-c', 'sid-d'}
+
+    store.ttl_seconds = 0
+    assert store.advance('sid-b', fp, 2, 3) == (0, 0)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv('CARE_AI_STATE_DIR', str(tmp_path / 'state'))
+    import app as app_module
+    monkeypatch.setattr(app_module.followup_cursors, 'ledger', SharedLedger('followup_cursors', str(tmp_path)))
+    # Requests start a deadline on this thread (app.bound_request); drop it after the test
+    with call_deadline(None):
+        yield app_module.app.test_client()
+
+
+def test_followup_without_a_session_is_keyed_by_client_ip(client):
+    def followup(ip):
+        return client.post('/followup', json={'symptoms': ['cough']}, environ_base={'REMOTE_ADDR': ip}).get_json()
+
+    first = followup('203.0.113.5')
+    second = followup('203.0.113.5')
+    other = followup('198.51.100.7')
+    assert second['question']['question'] != first['question']['question']
+    # Another address starts its own interview instead of continuing this one
+    assert other['question'] == first['question']
@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from flask import Flask, jsonify, request  # noqa: E402
+
+from admission import AdmissionController  # noqa: E402
+from idempotency import IdempotencyStore, idempotent  # noqa: E402
+
+
+@pytest.fixture
+def shed_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('CARE_AI_STATE_DIR', str(tmp_path / 'state'))
+    store = IdempotencyStore(spool_dir=str(tmp_path / 'idempotency'))
+    admission = AdmissionController(route_limits={'questions': (0.001, 1)})
+    app = Flask(__name__)
+    calls = []
+
+    @app.route('/extract_labels', methods=['POST'])
+    @idempotent(store)
+    @admission.admit('questions', fallback=lambda data: {'labels': 'keyword fallback'})
+    def extract_labels():
+        calls.append(1)
+        return jsonify({'labels': 'model'})
+
+    return app, admission, calls
+
+
+def test_shed_fallback_is_not_replayed_to_a_retry(shed_app):
+    app, admission, calls = shed_app
+    client = app.test_client()
+    headers = {'Idempotency-Key': 'retry-me'}
+
+    # Spend the client's tokens (a burst of 1, times 4 per IP), so the keyed request is shed
+    for _ in range(4):
+        client.post('/extract_labels', json={'symptoms': ['cough']})
+    shed = client.post('/extract_labels', json={'symptoms': ['fever']}, headers=headers)
+    assert shed.status_code == 200
+    assert shed.headers['X-Admission'] == 'rate_limited'
+    assert shed.get_json() == {'labels': 'keyword fallback'}
+
+    with admission.buckets.ledger.transaction() as buckets:
+        buckets.clear()
+    retry = client.post('/extract_labels', json={'symptoms': ['fever']}, headers=headers)
+    assert retry.get_json() == {'labels': 'model'}
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert len(calls) == 5
+
+    replay = client.post('/extract_labels', json={'symptoms': ['fever']}, headers=headers)
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json() == {'labels': 'model'}
+    assert len(calls) == 5
+
+
+def test_same_key_from_another_client_is_not_replayed(tmp_path):
+    store = IdempotencyStore(spool_dir=str(tmp_path))
+    app = Flask(__name__)
+
+    @app.route('/generate_patient_summary', methods=['POST'])
+    @idempotent(store)
+    def summary():
+        return jsonify({'for': request.remote_addr})
+
+    client = app.test_client()
+
+    def post(ip):
+        return client.post('/generate_patient_summary', json={'symptoms': ['cough']},
+                           headers={'Idempotency-Key': 'k1'}, environ_base={'REMOTE_ADDR': ip})
+
+    first, other, again = post('203.0.113.5'), post('198.51.100.7'), post('203.0.113.5')
+    assert first.get_json() == {'for': '203.0.113.5'}
+    assert other.get_json() == {'for': '198.51.100.7'}
+    assert 'Idempotent-Replayed' not in other.headers
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert again.get_json() == {'for': '203.0.113.5'}
+
+
+def _dead_pid() -> int:
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+def test_stale_marker_is_taken_over_by_exactly_one_claimant(tmp_path):
+    stores = [IdempotencyStore(spool_dir=str(tmp_path)) for _ in range(16)]
+    _, lock_path = stores[0]._paths('/analyze:alice:k1')
+    with open(lock_path, 'w') as f:
+        f.write(str(_dead_pid()))
+
+    barrier = threading.Barrier(len(stores))
+    claimed = []
+
+    def claim(store):
+        barrier.wait()
+        claimed.append(store._claim(lock_path))
+
+    threads = [threading.Thread(target=claim, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert claimed.count(True) == 1
+    with open(lock_path) as f:
+        assert f.read() == str(os.getpid())
+
+
+def test_release_keeps_a_marker_taken_over_by_another_worker(tmp_path):
+    store = IdempotencyStore(spool_dir=str(tmp_path))
+    state, _ = store.begin('/analyze:alice:k1', 'fp')
+    assert state == 'owner'
+    _, lock_path = store._paths('/analyze:alice:k1')
+    # The hung owner's marker was replaced by a worker that is still running
+    with open(lock_path, 'w') as f:
+        f.write(str(os.getppid()))
+    store.abandon('/analyze:alice:k1')
+    assert os.path.exists(lock_path)
@@ -0,0 +1,135 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from json_extract import JSONArrayItemStream, JSONExtractionError, extract_json, extract_json_partial  # noqa: E402
+
+
+def completion(content, finish_reason='stop'):
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason=finish_reason)])
+
+
+def test_array_wrapped_in_a_single_key_object_is_unwrapped():
+    text = 'Here you go:\n```json\n{"questions": [{"question": "Since when?"}, {"question": "Where?"}]}\n```'
+    assert extract_json(text, 'array') == [{'question': 'Since when?'}, {'question': 'Where?'}]
+
+
+def test_truncated_wrapper_keeps_its_complete_elements():
+    text = '{"questions": [{"question": "Since when?"}, {"question": "Whe'
+    assert extract_json_partial(text, 'array') == ([{'question': 'Since when?'}], True)
+
+
+def test_top_level_array_wins_over_a_wrapper():
+    assert extract_json('{"questions": [1]} then [2, 3]', 'array') == [2, 3]
+
+
+def test_object_with_several_keys_is_not_an_array():
+    with pytest.raises(JSONExtractionError):
+        extract_json('{"questions": [1], "total": 1}', 'array')
+
+
+def test_additional_questions_survive_a_wrapped_reply():
+    from openai_helper import OpenAIHelper
+    reply = completion('{"questions": [{"question": "When did it start?", "type": "textarea"}]}')
+    questions = OpenAIHelper()._parse_json_response('additional_questions', reply, expect='array')
+    assert questions == [{'question': 'When did it start?', 'type': 'textarea'}]
+
+
+def test_fenced_json_is_found():
+    text = 'Analysis:\n```json\n{"conditions": [{"name": "Migraine"}]}\n```\nHope this helps.'
+    assert extract_json(text) == {'conditions': [{'name': 'Migraine'}]}
+
+
+def test_prose_brackets_and_string_contents_do_not_confuse_nesting():
+    text = 'Note [see below]. The answer: {"q": "Is it \\"sharp\\" or {dull}]?", "n": [1, 2]} (done}'
+    assert extract_json(text, 'object') == {'q': 'Is it "sharp" or {dull}]?', 'n': [1, 2]}
+
+
+def test_values_of_the_other_type_are_skipped():
+    text = '[1, 2] and then {"a": 1}'
+    assert extract_json(text, 'object') == {'a': 1}
+    assert extract_json(text) == [1, 2]
+
+
+def test_no_json_raises():
+    with pytest.raises(JSONExtractionError):
+        extract_json('I cannot help with that.')
+    with pytest.raises(JSONExtractionError):
+        extract_json('')
+    with pytest.raises(JSONExtractionError):
+        extract_json('{"conditions": [{"name": "Migr')
+
+
+def test_complete_value_is_not_partial():
+    assert extract_json_partial('{"a": [1, 2]}') == ({'a': [1, 2]}, False)
+
+
+def test_truncated_array_keeps_complete_elements_only():
+    text = '[{"id": 1, "question": "Since when?"}, {"id": 2, "question": "Where does it h'
+    assert extract_json_partial(text, 'array') == ([{'id': 1, 'question': 'Since when?'}], True)
+
+
+def test_truncated_object_keeps_complete_pairs():
+    text = '{"conditions": [{"name": "Migraine", "likelihood": "high"}, {"name": "Tens'
+    payload, partial = extract_json_partial(text, 'object')
+    assert partial
+    assert payload == {'conditions': [{'name': 'Migraine', 'likelihood': 'high'}]}
+
+
+def test_half_generated_nested_values_are_dropped():
+    text = '{"conditions": [{"name": "Migraine"}], "follow_up": {"timeframe": "24 h'
+    assert extract_json_partial(text, 'object') == ({'conditions': [{'name': 'Migraine'}]}, True)
+    # A nested container opened but with nothing complete inside is dropped, not kept empty
+    text = '{"conditions": [{"name": "Migraine"}], "follow_up": {'
+    assert extract_json_partial(text, 'object') == ({'conditions': [{'name': 'Migraine'}]}, True)
+    text = '{"conditions": [{"name": "Migraine"}], "tests": ['
+    assert extract_json_partial(text, 'object') == ({'conditions': [{'name': 'Migraine'}]}, True)
+
+
+def test_value_cut_before_anything_completed_is_closed_empty():
+    assert extract_json_partial('{"conditions": [{"na', 'object') == ({}, True)
+
+
+def test_truncation_before_any_value_raises():
+    with pytest.raises(JSONExtractionError):
+        extract_json_partial('Here is the JSON you asked for:', 'object')
+
+
+def feed_in_chunks(stream, text, size):
+    items = []
+    for index in range(0, len(text), size):
+        items.extend(stream.feed(text[index:index + size]))
+    return items
+
+
+@pytest.mark.parametrize('size', [1, 3, 17, 1000])
+def test_stream_yields_array_items_as_they_complete(size):
+    text = 'Sure!\n```json\n[{"q": "a, [b]"}, {"q": "c \\"d\\""}, 3, "x"]\n```'
+    assert feed_in_chunks(JSONArrayItemStream(), text, size) == [{'q': 'a, [b]'}, {'q': 'c "d"'}, 3, 'x']
+
+
+def test_stream_item_is_returned_when_its_bracket_arrives():
+    stream = JSONArrayItemStream()
+    assert stream.feed('[{"q": "a"') == []
+    assert stream.feed('}, {"q"') == [{'q': 'a'}]
+    assert stream.feed(': "b"}]') == [{'q': 'b'}]
+    assert stream.done
+    assert stream.feed('[{"q": "c"}]') == []
+
+
+@pytest.mark.parametrize('size', [1, 5, 1000])
+def test_stream_by_key_skips_other_keys(size):
+    text = ('{"note": ["not", "these"], "nested": {"questions": [0]}, '
+            '"questions": [{"id": 1}, {"id": 2}], "do_indicators_focus": ["x"]}')
+    assert feed_in_chunks(JSONArrayItemStream('questions'), text, size) == [{'id': 1}, {'id': 2}]
+
+
+def test_stream_never_returns_a_cut_off_item():
+    stream = JSONArrayItemStream('q')
+    assert feed_in_chunks(stream, '{"q": [{"id": 1}, {"id": 2, "text": "unfini', 4) == [{'id': 1}]
+    assert not stream.done
@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from label_matcher import MIN_SIMILARITY, NEGATION_WINDOW, best_phrase, edit_distance, match_labels  # noqa: E402
+
+
+def test_edit_distance_counts_a_transposition_once():
+    assert edit_distance('nausea', 'nuasea', 2) == 1
+    assert edit_distance('headache', 'hedache', 2) == 1
+    # Capped just past the limit, so callers can reject early
+    assert edit_distance('fever', 'cough', 1) == 2
+
+
+@pytest.mark.parametrize('typo, label', [('hedache', 'headache'), ('nausia', 'nausea_vomiting'),
+                                         ('dizzyness', 'dizziness')])
+def test_typos_match_the_intended_label(typo, label):
+    result = match_labels([], f"I have {typo}")
+    assert label in result['extracted_labels']
+    assert result['extracted_labels'][label]['matched'] == typo
+    assert result['extracted_labels'][label]['confidence'] != 'high'
+
+
+def test_short_words_only_match_exactly():
+    assert best_phrase('not') is None
+    assert match_labels([], 'it is not hot')['extracted_labels'] == {}
+
+
+def test_far_misspellings_are_not_matched():
+    found = best_phrase('headphones')
+    assert found is None or found[2] < MIN_SIMILARITY
+
+
+def test_negation_carries_across_and():
+    result = match_labels([], 'denies fever and chills')
+    assert result['extracted_labels'] == {}
+    assert set(result['negated_labels']) == {'fever', 'chills_shivering'}
+
+
+@pytest.mark.parametrize('text', ['no fever, but chills', 'no fever but chills', 'without fever; chills since monday'])
+def test_negation_stops_at_the_clause_end(text):
+    result = match_labels([], text)
+    assert set(result['extracted_labels']) == {'chills_shivering'}
+    assert set(result['negated_labels']) == {'fever'}
+
+
+def test_negation_reaches_only_a_few_words():
+    filler = ' '.join(['x'] * NEGATION_WINDOW)
+    result = match_labels([], f"no {filler} headache")
+    assert 'headache' in result['extracted_labels']
+
+
+def test_an_affirmed_mention_wins_over_a_negated_one():
+    result = match_labels([], 'no fever yesterday. fever today')
+    assert 'fever' in result['extracted_labels'] and 'fever' not in result['negated_labels']
+
+
+def test_confidence_is_weakest_similarity_times_coverage():
+    assert match_labels([], 'headache')['confidence'] == 1.0
+    # Filler words do not count against coverage
+    assert match_labels([], 'a bad headache since yesterday')['confidence'] == 1.0
+    # Two of the three content words are unexplained
+    assert match_labels([], 'headache purple elephant')['confidence'] == pytest.approx(1 / 3, abs=1e-3)
+    typo = match_labels([], 'hedache')
+    assert typo['confidence'] == pytest.approx(1 - 1 / len('headache'), abs=1e-3)
+
+
+def test_selected_symptoms_match_with_full_confidence():
+    result = match_labels(['Fever', 'some unknown complaint'], '')
+    assert result['extracted_labels']['fever']['source'] == 'symptoms'
+    assert result['label_count'] == 1
+    assert result['confidence'] == 0.5
+    assert match_labels([], '')['confidence'] == 0.0
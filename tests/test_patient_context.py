@@ -0,0 +1,96 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from patient_context import PatientContextCache, build_digest, fingerprint, session_scope  # noqa: E402
+
+PATIENT = {
+    'caseType': 'sick',
+    'symptoms': ['cough'],
+    'demographics': {'age': 54, 'gender': 'Male', 'emrId': 'EMR-0042', 'occupation': 'Teacher'},
+    'medicalHistory': {'previousSurgeries': 'Appendectomy in 2010 at City Hospital', 'smoker': True, 'allergies': ''},
+    'medicalRecords': {'notes': 'Appendectomy in 2010 at City Hospital', 'lastVisit': '2023'},
+    'history': {'surgeries': 'Appendectomy in 2010 at City Hospital'},
+    'vitals': {'systolic': 150, 'diastolic': 95, 'pulseRate': 112, 'oxygenSaturation': 93, 'temperature': 38.4,
+               'temperatureUnit': '°C', 'weight': 80, 'weightUnit': 'kg', 'painScale': 6, 'glucoseNote': 'fasting'}
+}
+
+
+def test_identifiers_and_empty_answers_are_dropped():
+    digest = build_digest(PATIENT)
+    assert 'EMR-0042' not in ' '.join(digest.values())
+    assert digest['demographics'] == '54y Male; occupation: Teacher'
+    assert 'allergies' not in digest['medical_history']
+    assert digest['medical_history'] == 'previous surgeries: Appendectomy in 2010 at City Hospital; smoker: yes'
+
+
+def test_long_repeats_are_dropped_except_in_history():
+    digest = build_digest(PATIENT)
+    assert digest['medical_records'] == 'last visit: 2023'
+    # The analysis prompts read history on its own, so it keeps its own copy
+    assert digest['history'] == 'surgeries: Appendectomy in 2010 at City Hospital'
+
+
+def test_vitals_are_written_like_a_chart():
+    assert build_digest(PATIENT)['vitals'] == (
+        'BP 150/95 mmHg, HR 112 bpm, SpO2 93%, T 38.4 °C, pain 6/10, weight 80 kg, glucose note: fasting'
+    )
+    assert build_digest({'vitals': {'systolic': 120}})['vitals'] == 'BP 120/? mmHg'
+
+
+def test_fingerprint_only_covers_session_stable_fields():
+    assert fingerprint(PATIENT) == fingerprint({**PATIENT, 'symptoms': ['fever'], 'freeTextSymptoms': 'worse'})
+    assert fingerprint(PATIENT) != fingerprint({**PATIENT, 'vitals': {**PATIENT['vitals'], 'pulseRate': 90}})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PatientContextCache(path=str(tmp_path / 'patient_context.sqlite3'))
+
+
+def counting_builder():
+    calls = []
+
+    def build(patient_data):
+        calls.append(patient_data)
+        return build_digest(patient_data)
+    return build, calls
+
+
+def test_session_digest_is_reused_until_patient_fields_change(cache):
+    build, calls = counting_builder()
+    with session_scope('sid-a'):
+        first = cache.get(PATIENT, build)
+        assert cache.get({**PATIENT, 'symptoms': ['fever']}, build) == first
+        assert len(calls) == 1
+        changed = {**PATIENT, 'vitals': {**PATIENT['vitals'], 'pulseRate': 90}}
+        assert 'HR 90 bpm' in cache.get(changed, build)['vitals']
+        assert len(calls) == 2
+        # The session now holds the new digest, so going back rebuilds too
+        cache.get(PATIENT, build)
+        assert len(calls) == 3
+
+
+def test_sessions_do_not_share_entries(cache):
+    build, calls = counting_builder()
+    with session_scope('sid-a'):
+        cache.get(PATIENT, build)
+    with session_scope('sid-b'):
+        cache.get(PATIENT, build)
+    assert len(calls) == 2
+
+
+def test_expired_entries_are_rebuilt(tmp_path):
+    cache = PatientContextCache(ttl_seconds=0, path=str(tmp_path / 'patient_context.sqlite3'))
+    build, calls = counting_builder()
+    cache.get(PATIENT, build)
+    cache.get(PATIENT, build)
+    assert len(calls) == 2
+
+
+def test_cache_file_is_private(cache):
+    cache.get(PATIENT, counting_builder()[0])
+    assert os.stat(cache.path).st_mode & 0o777 == 0o600
@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from background import BackgroundJobs  # noqa: E402
+from prefetch import SpeculativePrefetcher, additional_inputs, input_key, label_inputs  # noqa: E402
+from shared_state import SharedLedger  # noqa: E402
+
+
+def test_input_key_is_stable_and_input_sensitive():
+    inputs = {'symptoms': ['cough', 'fever'], 'free_text': 'since Monday'}
+    reordered = {'free_text': 'since Monday', 'symptoms': ['cough', 'fever']}
+    assert input_key('labels', inputs) == input_key('labels', reordered)
+    assert input_key('labels', inputs) != input_key('followup_questions', inputs)
+    assert input_key('labels', inputs) != input_key('labels', {**inputs, 'free_text': 'since Sunday'})
+
+
+def test_inputs_ignore_fields_the_route_does_not_use():
+    data = {'symptoms': ['cough'], 'freeTextSymptoms': ' dry ', 'caseType': 'sick'}
+    assert label_inputs(data) == label_inputs({**data, 'vitals': {'heartRate': 80}})
+    base = additional_inputs({**data, 'vitals': {'heartRate': 80}})
+    assert base == additional_inputs({**data, 'vitals': {'heartRate': 80}, 'medicalRecords': 'x-ray'})
+    assert base != additional_inputs({**data, 'vitals': {'heartRate': 120}})
+    assert label_inputs({'symptoms': [], 'freeTextSymptoms': '  '}) is None
+
+
+@pytest.fixture
+def prefetcher(tmp_path):
+    release = threading.Event()
+    jobs = BackgroundJobs(max_workers=4, spool_dir=str(tmp_path / 'jobs'))
+    prefetcher = SpeculativePrefetcher(jobs, wait_timeout=2.0, ledger=SharedLedger('prefetch_sessions', str(tmp_path)))
+    prefetcher.register('labels', label_inputs, lambda inputs: release.wait(5) and inputs['symptoms'])
+    yield prefetcher, release
+    release.set()
+
+
+def key_for(data):
+    return input_key('labels', label_inputs(data))
+
+
+def test_changed_inputs_supersede_the_sessions_previous_job(prefetcher):
+    prefetcher, release = prefetcher
+    first, second = {'symptoms': ['cough']}, {'symptoms': ['fever']}
+    assert prefetcher.prefetch('sid-a', first) == {'labels': 'started'}
+    assert prefetcher.prefetch('sid-a', second) == {'labels': 'started'}
+    assert prefetcher.jobs.get(key_for(first)) is None
+    release.set()
+    assert prefetcher.take('labels', second) == ['fever']
+    assert prefetcher.take('labels', first) is None
+
+
+def test_clients_without_a_session_do_not_supersede_each_other(prefetcher):
+    prefetcher, release = prefetcher
+    first, second = {'symptoms': ['cough']}, {'symptoms': ['fever']}
+    prefetcher.prefetch(None, first)
+    prefetcher.prefetch(None, second)
+    release.set()
+    assert prefetcher.take('labels', first) == ['cough']
+    assert prefetcher.take('labels', second) == ['fever']
+
+
+def test_job_shared_with_another_session_is_kept(prefetcher):
+    prefetcher, release = prefetcher
+    shared = {'symptoms': ['cough']}
+    prefetcher.prefetch('sid-a', shared)
+    assert prefetcher.prefetch('sid-b', shared) == {'labels': 'pending'}
+    prefetcher.prefetch('sid-a', {'symptoms': ['fever']})
+    release.set()
+    assert prefetcher.take('labels', shared) == ['cough']
+
+
+def test_unknown_and_empty_kinds_are_reported(prefetcher):
+    prefetcher, _ = prefetcher
+    assert prefetcher.prefetch('sid-a', {'symptoms': []}, ['labels', 'nope']) == {'labels': 'skipped', 'nope': 'unknown'}
@@ -0,0 +1,82 @@
+import os
+import io
+import sys
+import json
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from openai_helper import OpenAIHelper  # noqa: E402
+from question_wire import QuestionTemplates, expand  # noqa: E402
+
+VITALS = {'pulseRate': 128, 'systolic': 182, 'diastolic': 112, 'oxygenSaturation': 88, 'bloodSugar': 310,
+          'temperature': 103.8, 'temperatureUnit': 'F', 'respiratoryRate': 32}
+PATIENT = {'caseType': 'sick', 'demographics': {'age': 70, 'gender': 'female'},
+           'medicalConditions': {'diabetic': 'yes'}, 'vitals': VITALS}
+
+
+@pytest.fixture(scope='module')
+def helper():
+    return OpenAIHelper()
+
+
+@pytest.fixture(scope='module')
+def templates(helper):
+    return QuestionTemplates(*helper.wire_templates())
+
+
+def decode(wire, dictionary):
+    """What the client does (static/js/main.js, expandQuestionItem) with one templated item."""
+    if isinstance(wire, str):
+        return dictionary[wire]
+    if isinstance(wire, list):
+        return expand(dictionary[wire[0]], wire[1])
+    return wire
+
+
+def questionnaires(helper):
+    symptoms = ['cough', 'Fever', 'Shortness of breath (difficulty breathing)', 'Knee pain']
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield 'structured', helper._generate_enhanced_structured_questions(
+            'sick', symptoms, 'tired since monday', PATIENT['demographics'])
+        yield 'individual', helper._generate_individual_symptom_questions(symptoms, 'tired since monday')
+        yield 'fallback', helper._generate_fallback_followup_questions(
+            PATIENT, helper._analyze_vitals_outliers(VITALS))['questions']
+        for age, case_type in ((8, 'sick'), (30, 'pregnancy'), (45, 'checkup')):
+            demographics = {'age': age, 'gender': 'female'}
+            yield f"fallback-{case_type}-{age}", helper._generate_fallback_followup_questions(
+                {**PATIENT, 'caseType': case_type, 'demographics': demographics, 'vitals': {}},
+                helper._analyze_vitals_outliers({}))['questions']
+
+
+def test_templated_questionnaires_expand_to_the_legacy_json(helper, templates):
+    dictionary = json.loads(templates.body)['templates']
+    for name, questions in questionnaires(helper):
+        legacy = json.loads(json.dumps(questions))
+        wire = json.loads(json.dumps(templates.encode_all(questions)))
+        assert [decode(item, dictionary) for item in wire] == legacy, name
+        # The rule-based questions all come from templates, none are sent inline
+        assert not any(isinstance(item, dict) for item in wire), name
+
+
+def test_one_by_one_questions_expand_to_the_legacy_json(helper, templates):
+    dictionary = json.loads(templates.body)['templates']
+    data = {'symptoms': ['cough', 'Knee pain'], 'freeTextSymptoms': 'tired'}
+    while True:
+        result = helper.get_next_followup_question(data)
+        if result['completed']:
+            break
+        wire = json.loads(json.dumps(templates.encode(result['question'])))
+        assert decode(wire, dictionary) == json.loads(json.dumps(result['question']))
+
+
+def test_questions_no_template_reproduces_are_sent_inline(templates):
+    llm_question = {'id': 1, 'question': 'Any recent travel?', 'type': 'yes_no', 'help_text': 'Travel history'}
+    assert templates.encode(llm_question) is llm_question
+    assert templates.encode('not a question') == 'not a question'
+
+
+def test_etag_is_stable_across_builds(helper, templates):
+    assert QuestionTemplates(*helper.wire_templates()).etag == templates.etag
@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from openai_helper import OpenAIHelper  # noqa: E402
+from quota_governor import QuotaExceededError, QuotaGovernor  # noqa: E402
+from scheduling import PriorityUpstreamScheduler, UpstreamBusyError  # noqa: E402
+from shared_state import SharedLedger  # noqa: E402
+
+MESSAGES = [{'role': 'user', 'content': 'List three causes of a dry cough.'}]
+
+
+@pytest.fixture
+def governor(tmp_path):
+    return QuotaGovernor(rpm=1, tpm=100000, max_wait=0.1, ledger=SharedLedger('openai_quota', str(tmp_path)))
+
+
+def test_released_reservation_frees_its_request(governor):
+    reservation = governor.acquire(MESSAGES, 100)
+    with pytest.raises(QuotaExceededError):
+        governor.acquire(MESSAGES, 100)
+    governor.release(reservation)
+    assert governor.usage()['requests_in_window'] == 0
+    governor.acquire(MESSAGES, 100)
+
+
+def test_failed_sent_call_still_counts_towards_rpm(governor):
+    reservation = governor.acquire(MESSAGES, 100)
+    governor.reconcile(reservation, None)
+    usage = governor.usage()
+    assert usage['requests_in_window'] == 1 and usage['tokens_in_window'] < 100
+
+
+def _failing_client(calls):
+    def create(**params):
+        calls.append(params)
+        raise RuntimeError('500 internal server error')
+    completions = type('Completions', (), {'create': staticmethod(create)})
+    return type('Client', (), {'chat': type('Chat', (), {'completions': completions})})
+
+
+def test_call_without_an_upstream_slot_does_not_use_quota(tmp_path, governor):
+    scheduler = PriorityUpstreamScheduler(SharedLedger('upstream_slots', str(tmp_path)), limit=1,
+                                          queue_timeout=0.1, poll_interval=0.01)
+    with scheduler.ledger.transaction() as state:
+        state['slots'] = {str(os.getppid()): 1}
+    helper = OpenAIHelper(upstream_limiter=scheduler, quota_governor=governor)
+    calls = []
+    helper.client = _failing_client(calls)
+    with pytest.raises(UpstreamBusyError):
+        helper._create_chat_completion('symptom_suggestions', MESSAGES, max_tokens=100)
+    assert calls == []
+    assert governor.usage()['requests_in_window'] == 0
+
+    with scheduler.ledger.transaction() as state:
+        state['slots'] = {}
+    with pytest.raises(RuntimeError):
+        helper._create_chat_completion('symptom_suggestions', MESSAGES, max_tokens=100)
+    assert len(calls) == 1
+    assert governor.usage()['requests_in_window'] == 1
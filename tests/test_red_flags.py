@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import red_flags  # noqa: E402
+
+
+def test_denied_chest_pain_in_free_text_is_not_an_emergency():
+    verdict = red_flags.evaluate({
+        'symptoms': ['no chest pain'],
+        'freeTextSymptoms': 'denies chest pain, no shortness of breath or sweating'
+    })
+    assert not verdict['emergency']
+    assert verdict['matched_rules'] == []
+
+
+def test_question_wording_answered_no_is_not_matched():
+    verdict = red_flags.evaluate({
+        'symptoms': ['chest pain'],
+        'detailed_symptoms': {
+            'Does the pain radiate to your arm or jaw?': 'No',
+            'Any shortness of breath?': 'No'
+        }
+    })
+    assert not verdict['emergency']
+
+
+def test_question_wording_answered_yes_is_matched():
+    verdict = red_flags.evaluate({
+        'symptoms': ['chest pain'],
+        'detailed_symptoms': {
+            'Does the pain radiate to your arm or jaw?': 'Yes',
+            'Any shortness of breath?': 'Yes - worse on stairs'
+        }
+    })
+    assert verdict['matched_rules'] == ['acute_coronary_syndrome']
+
+
+def test_negation_ends_at_the_clause():
+    verdict = red_flags.evaluate({
+        'symptoms': ['chest pain'],
+        'freeTextSymptoms': 'no fever, crushing pain spreading to my left arm, cold sweat'
+    })
+    assert verdict['matched_rules'] == ['acute_coronary_syndrome']
+
+
+def test_can_not_breathe_is_not_a_denial():
+    verdict = red_flags.evaluate({'freeTextSymptoms': 'I can not breathe'})
+    assert verdict['matched_rules'] == ['respiratory_distress']
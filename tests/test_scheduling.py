@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from scheduling import (  # noqa: E402
+    AGING_SECONDS, CallDeadlineExceeded, PriorityUpstreamScheduler, UpstreamBusyError, bounded_wait, call_deadline,
+    effective_rank, priority_rank, request_priority, time_left
+)
+from shared_state import SharedLedger  # noqa: E402
+
+
+def _dead_pid() -> int:
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return PriorityUpstreamScheduler(SharedLedger('upstream_slots', str(tmp_path)), limit=1,
+                                     queue_timeout=0.2, poll_interval=0.01)
+
+
+def test_urgency_dominates_route_class():
+    assert priority_rank('critical', 'suggest') < priority_rank('elevated', 'analysis')
+    assert priority_rank('routine', 'analysis') < priority_rank('routine', 'suggest')
+    assert priority_rank('unknown', 'unknown') > priority_rank('routine', 'suggest')
+
+
+def test_aging_promotes_one_route_class_per_interval():
+    rank = priority_rank('routine', 'suggest')
+    assert effective_rank(rank, 100.0, 100.0 + AGING_SECONDS) == rank - 1
+    assert effective_rank(rank, 100.0, 100.0) == rank
+
+
+def test_free_slot_goes_to_the_most_urgent_waiter(scheduler):
+    now = time.time()
+    routine, critical = priority_rank('routine', 'questions'), priority_rank('critical', 'analysis')
+    with scheduler.ledger.transaction() as state:
+        state['waiters'] = {'routine': [routine, now - 1, os.getpid()],
+                            'critical': [critical, now, os.getpid()]}
+    assert not scheduler._try_dispatch('routine', routine, now - 1)
+    assert scheduler._try_dispatch('critical', critical, now)
+    assert scheduler.in_use() == 1
+    # The slot is taken now, so even the head of the queue waits
+    assert not scheduler._try_dispatch('routine', routine, now - 1)
+    scheduler.release()
+    assert scheduler._try_dispatch('routine', routine, now - 1)
+
+
+def test_long_waiting_low_priority_ticket_is_not_starved(scheduler):
+    now = time.time()
+    suggest, critical = priority_rank('routine', 'suggest'), priority_rank('critical', 'analysis')
+    enqueued_at = now - (suggest - critical + 1) * AGING_SECONDS
+    with scheduler.ledger.transaction() as state:
+        state['waiters'] = {'suggest': [suggest, enqueued_at, os.getpid()],
+                            'critical': [critical, now, os.getpid()]}
+    assert not scheduler._try_dispatch('critical', critical, now)
+    assert scheduler._try_dispatch('suggest', suggest, enqueued_at)
+
+
+def test_slots_and_tickets_of_dead_workers_are_reclaimed(scheduler):
+    dead = _dead_pid()
+    with scheduler.ledger.transaction() as state:
+        state['slots'] = {str(dead): 1}
+        state['waiters'] = {'orphan': [0, time.time() - 60, dead]}
+    assert scheduler.in_use() == 0
+    with request_priority('questions', 'routine'):
+        with scheduler.slot():
+            assert scheduler.in_use() == 1
+    state = scheduler.ledger.read()
+    assert state['slots'] == {} and state['waiters'] == {}
+
+
+def test_queue_timeout_raises_and_leaves_the_queue(scheduler):
+    with scheduler.ledger.transaction() as state:
+        state['slots'] = {str(os.getppid()): 1}
+    with pytest.raises(UpstreamBusyError):
+        with scheduler.slot():
+            pass
+    assert scheduler.ledger.read()['waiters'] == {}
+
+
+def test_nested_deadline_never_extends_the_enclosing_one():
+    outer = time.monotonic() + 5
+    with call_deadline(outer):
+        with call_deadline(outer + 60):
+            assert time_left() <= 5
+        with call_deadline(None):
+            assert time_left() is None
+        assert bounded_wait(20.0) <= 5
+    assert time_left() is None and bounded_wait(20.0) == 20.0
+
+
+def test_passed_deadline_stops_waits_and_calls():
+    with call_deadline(time.monotonic() - 1):
+        assert bounded_wait(20.0) == 0.0
+        with pytest.raises(CallDeadlineExceeded):
+            time_left()
+
+
+def test_slot_wait_is_bounded_by_the_shorter_of_queue_timeout_and_timeout(scheduler):
+    with scheduler.ledger.transaction() as state:
+        state['slots'] = {str(os.getppid()): 1}
+    started = time.monotonic()
+    with pytest.raises(UpstreamBusyError):
+        with scheduler.slot(timeout=60):
+            pass
+    assert time.monotonic() - started < 2
@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import red_flags  # noqa: E402
+from openai_helper import OpenAIHelper  # noqa: E402
+from symptom_vocabulary import CANONICAL_SYMPTOMS, normalize_payload  # noqa: E402
+
+
+def spellings():
+    for symptom_id, (_, name, synonyms) in CANONICAL_SYMPTOMS.items():
+        for phrase in (name,) + synonyms:
+            yield phrase
+            yield phrase.title()
+        for synonym in synonyms:
+            yield f"{name.capitalize()} ({synonym})"
+            yield f"{synonym.capitalize()} ({name})"
+
+
+SPELLINGS = sorted(set(spellings()))
+
+RED_FLAG_CASES = [
+    {'symptoms': ['Chest pain (crushing sensation)', 'Difficulty breathing', 'Profuse sweating'], 'freeTextSymptoms': ''},
+    {'symptoms': ['Pain in the chest', 'Short of breath'], 'freeTextSymptoms': 'pain spreading to my left arm'},
+    {'symptoms': ['Shortness of breath (difficulty breathing)', 'Dizzy'], 'freeTextSymptoms': 'lips turning blue'},
+    {'symptoms': ['Head ache', 'Fever (high temperature)'], 'freeTextSymptoms': 'worst headache of my life, stiff neck'},
+    {'symptoms': ['Throwing up', 'Stomach ache'], 'freeTextSymptoms': 'vomiting blood'},
+]
+
+
+@pytest.fixture(scope='module')
+def helper():
+    return OpenAIHelper()
+
+
+def checklist(helper, data):
+    return [item.symptom for item in helper._get_symptom_specific_questions(data['symptoms'], data['freeTextSymptoms'])]
+
+
+@pytest.mark.parametrize('spelling', SPELLINGS)
+def test_normalization_keeps_checklist_rows_and_red_flags(helper, spelling):
+    raw = {'symptoms': [spelling], 'freeTextSymptoms': ''}
+    normalized = normalize_payload(raw)
+    assert checklist(helper, normalized) == checklist(helper, raw)
+    assert red_flags.evaluate(normalized)['matched_rules'] == red_flags.evaluate(raw)['matched_rules']
+
+
+def test_breathing_rows_survive_normalization(helper):
+    for spelling in ('difficulty breathing', 'Shortness of breath (difficulty breathing)', 'shortness of breath'):
+        data = normalize_payload({'symptoms': [spelling], 'freeTextSymptoms': ''})
+        assert data['symptoms'] == ['shortness of breath']
+        assert 'Wheezing sounds' in checklist(helper, data)
+
+
+@pytest.mark.parametrize('case', RED_FLAG_CASES)
+def test_normalization_keeps_red_flag_verdicts(case):
+    raw, normalized = red_flags.evaluate(case), red_flags.evaluate(normalize_payload(case))
+    assert raw['matched_rules']
+    assert normalized['matched_rules'] == raw['matched_rules']
+    assert normalized['emergency'] == raw['emergency']
@@ -0,0 +1,137 @@
+import math
+from typing import Dict, Optional
+
+from shared_state import SharedLedger
+from metrics import metrics
+
+# A truncated completion raises the family's max_tokens by this factor, up to MAX_SCALE x the default
+GROWTH_ON_TRUNCATION = 1.25
+MAX_SCALE = 2.0
+# Each complete ("stop") completion eases the scale back towards 1.0
+DECAY_ON_STOP = 0.98
+
+# Completion-length sketch: log-spaced buckets with ~2.5% relative error (DDSketch style)
+SKETCH_GAMMA = 1.05
+# Once a family has this many samples all bucket counts are halved, so old prompts fade out
+SKETCH_MAX_SAMPLES = 4000
+# Never size a completion below this, whatever the sketch says
+MIN_MAX_TOKENS = 64
+
+
+def _bucket(tokens: int) -> int:
+    return math.ceil(math.log(max(tokens, 1), SKETCH_GAMMA))
+
+
+def _bucket_upper(index: int) -> float:
+    return SKETCH_GAMMA ** index
+
+
+def sketch_quantile(sketch: Dict[str, float], q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-quantile, or None for an empty sketch."""
+    total = sum(sketch.values())
+    if total <= 0:
+        return None
+    rank = q * total
+    seen = 0.0
+    for index in sorted(int(k) for k in sketch):
+        seen += sketch[str(index)]
+        if seen >= rank:
+            return _bucket_upper(index)
+    return _bucket_upper(max(int(k) for k in sketch))
+
+
+def sketch_fraction_above(sketch: Dict[str, float], limit: float) -> float:
+    """Share of recorded completions longer than `limit` tokens."""
+    total = sum(sketch.values())
+    if total <= 0:
+        return 0.0
+    return sum(count for k, count in sketch.items() if _bucket_upper(int(k)) > limit) / total
+
+
+class MaxTokensTuner:
+    """
+    Host-wide max_tokens sizing per prompt family. Completion token counts feed a
+    streaming quantile sketch; once a family has enough samples each call gets
+    `percentile` of observed lengths plus `headroom`, capped at MAX_SCALE x the
+    default written at the call site. finish_reason still steers it: completions
+    cut off at the limit ("length") grow the family's scale so the next call can
+    finish, and normal completions ease it back.
+    """
+
+    def __init__(self, percentile: float = 0.99, headroom: float = 0.15, min_samples: int = 50,
+                 ledger: Optional[SharedLedger] = None):
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.ledger = ledger or SharedLedger('max_tokens')
+
+    def _limit(self, entry: Dict, default: int) -> int:
+        scale = min(max(entry.get('scale', 1.0), 1.0), MAX_SCALE)
+        ceiling = int(default * MAX_SCALE)
+        if entry.get('samples', 0) < self.min_samples:
+            return min(ceiling, int(default * scale))
+        observed = sketch_quantile(entry.get('sketch', {}), self.percentile) or default
+        return max(MIN_MAX_TOKENS, min(ceiling, int(observed * (1 + self.headroom) * scale)))
+
+    def max_tokens(self, family: str, default: int) -> int:
+        return self._limit(self.ledger.read().get(family, {}), default)
+
+    def record(self, family: str, finish_reason: Optional[str], completion_tokens: Optional[int] = None,
+               default: Optional[int] = None):
+        metrics.increment('llm_finish_reason', f"{family}/{finish_reason or 'unknown'}")
+        if finish_reason not in ('length', 'stop'):
+            return
+        with self.ledger.transaction() as state:
+            entry = state.setdefault(family, {'scale': 1.0, 'truncated': 0, 'calls': 0})
+            entry['calls'] += 1
+            if default:
+                entry['default'] = default
+            if finish_reason == 'length':
+                entry['truncated'] += 1
+                entry['scale'] = min(MAX_SCALE, entry['scale'] * GROWTH_ON_TRUNCATION)
+            else:
+                entry['scale'] = max(1.0, entry['scale'] * DECAY_ON_STOP)
+
+            if completion_tokens:
+                sketch = entry.setdefault('sketch', {})
+                key = str(_bucket(completion_tokens))
+                sketch[key] = sketch.get(key, 0) + 1
+                entry['samples'] = entry.get('samples', 0) + 1
+                if entry['samples'] > SKETCH_MAX_SAMPLES:
+                    for k in list(sketch):
+                        sketch[k] /= 2
+                        if sketch[k] < 0.5:
+                            del sketch[k]
+                    entry['samples'] = int(sum(sketch.values()))
+
+    def report(self) -> Dict:
+        """
+        Per family: sample count, observed p50/p95/p99 completion lengths, the static
+        call-site default, the adaptive limit, and how many reserved output tokens per
+        call the adaptive limit saves together with the share of recorded completions
+        that would not have fit under it.
+        """
+        rows = {}
+        for family, entry in self.ledger.read().items():
+            sketch = entry.get('sketch', {})
+            default = entry.get('default')
+            row = {
+                'samples': entry.get('samples', 0),
+                'calls': entry.get('calls', 0),
+                'truncated': entry.get('truncated', 0),
+                'p50': sketch_quantile(sketch, 0.5),
+                'p95': sketch_quantile(sketch, 0.95),
+                'p99': sketch_quantile(sketch, 0.99),
+                'default_max_tokens': default
+            }
+            if default:
+                limit = self._limit(entry, default)
+                row['adaptive_max_tokens'] = limit
+                row['reserved_tokens_saved_per_call'] = default - limit
+                row['would_truncate_share'] = round(sketch_fraction_above(sketch, limit), 4)
+            rows[family] = row
+        return rows
+
+    def snapshot(self) -> Dict:
+        return {family: {k: v for k, v in entry.items() if k != 'sketch'}
+                for family, entry in self.ledger.read().items()}
@@ -0,0 +1,127 @@
+"""
+Pre-generate questionnaires into the on-disk questionnaire cache before traffic arrives.
+
+Profiles come from the test cases in cases.md (their symptom sets, demographic bands and
+yes-answered conditions; case type "accident" when a recent injury is reported, otherwise
+"illness", the two case types the UI offers) and from the combinations the cache has seen
+requested most often. Each profile is generated once per questionnaire family from
+representative inputs and stored under the current prompt version, so workers serve these
+flows without an LLM call. Existing entries are kept unless --refresh is given.
+
+    python warm_questionnaires.py
+    python warm_questionnaires.py --top 100 --families dynamic_questions
+    python warm_questionnaires.py --dry-run        # list the profiles only
+    python warm_questionnaires.py --refresh        # regenerate entries that already exist
+"""
+import re
+import sys
+import argparse
+from typing import Dict, List
+
+from app import openai_helper, questionnaire_cache
+from questionnaire_cache import additional_profile, structured_profile
+
+FAMILIES = ('dynamic_questions', 'additional_questions')
+# cases.md medical history answers that the UI sends as medicalConditions
+CONDITION_FIELDS = {'diabetes': 'diabetic', 'hypertension': 'hypertension'}
+
+_CASE_HEADING = re.compile(r'^###\s+Test Case\s+(\d+):\s*(.+)$')
+_ROW = re.compile(r'^\|\s*\*\*(.+?)\*\*\s*\|\s*(.+?)\s*\|$')
+
+
+def parse_cases(path: str) -> List[Dict]:
+    """Request data (caseType, symptoms, demographics, medicalConditions) for each test case."""
+    cases, current = [], None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            heading = _CASE_HEADING.match(line.strip())
+            if heading:
+                current = {'name': f"Test Case {heading.group(1)}: {heading.group(2)}", 'caseType': 'illness',
+                           'symptoms': [], 'demographics': {}, 'medicalConditions': {}}
+                cases.append(current)
+                continue
+            row = _ROW.match(line.strip())
+            if current is None or row is None:
+                continue
+            field, value = row.group(1).strip().lower(), row.group(2)
+            if field == 'main symptoms':
+                current['symptoms'] = re.findall(r'"([^"]+)"', value)
+            elif field == 'demographics':
+                age = re.search(r'Age:\s*(\d+)', value)
+                gender = re.search(r'Gender:\s*(\w+)', value)
+                current['demographics'] = {'age': int(age.group(1)) if age else None,
+                                           'gender': gender.group(1).lower() if gender else ''}
+            elif field == 'medical history':
+                for item in value.split(','):
+                    name, _, answer = item.partition(':')
+                    name, answer = name.strip().lower(), answer.strip().lower()
+                    if name == 'recent injury' and answer == 'yes':
+                        current['caseType'] = 'accident'
+                    elif name in CONDITION_FIELDS:
+                        current['medicalConditions'][CONDITION_FIELDS[name]] = answer
+    return [case for case in cases if case['symptoms']]
+
+
+def case_profiles(cases: List[Dict], family: str, max_questions: int) -> List[Dict]:
+    profiles = []
+    for case in cases:
+        if family == 'dynamic_questions':
+            profile = structured_profile(case['caseType'], case['symptoms'], '', case['demographics'])
+        else:
+            profile = additional_profile({**case, 'freeTextSymptoms': ''}, max_questions, [])
+        if profile is not None:
+            profiles.append(profile)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', default='cases.md', help='markdown file with the known case profiles')
+    parser.add_argument('--top', type=int, default=50, help='most requested observed profiles to add per family')
+    parser.add_argument('--families', default=','.join(FAMILIES), help='comma list of questionnaire families')
+    parser.add_argument('--max-questions', type=int, default=20, help='max_questions of the OLDCARTS profiles')
+    parser.add_argument('--refresh', action='store_true', help='regenerate entries that already exist')
+    parser.add_argument('--dry-run', action='store_true', help='print the profiles without generating')
+    args = parser.parse_args()
+
+    if questionnaire_cache is None:
+        print("Questionnaire cache is disabled (QUESTIONNAIRE_CACHE=0); nothing to warm")
+        return
+
+    cases = parse_cases(args.cases)
+    failures = 0
+    for family in [f.strip() for f in args.families.split(',') if f.strip()]:
+        if family not in FAMILIES:
+            parser.error(f"unknown family {family!r}; choose from {', '.join(FAMILIES)}")
+        profiles, seen = [], set()
+        for profile in case_profiles(cases, family, args.max_questions) + questionnaire_cache.top_observed(family, args.top):
+            key = repr(sorted(profile.items()))
+            if key not in seen:
+                seen.add(key)
+                profiles.append(profile)
+
+        print(f"{family}: {len(profiles)} profiles ({len(cases)} from {args.cases})")
+        stored = existing = 0
+        for profile in profiles:
+            label = f"{profile['case_type']} | {profile['band']['age']} {profile['band']['gender']} | {', '.join(profile['symptoms'])}"
+            if args.dry_run:
+                print(f"  {label}")
+                continue
+            try:
+                if openai_helper.warm_questionnaire(family, profile, refresh=args.refresh):
+                    stored += 1
+                    print(f"  stored   {label}")
+                else:
+                    existing += 1
+            except Exception as e:
+                failures += 1
+                print(f"  FAILED   {label}: {e}")
+        if not args.dry_run:
+            print(f"{family}: {stored} generated, {existing} already cached")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()